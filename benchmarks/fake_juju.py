@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Stand-ins for the Juju hook tools and the host commands used by hooks.
+
+The harness puts a wrapper for every name in ``TOOLS`` in a directory put
+first on the PATH of the replayed hooks, which runs this script with the
+name of the tool as first argument. All tools share the model state kept in
+the JSON file named by ``BENCH_STATE`` and append one line per invocation
+to the JSON lines file named by ``BENCH_LOG``.
+"""
+
+import json
+import os
+import sys
+
+TOOLS = (
+    # Juju hook tools
+    'action-fail', 'action-get', 'action-log', 'action-set',
+    'application-version-set', 'close-port', 'config-get', 'goal-state',
+    'is-leader', 'juju-log', 'leader-get', 'leader-set', 'network-get',
+    'open-port', 'opened-ports', 'relation-get', 'relation-ids',
+    'relation-list', 'relation-set', 'status-get', 'status-set',
+    'storage-get', 'storage-list', 'unit-get',
+    # Host commands
+    'add-apt-repository', 'apt-cache', 'apt-get', 'apt-key', 'apt-mark',
+    'ceph', 'ceph-authtool', 'dpkg', 'dpkg-query', 'lsb_release', 'service',
+    'sudo', 'sysctl', 'systemctl', 'systemd-run',
+)
+
+# Same list as SANDBOXED_PATHS in hook_replay.py, files written by the fake
+# commands below these land in the sandbox instead.
+SANDBOXED_PATHS = (
+    '/etc/apt', '/etc/ceph', '/etc/default', '/etc/security/limits.d',
+    '/etc/sysctl.d', '/etc/systemd/system', '/run/ceph', '/var/lib/ceph',
+    '/var/log/ceph',
+)
+
+ADDRESS = '10.0.0.10'
+CEPH_VERSION = 'ceph version 17.2.6 (d7ff0d10654d2280e08f1ab989c7cdf3064446a5) quincy (stable)'  # noqa
+PACKAGE_VERSION = '17.2.6-0ubuntu0.22.04.1'
+
+
+def _sandbox_path(path):
+    root = os.environ.get('BENCH_ROOT')
+    for prefix in SANDBOXED_PATHS:
+        if root and (path == prefix or path.startswith(prefix + '/')):
+            return root + path
+    return path
+
+
+def _load_state():
+    with open(os.environ['BENCH_STATE']) as f:
+        return json.load(f)
+
+
+def _save_state(state):
+    path = os.environ['BENCH_STATE']
+    with open(path + '.tmp', 'w') as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+
+def _log(tool, args, **extra):
+    entry = {'hook': os.environ.get('JUJU_HOOK_NAME'), 'tool': tool,
+             'args': args}
+    entry.update(extra)
+    with open(os.environ['BENCH_LOG'], 'a') as f:
+        f.write(json.dumps(entry) + '\n')
+
+
+def _output(value, args):
+    """Print a value in the format requested with --format."""
+    if '--format=json' in args or '--format json' in ' '.join(args):
+        print(json.dumps(value))
+    elif value is None:
+        pass
+    elif isinstance(value, (dict, list)):
+        print(json.dumps(value))
+    else:
+        print(value)
+
+
+def _split_flags(args, with_value=('-r', '--format', '-l', '--log-level',
+                                   '--file')):
+    """Separate flags from positional arguments."""
+    flags, positional = {}, []
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg.startswith('-'):
+            name, sep, value = arg.partition('=')
+            if sep:
+                flags[name] = value
+            elif name in with_value and args:
+                flags[name] = args.pop(0)
+            else:
+                flags[name] = True
+        else:
+            positional.append(arg)
+    return flags, positional
+
+
+def _settings(positional, flags):
+    settings = {}
+    if flags.get('--file'):
+        import yaml
+        with open(flags['--file']) as f:
+            settings.update(yaml.safe_load(f) or {})
+    for item in positional:
+        key, _, value = item.partition('=')
+        settings[key] = value
+    return settings
+
+
+def _relation_id(flags):
+    return flags.get('-r') or os.environ.get('JUJU_RELATION_ID')
+
+
+# Juju hook tools
+
+def config_get(state, args):
+    flags, positional = _split_flags(args)
+    if positional:
+        return _output(state['config'].get(positional[0]), args)
+    return _output(state['config'], args)
+
+
+def is_leader(state, args):
+    return _output(state['leader'], ['--format=json'])
+
+
+def leader_get(state, args):
+    flags, positional = _split_flags(args)
+    if positional and positional[0] != '-':
+        return _output(state['leader_settings'].get(positional[0]), args)
+    return _output(state['leader_settings'], args)
+
+
+def leader_set(state, args):
+    if not state['leader']:
+        sys.stderr.write('ERROR cannot write leadership settings: '
+                         'cannot write settings: not the leader\n')
+        return 1
+    flags, positional = _split_flags(args)
+    for key, value in _settings(positional, flags).items():
+        if value in (None, ''):
+            state['leader_settings'].pop(key, None)
+        else:
+            state['leader_settings'][key] = str(value)
+    _save_state(state)
+
+
+def relation_ids(state, args):
+    flags, positional = _split_flags(args)
+    name = positional[0] if positional else os.environ.get('JUJU_RELATION')
+    return _output(sorted(rid for rid, rel in state['relations'].items()
+                          if rel['name'] == name), ['--format=json'])
+
+
+def relation_list(state, args):
+    flags, positional = _split_flags(args)
+    relation = state['relations'].get(_relation_id(flags))
+    if relation is None:
+        return _output([], ['--format=json'])
+    return _output(sorted(unit for unit in relation['units']
+                          if unit != state['unit']), ['--format=json'])
+
+
+def relation_get(state, args):
+    flags, positional = _split_flags(args)
+    relation = state['relations'].get(_relation_id(flags))
+    if relation is None:
+        sys.stderr.write('ERROR relation not found\n')
+        return 2
+    key = positional[0] if positional else '-'
+    if '--app' in flags:
+        data = relation['app'].get(
+            positional[1] if len(positional) > 1 else relation['remote_app'],
+            {})
+    else:
+        unit = (positional[1] if len(positional) > 1
+                else os.environ.get('JUJU_REMOTE_UNIT'))
+        data = relation['units'].get(unit, {})
+    if key == '-':
+        return _output(data, ['--format=json'])
+    return _output(data.get(key), ['--format=json'])
+
+
+def relation_set(state, args):
+    if '--help' in args:
+        print('usage: relation-set [options] key=value [key=value ...]\n'
+              '    --file  (= )\n'
+              '        file containing key-value pairs')
+        return
+    flags, positional = _split_flags(args)
+    rid = _relation_id(flags)
+    relation = state['relations'].get(rid)
+    if relation is None:
+        sys.stderr.write('ERROR relation not found\n')
+        return 2
+    if '--app' in flags:
+        data = relation['app'].setdefault(state['application'], {})
+    else:
+        data = relation['units'].setdefault(state['unit'], {})
+    settings = _settings(positional, flags)
+    previous = data.get('broker_req')
+    for key, value in settings.items():
+        if value in (None, ''):
+            data.pop(key, None)
+        else:
+            data[key] = str(value)
+    _save_state(state)
+    # Interfaces publish all their data on every flush, only a request that
+    # differs from the previous one reaches the monitors as a new request.
+    request = data.get('broker_req')
+    _log('relation-set', [], relation_id=rid, keys=sorted(settings),
+         broker_req=request if request != previous else None)
+
+
+def status_set(state, args):
+    flags, positional = _split_flags(args)
+    if '--application' in flags:
+        return
+    state['status'] = {'status': positional[0] if positional else '',
+                       'message': ' '.join(positional[1:])}
+    _save_state(state)
+
+
+def status_get(state, args):
+    status = state['status']
+    if '--include-data' in args:
+        return _output({'status': status['status'],
+                        'message': status['message'],
+                        'status-data': {}}, ['--format=json'])
+    return _output(status['status'], args)
+
+
+def network_get(state, args):
+    flags, positional = _split_flags(args)
+    if '--primary-address' in flags or '--ingress-address' in flags:
+        return _output(ADDRESS, args)
+    return _output({'bind-addresses': [{
+        'macaddress': '00:16:3e:00:00:01',
+        'interfacename': 'eth0',
+        'addresses': [{'address': ADDRESS, 'cidr': '10.0.0.0/24'}]}],
+        'egress-subnets': ['10.0.0.10/32'],
+        'ingress-addresses': [ADDRESS]}, ['--format=json'])
+
+
+def unit_get(state, args):
+    return _output(ADDRESS, args)
+
+
+def open_port(state, args):
+    flags, positional = _split_flags(args)
+    if positional and positional[0] not in state['ports']:
+        state['ports'].append(positional[0])
+        _save_state(state)
+
+
+def close_port(state, args):
+    flags, positional = _split_flags(args)
+    if positional and positional[0] in state['ports']:
+        state['ports'].remove(positional[0])
+        _save_state(state)
+
+
+def opened_ports(state, args):
+    return _output(state['ports'], args)
+
+
+def empty(state, args):
+    if '--format=json' in args or '--format' in args:
+        print('{}')
+
+
+def noop(state, args):
+    pass
+
+
+# Host commands
+
+def sudo(state, args):
+    flags = []
+    while args and args[0].startswith('-'):
+        flags.append(args.pop(0))
+    os.execvp(args[0], args)
+
+
+def systemctl(state, args):
+    flags, positional = _split_flags(args)
+    if not positional:
+        return
+    verb = positional[0]
+    if verb in ('is-active', 'is-enabled'):
+        print('active' if verb == 'is-active' else 'enabled')
+    elif verb == 'show':
+        print('ActiveState=active')
+
+
+def service(state, args):
+    if len(args) > 1 and args[1] == 'status':
+        print('{} start/running, process 1234'.format(args[0]))
+
+
+def ceph(state, args):
+    flags, positional = _split_flags(
+        args, with_value=('--conf', '-c', '--name', '-n', '--keyring', '-k',
+                          '--format', '--id', '-i', '--connect-timeout'))
+    if '--version' in flags or positional[:1] == ['version']:
+        print(CEPH_VERSION)
+        return
+    command = ' '.join(positional[:3])
+    responses = state['ceph']
+    for prefix in sorted(responses, key=len, reverse=True):
+        if command.startswith(prefix):
+            return _output(responses[prefix], [])
+    if flags.get('--format') == 'json':
+        print('{}')
+
+
+def ceph_authtool(state, args):
+    if args and not args[0].startswith('-'):
+        path = _sandbox_path(args[0])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'a') as f:
+            f.write('# {}\n'.format(' '.join(args[1:])))
+
+
+def dpkg_query(state, args):
+    flags, positional = _split_flags(args)
+    if '--list' in flags or '-l' in flags:
+        for package in positional:
+            print('ii  {}  {}  amd64  stand-in package'.format(
+                package, PACKAGE_VERSION))
+    elif '--show' in flags or '-W' in flags:
+        for package in positional:
+            print('{}\t{}'.format(package, PACKAGE_VERSION))
+
+
+def apt_cache(state, args):
+    flags, positional = _split_flags(args)
+    if positional[:1] == ['policy']:
+        for package in positional[1:]:
+            print('{}:\n  Installed: {}\n  Candidate: {}'.format(
+                package, PACKAGE_VERSION, PACKAGE_VERSION))
+
+
+def lsb_release(state, args):
+    print('jammy' if '-c' in args or '-cs' in args else 'Ubuntu 22.04 LTS')
+
+
+def sysctl(state, args):
+    flags, positional = _split_flags(args)
+    for arg in positional:
+        key, sep, value = arg.partition('=')
+        if not sep and key in state.get('sysctl', {}):
+            print('{} = {}'.format(key, state['sysctl'][key]))
+
+
+def systemd_run(state, args):
+    # Transient units are executed synchronously, which keeps the replay
+    # deterministic.
+    while args and args[0].startswith('-'):
+        args.pop(0)
+    if args:
+        os.execvp(args[0], args)
+
+
+HANDLERS = {
+    'action-fail': noop,
+    'action-get': empty,
+    'action-log': noop,
+    'action-set': noop,
+    'add-apt-repository': noop,
+    'application-version-set': noop,
+    'apt-cache': apt_cache,
+    'apt-get': noop,
+    'apt-key': noop,
+    'apt-mark': noop,
+    'ceph': ceph,
+    'ceph-authtool': ceph_authtool,
+    'close-port': close_port,
+    'config-get': config_get,
+    'dpkg': noop,
+    'dpkg-query': dpkg_query,
+    'goal-state': empty,
+    'is-leader': is_leader,
+    'juju-log': noop,
+    'leader-get': leader_get,
+    'leader-set': leader_set,
+    'lsb_release': lsb_release,
+    'network-get': network_get,
+    'open-port': open_port,
+    'opened-ports': opened_ports,
+    'relation-get': relation_get,
+    'relation-ids': relation_ids,
+    'relation-list': relation_list,
+    'relation-set': relation_set,
+    'service': service,
+    'status-get': status_get,
+    'status-set': status_set,
+    'storage-get': empty,
+    'storage-list': empty,
+    'sudo': sudo,
+    'sysctl': sysctl,
+    'systemctl': systemctl,
+    'systemd-run': systemd_run,
+    'unit-get': unit_get,
+}
+
+
+def main(argv):
+    tool, args = argv[1], argv[2:]
+    if tool != 'relation-set':
+        _log(tool, args)
+    return HANDLERS[tool](_load_state(), args)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,753 @@
+#!/usr/bin/env python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Replay sequences of hooks against the built charm and measure their cost.
+
+Every hook runs in its own process, as under Juju, with the real reactive
+handlers and charm class. Hook tools, systemctl, the package tools and the
+``ceph`` CLI are replaced by ``fake_juju.py`` and the ceph-mon side of the
+``ceph-mds`` relation is simulated between hooks. Files the charm writes
+below the system paths in ``SANDBOXED_PATHS`` end up in a temporary
+directory, so no Juju, Ceph or root access is needed.
+
+For every scenario the harness reports the wall time, the number of
+subprocesses spawned, the templates rendered, the broker requests sent and
+the service restarts issued. With ``--baseline`` it exits non-zero when a
+scenario got more expensive than recorded, see README.md for details.
+"""
+
+import argparse
+import collections
+import copy
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+import yaml
+
+import fake_juju
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_CHARM_DIR = os.path.join(HERE, os.pardir, 'build', 'builds',
+                                 'ceph-fs')
+
+SANDBOXED_PATHS = fake_juju.SANDBOXED_PATHS
+
+UNIT = 'ceph-fs/0'
+RELEASE_KEY = 'charmers.openstack-release-version'
+MAX_CONVERGE_ROUNDS = 10
+
+RESTART_VERBS = ('restart', 'try-restart', 'reload-or-restart', 'stop')
+METRICS = ('hooks', 'subprocesses', 'renders', 'broker_requests',
+           'restarts', 'errors')
+
+
+def default_ceph_responses(fsid):
+    """Canned output of the ``ceph`` commands issued by the charm."""
+    return {
+        'fs ls': [{'name': 'ceph-fs',
+                   'metadata_pool': 'ceph-fs_metadata',
+                   'data_pools': ['ceph-fs_data']}],
+        'fsid': fsid,
+        'mds stat': {'fsmap': {'epoch': 5, 'filesystems': []}},
+        'status': {'fsid': fsid, 'health': {'status': 'HEALTH_OK'}},
+        'health': {'status': 'HEALTH_OK', 'checks': {}},
+    }
+
+
+class Model(object):
+    """Model state shared with the fake hook tools through a JSON file."""
+
+    def __init__(self, root, charm_dir, config=None, leader=True):
+        self.path = os.path.join(root, 'state.json')
+        fsid = '6547bd3e-1397-11e2-82e5-53567c8d32dc'
+        with open(os.path.join(charm_dir, 'config.yaml')) as f:
+            options = yaml.safe_load(f).get('options', {})
+        state = {
+            'unit': UNIT,
+            'application': UNIT.split('/')[0],
+            'leader': leader,
+            'leader_settings': {},
+            'config': {name: option.get('default')
+                       for name, option in options.items()},
+            'relations': {},
+            'status': {'status': 'unknown', 'message': ''},
+            'ports': [],
+            'ceph': default_ceph_responses(fsid),
+            'fsid': fsid,
+        }
+        state['config'].update(config or {})
+        self.save(state)
+
+    def load(self):
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, state):
+        with open(self.path, 'w') as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+
+    def update(self, func):
+        state = self.load()
+        func(state)
+        self.save(state)
+
+
+class CephMon(object):
+    """Simulates the ceph-mon side of the ceph-mds relation.
+
+    Between hooks the monitor publishes the cluster details once the MDS
+    announced its name and answers every new broker request, which is what
+    lets a sequence of relation hooks converge.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def respond(self):
+        """Publish monitor data for the local unit's latest settings.
+
+        :returns: (relation id, remote unit) pairs whose data changed.
+        :rtype: List[Tuple[str, str]]
+        """
+        changed = []
+
+        def _respond(state):
+            for rid, relation in state['relations'].items():
+                if relation['name'] != 'ceph-mds':
+                    continue
+                local = relation['units'].get(state['unit'], {})
+                for unit, data in relation['units'].items():
+                    if unit == state['unit']:
+                        continue
+                    before = dict(data)
+                    self._publish(state, local, data)
+                    if data != before:
+                        changed.append((rid, unit))
+
+        self.model.update(_respond)
+        return changed
+
+    @staticmethod
+    def _publish(state, local, data):
+        mds_name = local.get('mds-name')
+        if mds_name:
+            data.update({
+                'fsid': state['fsid'],
+                'auth': 'cephx',
+                'ceph-public-address': '10.0.0.{}'.format(
+                    20 + len(data) % 200),
+                '{}_mds_key'.format(mds_name):
+                    'AQCEHRVeAAAAABAAzkXWDKGcPt4X4lrFDxpLwg==',
+            })
+        request = local.get('broker_req')
+        if request:
+            request_id = json.loads(request).get('request-id')
+            key = 'broker-rsp-{}'.format(state['unit'].replace('/', '-'))
+            response = json.loads(data.get(key, '{}'))
+            if response.get('request-id') != request_id:
+                data[key] = json.dumps({'exit-code': 0,
+                                        'request-id': request_id})
+
+
+class Sandbox(object):
+    """Temporary charm directory, unit state and fake tools for a replay."""
+
+    def __init__(self, charm_dir, python, config=None):
+        self.root = tempfile.mkdtemp(prefix='hook-replay-')
+        self.charm_dir = os.path.join(self.root, 'charm')
+        shutil.copytree(charm_dir, self.charm_dir, symlinks=True,
+                        ignore=shutil.ignore_patterns(
+                            '.venv', 'wheelhouse', 'unit_tests', 'tests',
+                            '.unit-state.db', '.juju-persistent-config'))
+        self.bin_dir = os.path.join(self.root, 'bin')
+        os.mkdir(self.bin_dir)
+        tool = os.path.join(HERE, 'fake_juju.py')
+        for name in fake_juju.TOOLS:
+            path = os.path.join(self.bin_dir, name)
+            with open(path, 'w') as f:
+                f.write('#!/bin/sh\nexec "{}" "{}" {} "$@"\n'.format(
+                    sys.executable, tool, name))
+            os.chmod(path, 0o755)
+        self.log = os.path.join(self.root, 'tools.jsonl')
+        self.metrics = os.path.join(self.root, 'metrics.jsonl')
+        self.python = python
+        self.model = Model(self.root, self.charm_dir, config=config)
+        self.mon = CephMon(self.model)
+        self.next_relation_id = 1
+        self._seed_unit_state()
+
+    def cleanup(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def _seed_unit_state(self):
+        # The release is normally recorded when the charm is installed, by
+        # querying the package manager. Seeding it keeps the replay
+        # independent from the host packages.
+        self.run_python(
+            'from charmhelpers.core import unitdata\n'
+            'kv = unitdata.kv()\n'
+            'kv.set({!r}, {!r})\n'
+            'kv.flush()\n'.format(RELEASE_KEY, self.release))
+
+    @property
+    def release(self):
+        return os.environ.get('BENCH_RELEASE', 'ussuri')
+
+    def environment(self, hook, relation_id=None, remote_unit=None,
+                    departing_unit=None):
+        env = dict(os.environ)
+        env.update({
+            'PATH': os.pathsep.join([self.bin_dir, env.get('PATH', '')]),
+            'PYTHONPATH': os.pathsep.join([
+                HERE, os.path.join(self.charm_dir, 'lib')]),
+            'CHARM_DIR': self.charm_dir,
+            'JUJU_CHARM_DIR': self.charm_dir,
+            'UNIT_STATE_DB': os.path.join(self.root, 'unit-state.db'),
+            'JUJU_UNIT_NAME': UNIT,
+            'JUJU_MODEL_NAME': 'hook-replay',
+            'JUJU_HOOK_NAME': hook,
+            'JUJU_VERSION': '3.1.6',
+            'JUJU_AVAILABILITY_ZONE': '',
+            'BENCH_ROOT': self.root,
+            'BENCH_STATE': self.model.path,
+            'BENCH_LOG': self.log,
+            'BENCH_METRICS': self.metrics,
+        })
+        for key in ('JUJU_RELATION', 'JUJU_RELATION_ID', 'JUJU_REMOTE_UNIT',
+                    'JUJU_REMOTE_APP', 'JUJU_DEPARTING_UNIT'):
+            env.pop(key, None)
+        if relation_id:
+            env['JUJU_RELATION'] = relation_id.split(':')[0]
+            env['JUJU_RELATION_ID'] = relation_id
+        if remote_unit:
+            env['JUJU_REMOTE_UNIT'] = remote_unit
+            env['JUJU_REMOTE_APP'] = remote_unit.split('/')[0]
+        if departing_unit:
+            env['JUJU_DEPARTING_UNIT'] = departing_unit
+        return env
+
+    def run_python(self, code):
+        subprocess.check_call([self.python, '-c', code],
+                              env=self.environment('install'),
+                              cwd=self.charm_dir)
+
+    def run_hook(self, hook, relation_id=None, remote_unit=None,
+                 departing_unit=None):
+        """Run one hook in a new process.
+
+        :returns: Wall time of the hook in seconds.
+        :rtype: float
+        """
+        env = self.environment(hook, relation_id, remote_unit,
+                               departing_unit)
+        start = time.monotonic()
+        subprocess.call([self.python, os.path.abspath(__file__),
+                         '--exec-hook', hook], env=env, cwd=self.charm_dir)
+        return time.monotonic() - start
+
+    # Model changes
+
+    def add_relation(self, name, remote_app, units=1):
+        rid = '{}:{}'.format(name, self.next_relation_id)
+        self.next_relation_id += 1
+
+        def _add(state):
+            state['relations'][rid] = {
+                'name': name,
+                'remote_app': remote_app,
+                'units': {state['unit']: {
+                    'private-address': fake_juju.ADDRESS,
+                    'ingress-address': fake_juju.ADDRESS,
+                    'egress-subnets': '10.0.0.10/32'}},
+                'app': {},
+            }
+        self.model.update(_add)
+        return rid
+
+    def add_unit(self, rid, unit):
+        def _add(state):
+            state['relations'][rid]['units'][unit] = {
+                'private-address': '10.0.0.{}'.format(
+                    20 + int(unit.split('/')[1]))}
+        self.model.update(_add)
+
+    def remove_unit(self, rid, unit):
+        self.model.update(
+            lambda state: state['relations'][rid]['units'].pop(unit))
+
+    def remove_relation(self, rid):
+        self.model.update(lambda state: state['relations'].pop(rid))
+
+    def set_config(self, **options):
+        self.model.update(lambda state: state['config'].update(options))
+
+    def set_leader(self, leader):
+        self.model.update(lambda state: state.update(leader=leader))
+
+    def set_leader_settings(self, **settings):
+        self.model.update(
+            lambda state: state['leader_settings'].update(settings))
+
+
+class Replay(object):
+    """Runs the steps of a scenario and accumulates their cost."""
+
+    def __init__(self, sandbox):
+        self.sandbox = sandbox
+        self.measuring = False
+        self.hooks = []
+        self.wall_time = 0.0
+
+    def hook(self, hook, relation_id=None, remote_unit=None,
+             departing_unit=None):
+        elapsed = self.sandbox.run_hook(hook, relation_id, remote_unit,
+                                        departing_unit)
+        if self.measuring:
+            self.wall_time += elapsed
+            self.hooks.append(hook)
+
+    def converge(self):
+        """Let the simulated monitors answer until nothing changes."""
+        for _ in range(MAX_CONVERGE_ROUNDS):
+            changed = self.sandbox.mon.respond()
+            if not changed:
+                return
+            for rid, unit in changed:
+                self.hook('{}-relation-changed'.format(rid.split(':')[0]),
+                          rid, unit)
+
+    def relate_ceph_mon(self, units=1):
+        rid = self.sandbox.add_relation('ceph-mds', 'ceph-mon')
+        self.hook('ceph-mds-relation-created', rid)
+        for i in range(units):
+            self.join(rid, 'ceph-mon/{}'.format(i))
+        return rid
+
+    def join(self, rid, unit):
+        self.sandbox.add_unit(rid, unit)
+        self.hook('ceph-mds-relation-joined', rid, unit)
+        self.hook('ceph-mds-relation-changed', rid, unit)
+        self.converge()
+
+    def depart(self, rid, unit):
+        self.sandbox.remove_unit(rid, unit)
+        self.hook('ceph-mds-relation-departed', rid, unit,
+                  departing_unit=unit)
+
+    def deploy(self, leader=True):
+        """Deploy the unit and relate it to the monitors.
+
+        A unit that is not the leader gets the leader settings of a leader
+        that already created the pools.
+        """
+        self.sandbox.set_leader(leader)
+        hooks = ('install', 'leader-elected' if leader else
+                 'leader-settings-changed', 'config-changed', 'start')
+        for hook in hooks:
+            self.hook(hook)
+        rid = self.relate_ceph_mon()
+        if not leader:
+            self.sandbox.set_leader_settings(**{'pools-ready': 'True'})
+            self.hook('leader-settings-changed')
+        return rid
+
+    def start(self):
+        """Start measuring, steps before this call only set the scene."""
+        self.measuring = True
+        start = self._read_lines(self.sandbox.log)
+        metrics = self._read_lines(self.sandbox.metrics)
+        self._offsets = (len(start), len(metrics))
+
+    @staticmethod
+    def _read_lines(path):
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def result(self):
+        tools = self._read_lines(self.sandbox.log)[self._offsets[0]:]
+        metrics = self._read_lines(self.sandbox.metrics)[self._offsets[1]:]
+        restarts = 0
+        for entry in tools:
+            args = [a for a in entry['args'] if not a.startswith('-')]
+            if entry['tool'] == 'systemctl' and args[:1] and \
+                    args[0] in RESTART_VERBS:
+                restarts += 1
+            elif entry['tool'] == 'service' and len(args) > 1 and \
+                    args[1] in RESTART_VERBS:
+                restarts += 1
+        commands = collections.Counter(entry['tool'] for entry in tools)
+        state = self.sandbox.model.load()
+        return {
+            'wall_time': round(self.wall_time, 3),
+            'hooks': len(self.hooks),
+            'subprocesses': sum(m['subprocesses'] for m in metrics),
+            'renders': sum(m['renders'] for m in metrics),
+            'broker_requests': sum(1 for entry in tools
+                                   if entry.get('broker_req')),
+            'restarts': restarts,
+            'errors': sum(1 for m in metrics if m['error']),
+            'commands': dict(sorted(commands.items())),
+            'failed_hooks': [{'hook': m['hook'], 'error': m['error']}
+                             for m in metrics if m['error']],
+            'status': '{status}: {message}'.format(**state['status']),
+        }
+
+
+# Scenarios. Each one sets the scene, calls replay.start() and then runs
+# the measured sequence of hooks.
+
+def scenario_deploy(replay):
+    """Fresh unit: install, config and relation to a single monitor."""
+    replay.start()
+    replay.deploy()
+
+
+def scenario_follower_deploy(replay):
+    """Fresh unit joining while another unit is the leader."""
+    replay.start()
+    replay.deploy(leader=False)
+
+
+def scenario_leader_change(replay):
+    """Converged follower taking over the leadership."""
+    replay.deploy(leader=False)
+    replay.start()
+    replay.sandbox.set_leader(True)
+    replay.hook('leader-elected')
+    replay.converge()
+
+
+def scenario_update_status(replay):
+    """Ten update-status hooks on a converged unit."""
+    replay.deploy()
+    replay.start()
+    for _ in range(10):
+        replay.hook('update-status')
+
+
+def scenario_config_change(replay):
+    """Tuning option changes on a converged unit."""
+    replay.deploy()
+    replay.start()
+    for options in ({'mds-cache-memory-limit': '8Gi'},
+                    {'mds-cache-reservation': 0.1},
+                    {'loglevel': 5}):
+        replay.sandbox.set_config(**options)
+        replay.hook('config-changed')
+        replay.converge()
+
+
+def scenario_relation_churn(replay):
+    """Monitors joining and leaving an established relation."""
+    rid = replay.deploy()
+    replay.start()
+    replay.join(rid, 'ceph-mon/1')
+    replay.join(rid, 'ceph-mon/2')
+    replay.depart(rid, 'ceph-mon/1')
+    replay.hook('update-status')
+
+
+def scenario_upgrade_charm(replay):
+    """Charm upgrade of a converged unit."""
+    replay.deploy()
+    replay.start()
+    replay.hook('upgrade-charm')
+    replay.hook('config-changed')
+    replay.converge()
+
+
+SCENARIOS = collections.OrderedDict([
+    ('deploy', scenario_deploy),
+    ('follower-deploy', scenario_follower_deploy),
+    ('leader-change', scenario_leader_change),
+    ('update-status', scenario_update_status),
+    ('config-change', scenario_config_change),
+    ('relation-churn', scenario_relation_churn),
+    ('upgrade-charm', scenario_upgrade_charm),
+])
+
+
+def run_scenario(name, charm_dir, python, keep=False):
+    sandbox = Sandbox(charm_dir, python)
+    try:
+        replay = Replay(sandbox)
+        SCENARIOS[name](replay)
+        result = replay.result()
+        if keep:
+            result['sandbox'] = sandbox.root
+        return result
+    finally:
+        if not keep:
+            sandbox.cleanup()
+
+
+# Hook process. Installs the sandbox and the counters, then runs the charm's
+# hook script exactly as Juju would, minus the dependency bootstrap.
+
+def _sandbox_path(path):
+    root = os.environ['BENCH_ROOT']
+    if isinstance(path, bytes) or not isinstance(path, (str, os.PathLike)):
+        return path
+    value = os.fspath(path)
+    if not value.startswith(root):
+        for prefix in SANDBOXED_PATHS:
+            if value == prefix or value.startswith(prefix + '/'):
+                return root + value
+    return path
+
+
+def _redirect(func, positions=(0,)):
+    def wrapper(*args, **kwargs):
+        args = list(args)
+        for i in positions:
+            if i < len(args):
+                args[i] = _sandbox_path(args[i])
+        return func(*args, **kwargs)
+    return wrapper
+
+
+def _ignore_permissions(func):
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except PermissionError:
+            pass
+    return wrapper
+
+
+def _any_user(func, fallback):
+    def wrapper(name):
+        try:
+            return func(name)
+        except KeyError:
+            return fallback()
+    return wrapper
+
+
+def install_sandbox():
+    """Redirect file access below SANDBOXED_PATHS to the sandbox."""
+    import builtins
+    import grp
+    import io
+    import pwd
+
+    builtins.open = io.open = _redirect(builtins.open)
+    for name in ('chmod', 'listdir', 'lstat', 'makedirs', 'mkdir', 'open',
+                 'readlink', 'remove', 'rmdir', 'stat', 'unlink'):
+        setattr(os, name, _redirect(getattr(os, name)))
+    for name in ('rename', 'replace', 'symlink'):
+        setattr(os, name, _redirect(getattr(os, name), positions=(0, 1)))
+    for name in ('chown', 'lchown'):
+        setattr(os, name, _ignore_permissions(
+            _redirect(getattr(os, name))))
+    os.fchown = _ignore_permissions(os.fchown)
+    for name in ('exists', 'isdir', 'isfile', 'islink', 'lexists',
+                 'getmtime', 'getsize'):
+        setattr(os.path, name, _redirect(getattr(os.path, name)))
+    shutil.chown = _ignore_permissions(_redirect(shutil.chown))
+    shutil.copy = _redirect(shutil.copy, positions=(0, 1))
+    shutil.copyfile = _redirect(shutil.copyfile, positions=(0, 1))
+    shutil.rmtree = _redirect(shutil.rmtree)
+    pwd.getpwnam = _any_user(pwd.getpwnam,
+                             lambda: pwd.getpwuid(os.getuid()))
+    grp.getgrnam = _any_user(grp.getgrnam,
+                             lambda: grp.getgrgid(os.getgid()))
+    # The charm pins the hostname of the MDS, keep it stable across hosts.
+    socket.gethostname = lambda: 'juju-replay-0'
+    try:
+        from charmhelpers import osplatform
+    except ImportError:
+        return
+    # Let the charm helpers take their Ubuntu code paths on any distro.
+    osplatform.get_platform = lambda: 'ubuntu'
+
+
+def install_counters(counters):
+    popen_init = subprocess.Popen.__init__
+
+    def _popen_init(self, *args, **kwargs):
+        counters['subprocesses'] += 1
+        return popen_init(self, *args, **kwargs)
+    subprocess.Popen.__init__ = _popen_init
+
+    try:
+        import jinja2
+    except ImportError:
+        return
+    template_render = jinja2.Template.render
+
+    def _render(self, *args, **kwargs):
+        counters['renders'] += 1
+        return template_render(self, *args, **kwargs)
+    jinja2.Template.render = _render
+
+
+def exec_hook(hook):
+    counters = {'subprocesses': 0, 'renders': 0}
+    error = None
+    hook_path = os.path.join(os.environ['CHARM_DIR'], 'hooks', hook)
+    sys.path.insert(0, os.path.join(os.environ['CHARM_DIR'], 'lib'))
+    install_sandbox()
+    install_counters(counters)
+    sys.argv = [hook_path]
+    try:
+        try:
+            from charms.layer import basic
+        except ImportError:
+            pass
+        else:
+            # Dependencies come from the interpreter running the harness.
+            basic.bootstrap_charm_deps = lambda: None
+        if os.path.exists(hook_path):
+            import runpy
+            runpy.run_path(hook_path, run_name='__main__')
+        else:
+            from charms.reactive import main
+            main()
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = 'exit status {}'.format(e.code)
+    except Exception:
+        error = traceback.format_exc()
+    with open(os.environ['BENCH_METRICS'], 'a') as f:
+        f.write(json.dumps(dict(counters, hook=hook, error=error)) + '\n')
+    return 1 if error else 0
+
+
+# Reporting
+
+def compare(results, baseline, tolerance):
+    """Find the metrics that regressed against a baseline.
+
+    Counts must not grow at all, the wall time may grow by ``tolerance``.
+
+    :returns: Human readable regressions.
+    :rtype: List[str]
+    """
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric in METRICS:
+            if result[metric] > reference.get(metric, 0):
+                regressions.append('{}: {} went from {} to {}'.format(
+                    name, metric, reference.get(metric, 0), result[metric]))
+        limit = reference.get('wall_time', 0) * (1 + tolerance)
+        if reference.get('wall_time') and result['wall_time'] > limit:
+            regressions.append('{}: wall_time went from {:.3f}s to {:.3f}s '
+                               '(tolerance {:.0%})'.format(
+                                   name, reference['wall_time'],
+                                   result['wall_time'], tolerance))
+    return regressions
+
+
+def format_table(results):
+    columns = ('wall_time',) + METRICS
+    width = max(len(name) for name in results) + 2
+    lines = ['{:<{}}'.format('scenario', width) +
+             ''.join('{:>17}'.format(c) for c in columns)]
+    for name, result in results.items():
+        lines.append('{:<{}}'.format(name, width) + ''.join(
+            '{:>17}'.format('{:.3f}s'.format(result[c]) if c == 'wall_time'
+                            else result[c]) for c in columns))
+    for name, result in results.items():
+        for failure in result['failed_hooks']:
+            lines.append('\n{} failed in {}:\n{}'.format(
+                name, failure['hook'], failure['error']))
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--exec-hook', help=argparse.SUPPRESS)
+    parser.add_argument('--charm-dir', default=DEFAULT_CHARM_DIR,
+                        help='Built charm to replay the hooks of '
+                             '(default: %(default)s).')
+    parser.add_argument('--python', default=sys.executable,
+                        help='Interpreter with the charm dependencies '
+                             'installed (default: %(default)s).')
+    parser.add_argument('--scenario', action='append',
+                        choices=list(SCENARIOS),
+                        help='Scenario to run, may be repeated '
+                             '(default: all).')
+    parser.add_argument('--repeat', type=int, default=1,
+                        help='Run every scenario this many times and keep '
+                             'the fastest wall time.')
+    parser.add_argument('--json', action='store_true',
+                        help='Print the results as JSON.')
+    parser.add_argument('--baseline',
+                        help='Fail if a scenario regressed against the '
+                             'results stored in this file.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed relative wall time increase over the '
+                             'baseline (default: %(default)s).')
+    parser.add_argument('--write-baseline',
+                        help='Store the results in this file.')
+    parser.add_argument('--keep', action='store_true',
+                        help='Keep the sandboxes for inspection.')
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if args.exec_hook:
+        return exec_hook(args.exec_hook)
+    charm_dir = os.path.abspath(args.charm_dir)
+    if not os.path.exists(os.path.join(charm_dir, 'metadata.yaml')):
+        sys.stderr.write('{} is not a built charm, run "tox -e '
+                         'build-reactive" first\n'.format(charm_dir))
+        return 2
+    results = collections.OrderedDict()
+    for name in args.scenario or SCENARIOS:
+        runs = [run_scenario(name, charm_dir, args.python, keep=args.keep)
+                for _ in range(max(1, args.repeat))]
+        result = copy.deepcopy(runs[0])
+        result['wall_time'] = min(run['wall_time'] for run in runs)
+        results[name] = result
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(format_table(results))
+    if args.write_baseline:
+        with open(args.write_baseline, 'w') as f:
+            json.dump({name: {metric: result[metric]
+                              for metric in ('wall_time',) + METRICS}
+                       for name, result in results.items()},
+                      f, indent=2, sort_keys=True)
+            f.write('\n')
+    status = 1 if any(r['errors'] for r in results.values()) else 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            sys.stderr.write('REGRESSION {}\n'.format(regression))
+        if regressions:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
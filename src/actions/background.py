@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, charm_dir, config, service_name)
+from charm.openstack import ceph_cli, jobs
+
+
+def action_log(message):
+    """Log a progress message of the running action.
+
+    :type message: str
+    """
+    subprocess.call(['action-log', message])
+
+
+def start_job(kind, params):
+    """Run an operation as a background job and report the job started.
+
+    :param kind: Operation, one of ``jobs.KINDS``.
+    :type kind: str
+    :param params: Keyword arguments of the operation.
+    :type params: Dict[str, Any]
+    """
+    try:
+        job = jobs.start(kind, service_name(), params,
+                         lib_dir=os.path.join(charm_dir(), 'lib'),
+                         max_jobs=config('max-jobs') or None)
+    except ValueError as e:
+        action_fail(str(e))
+        return
+    except subprocess.CalledProcessError as e:
+        action_fail('Unable to start the job: {}'.format(
+            ceph_cli.command_error(e)))
+        return
+    action_set({'job': job['id'], 'unit': job['unit']})
+
+
+def _summary(job):
+    return {key: job.get(key) for key in (
+        'id', 'kind', 'state', 'created', 'started', 'finished', 'progress',
+        'error')}
+
+
+def _job(args):
+    job = jobs.load(action_get('job'))
+    if not job:
+        raise ValueError('There is no job {}'.format(action_get('job')))
+    return jobs.refresh(job)
+
+
+def job_status(args):
+    if action_get('job'):
+        job = _job(args)
+        status = dict(_summary(job), params=job['params'], log=job['log'])
+        action_set({'state': job['state'],
+                    'status': json.dumps(status, indent=2)})
+        return
+    action_set({'jobs': json.dumps([_summary(job) for job in
+                                    jobs.list_jobs()], indent=2)})
+
+
+def job_cancel(args):
+    job = jobs.cancel(action_get('job'))
+    action_set({'state': job['state']})
+
+
+def job_result(args):
+    job = _job(args)
+    if job['state'] not in jobs.FINISHED:
+        raise ValueError('Job {} is still running: {}'.format(
+            job['id'], job['progress'] or 'no progress yet'))
+    if job['state'] == 'failed':
+        action_fail('Job {} failed: {}'.format(job['id'], job['error']))
+        return
+    action_set({'state': job['state'],
+                'result': json.dumps(job['result'], indent=2)})
+
+
+ACTIONS = {
+    'job-cancel': job_cancel,
+    'job-result': job_result,
+    'job-status': job_status,
+}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        return "Action {} undefined".format(action_name)
+    try:
+        action(args)
+    except subprocess.CalledProcessError as e:
+        action_fail(ceph_cli.command_error(e))
+    except ValueError as e:
+        action_fail(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import functools
+import json
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, service_name)
+from charm.openstack import bulk_delete, cephfs_client
+from charm.openstack.utils import fs_path
+from background import action_log, start_job
+
+
+def delete_tree():
+    fs_name = service_name()
+    resume = action_get('resume')
+    directory = action_get('directory')
+    if not resume and not directory:
+        action_fail('A directory is required unless resuming')
+        return
+    params = {
+        'root': fs_path(directory) if directory else None,
+        'workers': action_get('workers'),
+        'rate': action_get('rate') or None,
+        'max_queue': action_get('max-purge-queue') or None,
+        'time_limit': action_get('time-limit'),
+        'resume': resume,
+    }
+    if action_get('background'):
+        # Jobs run until they complete or are cancelled.
+        start_job('delete-tree', dict(params, time_limit=None))
+        return
+    try:
+        with cephfs_client.connect(fs_name) as fs:
+            result = bulk_delete.delete(
+                fs, queue_length=functools.partial(
+                    bulk_delete.purge_queue_length, fs_name),
+                on_progress=action_log, **params)
+    except ValueError as err:
+        action_fail(str(err))
+        return
+    except cephfs_client.Error as err:
+        action_fail("Unable to delete the tree: {}".format(err))
+        return
+    action_set({'complete': result['complete'],
+                'scanned': result['scanned'],
+                'unlinked': result['unlinked'],
+                'removed': result['removed'],
+                'pending': result['pending'],
+                'paused': result['paused'],
+                'rate': result['rate'],
+                'failed': json.dumps(result['failed'], indent=2)})
+
+
+if __name__ == '__main__':
+    delete_tree()
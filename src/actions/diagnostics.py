@@ -0,0 +1,182 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, config, service_name)
+import charms_openstack.bus
+import charms_openstack.charm as charm
+from charm.openstack import (
+    ceph_cli, cephfs_client, client_stats, dirfrags, maintenance, mds_cache,
+    metadata_bench, slow_ops)
+from charm.openstack.utils import (
+    format_size, fs_path, fs_paths, parse_size)
+from background import action_log
+
+charms_openstack.bus.discover()
+
+
+def _mds_cache():
+    with charm.provide_charm_instance() as cephfs_charm:
+        return cephfs_charm.get_mds_cache()
+
+
+def slow_ops_report(args):
+    report = slow_ops.analyse(slow_ops.collect(),
+                              depth=action_get('depth'),
+                              top=action_get('top'),
+                              min_duration=action_get('min-duration'))
+    action_set({'ops': report['ops'],
+                'blocked': report['blocked'],
+                'report': json.dumps(report, indent=2)})
+
+
+def cache_status(args):
+    action_set(mds_cache.cache_status(_mds_cache()))
+
+
+def cache_plan(args):
+    with cephfs_client.connect(service_name()) as fs:
+        files = int(cephfs_client.get_xattr(fs, '/', 'ceph.dir.rfiles'))
+        directories = int(cephfs_client.get_xattr(fs, '/',
+                                                  'ceph.dir.rsubdirs'))
+    sessions = mds_cache.session_totals(service_name())
+    measured = mds_cache.measure_inode_size()
+    result = mds_cache.plan(
+        _mds_cache(), files, directories, sessions['sessions'],
+        sessions['caps'], bytes_per_inode=measured['bytes-per-inode'],
+        rss_ratio=measured['rss-ratio'],
+        hot_fraction=action_get('hot-fraction'),
+        headroom=action_get('headroom'),
+        max_cache_per_mds=parse_size(action_get('max-cache-per-mds')))
+    recommended = result['recommended']
+    action_set({'mds-cache-memory-limit':
+                recommended['mds-cache-memory-limit'],
+                'mds-cache-reservation': recommended['mds-cache-reservation'],
+                'max-mds': recommended['max-mds'],
+                'memory-per-unit': result['memory-per-unit'],
+                'units': result['units'],
+                'report': json.dumps(result, indent=2)})
+
+
+def drop_cache(args):
+    if action_get('target-size'):
+        target = parse_size(action_get('target-size'))
+    else:
+        target = mds_cache.cache_limits(_mds_cache())['target']
+    if maintenance.postpone(config('maintenance-window'), 'drop-cache',
+                            {'timeout': action_get('timeout'),
+                             'target': target}):
+        action_set({'deferred': 'Queued for the maintenance window'})
+        return
+    result = mds_cache.drop_cache(action_get('timeout'), target,
+                                  progress=action_log,
+                                  interval=action_get('interval'))
+    action_set({key: json.dumps(value) if isinstance(value, dict) else value
+                for key, value in result.items() if value is not None})
+    if not result['target-reached']:
+        action_fail('Cache at {} after the drop, above the target of '
+                    '{}'.format(result['after']['bytes'],
+                                format_size(target)))
+
+
+def directory_hotspots(args):
+    with cephfs_client.connect(service_name()) as fs:
+        report = dirfrags.report(
+            fs, fs_paths(action_get('paths') or '/'),
+            depth=action_get('depth'), top=action_get('top'),
+            warn_ratio=action_get('warn-ratio'))
+    flagged = [d['path'] for d in report['directories'] if d['warnings']]
+    action_set({'scanned': report['scanned'],
+                'flagged': json.dumps(flagged),
+                'report': json.dumps(report, indent=2)})
+
+
+def fragment_directories(args):
+    results = {}
+    for path in fs_paths(action_get('directories')):
+        results[path] = dirfrags.fragment_directory(
+            path, action_get('fragments'))
+    action_set({'results': json.dumps(results)})
+
+
+def client_top(args):
+    rows = client_stats.top(service_name(),
+                            interval=action_get('interval'),
+                            client=action_get('client') or None,
+                            root=action_get('root') or None,
+                            sort=action_get('sort'),
+                            limit=action_get('limit'))
+    action_set({'clients': len(rows),
+                'table': client_stats.format_table(rows),
+                'report': json.dumps(rows, indent=2)})
+
+
+def metadata_benchmark(args):
+    directory = action_get('directory')
+    if not action_get('local'):
+        directory = fs_path(directory)
+    report = metadata_bench.run(
+        directory, phases=action_get('phases'),
+        workers=action_get('workers'), files=action_get('files'),
+        files_per_directory=action_get('files-per-directory'),
+        file_size=action_get('file-size'),
+        filesystem=None if action_get('local') else service_name())
+    results = {'report': json.dumps(report, indent=2)}
+    for phase, summary in report['phases'].items():
+        results[phase] = '{:.0f} ops/s, p99 {:.3f}ms'.format(
+            summary['ops-per-second'], summary['latency-ms']['p99'])
+    action_set(results)
+
+
+ACTIONS = {
+    'cache-plan': cache_plan,
+    'cache-status': cache_status,
+    'client-top': client_top,
+    'directory-hotspots': directory_hotspots,
+    'drop-cache': drop_cache,
+    'fragment-directories': fragment_directories,
+    'metadata-bench': metadata_benchmark,
+    'slow-ops': slow_ops_report,
+}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        return "Action {} undefined".format(action_name)
+    try:
+        action(args)
+    except subprocess.CalledProcessError as e:
+        action_fail(ceph_cli.command_error(e))
+    except (subprocess.TimeoutExpired, ValueError) as e:
+        action_fail(str(e))
+    except cephfs_client.Error as e:
+        action_fail('CephFS error: {}'.format(e))
+    except metadata_bench.Error as e:
+        action_fail(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
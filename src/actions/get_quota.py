@@ -13,9 +13,14 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import os
-from charmhelpers.core.hookenv import action_get, action_fail, action_set
-import xattr
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, service_name)
+from charm.openstack import cephfs_client
+from charm.openstack.utils import fs_paths
 
 __author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
 
@@ -23,22 +28,30 @@ __author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
 def get_quota():
     max_files = action_get('max-files')
     max_bytes = action_get('max-bytes')
-    directory = action_get('directory')
+    directories = fs_paths(
+        action_get('directories') or action_get('directory'))
+    if not directories:
+        action_fail('A directory or directories are required')
+        return
 
-    if not os.path.exists(directory):
-        action_fail("Directory must exist before setting quota")
     attr = "ceph.quota.{}"
     if max_files:
         attr = attr.format("max_files")
     elif max_bytes:
         attr = attr.format("max_bytes")
 
+    results = {}
+    directory = None
     try:
-        quota_value = xattr.getxattr(directory, attr)
-        action_set({'{} quota'.format(directory): quota_value})
-    except IOError as err:
+        with cephfs_client.connect(service_name()) as fs:
+            for directory in directories:
+                quota_value = cephfs_client.get_xattr(fs, directory, attr)
+                results['{} quota'.format(directory)] = quota_value
+    except cephfs_client.Error as err:
         action_fail(
             "Unable to get xattr on {}.  Error: {}".format(directory, err))
+        return
+    action_set(results)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,65 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, service_name)
+from charm.openstack import cephfs_client, quotas
+from charm.openstack.utils import fs_paths
+from background import action_log, start_job
+
+
+def list_quotas():
+    max_depth = action_get('max-depth')
+    params = {
+        'roots': fs_paths(
+            action_get('directories') or action_get('directory')),
+        'workers': action_get('workers'),
+        'max_depth': max_depth if max_depth >= 0 else None,
+        'exclude': action_get('exclude') or [],
+        'batch_size': action_get('batch-size'),
+        'time_limit': action_get('time-limit'),
+        'resume': action_get('resume'),
+    }
+    if action_get('background'):
+        # Jobs run until they complete or are cancelled.
+        start_job('list-quotas', dict(params, time_limit=None))
+        return
+    try:
+        with cephfs_client.connect(service_name()) as fs:
+            result = quotas.list_quotas(
+                fs, on_batch=lambda batch: action_log(json.dumps(batch)),
+                **params)
+    except ValueError as err:
+        action_fail(str(err))
+        return
+    except cephfs_client.Error as err:
+        action_fail("Unable to list quotas: {}".format(err))
+        return
+    action_set({'complete': result['complete'],
+                'scanned': result['scanned'],
+                'found': result['found'],
+                'pending': result['pending'],
+                'failed': json.dumps(result['failed'], indent=2),
+                'quotas': json.dumps(result['quotas'], indent=2),
+                'output': result['output']})
+
+
+if __name__ == '__main__':
+    list_quotas()
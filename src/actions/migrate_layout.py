@@ -0,0 +1,68 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import json
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, service_name)
+from charm.openstack import cephfs_client, layout_migration
+from charm.openstack.utils import fs_path, parse_size
+from background import action_log, start_job
+
+
+def migrate_layout():
+    try:
+        params = {
+            'root': fs_path(action_get('directory')),
+            'pool': action_get('pool'),
+            'workers': action_get('workers'),
+            'bandwidth': parse_size(action_get('bandwidth') or 0) or None,
+            'exclude': action_get('exclude') or [],
+            'time_limit': action_get('time-limit'),
+            'resume': action_get('resume'),
+        }
+    except ValueError as err:
+        action_fail(str(err))
+        return
+    if action_get('background'):
+        # Jobs run until they complete or are cancelled.
+        start_job('migrate-layout', dict(params, time_limit=None))
+        return
+    try:
+        with cephfs_client.connect(service_name()) as fs:
+            result = layout_migration.migrate(fs, on_progress=action_log,
+                                              **params)
+    except ValueError as err:
+        action_fail(str(err))
+        return
+    except cephfs_client.Error as err:
+        action_fail("Unable to migrate the layout: {}".format(err))
+        return
+    action_set({'complete': result['complete'],
+                'scanned': result['scanned'],
+                'migrated': result['migrated'],
+                'linked': result['linked'],
+                'skipped': result['skipped'],
+                'bytes': result['bytes'],
+                'pending': result['pending'],
+                'throughput': result['throughput'],
+                'failed': json.dumps(result['failed'], indent=2)})
+
+
+if __name__ == '__main__':
+    migrate_layout()
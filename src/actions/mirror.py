@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, service_name)
+from charm.openstack import ceph_cli, mirror
+from charm.openstack.utils import fs_paths
+
+
+def mirror_bootstrap_create(args):
+    token = mirror.create_bootstrap_token(service_name(),
+                                          action_get('client'),
+                                          action_get('site-name'))
+    action_set({'token': token})
+
+
+def mirror_bootstrap_import(args):
+    mirror.import_bootstrap_token(service_name(), action_get('token'))
+
+
+def mirror_add_directories(args):
+    fs_name = service_name()
+    mirror.enable_mirroring(fs_name)
+    for path in fs_paths(action_get('directories')):
+        mirror.add_directory(fs_name, path)
+
+
+def mirror_remove_directories(args):
+    for path in fs_paths(action_get('directories')):
+        mirror.remove_directory(service_name(), path)
+
+
+def mirror_status(args):
+    directories = mirror.sync_status(service_name())
+    lags = [d['lag'] for d in directories if d['lag'] is not None]
+    result = {'directories': len(directories),
+              'status': json.dumps(directories, indent=2)}
+    if lags:
+        # Left out until a snapshot of a directory has been synced.
+        result['max-lag'] = max(lags)
+    action_set(result)
+
+
+ACTIONS = {
+    'mirror-add-directories': mirror_add_directories,
+    'mirror-bootstrap-create': mirror_bootstrap_create,
+    'mirror-bootstrap-import': mirror_bootstrap_import,
+    'mirror-remove-directories': mirror_remove_directories,
+    'mirror-status': mirror_status,
+}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        return "Action {} undefined".format(action_name)
+    try:
+        action(args)
+    except subprocess.CalledProcessError as e:
+        action_fail(ceph_cli.command_error(e))
+    except (subprocess.TimeoutExpired, ValueError) as e:
+        action_fail(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
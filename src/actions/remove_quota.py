@@ -13,10 +13,13 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
-import os
+import sys
 
-from charmhelpers.core.hookenv import action_get, action_fail
-import xattr
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import action_get, action_fail, service_name
+from charm.openstack import cephfs_client
+from charm.openstack.utils import fs_paths
 
 __author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
 
@@ -24,19 +27,24 @@ __author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
 def remove_quota():
     max_files = action_get('max-files')
     max_bytes = action_get('max-bytes')
-    directory = action_get('directory')
+    directories = fs_paths(
+        action_get('directories') or action_get('directory'))
+    if not directories:
+        action_fail('A directory or directories are required')
+        return
 
-    if not os.path.exists(directory):
-        action_fail("Directory must exist before setting quota")
     attr = "ceph.quota.{}"
     if max_files:
         attr = attr.format("max_files")
     elif max_bytes:
         attr = attr.format("max_bytes")
 
+    directory = None
     try:
-        xattr.setxattr(directory, attr, str(0))
-    except IOError as err:
+        with cephfs_client.connect(service_name()) as fs:
+            for directory in directories:
+                cephfs_client.set_xattr(fs, directory, attr, 0)
+    except cephfs_client.Error as err:
         action_fail(
             "Unable to set xattr on {}.  Error: {}".format(directory, err))
 
@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import subprocess
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import action_fail, action_set
+import charms_openstack.bus
+import charms_openstack.charm as charm
+from charm.openstack import ceph_cli, maintenance
+
+charms_openstack.bus.discover()
+
+
+def run_deferred():
+    try:
+        with charm.provide_charm_instance() as cephfs_charm:
+            done = cephfs_charm.run_deferred(force=True)
+            cephfs_charm.assess_status()
+    except subprocess.CalledProcessError as err:
+        action_fail(ceph_cli.command_error(err))
+        return
+    pending = maintenance.load_state()['pending']
+    action_set({'ran': ' '.join(done),
+                'pending': ' '.join(sorted(pending))})
+
+
+if __name__ == '__main__':
+    run_deferred()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, config, service_name)
+from charm.openstack import ceph_cli, maintenance, scrub
+from charm.openstack.utils import fs_paths
+
+
+def _set_status():
+    status = scrub.status(service_name())
+    action_set({'state': status['state'],
+                'status': json.dumps(status, indent=2)})
+
+
+def scrub_start(args):
+    paths = fs_paths(action_get('paths') or '/')
+    if maintenance.postpone(config('maintenance-window'), 'scrub-start',
+                            {'paths': paths, 'repair': action_get('repair'),
+                             'force': action_get('force'),
+                             'max-ops': action_get('max-ops') or None}):
+        action_set({'deferred': 'Queued for the maintenance window'})
+        return
+    state = scrub.start(service_name(), paths,
+                        repair=action_get('repair'),
+                        force=action_get('force'),
+                        max_ops=action_get('max-ops') or None)
+    action_set({'tags': json.dumps(state['tags'])})
+
+
+def scrub_pause(args):
+    scrub.pause(service_name())
+    _set_status()
+
+
+def scrub_resume(args):
+    scrub.resume(service_name())
+    _set_status()
+
+
+def scrub_status(args):
+    _set_status()
+
+
+ACTIONS = {
+    'scrub-pause': scrub_pause,
+    'scrub-resume': scrub_resume,
+    'scrub-start': scrub_start,
+    'scrub-status': scrub_status,
+}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        return "Action {} undefined".format(action_name)
+    try:
+        action(args)
+    except subprocess.CalledProcessError as e:
+        action_fail(ceph_cli.command_error(e))
+    except (subprocess.TimeoutExpired, ValueError) as e:
+        action_fail(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -15,18 +15,24 @@
 # limitations under the License.
 
 __author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
-import os
-from charmhelpers.core.hookenv import action_get, action_fail
-import xattr
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import action_get, action_fail, service_name
+from charm.openstack import cephfs_client
+from charm.openstack.utils import fs_paths
 
 
 def set_quota():
     max_files = action_get('max-files')
     max_bytes = action_get('max-bytes')
-    directory = action_get('directory')
+    directories = fs_paths(
+        action_get('directories') or action_get('directory'))
+    if not directories:
+        action_fail('A directory or directories are required')
+        return
 
-    if not os.path.exists(directory):
-        action_fail("Directory must exist before setting quota")
     attr = "ceph.quota.{}"
     value = None
     if max_files:
@@ -36,9 +42,12 @@ def set_quota():
         attr = attr.format("max_bytes")
         value = str(max_bytes)
 
+    directory = None
     try:
-        xattr.setxattr(directory, attr, value)
-    except IOError as err:
+        with cephfs_client.connect(service_name()) as fs:
+            for directory in directories:
+                cephfs_client.set_xattr(fs, directory, attr, value)
+    except cephfs_client.Error as err:
         action_fail(
             "Unable to set xattr on {}.  Error: {}".format(directory, err))
 
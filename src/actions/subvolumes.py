@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+#
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import subprocess
+import sys
+
+sys.path.append('lib')
+
+from charmhelpers.core.hookenv import (
+    action_get, action_fail, action_set, service_name)
+from charm.openstack import ceph_cli, subvolumes
+
+
+def _volume():
+    return action_get('volume') or service_name()
+
+
+def _set_results(results):
+    failed = [r for r in results if r['status'] != 'ok']
+    action_set({'results': json.dumps(results),
+                'failed': len(failed)})
+    if failed:
+        action_fail('{} of {} operations failed'.format(len(failed),
+                                                        len(results)))
+
+
+def _bulk(func):
+    specs = subvolumes.parse_specs(action_get('subvolumes'))
+    _set_results(subvolumes.run_bulk(func, _volume(), specs,
+                                     workers=action_get('workers')))
+
+
+def create_subvolumes(args):
+    _bulk(subvolumes.create_subvolume)
+
+
+def resize_subvolumes(args):
+    _bulk(subvolumes.resize_subvolume)
+
+
+def remove_subvolumes(args):
+    _bulk(subvolumes.remove_subvolume)
+
+
+def _group_bulk(func):
+    specs = subvolumes.parse_specs(action_get('groups'))
+    _set_results(subvolumes.run_bulk(func, _volume(), specs,
+                                     workers=action_get('workers')))
+
+
+def create_subvolume_groups(args):
+    _group_bulk(subvolumes.create_group)
+
+
+def remove_subvolume_groups(args):
+    _group_bulk(subvolumes.remove_group)
+
+
+def list_subvolumes(args):
+    volume = _volume()
+    specs = []
+    for group in action_get('groups') or [None]:
+        for name in subvolumes.list_subvolumes(volume, group):
+            spec = {'name': name}
+            if group:
+                spec['group-name'] = group
+            specs.append(spec)
+    if action_get('with-info'):
+        _set_results(subvolumes.run_bulk(subvolumes.subvolume_info, volume,
+                                         specs,
+                                         workers=action_get('workers')))
+    else:
+        action_set({'results': json.dumps(specs)})
+
+
+def list_subvolume_groups(args):
+    action_set({'results': json.dumps(
+        subvolumes.list_groups(_volume()))})
+
+
+ACTIONS = {
+    'create-subvolumes': create_subvolumes,
+    'resize-subvolumes': resize_subvolumes,
+    'remove-subvolumes': remove_subvolumes,
+    'list-subvolumes': list_subvolumes,
+    'create-subvolume-groups': create_subvolume_groups,
+    'remove-subvolume-groups': remove_subvolume_groups,
+    'list-subvolume-groups': list_subvolume_groups,
+}
+
+
+def main(args):
+    action_name = os.path.basename(args[0])
+    try:
+        action = ACTIONS[action_name]
+    except KeyError:
+        return "Action {} undefined".format(action_name)
+    try:
+        action(args)
+    except subprocess.CalledProcessError as e:
+        action_fail(ceph_cli.command_error(e))
+    except ValueError as e:
+        action_fail(str(e))
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
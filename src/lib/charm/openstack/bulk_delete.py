@@ -0,0 +1,356 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Delete large directory trees without flooding the MDS purge queue.
+
+Unlinking a file only moves its inode to the purge queue of its MDS rank,
+which deletes the RADOS objects of its data later on, at the pace allowed
+by ``mds_max_purge_ops`` and ``filer_max_purge_ops``. A deletion faster than
+the purge queue grows the queue without bounds, and the journal of the rank
+with it. The deletion is therefore held under a rate of operations per
+second, and paused while the purge queues of the active ranks hold more
+than ``max_queue`` items, until they are back under half of it.
+
+The deletion runs in two phases. The files of every directory are unlinked
+by a ``tree_walk.TreeWalk``, whose cursor is saved every CHECKPOINT_INTERVAL
+seconds for the next run to resume from. The directories left, then all
+empty, are removed deepest first, the ones at the same depth at once.
+A deletion with paths that failed is not complete: the next run resumes
+with a new pass over what is left of the tree.
+"""
+
+import collections
+import concurrent.futures
+import contextlib
+import posixpath
+import subprocess
+import threading
+import time
+
+import cephfs
+
+from charm.openstack import ceph_cli, cephfs_client, tree_walk
+from charm.openstack.utils import RateLimiter
+
+CURSOR = 'delete-tree'
+CHECKPOINT_INTERVAL = 30
+# Seconds between two samples of the purge queues.
+QUEUE_INTERVAL = 10
+
+
+def _list_files(fs, path):
+    names = []
+    handle = fs.opendir(path)
+    try:
+        entry = fs.readdir(handle)
+        while entry:
+            # Anything but a directory, symlinks included.
+            if not entry.is_dir():
+                names.append(entry.d_name.decode('utf-8', 'surrogateescape'))
+            entry = fs.readdir(handle)
+    finally:
+        fs.closedir(handle)
+    return sorted(names)
+
+
+def purge_queue_length(fs_name):
+    """Items in the purge queues of the active ranks of a filesystem.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :returns: The files unlinked whose data is not deleted yet.
+    :rtype: int
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    status = ceph_cli.ceph_command('fs', 'status', fs_name, timeout=60) or {}
+    length = 0
+    for mds in status.get('mdsmap') or []:
+        if mds.get('state') != 'active':
+            continue
+        output = ceph_cli.ceph_command(
+            'tell', 'mds.{}'.format(mds['name']), 'perf', 'dump',
+            'purge_queue', timeout=60) or {}
+        length += (output.get('purge_queue') or {}).get(
+            'pq_item_in_journal', 0)
+    return length
+
+
+class Throttle(object):
+    """Pace of the deletions, shared by the workers.
+
+    :param rate: Operations per second, None for no limit.
+    :type rate: Optional[float]
+    :param max_queue: Purge queue length above which the deletions pause,
+                      None to never pause.
+    :type max_queue: Optional[int]
+    :param queue_length: Called for the current purge queue length.
+    :type queue_length: Optional[Callable[[], int]]
+    """
+
+    def __init__(self, rate=None, max_queue=None, queue_length=None):
+        self.limiter = RateLimiter(rate)
+        self.max_queue = max_queue if queue_length else None
+        self.queue_length = queue_length
+        self.lock = threading.Lock()
+        self.sampled = None
+        self.queue = None
+        self.error = None
+        self.paused = 0.0
+
+    def _sample(self):
+        self.sampled = time.monotonic()
+        try:
+            self.queue, self.error = self.queue_length(), None
+        except (subprocess.CalledProcessError,
+                subprocess.TimeoutExpired) as e:
+            # The operations fail until the next sample rather than run
+            # unchecked, or wait for the command to time out one by one.
+            self.queue, self.error = None, e
+        if self.error is not None:
+            raise self.error
+
+    def wait(self):
+        """Block until the next operation may run.
+
+        :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+                 when the purge queue could not be sampled.
+        """
+        if self.max_queue is not None:
+            # A worker sampling or paused holds the lock, the others wait
+            # for it.
+            with self.lock:
+                if (self.sampled is None or
+                        time.monotonic() - self.sampled >= QUEUE_INTERVAL):
+                    self._sample()
+                if self.error is not None:
+                    raise self.error
+                if self.queue > self.max_queue:
+                    while self.queue > self.max_queue // 2:
+                        time.sleep(QUEUE_INTERVAL)
+                        self.paused += QUEUE_INTERVAL
+                        self._sample()
+        self.limiter.consume()
+
+
+class TreeDeletion(object):
+    """Remove the files and directories of a tree.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param throttle: Pace of the operations.
+    :type throttle: Throttle
+    """
+
+    def __init__(self, fs, throttle):
+        self.fs = fs
+        self.throttle = throttle
+        self.lock = threading.Lock()
+        self.counters = {'unlinked': 0, 'removed': 0}
+        self.failed = []
+
+    def _remove(self, remove, path, counter):
+        try:
+            self.throttle.wait()
+        except (subprocess.CalledProcessError,
+                subprocess.TimeoutExpired) as e:
+            with self.lock:
+                self.failed.append(
+                    {'path': path, 'error': ceph_cli.command_error(e)})
+            return
+        try:
+            remove(path)
+        except cephfs.ObjectNotFound:
+            # Already removed, e.g. by the run interrupted.
+            return
+        except cephfs_client.Error as e:
+            with self.lock:
+                self.failed.append({'path': path, 'error': str(e)})
+            return
+        with self.lock:
+            self.counters[counter] += 1
+
+    def visit(self, fs, path):
+        """Unlink the files of a directory, for ``tree_walk.TreeWalk``."""
+        for name in _list_files(fs, path):
+            self._remove(self.fs.unlink, posixpath.join(path, name),
+                         'unlinked')
+
+    def remove_directory(self, path):
+        """Remove an empty directory.
+
+        :param path: Path of the directory within the filesystem.
+        :type path: str
+        """
+        self._remove(self.fs.rmdir, path, 'removed')
+
+
+def _remove_directories(fs, root, deletion, workers, deadline):
+    try:
+        fs.stat(root)
+    except cephfs.ObjectNotFound:
+        return True, []
+    walk = tree_walk.TreeWalk(fs, lambda fs, path: None, [[root, 0]],
+                              workers=workers, errors=cephfs_client.Error)
+    levels = collections.defaultdict(list)
+    with contextlib.closing(walk.run()) as results:
+        for path, _ in results:
+            levels[path.count('/')].append(path)
+            if deadline is not None and time.monotonic() >= deadline:
+                return False, walk.failed
+    stopped = threading.Event()
+
+    def _remove(path):
+        if stopped.is_set() or (
+                deadline is not None and time.monotonic() >= deadline):
+            return False
+        deletion.remove_directory(path)
+        return True
+
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers) as executor:
+        try:
+            for depth in sorted(levels, reverse=True):
+                if not all(executor.map(_remove, sorted(levels[depth]))):
+                    return False, walk.failed
+        finally:
+            # The removals queued are skipped, the executor only waits for
+            # the ones in progress.
+            stopped.set()
+    return True, walk.failed
+
+
+def delete(fs, root=None, workers=8, rate=None, max_queue=None,
+           queue_length=None, time_limit=None, resume=False,
+           on_progress=None):
+    """Delete a directory and everything below it.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param root: Directory to delete, not the root of the filesystem.
+    :type root: str
+    :param workers: Directories worked on at once.
+    :type workers: int
+    :param rate: Unlinks and removals per second by all the workers, None
+                 for no limit.
+    :type rate: Optional[float]
+    :param max_queue: Purge queue length above which the deletion pauses,
+                      None to never pause.
+    :type max_queue: Optional[int]
+    :param queue_length: Called for the current purge queue length, e.g.
+                         ``purge_queue_length`` of the filesystem.
+    :type queue_length: Optional[Callable[[], int]]
+    :param time_limit: Seconds after which the deletion is interrupted,
+                       None for no limit.
+    :type time_limit: Optional[float]
+    :param resume: Resume the interrupted deletion, whose root is used
+                   instead of the given one.
+    :type resume: bool
+    :param on_progress: Called with a progress message at every checkpoint.
+    :type on_progress: Optional[Callable[[str], None]]
+    :returns: Whether the deletion is 'complete', the number of directories
+              'scanned', files 'unlinked' and directories 'removed' for the
+              whole deletion, the directories still 'pending' a scan, the
+              paths that 'failed' since the last pass started, and for this
+              run the seconds 'paused' for
+              the purge queue and the 'rate' in operations per second.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if there is no deletion to resume or for the root
+             of the filesystem, cephfs.Error.
+    """
+    if resume:
+        cursor = tree_walk.load_cursor(CURSOR)
+        if not cursor:
+            raise ValueError('There is no interrupted deletion')
+    else:
+        root = posixpath.normpath('/' + (root or '').lstrip('/'))
+        if root == '/':
+            raise ValueError('Refusing to delete the root of the filesystem')
+        fs.stat(root)
+        cursor = {'root': root, 'phase': 'unlink', 'pending': [[root, 0]],
+                  'scanned': 0, 'unlinked': 0, 'removed': 0, 'failed': []}
+    throttle = Throttle(rate, max_queue, queue_length)
+    deletion = TreeDeletion(fs, throttle)
+    start = time.monotonic()
+    deadline = start + time_limit if time_limit is not None else None
+    done = 0
+
+    def _checkpoint(walk=None):
+        with deletion.lock:
+            counters = dict(deletion.counters)
+            failed = deletion.failed
+            deletion.counters = dict.fromkeys(counters, 0)
+            deletion.failed = []
+        for name, value in counters.items():
+            cursor[name] += value
+        cursor['failed'] += failed
+        if walk:
+            cursor['failed'] += walk.failed
+            cursor['scanned'] += walk.scanned
+            walk.scanned, walk.failed = 0, []
+            cursor['pending'] = walk.pending()
+        tree_walk.save_cursor(CURSOR, cursor)
+        return sum(counters.values())
+
+    if cursor['phase'] == 'unlink':
+        walk = tree_walk.TreeWalk(fs, deletion.visit, cursor['pending'],
+                                  workers=workers,
+                                  errors=cephfs_client.Error)
+        checkpoint = start
+        with contextlib.closing(walk.run()) as results:
+            for _ in results:
+                now = time.monotonic()
+                if now - checkpoint >= CHECKPOINT_INTERVAL:
+                    done += _checkpoint(walk)
+                    checkpoint = now
+                    if on_progress:
+                        on_progress('{} files unlinked at {:.0f}/s, {} '
+                                    'directories pending, purge queue '
+                                    '{}'.format(cursor['unlinked'],
+                                                done / (now - start),
+                                                len(cursor['pending']),
+                                                throttle.queue))
+                if deadline is not None and now >= deadline:
+                    break
+        done += _checkpoint(walk)
+        if not cursor['pending']:
+            cursor['phase'] = 'rmdir'
+            tree_walk.save_cursor(CURSOR, cursor)
+    complete = False
+    if cursor['phase'] == 'rmdir' and (
+            deadline is None or time.monotonic() < deadline):
+        if on_progress:
+            on_progress('{} files unlinked, removing the directories'.format(
+                cursor['unlinked']))
+        complete, failed = _remove_directories(
+            fs, cursor['root'], deletion, workers, deadline)
+        deletion.failed += failed
+        done += _checkpoint()
+    elapsed = time.monotonic() - start
+    failed = cursor['failed']
+    if complete and failed:
+        # Whatever is left, the root included, is retried by the next run.
+        complete = False
+        cursor.update(phase='unlink', pending=[[cursor['root'], 0]],
+                      failed=[])
+        tree_walk.save_cursor(CURSOR, cursor)
+    elif complete:
+        tree_walk.save_cursor(CURSOR, None)
+    return {'complete': complete,
+            'scanned': cursor['scanned'],
+            'unlinked': cursor['unlinked'],
+            'removed': cursor['removed'],
+            'pending': len(cursor['pending']),
+            'failed': failed,
+            'paused': int(throttle.paused),
+            'rate': round(done / elapsed, 1) if elapsed else 0}
@@ -0,0 +1,111 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run ``ceph`` CLI commands on behalf of the local MDS."""
+
+import json
+import socket
+import subprocess
+
+CEPH_CONF = '/etc/ceph/ceph.conf'
+MDS_KEYRING = '/var/lib/ceph/mds/ceph-{}/keyring'
+
+
+def mds_name():
+    """Name of the MDS daemon running on this unit.
+
+    :rtype: str
+    """
+    return 'mds.{}'.format(socket.gethostname())
+
+
+def _run(cmd, timeout=None):
+    output = subprocess.check_output(cmd, stderr=subprocess.PIPE,
+                                     timeout=timeout)
+    output = output.decode('utf-8').strip()
+    if not output:
+        return None
+    try:
+        return json.loads(output)
+    except ValueError:
+        return output
+
+
+def ceph_command(*args, timeout=None):
+    """Run a cluster command authenticated with the unit's MDS key.
+
+    :param args: Arguments to the ``ceph`` command.
+    :type args: str
+    :param timeout: Seconds to wait for the command to complete.
+    :type timeout: Optional[int]
+    :returns: Decoded JSON output, the raw output if it is not JSON or None
+              if the command printed nothing.
+    :rtype: Union[None, str, dict, list]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    name = mds_name()
+    cmd = ['ceph', '--conf', CEPH_CONF, '--name', name,
+           '--keyring', MDS_KEYRING.format(socket.gethostname()),
+           '--format', 'json']
+    cmd.extend(str(arg) for arg in args)
+    return _run(cmd, timeout=timeout)
+
+
+def daemon_command(*args, timeout=None):
+    """Run a command against the local MDS admin socket.
+
+    :param args: Arguments to the admin socket command.
+    :type args: str
+    :param timeout: Seconds to wait for the command to complete.
+    :type timeout: Optional[int]
+    :returns: Decoded JSON output, the raw output if it is not JSON or None
+              if the command printed nothing.
+    :rtype: Union[None, str, dict, list]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    cmd = ['ceph', '--conf', CEPH_CONF, 'daemon', mds_name()]
+    cmd.extend(str(arg) for arg in args)
+    return _run(cmd, timeout=timeout)
+
+
+def socket_command(path, *args, timeout=None):
+    """Run a command against the admin socket of another local daemon.
+
+    :param path: Path of the admin socket.
+    :type path: str
+    :param args: Arguments to the admin socket command.
+    :type args: str
+    :param timeout: Seconds to wait for the command to complete.
+    :type timeout: Optional[int]
+    :returns: Decoded JSON output, the raw output if it is not JSON or None
+              if the command printed nothing.
+    :rtype: Union[None, str, dict, list]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    cmd = ['ceph', '--admin-daemon', path]
+    cmd.extend(str(arg) for arg in args)
+    return _run(cmd, timeout=timeout)
+
+
+def command_error(exc):
+    """Describe a failed command for an action or log message.
+
+    :param exc: Exception raised by ``ceph_command`` or ``daemon_command``.
+    :type exc: Exception
+    :rtype: str
+    """
+    stderr = getattr(exc, 'stderr', None)
+    if stderr:
+        return stderr.decode('utf-8', errors='replace').strip()
+    return str(exc)
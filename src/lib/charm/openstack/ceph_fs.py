@@ -12,31 +12,196 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import contextlib
+import json
+import os
+import re
 import socket
+import subprocess
 
 import dns.resolver
+import psutil
+import yaml
 
+import charms.reactive as reactive
 import charms_openstack.adapters
 import charms_openstack.charm
 import charms_openstack.plugins
 
 import charmhelpers.core as ch_core
+import charmhelpers.core.host as ch_host
+import charmhelpers.core.sysctl as ch_sysctl
 
 # NOTE(fnordahl) theese out of style imports are here to help keeping helpers
 # moved from reactive module as-is to make the diff managable. At some point
 # in time we should replace them in favor of common helpers that would do the
 # same job.
 from charmhelpers.core.hookenv import (
-    config, log, cached, DEBUG, unit_get,
+    config, log, cached, DEBUG, WARNING, unit_get,
     network_get_primary_address,
     status_set)
 from charmhelpers.contrib.network.ip import (
     get_address_in_network,
     get_ipv6_addr)
 
+from charm.openstack import (
+    client_relation, maintenance, mds_autoscale, mds_cache, mds_cache_tune,
+    mirror, scrub)
+from charm.openstack.utils import format_size, parse_duration, parse_size
+
 
 charms_openstack.charm.use_defaults('charm.default-select-release')
 
+MDS_SERVICE_DROPIN = ('/etc/systemd/system/ceph-mds@{}.service.d/'
+                      'charm-resources.conf')
+MDS_ENVIRONMENT_FILE = '/etc/default/ceph-fs-charm'
+SCRUB_SERVICE = '/etc/systemd/system/ceph-fs-scrub.service'
+MIRROR_CONF = '/etc/ceph/cephfs-mirror.conf'
+MIRROR_KEYRING = '/etc/ceph/cephfs-mirror.keyring'
+MIRROR_SERVICE_DROPIN = ('/etc/systemd/system/{}.service.d/'
+                         'charm-mirror.conf'.format(mirror.MIRROR_SERVICE))
+SCRUB_TIMER = '/etc/systemd/system/ceph-fs-scrub.timer'
+AUTOSCALE_SERVICE = '/etc/systemd/system/ceph-fs-autoscale.service'
+AUTOSCALE_TIMER = '/etc/systemd/system/ceph-fs-autoscale.timer'
+CACHE_TUNE_SERVICE = '/etc/systemd/system/ceph-fs-cache-tune.service'
+CACHE_TUNE_TIMER = '/etc/systemd/system/ceph-fs-cache-tune.timer'
+THP_ENABLED = '/sys/kernel/mm/transparent_hugepage/enabled'
+SYSCTL_FILE = '/etc/sysctl.d/50-ceph-fs-charm.conf'
+PROC_SYS = '/proc/sys'
+THP_MODES = ('always', 'madvise', 'never')
+
+NUMA_POLICIES = ('default', 'preferred', 'bind', 'interleave', 'local')
+IO_SCHEDULING_CLASSES = ('realtime', 'best-effort', 'idle')
+
+
+def _cpu_list(value):
+    if not re.match(r'^\d+(-\d+)?([\s,]+\d+(-\d+)?)*$', value.strip()):
+        raise ValueError('expected a list of CPU indexes or ranges')
+    return value.strip()
+
+
+def _choice(*choices):
+    def _check(value):
+        if value not in choices:
+            raise ValueError('expected one of {}'.format(', '.join(choices)))
+        return value
+    return _check
+
+
+def _bounded_int(minimum, maximum):
+    def _check(value):
+        if not minimum <= int(value) <= maximum:
+            raise ValueError('expected a value between {} and {}'
+                             .format(minimum, maximum))
+        return int(value)
+    return _check
+
+
+def _memory(value):
+    if value == 'infinity':
+        return value
+    return parse_size(value)
+
+
+# Charm option, systemd directive and validator for the resource controls
+# rendered into the ceph-mds service drop-in.
+MDS_SERVICE_RESOURCES = (
+    ('cpu-affinity', 'CPUAffinity', _cpu_list),
+    ('numa-policy', 'NUMAPolicy', _choice(*NUMA_POLICIES)),
+    ('numa-mask', 'NUMAMask', _cpu_list),
+    ('cpu-weight', 'CPUWeight', _bounded_int(1, 10000)),
+    ('memory-high', 'MemoryHigh', _memory),
+    ('memory-max', 'MemoryMax', _memory),
+    ('nice', 'Nice', _bounded_int(-20, 19)),
+    ('io-scheduling-class', 'IOSchedulingClass',
+     _choice(*IO_SCHEDULING_CLASSES)),
+    ('io-scheduling-priority', 'IOSchedulingPriority', _bounded_int(0, 7)),
+    ('nofile', 'LimitNOFILE', _bounded_int(1024, 1 << 30)),
+)
+
+
+def _release_rate(value):
+    if not 0 <= float(value) <= 10:
+        raise ValueError('expected a value between 0 and 10')
+    return float(value)
+
+
+MSGR_MODES = ('crc', 'secure', 'crc secure', 'secure crc')
+MSGR_COMPRESS_MODES = ('none', 'force')
+MSGR_COMPRESSION_ALGORITHMS = ('snappy', 'zlib', 'zstd', 'lz4')
+
+# Charm option, ceph.conf section and option and validator for the messenger
+# settings of the MDS.
+MSGR_CONFIG = (
+    ('ms-client-mode', 'global', 'ms client mode', _choice(*MSGR_MODES)),
+    ('ms-service-mode', 'mds', 'ms service mode', _choice(*MSGR_MODES)),
+    ('ms-compress-mode', 'global', 'ms osd compress mode',
+     _choice(*MSGR_COMPRESS_MODES)),
+    ('ms-compression-algorithm', 'global', 'ms osd compression algorithm',
+     _choice(*MSGR_COMPRESSION_ALGORITHMS)),
+    ('ms-async-op-threads', 'mds', 'ms async op threads',
+     _bounded_int(1, 24)),
+)
+
+
+def _ops_per_pg(value):
+    if not 0 < float(value) <= 1000:
+        raise ValueError('expected a value above 0 and up to 1000')
+    return float(value)
+
+
+# Charm option, ceph.conf option and validator for the throttles of the MDS
+# purge queue, which deletes the objects of unlinked files.
+PURGE_CONFIG = (
+    ('mds-max-purge-ops', 'mds max purge ops', _bounded_int(1, 1 << 20)),
+    ('mds-max-purge-ops-per-pg', 'mds max purge ops per pg', _ops_per_pg),
+    ('filer-max-purge-ops', 'filer max purge ops', _bounded_int(1, 1024)),
+)
+
+# Charm option, environment variable and validator for the memory allocator
+# settings of the ceph-mds daemon.
+MDS_ENVIRONMENT = (
+    ('tcmalloc-max-total-thread-cache-bytes',
+     'TCMALLOC_MAX_TOTAL_THREAD_CACHE_BYTES', parse_size),
+    ('tcmalloc-release-rate', 'TCMALLOC_RELEASE_RATE', _release_rate),
+)
+
+
+def _page_multiple(value):
+    size = parse_size(value)
+    if size <= 0 or size % 4096:
+        raise ValueError('expected a positive multiple of 4Ki')
+    return size
+
+
+# Charm option, kind ('ceph' for ceph.conf, 'kernel' for the kernel client
+# mount options), client option and validator for the settings published to
+# the clients.
+CLIENT_CONFIG = (
+    ('client-cache-size', 'ceph', 'client_cache_size',
+     _bounded_int(1, 2 ** 31 - 1)),
+    ('client-oc-size', 'ceph', 'client_oc_size', parse_size),
+    ('client-readahead-max-bytes', 'ceph', 'client_readahead_max_bytes',
+     parse_size),
+    ('fuse-big-writes', 'ceph', 'fuse_big_writes', bool),
+    ('kernel-rasize', 'kernel', 'rasize', _page_multiple),
+    ('kernel-rsize', 'kernel', 'rsize', _page_multiple),
+    ('kernel-wsize', 'kernel', 'wsize', _page_multiple),
+)
+
+# Charm option, cephfs-mirror option and validator for the tunables of the
+# mirror daemon.
+MIRROR_CONFIG = (
+    ('cephfs-mirror-max-concurrent-directory-syncs',
+     'cephfs_mirror_max_concurrent_directory_syncs', _bounded_int(1, 64)),
+    ('cephfs-mirror-max-snapshot-sync-per-cycle',
+     'cephfs_mirror_max_snapshot_sync_per_cycle', _bounded_int(1, 64)),
+    ('cephfs-mirror-action-update-interval',
+     'cephfs_mirror_action_update_interval', _bounded_int(1, 3600)),
+    ('cephfs-mirror-directory-scan-interval',
+     'cephfs_mirror_directory_scan_interval', _bounded_int(1, 3600)),
+)
+
 
 class CephFSCharmConfigurationAdapter(
         charms_openstack.adapters.ConfigurationAdapter):
@@ -57,6 +222,119 @@ class CephFSCharmConfigurationAdapter(
     def mds_cache(self):
         return self.charm_instance.get_mds_cache()
 
+    @property
+    def mds_service_resources(self):
+        try:
+            return self.charm_instance.get_mds_service_resources()
+        except ValueError:
+            # Reported through the workload status, see
+            # ``custom_assess_status_check``.
+            return []
+
+    @property
+    def msgr_global(self):
+        return self._msgr_config('global')
+
+    @property
+    def msgr_mds(self):
+        return self._msgr_config('mds')
+
+    def _msgr_config(self, section):
+        try:
+            return [(option, value) for s, option, value
+                    in self.charm_instance.get_msgr_config()
+                    if s == section]
+        except ValueError:
+            return []
+
+    @property
+    def purge_config(self):
+        try:
+            return self.charm_instance.get_purge_config()
+        except ValueError:
+            return []
+
+    @property
+    def mds_environment(self):
+        try:
+            return self.charm_instance.get_mds_environment()
+        except ValueError:
+            return []
+
+    @property
+    def mds_environment_file(self):
+        return MDS_ENVIRONMENT_FILE
+
+    @property
+    def transparent_hugepage(self):
+        mode = ch_core.hookenv.config('transparent-hugepage')
+        return mode if mode in THP_MODES else None
+
+    @property
+    def scrub_schedule(self):
+        # Only the leader schedules scrubs, they cover the whole filesystem.
+        if not ch_core.hookenv.is_leader():
+            return None
+        try:
+            return self.charm_instance.get_scrub_schedule()
+        except ValueError:
+            return None
+
+    @property
+    def mds_autoscale(self):
+        # max_mds is a setting of the filesystem, only the leader scales it.
+        if not ch_core.hookenv.is_leader():
+            return None
+        try:
+            return self.charm_instance.get_mds_autoscale()
+        except ValueError:
+            return None
+
+    @property
+    def mds_cache_autotune(self):
+        try:
+            return self.charm_instance.get_mds_cache_autotune()
+        except ValueError:
+            return None
+
+    @property
+    def service_name(self):
+        return ch_core.hookenv.service_name()
+
+    @property
+    def maintenance_window(self):
+        try:
+            return self.charm_instance.get_maintenance_window()
+        except ValueError:
+            return None
+
+    @property
+    def charm_lib_dir(self):
+        return os.path.join(ch_core.hookenv.charm_dir(), 'lib')
+
+    @property
+    def mirror_user(self):
+        return mirror.MIRROR_USER
+
+    @property
+    def mirror_key(self):
+        return ch_core.hookenv.config('cephfs-mirror-key')
+
+    @property
+    def mirror_config(self):
+        try:
+            return self.charm_instance.get_mirror_config()
+        except ValueError:
+            return []
+
+    @property
+    def mirror_conf(self):
+        return MIRROR_CONF
+
+    @property
+    def mirror_keyring(self):
+        return MIRROR_KEYRING
+
     @property
     def public_addr(self):
         if ch_core.hookenv.config('prefer-ipv6'):
@@ -90,9 +368,702 @@ class BaseCephFSCharm(charms_openstack.plugins.CephCharm):
         self.services = [
             'ceph-mds@{}'.format(self.hostname),
         ]
+        self.mds_service_dropin = MDS_SERVICE_DROPIN.format(self.hostname)
         self.restart_map = {
             '/etc/ceph/ceph.conf': self.services,
+            self.mds_service_dropin: self.services,
+            MDS_ENVIRONMENT_FILE: self.services,
+            SCRUB_SERVICE: [],
+            SCRUB_TIMER: [],
+            AUTOSCALE_SERVICE: [],
+            AUTOSCALE_TIMER: [],
+            CACHE_TUNE_SERVICE: [],
+            CACHE_TUNE_TIMER: [],
+        }
+        if config('cephfs-mirror'):
+            # The mirror daemon has a configuration file of its own so that
+            # tuning it does not restart the MDS.
+            self.services = self.services + [mirror.MIRROR_SERVICE]
+            for path in (MIRROR_CONF, MIRROR_KEYRING, MIRROR_SERVICE_DROPIN):
+                self.restart_map[path] = [mirror.MIRROR_SERVICE]
+
+    @property
+    def all_packages(self):
+        packages = list(super().all_packages)
+        if config('cephfs-mirror'):
+            packages.append('cephfs-mirror')
+        return packages
+
+    @contextlib.contextmanager
+    def restart_on_change(self):
+        """Reload systemd before restarting when a unit file changed.
+
+        The timers of the charm are enabled or disabled when they changed,
+        the scrub and autoscale ones only run on the leader. Outside of the
+        maintenance window the restarts are queued for it.
+        """
+        timers = {SCRUB_TIMER: lambda: self.options.scrub_schedule,
+                  AUTOSCALE_TIMER: lambda: self.options.mds_autoscale,
+                  CACHE_TUNE_TIMER: lambda: self.options.mds_cache_autotune}
+        units = (self.mds_service_dropin, SCRUB_SERVICE, SCRUB_TIMER,
+                 AUTOSCALE_SERVICE, AUTOSCALE_TIMER, CACHE_TUNE_SERVICE,
+                 CACHE_TUNE_TIMER, MIRROR_SERVICE_DROPIN)
+        hashes = {path: ch_host.path_hash(path) for path in units}
+        deferred = not self.maintenance_window_open()
+        if deferred:
+            restart_map = self.full_restart_map
+            hashes.update({path: ch_host.path_hash(path)
+                           for path in restart_map})
+        with contextlib.ExitStack() as stack:
+            if not deferred:
+                stack.enter_context(super().restart_on_change())
+            yield
+            changed = [path for path in units
+                       if ch_host.path_hash(path) != hashes[path]]
+            if changed:
+                subprocess.check_call(['systemctl', 'daemon-reload'])
+            for timer, enabled in timers.items():
+                if timer in changed:
+                    subprocess.check_call(
+                        ['systemctl', 'enable' if enabled() else 'disable',
+                         '--now', os.path.basename(timer)])
+            if deferred:
+                services = [service for path, services in restart_map.items()
+                            if ch_host.path_hash(path) != hashes[path]
+                            for service in services]
+                if services:
+                    maintenance.defer('restart', {'services': services})
+
+    def upgrade_if_available(self, interfaces_list):
+        """Upgrade the packages, in the maintenance window only."""
+        if not self.maintenance_window_open():
+            maintenance.defer('upgrade')
+            return
+        super().upgrade_if_available(interfaces_list)
+
+    def get_maintenance_window(self):
+        """Get the window disruptive operations are deferred to.
+
+        :returns: The cron expression, None if operations run at once.
+        :rtype: Optional[str]
+        :raises: ValueError if the expression is invalid.
+        """
+        expression = (config('maintenance-window') or '').strip()
+        try:
+            maintenance.parse_window(expression)
+        except ValueError as e:
+            raise ValueError('maintenance-window: {}'.format(e))
+        return expression or None
+
+    def maintenance_window_open(self):
+        """Whether disruptive operations may run now.
+
+        An invalid window blocks the unit but defers nothing.
+
+        :rtype: bool
+        """
+        try:
+            return maintenance.window_open(self.get_maintenance_window())
+        except ValueError:
+            return True
+
+    def run_deferred(self, interfaces_list=None, force=False):
+        """Run the operations deferred to the maintenance window.
+
+        Operations that fail are queued again. Upgrades render the
+        configuration with the relations, without them they stay queued
+        and run in the next hook.
+
+        :param interfaces_list: Relation endpoints to render the
+                                configuration with, None outside of hooks.
+        :type interfaces_list: Optional[List[Any]]
+        :param force: Run them now even outside of the window.
+        :type force: bool
+        :returns: The operations run.
+        :rtype: List[str]
+        """
+        try:
+            window = self.get_maintenance_window()
+        except ValueError:
+            window = None
+        if force:
+            maintenance.force()
+        elif not maintenance.load_state()['pending']:
+            return []
+        operations = maintenance.take(window)
+        done = []
+        for operation in ('upgrade', 'restart', 'drop-cache', 'scrub-start',
+                          'scrub'):
+            if operation not in operations:
+                continue
+            details = operations[operation]
+            if operation == 'upgrade' and interfaces_list is None:
+                maintenance.defer(operation, details)
+                maintenance.force([operation])
+                continue
+            try:
+                self._run_deferred(operation, details, interfaces_list,
+                                   window)
+            except (subprocess.CalledProcessError,
+                    subprocess.TimeoutExpired, ValueError) as e:
+                log('Deferred {} failed: {}'.format(operation, e), WARNING)
+                maintenance.defer(operation, details)
+                continue
+            done.append(operation)
+        return done
+
+    def _run_deferred(self, operation, details, interfaces_list, window):
+        if operation == 'upgrade':
+            super().upgrade_if_available(interfaces_list)
+        elif operation == 'restart':
+            failed = [service for service in details['services']
+                      if not ch_host.service_restart(service)]
+            if failed:
+                # Only the services that failed are queued again.
+                details['services'] = failed
+                raise ValueError('Unable to restart {}'.format(
+                    ', '.join(failed)))
+        elif operation == 'drop-cache':
+            mds_cache.drop_cache(details['timeout'], details['target'])
+        elif operation == 'scrub-start':
+            scrub.start(ch_core.hookenv.service_name(), details['paths'],
+                        repair=details['repair'], force=details['force'],
+                        max_ops=details['max-ops'])
+        elif operation == 'scrub':
+            if not maintenance.window_open(window):
+                # The scrub service checks the window itself.
+                maintenance.force([operation])
+            subprocess.check_call(['systemctl', 'start', '--no-block',
+                                   os.path.basename(SCRUB_SERVICE)])
+
+    def custom_assess_status_check(self):
+        state, message = super().custom_assess_status_check()
+        if state is not None:
+            return state, message
+        if (reactive.is_flag_set('ceph-mds.available') and
+                not reactive.is_flag_set('leadership.set.pools-ready')):
+            return 'waiting', 'Waiting for the leader to create the pools'
+        try:
+            self.get_mds_service_resources()
+            self.get_mds_environment()
+            self.get_transparent_hugepage()
+            self.get_sysctl()
+            self.get_msgr_config()
+            self.get_purge_config()
+            self.get_client_config()
+            self.get_scrub_schedule()
+            self.get_mds_autoscale()
+            self.get_mds_cache_autotune()
+            self.get_mirror_config()
+            self.get_maintenance_window()
+        except ValueError as e:
+            return 'blocked', 'Invalid configuration: {}'.format(e)
+        if config('cephfs-mirror') and not config('cephfs-mirror-key'):
+            return 'blocked', ('cephfs-mirror-key is required to run '
+                               'cephfs-mirror')
+        return self.check_mds_memory_limits()
+
+    def custom_assess_status_last_check(self):
+        notes = self.get_status_notes()
+        if notes:
+            return 'active', 'Unit is ready ({})'.format('; '.join(notes))
+        return None, None
+
+    def get_status_notes(self):
+        """Collect runtime details to append to the active workload status.
+
+        :returns: Short human readable notes, may be empty.
+        :rtype: List[str]
+        """
+        notes = self.check_mds_allocator() + self.check_sysctl()
+        scrub_note = scrub.status_note()
+        if scrub_note:
+            notes.append(scrub_note)
+        try:
+            maintenance_note = maintenance.status_note(
+                self.get_maintenance_window())
+        except ValueError:
+            maintenance_note = None
+        if maintenance_note:
+            notes.append(maintenance_note)
+        if config('mds-cache-autotune'):
+            tune_note = mds_cache_tune.status_note()
+            if tune_note:
+                notes.append(tune_note)
+        if ch_core.hookenv.is_leader():
+            if config('mds-autoscale'):
+                autoscale_note = mds_autoscale.status_note()
+                if autoscale_note:
+                    notes.append(autoscale_note)
+            pending = client_relation.pending_clients()
+            if pending:
+                notes.append('{} client(s) waiting for a key'.format(
+                    len(pending)))
+        return notes
+
+    def get_mds_service_resources(self):
+        """Get the systemd resource controls to apply to the MDS service.
+
+        :returns: systemd directives and their values, for the options set.
+        :rtype: List[Tuple[str, Union[str, int]]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        resources = []
+        for option, directive, validate in MDS_SERVICE_RESOURCES:
+            value = config(option)
+            if value is None or value == '':
+                continue
+            try:
+                resources.append((directive, validate(value)))
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(option, e))
+        return resources
+
+    def get_msgr_config(self):
+        """Get the messenger (msgr2) settings to render in ceph.conf.
+
+        :returns: ceph.conf section, option and value for the options set.
+        :rtype: List[Tuple[str, str, Union[str, int]]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        settings = []
+        for option, section, ceph_option, validate in MSGR_CONFIG:
+            value = config(option)
+            if value is None or value == '':
+                continue
+            try:
+                settings.append((section, ceph_option, validate(value)))
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(option, e))
+        return settings
+
+    def get_purge_config(self):
+        """Get the purge queue throttles to render in ceph.conf.
+
+        :returns: ceph.conf option and value for the options set.
+        :rtype: List[Tuple[str, Union[int, float]]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        settings = []
+        for option, ceph_option, validate in PURGE_CONFIG:
+            value = config(option)
+            if value is None or value == '':
+                continue
+            try:
+                settings.append((ceph_option, validate(value)))
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(option, e))
+        return settings
+
+    def get_mds_environment(self):
+        """Get the environment of the MDS daemon for allocator tuning.
+
+        :returns: Environment variables and their values, for the options set.
+        :rtype: List[Tuple[str, Union[str, int, float]]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        environment = []
+        for option, variable, validate in MDS_ENVIRONMENT:
+            value = config(option)
+            if value is None or value == '':
+                continue
+            try:
+                environment.append((variable, validate(value)))
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(option, e))
+        thread_cache = dict(environment).get(
+            'TCMALLOC_MAX_TOTAL_THREAD_CACHE_BYTES')
+        try:
+            cache_limit = parse_size(config('mds-cache-memory-limit'))
+        except ValueError:
+            cache_limit = None
+        if thread_cache and cache_limit and thread_cache >= cache_limit:
+            raise ValueError('tcmalloc-max-total-thread-cache-bytes must be '
+                             'lower than mds-cache-memory-limit')
+        return environment
+
+    def get_client_config(self):
+        """Get the settings recommended to the clients of the filesystem.
+
+        :returns: Kind ('ceph' or 'kernel'), client option and value, for
+                  the options set.
+        :rtype: List[Tuple[str, str, Union[str, int, bool]]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        settings = []
+        for option, kind, client_option, validate in CLIENT_CONFIG:
+            value = config(option)
+            if value is None or value == '':
+                continue
+            try:
+                settings.append((kind, client_option, validate(value)))
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(option, e))
+        return settings
+
+    def update_cephfs_clients(self, ceph_mds):
+        """Publish keys and client settings on the cephfs-client relations.
+
+        :param ceph_mds: The ceph-mds endpoint, for the cluster details.
+        :type ceph_mds: CephMDSRequires
+        """
+        try:
+            settings = self.get_client_config()
+        except ValueError:
+            # Reported through the workload status.
+            return
+        options = {
+            'client-options': json.dumps(
+                {option: value for kind, option, value in settings
+                 if kind == 'ceph'}, sort_keys=True),
+            'kernel-mount-options': ','.join(
+                '{}={}'.format(option, value)
+                for kind, option, value in settings if kind == 'kernel'),
+        }
+        client_relation.update(ch_core.hookenv.service_name(),
+                               ceph_mds.fsid(), ceph_mds.mon_hosts(), options)
+
+    def get_scrub_schedule(self):
+        """Get the recurring scrub requested through the configuration.
+
+        :returns: The systemd calendar expression of the 'schedule', the
+                  'window' in seconds, the 'paths' to scrub and the
+                  'max-ops' in progress, None if no scrub is scheduled.
+        :rtype: Optional[Dict[str, Any]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        schedule = (config('scrub-schedule') or '').strip()
+        if not schedule:
+            return None
+        if '\n' in schedule:
+            raise ValueError('scrub-schedule: expected a single systemd '
+                             'calendar expression')
+        try:
+            window = parse_duration(config('scrub-window'))
+        except ValueError as e:
+            raise ValueError('scrub-window: {}'.format(e))
+        if window <= 0:
+            raise ValueError('scrub-window: expected a positive duration')
+        paths = (config('scrub-paths') or '/').split()
+        if not all(path.startswith('/') for path in paths):
+            raise ValueError('scrub-paths: expected absolute paths')
+        max_ops = config('scrub-max-ops-in-progress')
+        if max_ops is not None and max_ops != '':
+            try:
+                max_ops = _bounded_int(1, 1000)(max_ops)
+            except ValueError as e:
+                raise ValueError('scrub-max-ops-in-progress: {}'.format(e))
+        return {'schedule': schedule, 'window': window, 'paths': paths,
+                'max-ops': max_ops or None}
+
+    def get_mds_autoscale(self):
+        """Get the settings of the max_mds autoscaler.
+
+        :returns: The 'interval' between two runs, the 'cache-limit' in
+                  bytes and the 'settings' of the controller as taken by
+                  ``mds_autoscale.decide``, None if autoscaling is off.
+        :rtype: Optional[Dict[str, Any]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        if not config('mds-autoscale'):
+            return None
+        settings = {}
+        for option, key, validate in (
+                ('mds-autoscale-min-mds', 'min-mds', _bounded_int(1, 64)),
+                ('mds-autoscale-max-mds', 'max-mds', _bounded_int(1, 64)),
+                ('mds-autoscale-up-rate', 'up-rate', float),
+                ('mds-autoscale-down-rate', 'down-rate', float),
+                ('mds-autoscale-cache-pressure', 'cache-pressure', float),
+                ('mds-autoscale-sustain', 'sustain', parse_duration),
+                ('mds-autoscale-cooldown', 'cooldown', parse_duration),
+                ('mds-autoscale-standbys', 'standbys', _bounded_int(0, 64))):
+            try:
+                settings[key] = validate(config(option))
+            except (TypeError, ValueError) as e:
+                raise ValueError('{}: {}'.format(option, e))
+        if settings['max-mds'] < settings['min-mds']:
+            raise ValueError('mds-autoscale-max-mds: expected at least '
+                             'mds-autoscale-min-mds')
+        if not 0 <= settings['down-rate'] < settings['up-rate']:
+            raise ValueError('mds-autoscale-down-rate: expected a rate '
+                             'below mds-autoscale-up-rate')
+        if settings['cache-pressure'] <= 0:
+            raise ValueError('mds-autoscale-cache-pressure: expected a '
+                             'positive ratio')
+        try:
+            interval = parse_duration(config('mds-autoscale-interval'))
+        except ValueError as e:
+            raise ValueError('mds-autoscale-interval: {}'.format(e))
+        if interval <= 0 or interval > settings['sustain']:
+            raise ValueError('mds-autoscale-interval: expected a positive '
+                             'duration up to mds-autoscale-sustain')
+        return {'interval': interval,
+                'cache-limit': parse_size(config('mds-cache-memory-limit')),
+                'settings': settings}
+
+    def get_mds_cache_autotune(self):
+        """Get the settings of the cache limit tuner.
+
+        :returns: The 'interval' between two runs and the 'settings' of the
+                  tuner as taken by ``mds_cache_tune.decide``, None if the
+                  tuning is off.
+        :rtype: Optional[Dict[str, Any]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        if not config('mds-cache-autotune'):
+            return None
+        settings = {}
+        for option, key, validate in (
+                ('mds-cache-autotune-floor', 'floor', parse_size),
+                ('mds-cache-autotune-ceiling', 'ceiling', parse_size),
+                ('mds-cache-autotune-headroom', 'headroom', parse_size),
+                ('mds-cache-autotune-target-hit-ratio', 'target-hit-ratio',
+                 float),
+                ('mds-cache-autotune-step', 'step', float),
+                ('mds-cache-autotune-interval', 'interval', parse_duration)):
+            try:
+                settings[key] = validate(config(option))
+            except (TypeError, ValueError) as e:
+                raise ValueError('{}: {}'.format(option, e))
+        if not 0 < settings['floor'] <= settings['ceiling']:
+            raise ValueError('mds-cache-autotune-floor: expected a size up '
+                             'to mds-cache-autotune-ceiling')
+        if not 0 < settings['target-hit-ratio'] <= 1:
+            raise ValueError('mds-cache-autotune-target-hit-ratio: expected '
+                             'a ratio between 0 and 1')
+        if not 0 < settings['step'] <= 1:
+            raise ValueError('mds-cache-autotune-step: expected a ratio '
+                             'between 0 and 1')
+        if settings['interval'] <= 0:
+            raise ValueError('mds-cache-autotune-interval: expected a '
+                             'positive duration')
+        return {'interval': settings.pop('interval'), 'settings': settings}
+
+    def get_mirror_config(self):
+        """Get the tunables of the cephfs-mirror daemon.
+
+        :returns: cephfs-mirror options and their values, for the options
+                  set.
+        :rtype: List[Tuple[str, int]]
+        :raises: ValueError if an option has an invalid value.
+        """
+        settings = []
+        for option, mirror_option, validate in MIRROR_CONFIG:
+            value = config(option)
+            if value is None or value == '':
+                continue
+            try:
+                settings.append((mirror_option, validate(value)))
+            except ValueError as e:
+                raise ValueError('{}: {}'.format(option, e))
+        return settings
+
+    def configure_mirror(self):
+        """Enable the cephfs-mirror daemon, or stop it when turned off."""
+        if config('cephfs-mirror'):
+            if config('cephfs-mirror-key'):
+                ch_host.service('enable', mirror.MIRROR_SERVICE)
+                if not ch_host.service_running(mirror.MIRROR_SERVICE):
+                    ch_host.service_start(mirror.MIRROR_SERVICE)
+        elif os.path.exists(MIRROR_SERVICE_DROPIN):
+            ch_host.service_stop(mirror.MIRROR_SERVICE)
+            ch_host.service('disable', mirror.MIRROR_SERVICE)
+            for path in (MIRROR_SERVICE_DROPIN, MIRROR_KEYRING, MIRROR_CONF):
+                os.remove(path)
+            subprocess.check_call(['systemctl', 'daemon-reload'])
+
+    def get_transparent_hugepage(self):
+        """Get the transparent huge page mode requested for the host.
+
+        :returns: The mode, or None to leave the host default.
+        :rtype: Optional[str]
+        :raises: ValueError if the mode is invalid.
+        """
+        mode = config('transparent-hugepage')
+        if not mode:
+            return None
+        if mode not in THP_MODES:
+            raise ValueError('transparent-hugepage: expected one of {}'
+                             .format(', '.join(THP_MODES)))
+        return mode
+
+    def get_mds_process(self):
+        """Find the ceph-mds process of this unit.
+
+        The process is the main one of the systemd unit of the MDS, rather
+        than found among all the processes.
+
+        :returns: The process, or None if the daemon is not running.
+        :rtype: Optional[psutil.Process]
+        """
+        try:
+            output = subprocess.check_output(
+                ['systemctl', 'show', '--property', 'MainPID', '--value',
+                 'ceph-mds@{}'.format(self.hostname)],
+                universal_newlines=True)
+            pid = int(output.strip() or 0)
+        except (subprocess.CalledProcessError, ValueError) as e:
+            log('Unable to find the MDS process: {}'.format(e), DEBUG)
+            return None
+        if not pid:
+            # MainPID is 0 while the unit is not running.
+            return None
+        try:
+            return psutil.Process(pid)
+        except psutil.Error:
+            return None
+
+    def get_sysctl(self):
+        """Get the kernel settings requested through the configuration.
+
+        :returns: sysctl keys and their values.
+        :rtype: Dict[str, str]
+        :raises: ValueError if the option is not a YAML mapping.
+        """
+        try:
+            settings = yaml.safe_load(config('sysctl') or '{}') or {}
+        except yaml.YAMLError as e:
+            raise ValueError('sysctl: {}'.format(e))
+        if not isinstance(settings, dict) or not all(
+                isinstance(value, (str, int)) for value in settings.values()):
+            raise ValueError('sysctl: expected a mapping of keys to values')
+        return {str(key): str(value) for key, value in settings.items()}
+
+    def apply_sysctl(self):
+        """Write and load the kernel settings when they changed.
+
+        Containers can not change most kernel settings, nothing is applied
+        in one.
+        """
+        if ch_host.is_container():
+            return
+        try:
+            settings = self.get_sysctl()
+        except ValueError:
+            return
+        if (reactive.data_changed('ceph-fs.sysctl', settings) or
+                not os.path.exists(SYSCTL_FILE)):
+            ch_sysctl.create(yaml.safe_dump(settings), SYSCTL_FILE)
+
+    def check_sysctl(self):
+        """Check the kernel and the MDS run with the requested settings.
+
+        :returns: Status notes for the settings that differ from the ones
+                  applied by the charm.
+        :rtype: List[str]
+        """
+        if ch_host.is_container():
+            return []
+        try:
+            settings = self.get_sysctl()
+            nofile = dict(self.get_mds_service_resources()).get(
+                'LimitNOFILE')
+        except ValueError:
+            return []
+        drift = []
+        for key, value in sorted(settings.items()):
+            try:
+                with open(os.path.join(PROC_SYS,
+                                       *key.split('.'))) as f:
+                    current = f.read().split()
+            except OSError:
+                continue
+            if current != value.split():
+                drift.append('{}={}'.format(key, ' '.join(current)))
+        proc = self.get_mds_process() if nofile else None
+        if proc is not None:
+            try:
+                current = proc.rlimit(psutil.RLIMIT_NOFILE)[0]
+            except psutil.Error:
+                current = nofile
+            if current != nofile:
+                drift.append('nofile={}'.format(current))
+        if not drift:
+            return []
+        return ['settings differ from the charm: {}'.format(
+            ', '.join(drift))]
+
+    def check_mds_allocator(self):
+        """Check the allocator settings are in effect and report usage.
+
+        :returns: Status notes with the resident memory of the daemon
+                  against the cache limit, and any setting that is not
+                  applied yet.
+        :rtype: List[str]
+        """
+        notes = []
+        proc = self.get_mds_process()
+        if proc is None:
+            return notes
+        try:
+            rss = proc.memory_info().rss
+            environ = proc.environ()
+        except psutil.Error as e:
+            log('Unable to inspect the MDS process: {}'.format(e), DEBUG)
+            return notes
+        try:
+            cache_limit = format_size(
+                parse_size(config('mds-cache-memory-limit')))
+        except ValueError:
+            cache_limit = config('mds-cache-memory-limit')
+        notes.append('MDS RSS {} of {} cache limit'.format(
+            format_size(rss), cache_limit))
+        try:
+            expected = self.get_mds_environment()
+            thp_mode = self.get_transparent_hugepage()
+        except ValueError:
+            return notes
+        stale = [variable for variable, value in expected
+                 if environ.get(variable) != str(value)]
+        if stale:
+            notes.append('restart needed to apply {}'.format(
+                ', '.join(stale)))
+        if thp_mode:
+            try:
+                with open(THP_ENABLED) as f:
+                    current = re.search(r'\[(\w+)\]', f.read())
+            except OSError:
+                current = None
+            if current and current.group(1) != thp_mode:
+                notes.append('transparent hugepages {} instead of {}'.format(
+                    current.group(1), thp_mode))
+        return notes
+
+    def check_mds_memory_limits(self):
+        """Check the memory limits of the service leave room for the cache.
+
+        The MDS is expected to use up to mds-cache-memory-limit times
+        mds-health-cache-threshold before it raises a health warning, so
+        MemoryMax must not be lower than that. MemoryHigh is only required
+        to fit the cache itself, as exceeding it throttles the daemon rather
+        than killing it. With the cache tuning on, the cache may grow up to
+        mds-cache-autotune-ceiling.
+
+        :returns: Workload state and message, or (None, None) if consistent.
+        :rtype: Tuple[Optional[str], Optional[str]]
+        """
+        resources = dict(self.get_mds_service_resources())
+        try:
+            cache_limit = parse_size(config('mds-cache-memory-limit'))
+        except ValueError:
+            return 'blocked', ('Invalid configuration: '
+                               'mds-cache-memory-limit')
+        autotune = self.get_mds_cache_autotune()
+        if autotune:
+            cache_limit = max(cache_limit, autotune['settings']['ceiling'])
+        threshold = config('mds-health-cache-threshold') or 1
+        required = {
+            'MemoryMax': ('memory-max', int(cache_limit * threshold)),
+            'MemoryHigh': ('memory-high', cache_limit),
         }
+        for directive, (option, minimum) in required.items():
+            limit = resources.get(directive)
+            if isinstance(limit, int) and limit < minimum:
+                return 'blocked', (
+                    '{} ({}) is too low for mds-cache-memory-limit, '
+                    'need at least {}'.format(option, format_size(limit),
+                                              format_size(minimum)))
+        return None, None
 
     # NOTE(fnordahl) moved from reactive handler module, otherwise keeping
     # these as-is to make the diff managable. At some point in time we should
@@ -175,9 +1146,11 @@ class BaseCephFSCharm(charms_openstack.plugins.CephCharm):
 
 class MitakaCephFSCharm(BaseCephFSCharm):
     release = 'mitaka'
-    packages = ['ceph-mds', 'gdisk', 'btrfs-tools', 'xfsprogs']
+    packages = ['ceph-mds', 'gdisk', 'btrfs-tools', 'xfsprogs',
+                'python3-cephfs', 'python3-rados']
 
 
 class UssuriCephFSCharm(BaseCephFSCharm):
     release = 'ussuri'
-    packages = ['ceph-mds', 'gdisk', 'btrfs-progs', 'xfsprogs']
+    packages = ['ceph-mds', 'gdisk', 'btrfs-progs', 'xfsprogs',
+                'python3-cephfs', 'python3-rados']
@@ -0,0 +1,129 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Access CephFS through libcephfs using the unit's own MDS key.
+
+This avoids the need for a local (kernel or FUSE) mount of the filesystem
+on the unit running the action.
+"""
+
+import contextlib
+import socket
+
+import cephfs
+import rados
+
+from charm.openstack.ceph_cli import CEPH_CONF, MDS_KEYRING
+
+Error = (cephfs.Error, rados.Error)
+
+
+@contextlib.contextmanager
+def connect(filesystem=None):
+    """Mount a filesystem through libcephfs.
+
+    The connection authenticates as the local MDS (``mds.<hostname>``) with
+    the keyring the charm installed for it, so it works on any unit that
+    has been configured.
+
+    :param filesystem: Name of the filesystem to mount, None for the default.
+    :type filesystem: Optional[str]
+    :returns: A mounted libcephfs handle.
+    :rtype: Iterator[cephfs.LibCephFS]
+    :raises: cephfs.Error, rados.Error
+    """
+    hostname = socket.gethostname()
+    cluster = rados.Rados(name='mds.{}'.format(hostname),
+                          conffile=CEPH_CONF,
+                          conf={'keyring': MDS_KEYRING.format(hostname)})
+    cluster.connect()
+    try:
+        fs = cephfs.LibCephFS(rados_inst=cluster)
+        fs.mount(filesystem_name=filesystem)
+        try:
+            yield fs
+        finally:
+            fs.shutdown()
+    finally:
+        cluster.shutdown()
+
+
+def get_xattr(fs, path, name):
+    """Read an extended attribute as a string.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param path: Path within the filesystem.
+    :type path: str
+    :param name: Name of the attribute, e.g. ``ceph.quota.max_bytes``.
+    :type name: str
+    :rtype: str
+    :raises: cephfs.Error
+    """
+    return fs.getxattr(path, name).decode('utf-8')
+
+
+def set_xattr(fs, path, name, value):
+    """Set an extended attribute from a string value.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param path: Path within the filesystem.
+    :type path: str
+    :param name: Name of the attribute, e.g. ``ceph.quota.max_bytes``.
+    :type name: str
+    :param value: Value of the attribute.
+    :type value: str
+    :raises: cephfs.Error
+    """
+    fs.setxattr(path, name, str(value).encode('utf-8'), 0)
+
+
+def get_quota(fs, path):
+    """Quota of a directory.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param path: Path within the filesystem.
+    :type path: str
+    :returns: The 'max-bytes' and 'max-files' limits, 0 when not set.
+    :rtype: Dict[str, int]
+    :raises: cephfs.Error
+    """
+    quota = {}
+    for name in ('max_bytes', 'max_files'):
+        try:
+            value = get_xattr(fs, path, 'ceph.quota.{}'.format(name))
+        except cephfs.NoData:
+            value = None
+        quota[name.replace('_', '-')] = int(value or 0)
+    return quota
+
+
+def get_rctime(fs, path):
+    """Last change below a directory, from its recursive statistics.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param path: Path of a directory within the filesystem.
+    :type path: str
+    :returns: Seconds since the epoch of the most recent change of the
+              directory or of anything below it.
+    :rtype: float
+    :raises: cephfs.Error, ValueError if the attribute can not be parsed.
+    """
+    # Seconds and nanoseconds, e.g. '1700000000.090000000'.
+    seconds, _, nanoseconds = get_xattr(
+        fs, path, 'ceph.dir.rctime').partition('.')
+    return int(seconds) + int(nanoseconds or 0) / 1e9
@@ -0,0 +1,234 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Find the files and directories changed since a given time.
+
+The MDS keeps the time of the last change below every directory in its
+``ceph.dir.rctime`` attribute, so a subtree whose rctime is older than the
+time looked for is skipped without being listed. Only the directories on
+the way to a change are read, and the files in them are checked one by one
+against their change time. A directory is reported when its own change time
+is recent, which is also how the removal or the renaming of its entries
+shows, as removed files can not be reported themselves.
+
+The walk stops at its time limit and saves a cursor, the next run resumes
+from it. Changes are appended to OUTPUT as they are found, one JSON object
+per line, with their 'path', 'type' and 'ctime', and the 'size' of files.
+"""
+
+import contextlib
+import datetime
+import json
+import os
+import posixpath
+import threading
+import time
+
+import cephfs
+
+from charm.openstack import cephfs_client, tree_walk
+from charm.openstack.utils import parse_duration
+
+CURSOR = 'find-changes'
+OUTPUT = os.path.join(tree_walk.STATE_DIR, 'find-changes.jsonl')
+CHECKPOINT_INTERVAL = 30
+
+
+def parse_since(value, now=None):
+    """Time from which changes are looked for.
+
+    :param value: Seconds since the epoch, a date and time in ISO 8601
+                  format, in local time unless it has an offset, or a
+                  duration before ``now`` such as '24h' or '7d'.
+    :type value: str
+    :param now: Time the durations are counted back from, the current one
+                by default.
+    :type now: Optional[float]
+    :returns: Seconds since the epoch.
+    :rtype: float
+    :raises: ValueError if the value can not be parsed.
+    """
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        return (time.time() if now is None else now) - parse_duration(value)
+    except ValueError:
+        pass
+    try:
+        return datetime.datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        raise ValueError('Invalid time: {!r}, expected seconds since the '
+                         'epoch, an ISO 8601 date or a duration'.format(value))
+
+
+def _timestamp(value):
+    # Older bindings return seconds, newer ones datetimes.
+    if hasattr(value, 'timestamp'):
+        value = value.timestamp()
+    return float(value)
+
+
+def _list_files(fs, path):
+    names = []
+    handle = fs.opendir(path)
+    try:
+        entry = fs.readdir(handle)
+        while entry:
+            if not entry.is_dir():
+                names.append(entry.d_name.decode('utf-8', 'surrogateescape'))
+            entry = fs.readdir(handle)
+    finally:
+        fs.closedir(handle)
+    return sorted(names)
+
+
+class ChangeFinder(object):
+    """Changes within directories, skipping the subtrees left unchanged.
+
+    :param since: Seconds since the epoch from which changes are reported.
+    :type since: float
+    """
+
+    def __init__(self, since):
+        self.since = since
+        self.lock = threading.Lock()
+        self.skipped = 0
+
+    def _change(self, path, kind, stat):
+        ctime = _timestamp(stat.st_ctime)
+        if ctime < self.since:
+            return None
+        change = {'path': path, 'type': kind, 'ctime': ctime}
+        if kind == 'file':
+            change['size'] = stat.st_size
+        return change
+
+    def visit(self, fs, path):
+        """Changes within a directory, for a split ``tree_walk.TreeWalk``."""
+        if cephfs_client.get_rctime(fs, path) < self.since:
+            with self.lock:
+                self.skipped += 1
+            return [], False
+        changes = [self._change(path, 'directory', fs.stat(path))]
+        for name in _list_files(fs, path):
+            file_path = posixpath.join(path, name)
+            try:
+                changes.append(self._change(file_path, 'file',
+                                            fs.lstat(file_path)))
+            except cephfs.ObjectNotFound:
+                # Removed since the listing, its directory changed too.
+                pass
+        return [change for change in changes if change], True
+
+
+def find_changes(fs, roots=('/',), since=None, workers=8, exclude=(),
+                 batch_size=100, time_limit=None, resume=False,
+                 on_batch=None):
+    """Walk the changed parts of the tree and report what changed.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param roots: Directories to walk.
+    :type roots: List[str]
+    :param since: Seconds since the epoch from which changes are reported.
+    :type since: float
+    :param workers: Directories read at once.
+    :type workers: int
+    :param exclude: Glob patterns of subtrees to skip.
+    :type exclude: List[str]
+    :param batch_size: Changes per batch.
+    :type batch_size: int
+    :param time_limit: Seconds after which the walk is interrupted, None
+                       for no limit.
+    :type time_limit: Optional[float]
+    :param resume: Resume the interrupted walk, whose roots, time and
+                   exclusions are used instead of the given ones.
+    :type resume: bool
+    :param on_batch: Called with every batch of changes found.
+    :type on_batch: Optional[Callable[[List[Dict[str, Any]]], None]]
+    :returns: Whether the walk is 'complete', the 'since' time, the number
+              of directories 'scanned', of unchanged subtrees 'skipped', of
+              changes 'found' and of directories still 'pending' for the
+              whole walk, the directories that 'failed' and the 'output'
+              file.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if there is no walk to resume or no time is given,
+             cephfs.Error
+    """
+    if resume:
+        cursor = tree_walk.load_cursor(CURSOR)
+        if not cursor:
+            raise ValueError('There is no interrupted find-changes walk')
+    else:
+        if since is None:
+            raise ValueError('A time to find the changes since is required')
+        cursor = {'roots': list(roots), 'since': since,
+                  'exclude': list(exclude),
+                  'pending': [[root, 0] for root in roots],
+                  'scanned': 0, 'skipped': 0, 'found': 0, 'failed': []}
+        os.makedirs(os.path.dirname(OUTPUT), exist_ok=True)
+        open(OUTPUT, 'w').close()
+    finder = ChangeFinder(cursor['since'])
+    walk = tree_walk.TreeWalk(
+        fs, finder.visit, cursor['pending'], workers=workers,
+        exclude=cursor['exclude'], errors=(cephfs_client.Error, ValueError),
+        split=True)
+    start = time.monotonic()
+    checkpoint = start
+    batch = []
+
+    def _flush():
+        with open(OUTPUT, 'a') as f:
+            for change in batch:
+                f.write(json.dumps(change) + '\n')
+        if on_batch:
+            # A directory may hold more changes than a batch.
+            for index in range(0, len(batch), batch_size):
+                on_batch(batch[index:index + batch_size])
+        cursor['found'] += len(batch)
+        del batch[:]
+        with finder.lock:
+            cursor['skipped'] += finder.skipped
+            finder.skipped = 0
+        cursor['scanned'] += walk.scanned
+        cursor['failed'] += walk.failed
+        walk.scanned, walk.failed = 0, []
+        cursor['pending'] = walk.pending()
+        tree_walk.save_cursor(CURSOR, cursor)
+
+    with contextlib.closing(walk.run()) as results:
+        for _, changes in results:
+            batch.extend(changes)
+            now = time.monotonic()
+            if (len(batch) >= batch_size or
+                    now - checkpoint >= CHECKPOINT_INTERVAL):
+                _flush()
+                checkpoint = now
+            if time_limit is not None and now - start >= time_limit:
+                break
+    _flush()
+    complete = not cursor['pending']
+    if complete:
+        tree_walk.save_cursor(CURSOR, None)
+    return {'complete': complete,
+            'since': cursor['since'],
+            'scanned': cursor['scanned'],
+            'skipped': cursor['skipped'],
+            'found': cursor['found'],
+            'pending': len(cursor['pending']),
+            'failed': cursor['failed'],
+            'output': OUTPUT}
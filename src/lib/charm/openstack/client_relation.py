@@ -0,0 +1,186 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Share the filesystem with the applications related as clients.
+
+Every application related on the ``cephfs-client`` endpoint gets a cephx
+key restricted to the path it asks for, the monitor addresses and the client
+options recommended by the charm. The MDS key can not create other keys, so
+the leader asks the monitors for them with a ``create-cephfs-client`` broker
+request, one client at a time as the broker answers with a single key. The
+keys are kept in the leader settings to survive a change of leader.
+"""
+
+import json
+import posixpath
+
+import charms.reactive as reactive
+
+from charmhelpers.contrib.storage.linux import ceph as ch_ceph
+from charmhelpers.core.hookenv import (
+    leader_get, leader_set, log, related_units, relation_get, relation_ids,
+    relation_set, remote_service_name, WARNING)
+
+ENDPOINT = 'cephfs-client'
+BROKER_RELATION = 'ceph-mds'
+KEY_OP = 'create-cephfs-client'
+KEYS_SETTING = 'cephfs-client-keys'
+
+
+def requested_clients():
+    """Applications related as clients and the path each one mounts.
+
+    The path is taken from the 'path' setting of the remote units, the root
+    of the filesystem if none is set.
+
+    :returns: Relation id to the cephx 'client' entity of the application
+              and its 'path'.
+    :rtype: Dict[str, Dict[str, str]]
+    """
+    clients = {}
+    for rid in relation_ids(ENDPOINT):
+        units = related_units(rid)
+        if not units:
+            continue
+        paths = set(filter(None, (relation_get('path', unit, rid)
+                                  for unit in units)))
+        path = sorted(paths)[0] if paths else '/'
+        if len(paths) > 1 or not path.startswith('/'):
+            log('Ignoring {}: units request different or relative paths '
+                '{}'.format(rid, sorted(paths)), WARNING)
+            continue
+        clients[rid] = {
+            'client': 'client.{}'.format(remote_service_name(rid)),
+            'path': posixpath.normpath(path),
+        }
+    return clients
+
+
+def get_keys():
+    """Keys handed out so far.
+
+    :returns: cephx entity to its 'key' and the 'path' it is restricted to.
+    :rtype: Dict[str, Dict[str, str]]
+    """
+    return json.loads(leader_get(KEYS_SETTING) or '{}')
+
+
+def pending_clients(clients=None, keys=None):
+    """Clients still waiting for a key for the path they requested.
+
+    :rtype: List[Dict[str, str]]
+    """
+    clients = requested_clients() if clients is None else clients
+    keys = get_keys() if keys is None else keys
+    return sorted((c for c in clients.values()
+                   if keys.get(c['client'], {}).get('path') != c['path']),
+                  key=lambda c: c['client'])
+
+
+def _broker_response(rid, request_id):
+    attribute = ch_ceph.get_broker_rsp_key()
+    for unit in related_units(rid):
+        response = relation_get(attribute, unit, rid)
+        if response:
+            response = json.loads(response)
+            if response.get('request-id') == request_id:
+                return response
+    return None
+
+
+def collect_keys(keys):
+    """Add the key the monitors created for the last request to ``keys``.
+
+    :param keys: Keys as returned by ``get_keys``, updated in place.
+    :type keys: Dict[str, Dict[str, str]]
+    """
+    for rid in relation_ids(BROKER_RELATION):
+        request = ch_ceph.get_previous_request(rid)
+        ops = [op for op in (request.ops if request else [])
+               if op.get('op') == KEY_OP]
+        if not ops:
+            continue
+        response = _broker_response(rid, request.request_id)
+        if not response:
+            continue
+        if response.get('exit-code') or not response.get('key'):
+            log('No key for {} in the broker response: {}'.format(
+                ops[-1]['client_id'], response.get('stderr')), WARNING)
+            continue
+        keys[ops[-1]['client_id']] = {'key': response['key'],
+                                      'path': ops[-1]['path']}
+
+
+def request_key(fs_name, client, path):
+    """Ask the monitors for a key of ``client`` restricted to ``path``.
+
+    The key operation replaces any previous one in the broker request of
+    this unit and comes last, the pool and filesystem operations are kept.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :param client: cephx entity, e.g. 'client.app'.
+    :type client: str
+    :param path: Directory the key gives read-write access to.
+    :type path: str
+    """
+    for rid in relation_ids(BROKER_RELATION):
+        previous = ch_ceph.get_previous_request(rid)
+        ops = [op for op in (previous.ops if previous else [])
+               if op.get('op') != KEY_OP]
+        ops.append({'op': KEY_OP, 'fs_name': fs_name, 'client_id': client,
+                    'path': path, 'perms': 'rw'})
+        request = ch_ceph.CephBrokerRq()
+        request.set_ops(ops)
+        ch_ceph.send_request_if_needed(request, relation=BROKER_RELATION)
+
+
+def update(fs_name, fsid, mon_hosts, options):
+    """Hand out keys and publish the connection details to the clients.
+
+    Only called on the leader, which owns the application data of the
+    relations and the broker request.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :param fsid: Cluster fsid.
+    :type fsid: str
+    :param mon_hosts: Monitor addresses.
+    :type mon_hosts: List[str]
+    :param options: Client settings published along with the key.
+    :type options: Dict[str, str]
+    """
+    clients = requested_clients()
+    stored = get_keys()
+    keys = dict(stored)
+    collect_keys(keys)
+    related = {c['client'] for c in clients.values()}
+    keys = {client: key for client, key in keys.items() if client in related}
+    if keys != stored:
+        leader_set({KEYS_SETTING: json.dumps(keys, sort_keys=True)})
+    pending = pending_clients(clients, keys)
+    if pending:
+        request_key(fs_name, pending[0]['client'], pending[0]['path'])
+    for rid, client in clients.items():
+        if client in pending:
+            continue
+        data = dict(options,
+                    **{'fs-name': fs_name,
+                       'fsid': fsid,
+                       'mon-hosts': ' '.join(mon_hosts or []),
+                       'client-id': client['client'].split('.', 1)[1],
+                       'key': keys[client['client']]['key'],
+                       'path': client['path']})
+        if reactive.data_changed('{}.{}'.format(ENDPOINT, rid), data):
+            relation_set(relation_id=rid, relation_settings=data, app=True)
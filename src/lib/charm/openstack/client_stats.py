@@ -0,0 +1,234 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Per-client performance of the filesystem, as shown by ``cephfs-top``.
+
+Clients report their counters to the MDS, which forwards them to the mgr
+``stats`` module behind ``ceph fs perf stats``. The I/O counters are
+cumulative, rates are computed from two samples taken ``interval`` seconds
+apart. Clients do not report a metadata operation count, it is estimated
+from the growth of their total metadata latency divided by their average
+metadata latency.
+"""
+
+import time
+
+from charm.openstack import ceph_cli
+from charm.openstack.utils import format_size
+
+SORT_KEYS = ('metadata-ops', 'read-throughput', 'write-throughput',
+             'cap-hit-ratio', 'metadata-latency', 'read-latency',
+             'write-latency')
+
+TABLE_COLUMNS = (
+    ('client', 'CLIENT', '{}'),
+    ('hostname', 'HOST', '{}'),
+    ('root', 'ROOT', '{}'),
+    ('metadata-ops', 'MD OPS/S', '{:.1f}'),
+    ('read-throughput', 'READ/S', None),
+    ('write-throughput', 'WRITE/S', None),
+    ('cap-hit-ratio', 'CAP HIT', '{:.1%}'),
+    ('metadata-latency', 'MD LAT MS', '{:.2f}'),
+    ('read-latency', 'RD LAT MS', '{:.2f}'),
+    ('write-latency', 'WR LAT MS', '{:.2f}'),
+)
+
+
+def enable_stats_module():
+    """Enable the mgr ``stats`` module unless it already is.
+
+    :returns: Whether the module had to be enabled.
+    :rtype: bool
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    modules = ceph_cli.ceph_command('mgr', 'module', 'ls', timeout=60) or {}
+    if 'stats' in (modules.get('enabled_modules') or []) + (
+            modules.get('always_on_modules') or []):
+        return False
+    ceph_cli.ceph_command('mgr', 'module', 'enable', 'stats', timeout=60)
+    return True
+
+
+def _for_filesystem(section, fs_name):
+    # Since Quincy the metrics are grouped by filesystem name.
+    section = section or {}
+    if isinstance(section.get(fs_name), dict):
+        return section[fs_name]
+    return {client: value for client, value in section.items()
+            if client.startswith('client.')}
+
+
+def _seconds(value):
+    return value[0] + value[1] / 1e9
+
+
+def parse_counters(stats, fs_name):
+    """Decode the per-client counters of ``ceph fs perf stats``.
+
+    :param stats: Output of ``ceph fs perf stats``.
+    :type stats: Dict[str, Any]
+    :param fs_name: Filesystem the clients are mounting.
+    :type fs_name: str
+    :returns: Client entity to its 'hostname', 'root', cap 'cap-hits' and
+              'cap-misses', 'read-ops', 'read-bytes', 'write-ops',
+              'write-bytes', total 'metadata-latency-total' and average
+              latencies in seconds, for the counters the client reports.
+    :rtype: Dict[str, Dict[str, Any]]
+    """
+    names = stats.get('global_counters') or []
+    metadata = _for_filesystem(stats.get('client_metadata'), fs_name)
+    clients = {}
+    for client, values in _for_filesystem(stats.get('global_metrics'),
+                                          fs_name).items():
+        counters = dict(zip(names, values))
+        info = metadata.get(client) or {}
+        entry = {'hostname': info.get('hostname', 'unknown'),
+                 'root': info.get('root', '/')}
+        if 'cap_hit' in counters:
+            entry['cap-hits'], entry['cap-misses'] = counters['cap_hit']
+        for name in ('read', 'write'):
+            if '{}_io_sizes'.format(name) in counters:
+                ops, size = counters['{}_io_sizes'.format(name)]
+                entry['{}-ops'.format(name)] = ops
+                entry['{}-bytes'.format(name)] = size
+        if 'metadata_latency' in counters:
+            entry['metadata-latency-total'] = _seconds(
+                counters['metadata_latency'])
+        for name in ('metadata', 'read', 'write'):
+            if 'avg_{}_latency'.format(name) in counters:
+                entry['{}-latency'.format(name)] = _seconds(
+                    counters['avg_{}_latency'.format(name)])
+        clients[client] = entry
+    return clients
+
+
+def _matches(row, client, root):
+    if client and client not in (row['client'], row['client'].split('.')[-1],
+                                 row['hostname']):
+        return False
+    if root:
+        root = root.rstrip('/')
+        if row['root'] != root and not row['root'].startswith(root + '/'):
+            return False
+    return True
+
+
+def client_rates(before, after, interval):
+    """Combine two samples of ``parse_counters`` into per-client rates.
+
+    :param before: First sample.
+    :type before: Dict[str, Dict[str, Any]]
+    :param after: Second sample.
+    :type after: Dict[str, Dict[str, Any]]
+    :param interval: Seconds between the samples.
+    :type interval: float
+    :returns: One row per client present in the second sample, with
+              'metadata-ops' per second, 'read-throughput' and
+              'write-throughput' in bytes per second, 'read-iops',
+              'write-iops', 'cap-hit-ratio' and latencies in milliseconds.
+    :rtype: List[Dict[str, Any]]
+    """
+    rows = []
+    for client, now in after.items():
+        then = before.get(client, {})
+
+        def _rate(key):
+            if key not in now:
+                return None
+            return max(0, now[key] - then.get(key, 0)) / interval
+
+        row = {'client': client,
+               'hostname': now['hostname'],
+               'root': now['root'],
+               'read-iops': _rate('read-ops'),
+               'write-iops': _rate('write-ops'),
+               'read-throughput': _rate('read-bytes'),
+               'write-throughput': _rate('write-bytes')}
+        latency_growth = _rate('metadata-latency-total')
+        if latency_growth is not None and now.get('metadata-latency'):
+            row['metadata-ops'] = latency_growth / now['metadata-latency']
+        else:
+            row['metadata-ops'] = None
+        hits = now.get('cap-hits', 0)
+        caps = hits + now.get('cap-misses', 0)
+        row['cap-hit-ratio'] = hits / caps if caps else None
+        for name in ('metadata', 'read', 'write'):
+            latency = now.get('{}-latency'.format(name))
+            row['{}-latency'.format(name)] = (
+                None if latency is None else latency * 1000)
+        rows.append(row)
+    return rows
+
+
+def top(fs_name, interval=5, client=None, root=None, sort='metadata-ops',
+        limit=20):
+    """Sample the client counters and rank the clients.
+
+    :param fs_name: Filesystem the clients are mounting.
+    :type fs_name: str
+    :param interval: Seconds between the two samples.
+    :type interval: float
+    :param client: Only report this client, given as entity, id or host.
+    :type client: Optional[str]
+    :param root: Only report clients mounting this directory or below.
+    :type root: Optional[str]
+    :param sort: Column to sort by, one of SORT_KEYS, highest first.
+    :type sort: str
+    :param limit: Number of clients reported.
+    :type limit: int
+    :returns: The rows as returned by ``client_rates``.
+    :rtype: List[Dict[str, Any]]
+    :raises: ValueError, subprocess.CalledProcessError,
+             subprocess.TimeoutExpired
+    """
+    if sort not in SORT_KEYS:
+        raise ValueError('Invalid sort key {}, expected one of {}'.format(
+            sort, ', '.join(SORT_KEYS)))
+    enable_stats_module()
+    before = parse_counters(
+        ceph_cli.ceph_command('fs', 'perf', 'stats', timeout=60) or {},
+        fs_name)
+    time.sleep(interval)
+    after = parse_counters(
+        ceph_cli.ceph_command('fs', 'perf', 'stats', timeout=60) or {},
+        fs_name)
+    rows = [row for row in client_rates(before, after, interval)
+            if _matches(row, client, root)]
+    rows.sort(key=lambda row: (-(row[sort] or 0), row['client']))
+    return rows[:limit]
+
+
+def format_table(rows):
+    """Render rows of ``top`` as a text table.
+
+    :type rows: List[Dict[str, Any]]
+    :rtype: str
+    """
+    lines = [[title for _, title, _ in TABLE_COLUMNS]]
+    for row in rows:
+        line = []
+        for key, _, fmt in TABLE_COLUMNS:
+            value = row.get(key)
+            if value is None:
+                line.append('-')
+            elif fmt is None:
+                line.append(format_size(value))
+            else:
+                line.append(fmt.format(value))
+        lines.append(line)
+    widths = [max(len(line[i]) for line in lines)
+              for i in range(len(TABLE_COLUMNS))]
+    return '\n'.join(
+        '  '.join(cell.ljust(width) for cell, width in zip(line, widths))
+        .rstrip() for line in lines)
@@ -0,0 +1,218 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Find large directories and manage their fragmentation.
+
+The MDS splits a directory fragment once it holds more than
+``mds_bal_split_size`` entries and refuses new entries in a fragment above
+``mds_bal_fragment_size_max`` or a directory above ``mds_dir_max_entries``.
+Directories close to these limits are the usual cause of MDS stalls.
+"""
+
+import collections
+import math
+import os
+import subprocess
+
+from charm.openstack import ceph_cli, cephfs_client
+
+THRESHOLDS = ('mds_bal_split_size', 'mds_bal_fragment_size_max',
+              'mds_dir_max_entries')
+
+
+def get_thresholds():
+    """Read the fragmentation limits from the local MDS.
+
+    :returns: Value of every option in THRESHOLDS, 0 for the options the
+              running version does not know.
+    :rtype: Dict[str, int]
+    """
+    thresholds = {}
+    for option in THRESHOLDS:
+        try:
+            value = ceph_cli.daemon_command('config', 'get', option)
+        except subprocess.CalledProcessError:
+            value = None
+        thresholds[option] = int((value or {}).get(option) or 0)
+    return thresholds
+
+
+def subtree_roots():
+    """Paths of the subtrees the MDS cluster is partitioned into.
+
+    :rtype: List[str]
+    """
+    paths = set()
+    for subtree in ceph_cli.daemon_command('get', 'subtrees') or []:
+        path = subtree.get('dir', {}).get('path')
+        # The root is reported as '', MDS private directories ('~mds0')
+        # are not part of the filesystem tree.
+        if path == '' or (path or '').startswith('/'):
+            paths.add(path or '/')
+    return sorted(paths)
+
+
+def fragments(path):
+    """Fragments of a directory, as 'value/bits' strings.
+
+    :param path: Directory within the filesystem.
+    :type path: str
+    :returns: The fragments, None if the directory is not in the cache of
+              the local MDS.
+    :rtype: Optional[List[str]]
+    """
+    try:
+        frags = ceph_cli.daemon_command('dirfrag', 'ls', path)
+    except subprocess.CalledProcessError:
+        return None
+    return [frag['str'] for frag in frags or []]
+
+
+def _dir_stats(fs, path):
+    stats = {'path': path}
+    for name in ('entries', 'files', 'subdirs', 'rentries'):
+        stats[name] = int(cephfs_client.get_xattr(
+            fs, path, 'ceph.dir.{}'.format(name)))
+    return stats
+
+
+def _subdirs(fs, path):
+    handle = fs.opendir(path)
+    try:
+        entry = fs.readdir(handle)
+        while entry:
+            name = entry.d_name.decode('utf-8', errors='surrogateescape')
+            if entry.is_dir() and name not in ('.', '..'):
+                yield os.path.join(path, name)
+            entry = fs.readdir(handle)
+    finally:
+        fs.closedir(handle)
+
+
+def scan(fs, roots, depth=2, max_listing=100000):
+    """Collect the entry counts of directories below some roots.
+
+    Directories are walked breadth first. A directory is only listed to
+    find its subdirectories if it has some and holds no more than
+    ``max_listing`` entries, listing huge directories is what hurts.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param roots: Directories to start from.
+    :type roots: Iterable[str]
+    :param depth: Levels of subdirectories to descend into.
+    :type depth: int
+    :param max_listing: Largest directory listed.
+    :type max_listing: int
+    :returns: Stats of every directory visited, with the 'entries',
+              'files' and 'subdirs' it holds and its recursive 'rentries'.
+    :rtype: List[Dict[str, Any]]
+    :raises: cephfs.Error
+    """
+    queue = collections.deque((root, 0) for root in roots)
+    seen = set()
+    stats = []
+    while queue:
+        path, level = queue.popleft()
+        if path in seen:
+            continue
+        seen.add(path)
+        entry = _dir_stats(fs, path)
+        stats.append(entry)
+        if (level < depth and entry['subdirs'] and
+                entry['entries'] <= max_listing):
+            queue.extend((subdir, level + 1)
+                         for subdir in _subdirs(fs, path))
+    return stats
+
+
+def _warnings(entry, thresholds, warn_ratio):
+    warnings = []
+    per_fragment = entry['entries'] / max(1, len(entry['fragments'] or []))
+    for option, size in (('mds_bal_split_size', per_fragment),
+                         ('mds_bal_fragment_size_max', per_fragment),
+                         ('mds_dir_max_entries', entry['entries'])):
+        limit = thresholds.get(option)
+        if limit and size >= limit * warn_ratio:
+            warnings.append('{} at {:.0%} of {} ({})'.format(
+                'fragment' if option != 'mds_dir_max_entries'
+                else 'directory', size / limit, option, limit))
+    return warnings
+
+
+def report(fs, roots, depth=2, top=20, warn_ratio=0.9):
+    """List the largest directories and flag the ones close to the limits.
+
+    The subtree roots of the MDS cluster are always included.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param roots: Directories to scan from.
+    :type roots: Iterable[str]
+    :param depth: Levels of subdirectories to descend into.
+    :type depth: int
+    :param top: Number of directories reported.
+    :type top: int
+    :param warn_ratio: Fraction of a limit above which a directory is
+                       flagged.
+    :type warn_ratio: float
+    :returns: The 'thresholds' in effect, the number of directories
+              'scanned' and the largest 'directories' with their fragments
+              and 'warnings'.
+    :rtype: Dict[str, Any]
+    :raises: cephfs.Error, subprocess.CalledProcessError,
+             subprocess.TimeoutExpired
+    """
+    thresholds = get_thresholds()
+    stats = scan(fs, list(roots) + subtree_roots(), depth=depth)
+    largest = sorted(stats, key=lambda s: (-s['entries'], s['path']))[:top]
+    for entry in largest:
+        entry['fragments'] = fragments(entry['path'])
+        entry['warnings'] = _warnings(entry, thresholds, warn_ratio)
+    return {'thresholds': thresholds,
+            'scanned': len(stats),
+            'directories': largest}
+
+
+def fragment_directory(path, count):
+    """Split the fragments of a directory ahead of its growth.
+
+    Every fragment with fewer bits than needed for ``count`` fragments is
+    split, fragments that are already smaller are left alone. This requires
+    ``mds_bal_fragment_dirs`` and the directory to be in the cache of the
+    local MDS, which must be its authority.
+
+    :param path: Directory within the filesystem.
+    :type path: str
+    :param count: Number of fragments wanted, a power of 2.
+    :type count: int
+    :returns: The fragments after the split.
+    :rtype: List[str]
+    :raises: ValueError, subprocess.CalledProcessError,
+             subprocess.TimeoutExpired
+    """
+    if count < 1 or count & (count - 1):
+        raise ValueError('The number of fragments must be a power of 2, '
+                         'got {}'.format(count))
+    bits = int(math.log2(count))
+    current = fragments(path)
+    if current is None:
+        raise ValueError('{} is not in the cache of the local MDS'.format(
+            path))
+    for frag in current:
+        frag_bits = int(frag.split('/')[1])
+        if frag_bits < bits:
+            ceph_cli.daemon_command('dirfrag', 'split', path, frag,
+                                    bits - frag_bits)
+    return fragments(path)
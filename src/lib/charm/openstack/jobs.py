@@ -0,0 +1,369 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Background jobs for the actions that outlast the action timeout.
+
+A job runs one of the KINDS of long operations in a transient systemd unit
+started by ``systemd-run``, detached from the action that started it. Its
+state is a JSON file in JOBS_DIR, updated by the unit with the progress
+messages of the operation and, once it is over, with its result or error.
+Stopping the unit cancels the job: the operation is interrupted and can be
+resumed from its last checkpoint, as after its time limit.
+
+Jobs are started under a lock, at most ``max_jobs`` at once and a single
+one of each kind, as operations of the same kind share their cursor. A job
+is 'starting' until its unit runs it. A job whose unit is gone without
+recording its end, e.g. killed or lost in a reboot, is reported as failed.
+The state of a job is changed under a lock of its own, the unit recording
+its progress at most every PROGRESS_INTERVAL seconds.
+
+Run as a module, this is the process of the transient unit.
+"""
+
+import argparse
+import contextlib
+import fcntl
+import functools
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+JOBS_DIR = '/var/lib/ceph-fs-charm/jobs'
+UNIT_PREFIX = 'ceph-fs-job-'
+ACTIVE = ('starting', 'running')
+FINISHED = ('completed', 'failed', 'cancelled')
+# Progress messages kept in the state of a job.
+MAX_LOG = 20
+# Finished jobs kept, the oldest ones are removed first.
+MAX_FINISHED = 50
+# Seconds a cancelled job has to stop its workers before it is killed.
+STOP_TIMEOUT = 300
+# Seconds a job may stay starting without its unit before it has failed.
+START_TIMEOUT = 60
+# Seconds between two saves of the progress messages of a job.
+PROGRESS_INTERVAL = 5
+
+
+class Cancelled(Exception):
+    pass
+
+
+def _list_quotas(filesystem, params, log):
+    from charm.openstack import cephfs_client, quotas
+    with cephfs_client.connect(filesystem) as fs:
+        return quotas.list_quotas(
+            fs, on_batch=lambda batch: log(json.dumps(batch)), **params)
+
+
+def _find_changes(filesystem, params, log):
+    from charm.openstack import cephfs_client, changes
+    with cephfs_client.connect(filesystem) as fs:
+        return changes.find_changes(
+            fs, on_batch=lambda batch: log(json.dumps(batch)), **params)
+
+
+def _migrate_layout(filesystem, params, log):
+    from charm.openstack import cephfs_client, layout_migration
+    with cephfs_client.connect(filesystem) as fs:
+        return layout_migration.migrate(fs, on_progress=log, **params)
+
+
+def _delete_tree(filesystem, params, log):
+    from charm.openstack import bulk_delete, cephfs_client
+    with cephfs_client.connect(filesystem) as fs:
+        return bulk_delete.delete(
+            fs, queue_length=functools.partial(
+                bulk_delete.purge_queue_length, filesystem),
+            on_progress=log, **params)
+
+
+# Operations run as jobs, called with the filesystem, the keyword arguments
+# of the operation and a callback for its progress messages.
+KINDS = {
+    'delete-tree': _delete_tree,
+    'find-changes': _find_changes,
+    'list-quotas': _list_quotas,
+    'migrate-layout': _migrate_layout,
+}
+
+
+def _path(job_id):
+    return os.path.join(JOBS_DIR, '{}.json'.format(job_id))
+
+
+def _lock_path(job_id):
+    return os.path.join(JOBS_DIR, '.{}.lock'.format(job_id))
+
+
+def load(job_id):
+    """State of a job.
+
+    :param job_id: Identifier of the job.
+    :type job_id: str
+    :returns: The job, None if there is no such job.
+    :rtype: Optional[Dict[str, Any]]
+    """
+    if not job_id or os.sep in job_id:
+        return None
+    try:
+        with open(_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save(job):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    f = tempfile.NamedTemporaryFile('w', dir=JOBS_DIR, prefix='.',
+                                    suffix='.new', delete=False)
+    try:
+        with f:
+            json.dump(job, f)
+        os.replace(f.name, _path(job['id']))
+    except Exception:
+        os.remove(f.name)
+        raise
+
+
+@contextlib.contextmanager
+def _flock(path):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    with open(path, 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def _locked():
+    # Concurrent actions must not start more jobs than allowed.
+    return _flock(os.path.join(JOBS_DIR, '.lock'))
+
+
+def _job_locked(job_id):
+    # The unit of a job and the actions load, change and save its state
+    # under this lock.
+    return _flock(_lock_path(job_id))
+
+
+def _update(job_id, changes):
+    with _job_locked(job_id):
+        job = load(job_id)
+        if job is None:
+            raise ValueError('There is no job {}'.format(job_id))
+        job.update(changes)
+        save(job)
+    return job
+
+
+def unit_active(unit):
+    """Whether a systemd unit is running.
+
+    :type unit: str
+    :rtype: bool
+    """
+    return subprocess.call(['systemctl', 'is-active', '--quiet', unit]) == 0
+
+
+def _gone(job):
+    if job['state'] == 'starting':
+        # The unit does not exist until systemd-run returns.
+        return (time.time() - job['created'] >= START_TIMEOUT and
+                not unit_active(job['unit']))
+    return job['state'] == 'running' and not unit_active(job['unit'])
+
+
+def refresh(job):
+    """Fail an active job whose unit is gone.
+
+    :param job: State of the job, updated.
+    :type job: Dict[str, Any]
+    :returns: The job.
+    :rtype: Dict[str, Any]
+    """
+    if not _gone(job):
+        return job
+    with _job_locked(job['id']):
+        # The unit may have recorded its start or end since the state was
+        # read.
+        job.update(load(job['id']) or {})
+        if _gone(job):
+            job.update({'state': 'failed', 'finished': time.time(),
+                        'error': 'The job stopped without recording its '
+                                 'end'})
+            save(job)
+    return job
+
+
+def list_jobs():
+    """All the jobs kept, oldest first.
+
+    :rtype: List[Dict[str, Any]]
+    """
+    try:
+        names = os.listdir(JOBS_DIR)
+    except OSError:
+        return []
+    jobs = [load(name[:-len('.json')]) for name in names
+            if name.endswith('.json')]
+    return sorted((refresh(job) for job in jobs if job),
+                  key=lambda job: job['created'])
+
+
+def _prune(jobs):
+    finished = [job for job in jobs if job['state'] in FINISHED]
+    for job in finished[:max(0, len(finished) - MAX_FINISHED)]:
+        os.remove(_path(job['id']))
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(_lock_path(job['id']))
+
+
+def start(kind, filesystem, params, lib_dir, max_jobs=None):
+    """Start an operation in the background.
+
+    :param kind: Operation, one of KINDS.
+    :type kind: str
+    :param filesystem: Name of the filesystem the operation works on.
+    :type filesystem: str
+    :param params: Keyword arguments of the operation, JSON serialisable.
+    :type params: Dict[str, Any]
+    :param lib_dir: Directory of the charm libraries, for the unit.
+    :type lib_dir: str
+    :param max_jobs: Jobs running at once, None for no limit.
+    :type max_jobs: Optional[int]
+    :returns: The state of the job.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if the job may not start,
+             subprocess.CalledProcessError
+    """
+    if kind not in KINDS:
+        raise ValueError('Unknown job kind: {}'.format(kind))
+    with _locked():
+        jobs = list_jobs()
+        running = [job for job in jobs if job['state'] in ACTIVE]
+        for job in running:
+            if job['kind'] == kind:
+                raise ValueError('A {} job is already running: {}'.format(
+                    kind, job['id']))
+        if max_jobs and len(running) >= max_jobs:
+            raise ValueError('{} jobs already running, the limit is '
+                             '{}'.format(len(running), max_jobs))
+        job_id = uuid.uuid4().hex[:8]
+        job = {'id': job_id, 'kind': kind, 'filesystem': filesystem,
+               'params': params, 'unit': UNIT_PREFIX + job_id,
+               'state': 'starting', 'created': time.time(), 'started': None,
+               'finished': None, 'progress': None, 'log': [],
+               'result': None, 'error': None}
+        save(job)
+        try:
+            subprocess.check_call([
+                'systemd-run', '--unit', job['unit'], '--collect', '--quiet',
+                '--description', 'ceph-fs {} job {}'.format(kind, job_id),
+                '--setenv', 'PYTHONPATH={}'.format(lib_dir),
+                '--property', 'TimeoutStopSec={}'.format(STOP_TIMEOUT),
+                '/usr/bin/python3', '-m', 'charm.openstack.jobs', job_id])
+        except subprocess.CalledProcessError as e:
+            job = _update(job_id, {
+                'state': 'failed', 'finished': time.time(),
+                'error': 'Unable to start the unit: {}'.format(e)})
+            raise
+        _prune(jobs)
+    return job
+
+
+def cancel(job_id):
+    """Stop a running job.
+
+    :param job_id: Identifier of the job.
+    :type job_id: str
+    :returns: The state of the job.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if there is no such job or it is over,
+             subprocess.CalledProcessError
+    """
+    job = load(job_id)
+    if not job:
+        raise ValueError('There is no job {}'.format(job_id))
+    if job['state'] in FINISHED:
+        raise ValueError('Job {} is already {}'.format(job_id, job['state']))
+    if unit_active(job['unit']):
+        # The unit records the cancellation as it stops.
+        subprocess.check_call(['systemctl', 'stop', job['unit']])
+    with _job_locked(job_id):
+        job = load(job_id)
+        if job['state'] in ACTIVE:
+            job.update({'state': 'cancelled', 'finished': time.time()})
+            save(job)
+    return job
+
+
+def run(job_id):
+    """Run a job, in its transient unit.
+
+    :param job_id: Identifier of the job.
+    :type job_id: str
+    :returns: The state of the job once over.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if there is no such job.
+    """
+    job = load(job_id)
+    if not job:
+        raise ValueError('There is no job {}'.format(job_id))
+
+    progress = {'progress': job['progress'], 'log': job['log']}
+    saved = [time.monotonic()]
+
+    def _cancel(signum, frame):
+        raise Cancelled()
+
+    def _log(message):
+        progress.update({'progress': message, 'updated': time.time(),
+                         'log': (progress['log'] + [message])[-MAX_LOG:]})
+        now = time.monotonic()
+        if now - saved[0] >= PROGRESS_INTERVAL:
+            _update(job_id, progress)
+            saved[0] = now
+
+    signal.signal(signal.SIGTERM, _cancel)
+    _update(job_id, {'state': 'running', 'started': time.time()})
+    end = {}
+    try:
+        end['result'] = KINDS[job['kind']](job['filesystem'],
+                                           job['params'], _log)
+        end['state'] = 'completed'
+    except Cancelled:
+        end['state'] = 'cancelled'
+    except Exception as e:
+        end['state'] = 'failed'
+        end['error'] = '{}: {}'.format(type(e).__name__, e)
+    end['finished'] = time.time()
+    return _update(job_id, dict(progress, **end))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run a background job of the ceph-fs charm.')
+    parser.add_argument('job_id')
+    args = parser.parse_args(argv)
+    job = run(args.job_id)
+    if job['state'] == 'failed':
+        print(job['error'], file=sys.stderr)
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,335 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Move the data of existing files to another data pool.
+
+The layout of a file can only change while it is empty, so every file is
+copied to a new file next to it, created in the new pool, which then
+replaces it. The copy gets the owner, mode, user extended attributes and
+times of the original, and its size and SHA-256 digest are checked against
+the original before the rename. A file modified during the copy is left
+alone and reported as failed, the next run retries it. Hard links to a file
+are moved to its copy, so they keep sharing their data.
+
+Directories are migrated by a ``tree_walk.TreeWalk`` with a cursor saved
+every CHECKPOINT_INTERVAL seconds, the next run resumes from it. Files
+already in the new pool are skipped, so a directory being migrated when the
+walk stopped is only copied once. The bytes read from the cluster, by the
+copies and their verification, are held under a bandwidth cap.
+"""
+
+import contextlib
+import hashlib
+import os
+import posixpath
+import threading
+import time
+
+import cephfs
+
+from charm.openstack import cephfs_client, tree_walk
+from charm.openstack.utils import RateLimiter, format_size
+
+CURSOR = 'migrate-layout'
+CHECKPOINT_INTERVAL = 30
+# Name of the copies, next to their original.
+SUFFIX = '.ceph-fs-migrate'
+CHUNK_SIZE = 4 << 20
+
+
+class Modified(Exception):
+    pass
+
+
+def _list_files(fs, path):
+    names = []
+    handle = fs.opendir(path)
+    try:
+        entry = fs.readdir(handle)
+        while entry:
+            if entry.is_file():
+                names.append(entry.d_name.decode('utf-8', 'surrogateescape'))
+            entry = fs.readdir(handle)
+    finally:
+        fs.closedir(handle)
+    return sorted(names)
+
+
+def _timestamp(value):
+    # Older bindings return seconds, newer ones datetimes.
+    if hasattr(value, 'timestamp'):
+        value = value.timestamp()
+    return int(value)
+
+
+class LayoutMigration(object):
+    """Copy the files of directories into a data pool.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param pool: Data pool to move the files to.
+    :type pool: str
+    :param links: Copies of the files with hard links already migrated, by
+                  inode number of the original.
+    :type links: Dict[str, str]
+    :param bandwidth: Bytes read per second, None for no limit.
+    :type bandwidth: Optional[int]
+    """
+
+    def __init__(self, fs, pool, links=None, bandwidth=None):
+        self.fs = fs
+        self.pool = pool
+        self.links = dict(links or {})
+        self.limiter = RateLimiter(bandwidth)
+        # Files with hard links are migrated one at a time, so that two
+        # of their links are never copied at once.
+        self.links_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.counters = {'migrated': 0, 'linked': 0, 'skipped': 0,
+                         'bytes': 0}
+        self.failed = []
+
+    def _count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def _read(self, fd, digest, out=None):
+        offset = 0
+        while True:
+            data = self.fs.read(fd, offset, CHUNK_SIZE)
+            if not data:
+                return offset
+            self.limiter.consume(len(data))
+            digest.update(data)
+            if out is not None:
+                self.fs.write(out, data, offset)
+            offset += len(data)
+
+    def _copy_metadata(self, path, copy, stat):
+        self.fs.chown(copy, stat.st_uid, stat.st_gid)
+        self.fs.chmod(copy, stat.st_mode & 0o7777)
+        names = self.fs.listxattr(path)
+        if isinstance(names, tuple):
+            names = names[1]
+        for name in filter(None, names.split(b'\0')):
+            name = name.decode('utf-8')
+            if not name.startswith('ceph.'):
+                self.fs.setxattr(copy, name, self.fs.getxattr(path, name), 0)
+        self.fs.utime(copy, (_timestamp(stat.st_atime),
+                             _timestamp(stat.st_mtime)))
+
+    def _remove_leftover(self, copy):
+        try:
+            self.fs.unlink(copy)
+        except cephfs.ObjectNotFound:
+            pass
+
+    def _copy(self, path, stat):
+        copy = path + SUFFIX
+        self._remove_leftover(copy)
+        out = self.fs.open(copy, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o600)
+        try:
+            cephfs_client.set_xattr(self.fs, copy, 'ceph.file.layout.pool',
+                                    self.pool)
+            source = hashlib.sha256()
+            fd = self.fs.open(path, os.O_RDONLY, 0)
+            try:
+                size = self._read(fd, source, out)
+            finally:
+                self.fs.close(fd)
+            self.fs.fsync(out, 0)
+        finally:
+            self.fs.close(out)
+        try:
+            after = self.fs.stat(path)
+            if (size != stat.st_size or after.st_size != stat.st_size or
+                    after.st_mtime != stat.st_mtime):
+                raise Modified('modified during the copy')
+            written = hashlib.sha256()
+            fd = self.fs.open(copy, os.O_RDONLY, 0)
+            try:
+                self._read(fd, written)
+            finally:
+                self.fs.close(fd)
+            if written.digest() != source.digest():
+                raise Modified('checksum of the copy differs')
+            self._copy_metadata(path, copy, stat)
+            self.fs.rename(copy, path)
+        except BaseException:
+            self.fs.unlink(copy)
+            raise
+        self._count('migrated')
+        self._count('bytes', size)
+
+    def _link(self, path, stat):
+        target = self.links.get(str(stat.st_ino))
+        if target:
+            copy = path + SUFFIX
+            self._remove_leftover(copy)
+            try:
+                self.fs.link(target, copy)
+            except cephfs.ObjectNotFound:
+                # The copy was removed or renamed since, copy again.
+                pass
+            else:
+                self.fs.rename(copy, path)
+                self._count('linked')
+                if stat.st_nlink == 1:
+                    # The last link moved, the inode number of the
+                    # original may be reused by a new file.
+                    del self.links[str(stat.st_ino)]
+                return
+        self._copy(path, stat)
+        if stat.st_nlink > 1:
+            self.links[str(stat.st_ino)] = path
+
+    def migrate_file(self, path):
+        """Move a file to the pool, unless it is already in it.
+
+        :param path: Path of the file within the filesystem.
+        :type path: str
+        :raises: cephfs.Error, rados.Error, Modified
+        """
+        if path.endswith(SUFFIX):
+            # A copy left over by an interrupted run, redone with its file.
+            return
+        stat = self.fs.stat(path)
+        if cephfs_client.get_xattr(
+                self.fs, path, 'ceph.file.layout.pool') == self.pool:
+            self._count('skipped')
+            return
+        # Moving a link lowers the link count of the original, the last
+        # link left is only known by its inode number. The number is looked
+        # up under the lock, which is held until the copy of a previous
+        # link is recorded.
+        with self.links_lock:
+            if stat.st_nlink > 1 or str(stat.st_ino) in self.links:
+                self._link(path, stat)
+                return
+        self._copy(path, stat)
+
+    def visit(self, fs, path):
+        """Migrate the files of a directory, for ``tree_walk.TreeWalk``."""
+        for name in _list_files(fs, path):
+            file_path = posixpath.join(path, name)
+            try:
+                self.migrate_file(file_path)
+            except (cephfs_client.Error, Modified) as e:
+                with self.lock:
+                    self.failed.append({'path': file_path, 'error': str(e)})
+
+
+def migrate(fs, root='/', pool=None, workers=4, bandwidth=None, exclude=(),
+            time_limit=None, resume=False, on_progress=None):
+    """Move the files below a directory to another data pool.
+
+    The layout of ``root`` is set to the pool first, so that the files
+    created meanwhile are created in it.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param root: Directory to migrate.
+    :type root: str
+    :param pool: Data pool of the filesystem to move the files to.
+    :type pool: str
+    :param workers: Directories migrated at once.
+    :type workers: int
+    :param bandwidth: Bytes read per second by all the workers, None for no
+                      limit.
+    :type bandwidth: Optional[int]
+    :param exclude: Glob patterns of subtrees to skip.
+    :type exclude: List[str]
+    :param time_limit: Seconds after which the migration is interrupted,
+                       None for no limit.
+    :type time_limit: Optional[float]
+    :param resume: Resume the interrupted migration, whose root, pool and
+                   exclusions are used instead of the given ones.
+    :type resume: bool
+    :param on_progress: Called with a progress message at every checkpoint.
+    :type on_progress: Optional[Callable[[str], None]]
+    :returns: Whether the migration is 'complete', the number of
+              directories 'scanned', files 'migrated', 'linked' and
+              'skipped' and the 'bytes' copied for the whole migration, the
+              directories still 'pending', the files and directories that
+              'failed' and the 'throughput' of this run.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if there is no migration to resume, cephfs.Error
+    """
+    if resume:
+        cursor = tree_walk.load_cursor(CURSOR)
+        if not cursor:
+            raise ValueError('There is no interrupted migration')
+    else:
+        if not pool:
+            raise ValueError('A pool is required')
+        cephfs_client.set_xattr(fs, root, 'ceph.dir.layout.pool', pool)
+        cursor = {'root': root, 'pool': pool, 'exclude': list(exclude),
+                  'pending': [[root, 0]], 'links': {}, 'scanned': 0,
+                  'migrated': 0, 'linked': 0, 'skipped': 0, 'bytes': 0,
+                  'failed': []}
+    migration = LayoutMigration(fs, cursor['pool'], links=cursor['links'],
+                                bandwidth=bandwidth)
+    walk = tree_walk.TreeWalk(fs, migration.visit, cursor['pending'],
+                              workers=workers, exclude=cursor['exclude'],
+                              errors=cephfs_client.Error)
+    start = time.monotonic()
+    checkpoint = start
+    copied = 0
+
+    def _checkpoint():
+        with migration.lock:
+            counters = dict(migration.counters)
+            failed = migration.failed
+            migration.counters = dict.fromkeys(counters, 0)
+            migration.failed = []
+        for name, value in counters.items():
+            cursor[name] += value
+        cursor['failed'] += walk.failed + failed
+        cursor['scanned'] += walk.scanned
+        walk.scanned, walk.failed = 0, []
+        cursor['links'] = dict(migration.links)
+        cursor['pending'] = walk.pending()
+        tree_walk.save_cursor(CURSOR, cursor)
+        return counters['bytes']
+
+    with contextlib.closing(walk.run()) as results:
+        for _ in results:
+            now = time.monotonic()
+            if now - checkpoint >= CHECKPOINT_INTERVAL:
+                copied += _checkpoint()
+                checkpoint = now
+                if on_progress:
+                    on_progress('{} files migrated, {} copied at {}/s, {} '
+                                'directories pending'.format(
+                                    cursor['migrated'],
+                                    format_size(cursor['bytes']),
+                                    format_size(copied / (now - start)),
+                                    len(cursor['pending'])))
+            if time_limit is not None and now - start >= time_limit:
+                break
+    copied += _checkpoint()
+    elapsed = time.monotonic() - start
+    complete = not cursor['pending']
+    if complete:
+        tree_walk.save_cursor(CURSOR, None)
+    return {'complete': complete,
+            'scanned': cursor['scanned'],
+            'migrated': cursor['migrated'],
+            'linked': cursor['linked'],
+            'skipped': cursor['skipped'],
+            'bytes': cursor['bytes'],
+            'pending': len(cursor['pending']),
+            'failed': cursor['failed'],
+            'throughput': '{}/s'.format(
+                format_size(copied / elapsed if elapsed else 0))}
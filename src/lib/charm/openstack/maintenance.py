@@ -0,0 +1,298 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Maintenance window for the operations that disrupt clients.
+
+The window is a cron expression of five fields, minute, hour, day of the
+month, month and day of the week, matched against the local time of the
+unit: the window is open during every minute the expression matches, e.g.
+``* 1-4 * * 6,0`` from 01:00 to 04:59 on weekends. Operations outside of
+the window are queued in MAINTENANCE_STATE, by the hooks, the actions and
+the services of the charm alike, and run by the first hook once the window
+opens. Forcing an operation lets it run at once regardless of the window.
+"""
+
+import contextlib
+import datetime
+import fcntl
+import json
+import os
+import time
+
+from charm.openstack.utils import format_duration
+
+MAINTENANCE_STATE = '/var/lib/ceph-fs-charm/maintenance.json'
+# Name and range of the fields of the window.
+FIELDS = (('minute', 0, 59), ('hour', 0, 23), ('day of month', 1, 31),
+          ('month', 1, 12), ('day of week', 0, 7))
+# Days searched for the next opening of the window, a leap year.
+SEARCH_DAYS = 366 * 4
+
+
+def _parse_field(text, name, low, high):
+    values = set()
+    for part in text.split(','):
+        span, _, step = part.partition('/')
+        try:
+            step = int(step) if step else 1
+            if span == '*':
+                first, last = low, high
+            elif '-' in span:
+                first, last = (int(value) for value in span.split('-', 1))
+            else:
+                first = int(span)
+                last = high if step > 1 else first
+        except ValueError:
+            raise ValueError('invalid {} {!r}'.format(name, part))
+        if not low <= first <= last <= high or step < 1:
+            raise ValueError('{} {!r} out of range {}-{}'.format(
+                name, part, low, high))
+        values.update(range(first, last + 1, step))
+    return values
+
+
+def parse_window(expression):
+    """Parse a maintenance window.
+
+    :param expression: Cron expression of the minutes in the window.
+    :type expression: str
+    :returns: The values matched by each field, the day of the week 0 being
+              Sunday, and whether the days of the month and of the week
+              are restricted. None for an empty expression.
+    :rtype: Optional[Dict[str, Any]]
+    :raises: ValueError if the expression is invalid.
+    """
+    fields = (expression or '').split()
+    if not fields:
+        return None
+    if len(fields) != len(FIELDS):
+        raise ValueError('expected 5 fields, minute, hour, day of month, '
+                         'month and day of week')
+    window = {name: _parse_field(field, name, low, high)
+              for field, (name, low, high) in zip(fields, FIELDS)}
+    if 7 in window['day of week']:
+        window['day of week'] = (window['day of week'] - {7}) | {0}
+    # As in cron, restricting both days matches either of them.
+    window['restricted'] = fields[2] != '*' and fields[4] != '*'
+    return window
+
+
+def _day_matches(window, date):
+    weekday = (date.weekday() + 1) % 7
+    if date.month not in window['month']:
+        return False
+    if window['restricted']:
+        return (date.day in window['day of month'] or
+                weekday in window['day of week'])
+    return (date.day in window['day of month'] and
+            weekday in window['day of week'])
+
+
+def window_open(expression, now=None):
+    """Whether the maintenance window is open.
+
+    :param expression: Cron expression of the window, always open if
+                       empty.
+    :type expression: str
+    :param now: Local time to check, the current one by default.
+    :type now: Optional[datetime.datetime]
+    :rtype: bool
+    :raises: ValueError if the expression is invalid.
+    """
+    window = parse_window(expression)
+    if window is None:
+        return True
+    now = now or datetime.datetime.now()
+    return (now.minute in window['minute'] and now.hour in window['hour'] and
+            _day_matches(window, now.date()))
+
+
+def next_opening(expression, now=None):
+    """Next time the maintenance window opens.
+
+    :param expression: Cron expression of the window.
+    :type expression: str
+    :param now: Local time to start from, the current one by default.
+    :type now: Optional[datetime.datetime]
+    :returns: The first minute of the window after ``now``, ``now`` if the
+              window is open, None if it never opens.
+    :rtype: Optional[datetime.datetime]
+    :raises: ValueError if the expression is invalid.
+    """
+    now = now or datetime.datetime.now()
+    if window_open(expression, now):
+        return now
+    window = parse_window(expression)
+    for days in range(SEARCH_DAYS):
+        date = now.date() + datetime.timedelta(days=days)
+        if not _day_matches(window, date):
+            continue
+        for hour in sorted(window['hour']):
+            for minute in sorted(window['minute']):
+                opening = datetime.datetime.combine(
+                    date, datetime.time(hour, minute))
+                if opening > now:
+                    return opening
+    return None
+
+
+def load_state():
+    """Operations queued for the maintenance window.
+
+    :returns: The 'pending' operations with their details, and the ones
+              'forced' to run regardless of the window.
+    :rtype: Dict[str, Any]
+    """
+    try:
+        with open(MAINTENANCE_STATE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        state = {}
+    state.setdefault('pending', {})
+    state.setdefault('forced', [])
+    return state
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(MAINTENANCE_STATE), exist_ok=True)
+    with open(MAINTENANCE_STATE + '.new', 'w') as f:
+        json.dump(state, f)
+    os.replace(MAINTENANCE_STATE + '.new', MAINTENANCE_STATE)
+
+
+@contextlib.contextmanager
+def _locked():
+    # Hooks, actions and services of the charm update the queue.
+    os.makedirs(os.path.dirname(MAINTENANCE_STATE), exist_ok=True)
+    with open(MAINTENANCE_STATE + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = load_state()
+        yield state
+        save_state(state)
+
+
+def defer(operation, details=None):
+    """Queue an operation for the maintenance window.
+
+    An operation is queued once: the details of a queued one are updated,
+    the 'services' to restart are added to the ones already queued.
+
+    :param operation: Name of the operation, e.g. 'restart'.
+    :type operation: str
+    :param details: What the operation needs to run.
+    :type details: Optional[Dict[str, Any]]
+    """
+    with _locked() as state:
+        queued = state['pending'].get(operation) or {}
+        merged = dict(queued, **(details or {}))
+        if 'services' in queued:
+            merged['services'] = sorted(set(queued['services']) |
+                                        set(merged['services']))
+        merged['since'] = queued.get('since') or merged.get('since') or (
+            time.time())
+        state['pending'][operation] = merged
+
+
+def postpone(expression, operation, details=None):
+    """Queue an operation unless it may run now.
+
+    It may run when the window is open or when it was forced, which is
+    then cleared.
+
+    :param expression: Cron expression of the window.
+    :type expression: str
+    :param operation: Name of the operation.
+    :type operation: str
+    :param details: What the operation needs to run.
+    :type details: Optional[Dict[str, Any]]
+    :returns: Whether the operation was queued.
+    :rtype: bool
+    :raises: ValueError if the expression is invalid.
+    """
+    if window_open(expression):
+        return False
+    with _locked() as state:
+        if operation in state['forced']:
+            state['forced'].remove(operation)
+            state['pending'].pop(operation, None)
+            return False
+    defer(operation, details)
+    return True
+
+
+def force(operations=None):
+    """Let queued operations run regardless of the window.
+
+    :param operations: Operations to force, all the queued ones by default.
+    :type operations: Optional[List[str]]
+    :returns: The operations forced.
+    :rtype: List[str]
+    """
+    with _locked() as state:
+        if operations is None:
+            operations = list(state['pending'])
+        state['forced'] = sorted(set(state['forced']) | set(operations))
+        return list(operations)
+
+
+def take(expression):
+    """Remove the operations that may run now from the queue.
+
+    :param expression: Cron expression of the window.
+    :type expression: str
+    :returns: The operations with their details: all of them when the
+              window is open, the forced ones otherwise.
+    :rtype: Dict[str, Dict[str, Any]]
+    :raises: ValueError if the expression is invalid.
+    """
+    is_open = window_open(expression)
+    with _locked() as state:
+        runnable = {operation: details
+                    for operation, details in state['pending'].items()
+                    if is_open or operation in state['forced']}
+        for operation in runnable:
+            del state['pending'][operation]
+        state['forced'] = [operation for operation in state['forced']
+                           if operation not in runnable]
+        return runnable
+
+
+def status_note(expression):
+    """Operations waiting for the window, for the workload status.
+
+    :param expression: Cron expression of the window.
+    :type expression: str
+    :returns: The note, None if nothing is queued.
+    :rtype: Optional[str]
+    """
+    pending = load_state()['pending']
+    if not pending:
+        return None
+    operations = []
+    for operation, details in sorted(pending.items()):
+        if details.get('services'):
+            operation = '{} {}'.format(operation,
+                                       ' '.join(details['services']))
+        operations.append(operation)
+    note = 'deferred: {}'.format(', '.join(operations))
+    try:
+        opening = next_opening(expression)
+    except ValueError:
+        return note
+    if opening is None:
+        return note + ', the maintenance window never opens'
+    delay = (opening - datetime.datetime.now()).total_seconds()
+    if delay > 0:
+        note += ', maintenance window in {}'.format(format_duration(delay))
+    return note
@@ -0,0 +1,244 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Scale the number of active MDS ranks with the load of the filesystem.
+
+Every run samples the request rate of the active ranks and the cache usage
+of the most loaded one, and keeps the samples of the last ``sustain``
+seconds in AUTOSCALE_STATE. ``max_mds`` is raised when every sample of that
+period shows the ranks over the scale-up rate, or a rank unable to trim its
+cache under ``cache-pressure`` times its limit. It is lowered when every
+sample shows the request rate would still be under the scale-down rate with
+one rank less; the cache always fills up to its limit, so it tells nothing
+about an idle rank. The gap between the two rates and the projection on one
+rank less keep the controller from flapping, and no change is made for
+``cooldown`` seconds after the previous one. ``max_mds`` is always kept low
+enough to leave ``standbys`` daemons to take over failed ranks.
+
+Run as a module, this is the service started by the autoscale timer of the
+leader. Decisions are printed to the journal of the service and the last
+ones kept in AUTOSCALE_STATE for the workload status.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from charm.openstack import ceph_cli
+from charm.openstack.utils import format_duration, parse_duration
+
+AUTOSCALE_STATE = '/var/lib/ceph-fs-charm/autoscale.json'
+MAX_DECISIONS = 20
+
+
+def load_state():
+    """Samples and decisions of the previous runs.
+
+    :returns: The 'samples', the 'decisions' and the 'max-mds' set, empty
+              if the controller never ran.
+    :rtype: Dict[str, Any]
+    """
+    try:
+        with open(AUTOSCALE_STATE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(AUTOSCALE_STATE), exist_ok=True)
+    with open(AUTOSCALE_STATE + '.new', 'w') as f:
+        json.dump(state, f)
+    os.replace(AUTOSCALE_STATE + '.new', AUTOSCALE_STATE)
+
+
+def sample(fs_name, cache_limit):
+    """Measure the load of the active ranks.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :param cache_limit: mds-cache-memory-limit, in bytes.
+    :type cache_limit: int
+    :returns: The sample 'time', the number of 'active' ranks, of
+              'standby' daemons and of all the 'daemons', the 'max-mds'
+              and 'standby-count-wanted' of the filesystem, the total
+              request 'rate' and the highest 'cache' usage of a rank, as a
+              share of ``cache_limit``.
+    :rtype: Dict[str, Any]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    status = ceph_cli.ceph_command('fs', 'status', fs_name, timeout=60) or {}
+    daemons = status.get('mdsmap') or []
+    active = [mds for mds in daemons if mds.get('state') == 'active']
+    cache = 0
+    for mds in active:
+        output = ceph_cli.ceph_command('tell', 'mds.{}'.format(mds['name']),
+                                       'cache', 'status', timeout=60) or {}
+        cache = max(cache, (output.get('pool') or {}).get('bytes', 0))
+    mdsmap = (ceph_cli.ceph_command('fs', 'get', fs_name, timeout=60) or
+              {}).get('mdsmap', {})
+    return {
+        'time': time.time(),
+        'active': len(active),
+        'standby': len([mds for mds in daemons
+                        if mds.get('state', '').startswith('standby')]),
+        'daemons': len(daemons),
+        'max-mds': mdsmap.get('max_mds', len(active)),
+        'standby-count-wanted': mdsmap.get('standby_count_wanted'),
+        'rate': sum(mds.get('rate', 0) for mds in active),
+        'cache': round(cache / cache_limit, 3) if cache_limit else 0,
+    }
+
+
+def decide(settings, samples, last_change, now):
+    """Work out the max_mds the load calls for.
+
+    :param settings: The 'min-mds', 'max-mds', 'up-rate' and 'down-rate'
+                     requests per second per rank, the 'cache-pressure'
+                     share of the cache, the 'sustain' and 'cooldown'
+                     periods in seconds and the 'standbys' to keep.
+    :type settings: Dict[str, Any]
+    :param samples: Samples of ``sample``, oldest first, the last one being
+                    the current state.
+    :type samples: List[Dict[str, Any]]
+    :param last_change: Time of the last change of max_mds, None if none.
+    :type last_change: Optional[float]
+    :param now: Current time.
+    :type now: float
+    :returns: The new max_mds and the reason for the change, None and None
+              to keep the current one.
+    :rtype: Tuple[Optional[int], Optional[str]]
+    """
+    current = samples[-1]
+    max_mds = current['max-mds']
+    # Some of the daemons must remain standbys.
+    capacity = max(1, current['daemons'] - settings['standbys'])
+    if max_mds > capacity and max_mds > settings['min-mds']:
+        return (max(settings['min-mds'], capacity),
+                'keep {} standby(s) with {} available'.format(
+                    settings['standbys'], current['standby']))
+    if max_mds < settings['min-mds']:
+        return settings['min-mds'], 'below mds-autoscale-min-mds'
+    if max_mds > settings['max-mds']:
+        return settings['max-mds'], 'above mds-autoscale-max-mds'
+    if last_change is not None and now - last_change < settings['cooldown']:
+        return None, None
+    window = [s for s in samples if s['time'] >= now - settings['sustain']]
+    if (len(window) == len(samples) or
+            any(s['max-mds'] != max_mds for s in window)):
+        # The load was not measured over the whole period at this size.
+        return None, None
+    rates = [s['rate'] / max(1, s['active']) for s in window]
+    if max_mds < min(settings['max-mds'], capacity):
+        if min(rates) > settings['up-rate']:
+            return max_mds + 1, '{:.0f} req/s per rank for {}'.format(
+                min(rates), format_duration(settings['sustain']))
+        if min(s['cache'] for s in window) > settings['cache-pressure']:
+            return max_mds + 1, 'cache at {:.0%} of the limit for {}'.format(
+                min(s['cache'] for s in window),
+                format_duration(settings['sustain']))
+    if max_mds > settings['min-mds']:
+        fewer = max_mds - 1
+        rate = max(s['rate'] for s in window) / fewer
+        if rate < settings['down-rate']:
+            return fewer, '{:.0f} req/s per rank with {} rank(s)'.format(
+                rate, fewer)
+    return None, None
+
+
+def run_once(fs_name, settings, cache_limit):
+    """Sample the load and apply the decision.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :param settings: Settings as taken by ``decide``.
+    :type settings: Dict[str, Any]
+    :param cache_limit: mds-cache-memory-limit, in bytes.
+    :type cache_limit: int
+    :returns: The decision made, None if max_mds was kept.
+    :rtype: Optional[Dict[str, Any]]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    state = load_state()
+    current = sample(fs_name, cache_limit)
+    now = current['time']
+    # One sample older than the period is kept to tell it is covered.
+    samples = [s for s in state.get('samples') or []
+               if s['time'] >= now - 2 * settings['sustain']]
+    samples.append(current)
+    if current['standby-count-wanted'] != settings['standbys']:
+        ceph_cli.ceph_command('fs', 'set', fs_name, 'standby_count_wanted',
+                              settings['standbys'], timeout=60)
+    target, reason = decide(settings, samples, state.get('last-change'), now)
+    decision = None
+    if target is not None and target != current['max-mds']:
+        ceph_cli.ceph_command('fs', 'set', fs_name, 'max_mds', target,
+                              timeout=60)
+        decision = {'time': now, 'from': current['max-mds'], 'to': target,
+                    'reason': reason}
+        state['decisions'] = (
+            (state.get('decisions') or []) + [decision])[-MAX_DECISIONS:]
+        state['last-change'] = now
+        # Samples taken at the previous size say nothing about the new one.
+        samples = [current]
+    state['samples'] = samples
+    state['max-mds'] = target or current['max-mds']
+    save_state(state)
+    return decision
+
+
+def status_note():
+    """Current max_mds and the last decision, for the workload status.
+
+    :returns: The note, None if the controller never ran.
+    :rtype: Optional[str]
+    """
+    state = load_state()
+    if not state.get('max-mds'):
+        return None
+    note = 'max_mds {}'.format(state['max-mds'])
+    if state.get('decisions'):
+        last = state['decisions'][-1]
+        note += ', scaled {} to {} {} ago ({})'.format(
+            last['from'], last['to'],
+            format_duration(time.time() - last['time']), last['reason'])
+    return note
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Scale max_mds of the filesystem with its load.')
+    parser.add_argument('--filesystem', required=True)
+    parser.add_argument('--cache-limit', required=True, type=int)
+    parser.add_argument('--min-mds', type=int, default=1)
+    parser.add_argument('--max-mds', type=int, required=True)
+    parser.add_argument('--up-rate', type=float, required=True)
+    parser.add_argument('--down-rate', type=float, required=True)
+    parser.add_argument('--cache-pressure', type=float, default=1.2)
+    parser.add_argument('--sustain', type=parse_duration, default=600)
+    parser.add_argument('--cooldown', type=parse_duration, default=1800)
+    parser.add_argument('--standbys', type=int, default=1)
+    args = parser.parse_args(argv)
+    settings = {key.replace('_', '-'): value
+                for key, value in vars(args).items()
+                if key not in ('filesystem', 'cache_limit')}
+    decision = run_once(args.filesystem, settings, args.cache_limit)
+    if decision:
+        print('max_mds {from} -> {to}: {reason}'.format(**decision))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,272 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Inspect, shrink and size the cache of the MDS."""
+
+import math
+import threading
+import time
+
+from charm.openstack import ceph_cli
+from charm.openstack.utils import (
+    format_config_size,
+    format_size,
+    parse_size,
+)
+
+
+def cache_limits(cache):
+    """Work out the cache sizes the MDS is configured to maintain.
+
+    :param cache: Cache options as returned by ``get_mds_cache()`` of the
+                  charm class.
+    :type cache: Dict[str, Any]
+    :returns: The 'limit', the 'target' the MDS trims down to (the limit
+              minus the reservation) and the size at which the MDS reports
+              an oversized cache ('warning'), in bytes.
+    :rtype: Dict[str, int]
+    :raises: ValueError if mds-cache-memory-limit is not a valid size.
+    """
+    limit = parse_size(cache['mds-cache-memory-limit'])
+    reservation = cache.get('mds-cache-reservation') or 0
+    threshold = cache.get('mds-health-cache-threshold') or 1
+    return {'limit': limit,
+            'target': int(limit * (1 - reservation)),
+            'warning': int(limit * threshold)}
+
+
+# Size of a cached inode with its dentry and caps, when the local MDS has
+# too few inodes cached to measure it.
+DEFAULT_BYTES_PER_INODE = 4096
+# Caps recalled from a session in one go (mds_recall_max_caps), the
+# reservation leaves room for every session to acquire as many meanwhile.
+RECALL_MAX_CAPS = 5000
+MIN_MEASURED_INODES = 10000
+
+
+def _usage():
+    pool = (ceph_cli.daemon_command('cache', 'status') or {}).get('pool', {})
+    mem = (ceph_cli.daemon_command('perf', 'dump', 'mds_mem') or {}).get(
+        'mds_mem', {})
+    return {'bytes': pool.get('bytes', 0),
+            'items': pool.get('items', 0),
+            'caps': mem.get('cap', 0)}
+
+
+def cache_status(cache):
+    """Report the cache usage of the local MDS against its limits.
+
+    :param cache: Cache options as returned by ``get_mds_cache()``.
+    :type cache: Dict[str, Any]
+    :rtype: Dict[str, Any]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired,
+             ValueError
+    """
+    limits = cache_limits(cache)
+    pool = (ceph_cli.daemon_command('cache', 'status') or {}).get('pool', {})
+    perf = ceph_cli.daemon_command('perf', 'dump') or {}
+    mem, mds = perf.get('mds_mem', {}), perf.get('mds', {})
+    used = pool.get('bytes', 0)
+    limit = limits['limit']
+    return {
+        'memory-used': format_size(used),
+        'memory-limit': format_size(limit),
+        'memory-target': format_size(limits['target']),
+        # There is no ratio to report against a limit of 0.
+        'usage': '{:.1%}'.format(used / limit) if limit else 'unavailable',
+        'oversized': bool(limit) and used > limits['warning'],
+        'rss': format_size(mem.get('rss', 0) * 1024),
+        'items': pool.get('items', 0),
+        'inodes': mem.get('ino', 0),
+        'dentries': mem.get('dn', 0),
+        'caps': mem.get('cap', 0),
+        'inodes-pinned': mds.get('inodes_pinned', 0),
+        'inodes-with-caps': mds.get('inodes_with_caps', 0),
+    }
+
+
+def drop_cache(timeout, target, progress=None, interval=5):
+    """Ask the MDS to recall client caps and trim its cache.
+
+    ``cache drop`` blocks until the clients released their caps or the
+    timeout expired, the cache usage is polled meanwhile and reported
+    through ``progress``.
+
+    :param timeout: Seconds the MDS waits for clients to release caps.
+    :type timeout: int
+    :param target: Cache size in bytes the drop is expected to reach.
+    :type target: int
+    :param progress: Called with a message after every poll.
+    :type progress: Optional[Callable[[str], None]]
+    :param interval: Seconds between two polls.
+    :type interval: int
+    :returns: Cache usage 'before' and 'after' the drop, whether the
+              'target' was reached, the 'duration' and the MDS 'output'.
+    :rtype: Dict[str, Any]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    before = _usage()
+    outcome = {}
+
+    def _drop():
+        try:
+            outcome['output'] = ceph_cli.daemon_command(
+                'cache', 'drop', timeout, timeout=timeout + 60)
+        except Exception as e:
+            outcome['error'] = e
+
+    start = time.monotonic()
+    worker = threading.Thread(target=_drop, daemon=True)
+    worker.start()
+    while True:
+        worker.join(interval)
+        usage = _usage()
+        if progress:
+            progress('cache {} in {} items, {} caps after {:.0f}s '
+                     '(target {})'.format(format_size(usage['bytes']),
+                                          usage['items'], usage['caps'],
+                                          time.monotonic() - start,
+                                          format_size(target)))
+        if not worker.is_alive():
+            break
+    if 'error' in outcome:
+        raise outcome['error']
+    return {
+        'before': dict(before, bytes=format_size(before['bytes'])),
+        'after': dict(usage, bytes=format_size(usage['bytes'])),
+        'target': format_size(target),
+        'target-reached': usage['bytes'] <= target,
+        'duration': round(time.monotonic() - start, 1),
+        'output': outcome.get('output'),
+    }
+
+
+def session_totals(fs_name):
+    """Client sessions and caps of the filesystem, over all active ranks.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :returns: The number of 'sessions', 'caps' and 'active' ranks.
+    :rtype: Dict[str, int]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    status = ceph_cli.ceph_command('fs', 'status', fs_name, timeout=60) or {}
+    active = [mds for mds in status.get('mdsmap') or []
+              if mds.get('state') == 'active']
+    return {
+        'sessions': sum(entry.get('clients', 0)
+                        for entry in status.get('clients') or []
+                        if entry.get('fs', fs_name) == fs_name),
+        'caps': sum(mds.get('caps', 0) for mds in active),
+        'active': len(active),
+    }
+
+
+def measure_inode_size():
+    """Bytes per cached inode and resident memory overhead of the local MDS.
+
+    :returns: The 'bytes-per-inode', None when too few inodes are cached
+              for a measure, and the 'rss-ratio' of the resident memory to
+              the cache size, None if the cache is empty.
+    :rtype: Dict[str, Optional[float]]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    pool = (ceph_cli.daemon_command('cache', 'status') or {}).get('pool', {})
+    mem = (ceph_cli.daemon_command('perf', 'dump', 'mds_mem') or {}).get(
+        'mds_mem', {})
+    used, inodes = pool.get('bytes', 0), mem.get('ino', 0)
+    return {
+        'bytes-per-inode': (used / inodes
+                            if inodes >= MIN_MEASURED_INODES else None),
+        'rss-ratio': mem.get('rss', 0) * 1024 / used if used else None,
+    }
+
+
+def _round_size(value):
+    # Whole GiB above 1GiB, 256MiB steps below.
+    step = 1 << 30 if value > 1 << 30 else 256 << 20
+    return max(step, int(math.ceil(value / step)) * step)
+
+
+def plan(cache, files, directories, sessions, caps, bytes_per_inode=None,
+         rss_ratio=None, hot_fraction=0.1, headroom=0.2,
+         max_cache_per_mds=32 << 30):
+    """Recommend the cache size and number of active MDS for a workload.
+
+    The working set is the share ``hot_fraction`` of all the inodes of the
+    filesystem, and at least every inode a client holds caps on, as those
+    are pinned in the cache. It is spread over as few active MDS as
+    possible without any of them caching more than ``max_cache_per_mds``.
+
+    :param cache: Current cache options, as returned by ``get_mds_cache()``.
+    :type cache: Dict[str, Any]
+    :param files: Files in the filesystem, the ``ceph.dir.rfiles`` of /.
+    :type files: int
+    :param directories: Directories in the filesystem, the
+                        ``ceph.dir.rsubdirs`` of /.
+    :type directories: int
+    :param sessions: Client sessions.
+    :type sessions: int
+    :param caps: Caps held by the clients.
+    :type caps: int
+    :param bytes_per_inode: Measured cache bytes per inode, None to use
+                            DEFAULT_BYTES_PER_INODE.
+    :type bytes_per_inode: Optional[float]
+    :param rss_ratio: Measured resident memory of the MDS over its cache
+                      size, None to only account for the health threshold.
+    :type rss_ratio: Optional[float]
+    :param hot_fraction: Share of the inodes accessed by the workload.
+    :type hot_fraction: float
+    :param headroom: Extra cache on top of the working set.
+    :type headroom: float
+    :param max_cache_per_mds: Largest cache, in bytes, of a single MDS.
+    :type max_cache_per_mds: int
+    :returns: The inputs, the 'working-set' in inodes, the 'cache-needed'
+              overall, the 'recommended' values of 'mds-cache-memory-limit',
+              'mds-cache-reservation' and 'max-mds', the 'memory-per-unit'
+              the MDS may use and the number of 'units' with a standby.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if mds-cache-memory-limit is not a valid size.
+    """
+    current = cache_limits(cache)
+    measured = bytes_per_inode is not None
+    bytes_per_inode = bytes_per_inode or DEFAULT_BYTES_PER_INODE
+    working_set = max(caps, int((files + directories) * hot_fraction))
+    needed = working_set * bytes_per_inode * (1 + headroom)
+    max_mds = max(1, int(math.ceil(needed / max_cache_per_mds)))
+    limit = _round_size(needed / max_mds)
+    reserve = sessions * RECALL_MAX_CAPS * bytes_per_inode / max_mds
+    reservation = round(min(0.5, max(0.05, reserve / limit)), 2)
+    # The cache may grow up to the health threshold before being trimmed,
+    # the allocator adds its own overhead on top.
+    threshold = cache.get('mds-health-cache-threshold') or 1.5
+    memory = limit * max(threshold, rss_ratio or 0)
+    return {
+        'files': files,
+        'directories': directories,
+        'sessions': sessions,
+        'caps': caps,
+        'bytes-per-inode': int(bytes_per_inode),
+        'bytes-per-inode-measured': measured,
+        'working-set': working_set,
+        'cache-needed': format_size(needed),
+        'current': {'mds-cache-memory-limit': format_size(current['limit']),
+                    'mds-cache-reservation':
+                    cache.get('mds-cache-reservation')},
+        'recommended': {'mds-cache-memory-limit': format_config_size(limit),
+                        'mds-cache-reservation': reservation,
+                        'max-mds': max_mds},
+        'memory-per-unit': format_size(_round_size(memory)),
+        'units': max_mds + 1,
+    }
@@ -0,0 +1,256 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Adjust the cache limit of the local MDS to its workload.
+
+Every run compares the counters of the MDS with the ones of the previous
+run. The cache is grown by ``step`` when the ``MDS_CACHE_OVERSIZED`` health
+check names the daemon, or when path lookups miss the cache more often
+than ``target_hit_ratio`` allows while the MDS recalls caps from clients to
+stay under its limit. It is shrunk by half a step after QUIET_RUNS runs in
+a row without misses or recalls, or at once when the host has less than
+``headroom`` bytes of memory available. The limit stays between ``floor``
+and ``ceiling`` and is applied through the admin socket, the value from the
+charm configuration is only used by the daemon until the next run after it
+starts.
+
+Run as a module, this is the service started by the cache tuning timer.
+The tuned limit, the counters and the last decisions are kept in
+CACHE_TUNE_STATE.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from charm.openstack import ceph_cli
+from charm.openstack.utils import format_duration, format_size, parse_size
+
+CACHE_TUNE_STATE = '/var/lib/ceph-fs-charm/cache-tune.json'
+MEMINFO = '/proc/meminfo'
+MAX_DECISIONS = 20
+QUIET_RUNS = 3
+# Limits are changed in steps of whole MiB.
+ROUNDING = 1 << 20
+
+
+def load_state():
+    """Counters and decisions of the previous runs.
+
+    :returns: The 'limit' set, the 'counters' of the last run, the number
+              of 'quiet' runs in a row and the 'decisions', empty if the
+              tuner never ran.
+    :rtype: Dict[str, Any]
+    """
+    try:
+        with open(CACHE_TUNE_STATE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(CACHE_TUNE_STATE), exist_ok=True)
+    with open(CACHE_TUNE_STATE + '.new', 'w') as f:
+        json.dump(state, f)
+    os.replace(CACHE_TUNE_STATE + '.new', CACHE_TUNE_STATE)
+
+
+def memory_available():
+    """Memory available on the host, in bytes.
+
+    :rtype: int
+    """
+    with open(MEMINFO) as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def cache_oversized():
+    """Whether the MDS_CACHE_OVERSIZED health check names the local MDS.
+
+    :rtype: bool
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    health = ceph_cli.ceph_command('health', 'detail', timeout=60) or {}
+    check = (health.get('checks') or {}).get('MDS_CACHE_OVERSIZED') or {}
+    name = ceph_cli.mds_name()
+    return any(name + '(' in detail.get('message', '') or
+               name + ' ' in detail.get('message', '')
+               for detail in check.get('detail') or [])
+
+
+def counters():
+    """Cumulative counters of the local MDS.
+
+    :returns: Path 'traverse' operations and the ones that were cache
+              'hits', the 'recalls' of caps the sessions currently account
+              for, and the cache 'limit' and 'usage' in bytes.
+    :rtype: Dict[str, int]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    mds = (ceph_cli.daemon_command('perf', 'dump', 'mds') or {}).get(
+        'mds', {})
+    sessions = ceph_cli.daemon_command('session', 'ls') or []
+    pool = (ceph_cli.daemon_command('cache', 'status') or {}).get('pool', {})
+    limit = (ceph_cli.daemon_command(
+        'config', 'get', 'mds_cache_memory_limit') or {}).get(
+            'mds_cache_memory_limit')
+    return {
+        'traverse': mds.get('traverse', 0),
+        'hits': mds.get('traverse_hit', 0),
+        # Decaying counters, already a measure of recent activity.
+        'recalls': int(sum((session.get('recall_caps') or {}).get('value', 0)
+                           for session in sessions)),
+        'limit': parse_size(limit or 0),
+        'usage': pool.get('bytes', 0),
+    }
+
+
+def _round(value):
+    return int(value) // ROUNDING * ROUNDING
+
+
+def decide(settings, before, after, oversized, available, quiet):
+    """Work out the cache limit the workload calls for.
+
+    :param settings: The 'floor', 'ceiling' and 'headroom' in bytes, the
+                     'target-hit-ratio' and the 'step' as a share of the
+                     limit.
+    :type settings: Dict[str, Any]
+    :param before: ``counters`` of the previous run, None on the first one.
+    :type before: Optional[Dict[str, int]]
+    :param after: ``counters`` of this run.
+    :type after: Dict[str, int]
+    :param oversized: Whether the MDS reports an oversized cache.
+    :type oversized: bool
+    :param available: Memory available on the host, in bytes.
+    :type available: int
+    :param quiet: Runs in a row without cache misses or recalls before this
+                  one.
+    :type quiet: int
+    :returns: The new limit, None to keep the current one, the reason and
+              whether this run was quiet.
+    :rtype: Tuple[Optional[int], str, bool]
+    """
+    limit = after['limit']
+    bounded = min(settings['ceiling'], max(settings['floor'], limit))
+    if available < settings['headroom']:
+        target = max(settings['floor'],
+                     _round(limit * (1 - settings['step'] / 2)))
+        return (target if target < limit else None,
+                '{} of memory available on the host'.format(
+                    format_size(available)), False)
+    if bounded != limit:
+        return bounded, 'outside of the floor and ceiling', False
+    if before is None or after['traverse'] < before['traverse']:
+        # First run or daemon restarted, there is nothing to compare to.
+        return None, 'no previous sample', False
+    lookups = after['traverse'] - before['traverse']
+    hits = max(0, after['hits'] - before['hits'])
+    ratio = hits / lookups if lookups else 1.0
+    grow = None
+    if oversized:
+        grow = 'cache oversized'
+    elif ratio < settings['target-hit-ratio'] and after['recalls']:
+        grow = 'hit ratio {:.0%}, {} caps recalled'.format(
+            ratio, after['recalls'])
+    if grow:
+        # Growing the cache must leave the headroom free.
+        target = min(settings['ceiling'],
+                     _round(limit * (1 + settings['step'])),
+                     _round(limit + available - settings['headroom']))
+        return (target if target > limit else None, grow, False)
+    quiet_run = hits == lookups and not after['recalls']
+    if quiet_run and quiet + 1 >= QUIET_RUNS:
+        target = max(settings['floor'],
+                     _round(limit * (1 - settings['step'] / 2)))
+        return (target if target < limit else None,
+                'no cache miss or recall in {} runs'.format(QUIET_RUNS),
+                True)
+    return None, 'hit ratio {:.0%}'.format(ratio), quiet_run
+
+
+def run_once(settings):
+    """Sample the counters and apply the decision.
+
+    :param settings: Settings as taken by ``decide``.
+    :type settings: Dict[str, Any]
+    :returns: The decision made, None if the limit was kept.
+    :rtype: Optional[Dict[str, Any]]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    state = load_state()
+    after = counters()
+    target, reason, quiet = decide(
+        settings, state.get('counters'), after, cache_oversized(),
+        memory_available(), state.get('quiet', 0))
+    decision = None
+    if target is not None:
+        ceph_cli.daemon_command('config', 'set', 'mds_cache_memory_limit',
+                                target)
+        decision = {'time': time.time(), 'from': after['limit'],
+                    'to': target, 'reason': reason}
+        state['decisions'] = (
+            (state.get('decisions') or []) + [decision])[-MAX_DECISIONS:]
+        quiet = False
+    state['counters'] = after
+    state['limit'] = target or after['limit']
+    state['quiet'] = state.get('quiet', 0) + 1 if quiet else 0
+    save_state(state)
+    return decision
+
+
+def status_note():
+    """Tuned limit and the last change, for the workload status.
+
+    :returns: The note, None if the tuner never ran.
+    :rtype: Optional[str]
+    """
+    state = load_state()
+    if not state.get('limit'):
+        return None
+    note = 'cache limit {}'.format(format_size(state['limit']))
+    if state.get('decisions'):
+        last = state['decisions'][-1]
+        note += ', {} {} ago ({})'.format(
+            'grown' if last['to'] > last['from'] else 'shrunk',
+            format_duration(time.time() - last['time']), last['reason'])
+    return note
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Tune the cache limit of the local MDS.')
+    parser.add_argument('--floor', required=True, type=parse_size)
+    parser.add_argument('--ceiling', required=True, type=parse_size)
+    parser.add_argument('--headroom', required=True, type=parse_size)
+    parser.add_argument('--target-hit-ratio', type=float, default=0.9)
+    parser.add_argument('--step', type=float, default=0.25)
+    args = parser.parse_args(argv)
+    settings = {key.replace('_', '-'): value
+                for key, value in vars(args).items()}
+    decision = run_once(settings)
+    if decision:
+        print('mds_cache_memory_limit {} -> {}: {}'.format(
+            format_size(decision['from']), format_size(decision['to']),
+            decision['reason']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
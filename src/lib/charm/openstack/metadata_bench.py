@@ -0,0 +1,355 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Metadata benchmark in the manner of mdtest.
+
+Worker processes create files in directories of their own, then stat them,
+list their directories, rename the files and unlink them. The workers start
+every phase together, so a phase measures the metadata rate of all of them
+at once, and time every operation for the latency percentiles. Files are
+spread over directories of ``files_per_directory`` entries each, which sets
+the size of the directories listed by the readdir phase.
+
+The benchmark runs against a local directory, e.g. a kernel mount of the
+filesystem or a tmpfs, or against a path within CephFS through libcephfs.
+Run as a module, it prints the report as JSON.
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import posixpath
+import queue
+import socket
+import sys
+import threading
+import time
+
+PHASES = ('create', 'stat', 'readdir', 'rename', 'unlink')
+PERCENTILES = (50, 90, 99)
+# Longest a worker waits for the others to finish a phase.
+BARRIER_TIMEOUT = 3600
+
+
+class Error(Exception):
+    pass
+
+
+class LocalBackend(object):
+    """Operations on a local directory."""
+
+    def mkdir(self, path):
+        os.mkdir(path, 0o755)
+
+    def create(self, path, data):
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        try:
+            if data:
+                os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def stat(self, path):
+        os.stat(path)
+
+    def listdir(self, path):
+        os.listdir(path)
+
+    def rename(self, src, dst):
+        os.rename(src, dst)
+
+    def unlink(self, path):
+        os.unlink(path)
+
+    def rmdir(self, path):
+        os.rmdir(path)
+
+
+class CephFSBackend(object):
+    """Operations on a path within CephFS, through libcephfs.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    """
+
+    def __init__(self, fs):
+        self.fs = fs
+
+    def mkdir(self, path):
+        self.fs.mkdir(path, 0o755)
+
+    def create(self, path, data):
+        fd = self.fs.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        try:
+            if data:
+                self.fs.write(fd, data, 0)
+        finally:
+            self.fs.close(fd)
+
+    def stat(self, path):
+        self.fs.stat(path)
+
+    def listdir(self, path):
+        handle = self.fs.opendir(path)
+        try:
+            while self.fs.readdir(handle):
+                pass
+        finally:
+            self.fs.closedir(handle)
+
+    def rename(self, src, dst):
+        self.fs.rename(src, dst)
+
+    def unlink(self, path):
+        self.fs.unlink(path)
+
+    def rmdir(self, path):
+        self.fs.rmdir(path)
+
+
+@contextlib.contextmanager
+def _backend(filesystem):
+    if filesystem is None:
+        yield LocalBackend()
+        return
+    # libcephfs is only needed to benchmark CephFS itself.
+    from charm.openstack import cephfs_client
+    with cephfs_client.connect(filesystem or None) as fs:
+        yield CephFSBackend(fs)
+
+
+def _run_phases(ops, index, settings, barrier):
+    top = posixpath.join(settings['directory'], 'worker.{}'.format(index))
+    per_directory = settings['files-per-directory']
+    directories = [posixpath.join(top, 'dir.{}'.format(n)) for n in
+                   range(math.ceil(settings['files'] / per_directory))]
+    names = [posixpath.join(directories[n // per_directory],
+                            'file.{}'.format(n))
+             for n in range(settings['files'])]
+    data = b'\0' * settings['file-size']
+    if index == 0:
+        ops.mkdir(settings['directory'])
+    barrier.wait(BARRIER_TIMEOUT)
+    ops.mkdir(top)
+    for directory in directories:
+        ops.mkdir(directory)
+    operations = {
+        'create': lambda path: ops.create(path, data),
+        'stat': ops.stat,
+        'readdir': ops.listdir,
+        'rename': lambda path: ops.rename(path, path + '.renamed'),
+        'unlink': ops.unlink,
+    }
+    samples = {}
+    for phase in settings['phases']:
+        operation = operations[phase]
+        latencies = []
+        barrier.wait(BARRIER_TIMEOUT)
+        # CLOCK_MONOTONIC is shared by the processes of the host.
+        start = time.monotonic()
+        for path in directories if phase == 'readdir' else names:
+            before = time.perf_counter()
+            operation(path)
+            latencies.append(time.perf_counter() - before)
+        samples[phase] = {'start': start, 'end': time.monotonic(),
+                          'latencies': latencies}
+        if phase == 'rename':
+            names = [path + '.renamed' for path in names]
+    barrier.wait(BARRIER_TIMEOUT)
+    if 'unlink' not in samples:
+        for path in names:
+            ops.unlink(path)
+    for directory in directories:
+        ops.rmdir(directory)
+    ops.rmdir(top)
+    barrier.wait(BARRIER_TIMEOUT)
+    if index == 0:
+        ops.rmdir(settings['directory'])
+    return samples
+
+
+def _worker(index, settings, barrier, results):
+    try:
+        with _backend(settings['filesystem']) as ops:
+            samples = _run_phases(ops, index, settings, barrier)
+    except threading.BrokenBarrierError:
+        # Another worker failed and reports the error.
+        results.put((index, None, None))
+    except Exception as e:
+        barrier.abort()
+        results.put((index, None, '{}: {}'.format(type(e).__name__, e)))
+    else:
+        results.put((index, samples, None))
+
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+def summarise(samples):
+    """Rates and latencies of a phase over all the workers.
+
+    :param samples: Samples of the phase, one per worker, with the 'start'
+                    and 'end' times and the 'latencies' of the operations,
+                    in seconds.
+    :type samples: List[Dict[str, Any]]
+    :returns: The number of 'ops', the 'seconds' from the first worker
+              starting to the last one finishing, the 'ops-per-second' and
+              the 'latency-ms' mean, percentiles and max.
+    :rtype: Dict[str, Any]
+    """
+    latencies = sorted(latency for sample in samples
+                       for latency in sample['latencies'])
+    seconds = (max(sample['end'] for sample in samples) -
+               min(sample['start'] for sample in samples))
+    latency = {'mean': sum(latencies) / len(latencies) if latencies else 0}
+    for percent in PERCENTILES:
+        latency['p{}'.format(percent)] = _percentile(latencies, percent)
+    latency['max'] = latencies[-1] if latencies else 0
+    return {
+        'ops': len(latencies),
+        'seconds': round(seconds, 3),
+        'ops-per-second': round(len(latencies) / seconds, 1) if seconds else 0,
+        'latency-ms': {key: round(value * 1000, 3)
+                       for key, value in latency.items()},
+    }
+
+
+def run(directory, phases=PHASES, workers=4, files=1000,
+        files_per_directory=1000, file_size=0, filesystem=None):
+    """Run the benchmark.
+
+    The workers work in a new directory below ``directory``, removed at the
+    end of a successful run.
+
+    :param directory: Directory to run the benchmark in.
+    :type directory: str
+    :param phases: Phases to run, always in the order of PHASES. Every
+                   phase works on the files created by the create phase.
+    :type phases: List[str]
+    :param workers: Number of worker processes.
+    :type workers: int
+    :param files: Files created by every worker.
+    :type files: int
+    :param files_per_directory: Files per directory of a worker.
+    :type files_per_directory: int
+    :param file_size: Bytes written to every file created.
+    :type file_size: int
+    :param filesystem: Name of the CephFS filesystem ``directory`` is in,
+                       accessed through libcephfs, '' for the default one.
+                       None when ``directory`` is a local directory.
+    :type filesystem: Optional[str]
+    :returns: The settings of the run and the summary of every phase as
+              returned by ``summarise``.
+    :rtype: Dict[str, Any]
+    :raises: ValueError for invalid settings, Error if a worker failed
+    """
+    unknown = set(phases) - set(PHASES)
+    if unknown:
+        raise ValueError('Unknown phases: {}'.format(
+            ', '.join(sorted(unknown))))
+    if 'create' not in phases:
+        raise ValueError('The create phase is required')
+    if workers < 1 or files < 1 or files_per_directory < 1 or file_size < 0:
+        raise ValueError('workers, files and files-per-directory must be '
+                         'positive and file-size not negative')
+    settings = {
+        'directory': posixpath.join(directory, 'metadata-bench.{}.{}'.format(
+            socket.gethostname(), os.getpid())),
+        'phases': [phase for phase in PHASES if phase in phases],
+        'files': files,
+        'files-per-directory': files_per_directory,
+        'file-size': file_size,
+        'filesystem': filesystem,
+    }
+    # Workers are forked before this process opens any libcephfs
+    # connection, and each opens its own.
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [context.Process(target=_worker,
+                                 args=(index, settings, barrier, results))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    samples = {}
+    errors = []
+    try:
+        while len(samples) < workers:
+            try:
+                index, result, error = results.get(timeout=1)
+            except queue.Empty:
+                if any(process.exitcode for process in processes):
+                    barrier.abort()
+                    errors.append('worker exited unexpectedly')
+                    break
+                continue
+            samples[index] = result
+            if error:
+                errors.append('worker {}: {}'.format(index, error))
+    finally:
+        for process in processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+    if errors:
+        raise Error('Benchmark in {} failed, {}'.format(
+            settings['directory'], '; '.join(errors)))
+    return {
+        'directory': directory,
+        'workers': workers,
+        'files-per-worker': files,
+        'files-per-directory': files_per_directory,
+        'file-size': file_size,
+        'phases': {phase: summarise([samples[index][phase]
+                                     for index in range(workers)])
+                   for phase in settings['phases']},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the metadata operations of a filesystem.')
+    parser.add_argument('directory')
+    parser.add_argument('--phases', nargs='+', choices=PHASES,
+                        default=list(PHASES))
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--files', type=int, default=1000)
+    parser.add_argument('--files-per-directory', type=int, default=1000)
+    parser.add_argument('--file-size', type=int, default=0)
+    parser.add_argument('--cephfs', metavar='FILESYSTEM', nargs='?',
+                        const='', dest='filesystem',
+                        help='Run in CephFS through libcephfs rather than '
+                             'in a local directory.')
+    args = parser.parse_args(argv)
+    try:
+        report = run(args.directory, phases=args.phases,
+                     workers=args.workers, files=args.files,
+                     files_per_directory=args.files_per_directory,
+                     file_size=args.file_size, filesystem=args.filesystem)
+    except (ValueError, Error) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Snapshot mirroring of the filesystem with ``cephfs-mirror``.
+
+The mgr ``mirroring`` module assigns the mirrored directories to the
+cephfs-mirror daemons, so every unit running one takes a share of the
+directories and syncs them in parallel with the others. Peers are added by
+exchanging a bootstrap token: the remote (secondary) cluster creates it for
+a user of its own and the primary cluster imports it.
+"""
+
+import glob
+import re
+import time
+
+from charm.openstack import ceph_cli
+
+MIRROR_USER = 'cephfs-mirror'
+MIRROR_SERVICE = 'cephfs-mirror@{}'.format(MIRROR_USER)
+ADMIN_SOCKETS = '/var/run/ceph/ceph-client.{}.*.asok'.format(MIRROR_USER)
+
+
+def enable_mirroring(fs_name):
+    """Enable the mgr mirroring module and mirroring of the filesystem.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    modules = ceph_cli.ceph_command('mgr', 'module', 'ls', timeout=60) or {}
+    if 'mirroring' not in (modules.get('enabled_modules') or []):
+        ceph_cli.ceph_command('mgr', 'module', 'enable', 'mirroring',
+                              timeout=60)
+    ceph_cli.ceph_command('fs', 'snapshot', 'mirror', 'enable', fs_name,
+                          timeout=60)
+
+
+def create_bootstrap_token(fs_name, client, site_name):
+    """Create the token a primary cluster imports to mirror to this one.
+
+    :param fs_name: Name of the filesystem receiving the snapshots.
+    :type fs_name: str
+    :param client: User the primary cluster connects as, e.g.
+                   'client.mirror_remote'. It is created if needed with
+                   the access mirroring requires.
+    :type client: str
+    :param site_name: Name of this cluster as seen by the primary one.
+    :type site_name: str
+    :returns: The token.
+    :rtype: str
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    ceph_cli.ceph_command('fs', 'authorize', fs_name, client, '/', 'rwps',
+                          timeout=60)
+    output = ceph_cli.ceph_command(
+        'fs', 'snapshot', 'mirror', 'peer_bootstrap', 'create', fs_name,
+        client, site_name, timeout=60)
+    return output['token']
+
+
+def import_bootstrap_token(fs_name, token):
+    """Add the cluster a token was created on as a peer of the filesystem.
+
+    :param fs_name: Name of the filesystem to mirror.
+    :type fs_name: str
+    :param token: Token created on the remote cluster.
+    :type token: str
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    enable_mirroring(fs_name)
+    ceph_cli.ceph_command('fs', 'snapshot', 'mirror', 'peer_bootstrap',
+                          'import', fs_name, token, timeout=60)
+
+
+def add_directory(fs_name, path):
+    ceph_cli.ceph_command('fs', 'snapshot', 'mirror', 'add', fs_name, path,
+                          timeout=60)
+
+
+def remove_directory(fs_name, path):
+    ceph_cli.ceph_command('fs', 'snapshot', 'mirror', 'remove', fs_name,
+                          path, timeout=60)
+
+
+def admin_socket():
+    """Admin socket of the cephfs-mirror daemon of this unit.
+
+    :rtype: str
+    :raises: ValueError if the daemon is not running.
+    """
+    sockets = sorted(glob.glob(ADMIN_SOCKETS))
+    if not sockets:
+        raise ValueError('The cephfs-mirror daemon is not running')
+    return sockets[-1]
+
+
+def _stamp(value):
+    # Sync times are given on the monotonic clock of the daemon, which is
+    # the one of this host, e.g. '274900.558797s'.
+    match = re.match(r'^([\d.]+)s?$', str(value or ''))
+    return float(match.group(1)) if match else None
+
+
+def sync_status(fs_name):
+    """Sync state of the directories this unit's mirror daemon handles.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :returns: One entry per directory and peer, with the directory 'path',
+              the 'peer' uuid, its 'state', the 'last-synced-snap', the
+              'sync-duration' of the last snapshot, the 'lag' in seconds
+              since that snapshot was synced and the number of
+              'snaps-synced'. The most lagging directories first.
+    :rtype: List[Dict[str, Any]]
+    :raises: ValueError, subprocess.CalledProcessError,
+             subprocess.TimeoutExpired
+    """
+    path = admin_socket()
+    prefix = 'fs mirror peer status {}@'.format(fs_name)
+    commands = [command for command in
+                ceph_cli.socket_command(path, 'help', timeout=60) or {}
+                if command.startswith(prefix)]
+    now = time.monotonic()
+    directories = []
+    for command in commands:
+        peer = command.split()[-1]
+        output = ceph_cli.socket_command(path, *command.split(),
+                                         timeout=60) or {}
+        for directory, info in sorted(output.items()):
+            last = info.get('last_synced_snap') or {}
+            stamp = _stamp(last.get('sync_time_stamp'))
+            directories.append({
+                'path': directory,
+                'peer': peer,
+                'state': info.get('state', 'unknown'),
+                'last-synced-snap': last.get('name'),
+                'sync-duration': last.get('sync_duration'),
+                'lag': round(now - stamp, 1) if stamp is not None else None,
+                'snaps-synced': info.get('snaps_synced', 0),
+            })
+    directories.sort(key=lambda d: (
+        d['lag'] is not None, -(d['lag'] or 0), d['path']))
+    return directories
@@ -0,0 +1,131 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Inventory of the quotas set in the filesystem.
+
+Quotas are only found by reading the ``ceph.quota.*`` attributes of every
+directory, which takes longer than an action may run on large trees. The
+walk stops at its time limit and saves a cursor, the next run resumes from
+it. Quotas are appended to OUTPUT as they are found, one JSON object per
+line, so the inventory of all the runs of a walk is kept on the unit.
+"""
+
+import contextlib
+import json
+import os
+import time
+
+from charm.openstack import cephfs_client, tree_walk
+
+CURSOR = 'list-quotas'
+OUTPUT = os.path.join(tree_walk.STATE_DIR, 'list-quotas.jsonl')
+CHECKPOINT_INTERVAL = 30
+
+
+def _visit(fs, path):
+    quota = cephfs_client.get_quota(fs, path)
+    if not any(quota.values()):
+        return None
+    return dict(quota, path=path)
+
+
+def list_quotas(fs, roots=('/',), workers=8, max_depth=None, exclude=(),
+                batch_size=100, time_limit=None, resume=False,
+                on_batch=None):
+    """Walk the tree and report the directories with a quota.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param roots: Directories to walk.
+    :type roots: List[str]
+    :param workers: Directories read at once.
+    :type workers: int
+    :param max_depth: Depth below the roots at which the walk stops.
+    :type max_depth: Optional[int]
+    :param exclude: Glob patterns of subtrees to skip.
+    :type exclude: List[str]
+    :param batch_size: Quotas per batch.
+    :type batch_size: int
+    :param time_limit: Seconds after which the walk is interrupted, None
+                       for no limit.
+    :type time_limit: Optional[float]
+    :param resume: Resume the interrupted walk, whose roots and options
+                   are used instead of the given ones.
+    :type resume: bool
+    :param on_batch: Called with every batch of quotas found.
+    :type on_batch: Optional[Callable[[List[Dict[str, Any]]], None]]
+    :returns: Whether the walk is 'complete', the number of directories
+              'scanned', quotas 'found' and directories still 'pending' for
+              the whole walk, the directories that 'failed', the 'quotas'
+              found by this run and the 'output' file.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if there is no walk to resume, cephfs.Error
+    """
+    if resume:
+        cursor = tree_walk.load_cursor(CURSOR)
+        if not cursor:
+            raise ValueError('There is no interrupted list-quotas walk')
+    else:
+        cursor = {'roots': list(roots), 'max-depth': max_depth,
+                  'exclude': list(exclude),
+                  'pending': [[root, 0] for root in roots],
+                  'scanned': 0, 'found': 0, 'failed': []}
+        os.makedirs(os.path.dirname(OUTPUT), exist_ok=True)
+        open(OUTPUT, 'w').close()
+    walk = tree_walk.TreeWalk(
+        fs, _visit, cursor['pending'], workers=workers,
+        max_depth=cursor['max-depth'], exclude=cursor['exclude'],
+        errors=cephfs_client.Error)
+    start = time.monotonic()
+    checkpoint = start
+    found = []
+    batch = []
+
+    def _flush():
+        with open(OUTPUT, 'a') as f:
+            for quota in batch:
+                f.write(json.dumps(quota) + '\n')
+        if batch and on_batch:
+            on_batch(list(batch))
+        cursor['found'] += len(batch)
+        found.extend(batch)
+        del batch[:]
+        cursor['scanned'] += walk.scanned
+        cursor['failed'] += walk.failed
+        walk.scanned, walk.failed = 0, []
+        cursor['pending'] = walk.pending()
+        tree_walk.save_cursor(CURSOR, cursor)
+
+    with contextlib.closing(walk.run()) as results:
+        for _, quota in results:
+            if quota:
+                batch.append(quota)
+            now = time.monotonic()
+            if (len(batch) >= batch_size or
+                    now - checkpoint >= CHECKPOINT_INTERVAL):
+                _flush()
+                checkpoint = now
+            if time_limit is not None and now - start >= time_limit:
+                break
+    _flush()
+    complete = not cursor['pending']
+    if complete:
+        tree_walk.save_cursor(CURSOR, None)
+    return {'complete': complete,
+            'scanned': cursor['scanned'],
+            'found': cursor['found'],
+            'pending': len(cursor['pending']),
+            'failed': cursor['failed'],
+            'quotas': found,
+            'output': OUTPUT}
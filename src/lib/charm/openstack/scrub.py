@@ -0,0 +1,312 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Forward scrubs of the filesystem, throttled and confined to a window.
+
+Scrubs are driven through rank 0 of the filesystem, which spreads the work
+over the active ranks. ``mds_max_scrub_ops_in_progress`` bounds the number
+of inodes scrubbed in parallel, lower values leave more of the MDS to the
+clients. When and for how many windows the scrub started by the charm ran
+is recorded in SCRUB_STATE, to report how long full scrubs take, along with
+its last status seen by the scrub service for the workload status.
+
+Run as a module, this is the service started by the scrub timer of the
+charm: it resumes the paused scrub or starts a new one, and pauses it again
+once the window is over. The scrubs of the charm are told apart from the
+others by their tags, and as the MDS pauses and resumes all the scrubs at
+once, the scrub service leaves them alone while others are active. Outside
+of the maintenance window of the charm the scrub is queued for it instead.
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+
+from charm.openstack import ceph_cli, maintenance
+from charm.openstack.utils import format_duration, parse_duration
+
+SCRUB_STATE = '/var/lib/ceph-fs-charm/scrub.json'
+
+
+def _tell(fs_name, *args):
+    return ceph_cli.ceph_command('tell', 'mds.{}:0'.format(fs_name), *args,
+                                 timeout=60)
+
+
+def load_state():
+    """Details of the last scrub started by the charm.
+
+    :returns: The 'paths', 'tags', 'started' and 'finished' timestamps,
+              number of 'windows' it ran in and 'last-status' seen, empty
+              if there was none.
+    :rtype: Dict[str, Any]
+    """
+    try:
+        with open(SCRUB_STATE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    os.makedirs(os.path.dirname(SCRUB_STATE), exist_ok=True)
+    with open(SCRUB_STATE + '.new', 'w') as f:
+        json.dump(state, f)
+    os.replace(SCRUB_STATE + '.new', SCRUB_STATE)
+
+
+def set_max_ops(value):
+    """Set ``mds_max_scrub_ops_in_progress`` on the running MDS daemons.
+
+    :type value: int
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    ceph_cli.ceph_command('tell', 'mds.*', 'config', 'set',
+                          'mds_max_scrub_ops_in_progress', value, timeout=60)
+
+
+def scrub_status(fs_name):
+    """Ask rank 0 for the state of the scrubs.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :returns: The 'state' ('idle', 'running' or 'paused'), the 'status'
+              reported by the MDS, the number of 'inodes-queued' and the
+              active 'scrubs'.
+    :rtype: Dict[str, Any]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    output = _tell(fs_name, 'scrub', 'status') or {}
+    if not isinstance(output, dict):
+        output = {'status': output}
+    text = output.get('status') or ''
+    if 'paused' in text.lower():
+        state = 'paused'
+    elif not text or text.startswith(('no active', 'idle')):
+        state = 'idle'
+    else:
+        state = 'running'
+    queued = re.search(r'(\d+) inodes', text)
+    return {'state': state,
+            'status': text,
+            'inodes-queued': int(queued.group(1)) if queued else None,
+            'scrubs': output.get('scrubs') or {}}
+
+
+def _own_scrubs(current, state):
+    # Tags of the active scrubs started by the charm.
+    tags = set((state.get('tags') or {}).values())
+    return sorted(tag for tag in current['scrubs'] if tag in tags)
+
+
+def _other_scrubs(current, state):
+    tags = set((state.get('tags') or {}).values())
+    return sorted(tag for tag in current['scrubs'] if tag not in tags)
+
+
+def _record_status(state, current):
+    state['last-status'] = {'state': current['state'],
+                            'inodes-queued': current['inodes-queued'],
+                            'checked': time.time()}
+    save_state(state)
+
+
+def status(fs_name):
+    """State of the scrubs along with the progress of the charm's scrub.
+
+    A scrub of the charm found idle, or no longer active among others, is
+    recorded as finished, otherwise its status is recorded.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :returns: ``scrub_status`` with the 'paths', 'started', 'finished',
+              'windows' and 'elapsed' seconds of the last scrub started by
+              the charm.
+    :rtype: Dict[str, Any]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    current = scrub_status(fs_name)
+    state = load_state()
+    if state.get('started') and not state.get('finished'):
+        if current['state'] == 'idle' or (
+                current['scrubs'] and not _own_scrubs(current, state)):
+            state['finished'] = time.time()
+            save_state(state)
+        else:
+            _record_status(state, current)
+    if state.get('started'):
+        current['elapsed'] = int((state.get('finished') or time.time()) -
+                                 state['started'])
+    current.update((key, state.get(key))
+                   for key in ('paths', 'started', 'finished', 'windows'))
+    return current
+
+
+def start(fs_name, paths, repair=False, force=False, max_ops=None):
+    """Start a recursive forward scrub.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :param paths: Directories to scrub.
+    :type paths: List[str]
+    :param repair: Repair the damage found.
+    :type repair: bool
+    :param force: Also scrub the inodes scrubbed recently.
+    :type force: bool
+    :param max_ops: Value of ``mds_max_scrub_ops_in_progress`` to apply
+                    first, None to keep the current one.
+    :type max_ops: Optional[int]
+    :returns: The recorded state.
+    :rtype: Dict[str, Any]
+    :raises: ValueError if a scrub is in progress,
+             subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    current = scrub_status(fs_name)
+    if current['state'] != 'idle':
+        raise ValueError('A scrub is already {}: {}'.format(
+            current['state'], current['status']))
+    options = ['recursive']
+    if repair:
+        options.append('repair')
+    if force:
+        options.append('force')
+    return _start(fs_name, paths, ','.join(options), max_ops)
+
+
+def _start(fs_name, paths, options, max_ops):
+    if max_ops:
+        set_max_ops(max_ops)
+    tags = {}
+    for path in paths:
+        output = _tell(fs_name, 'scrub', 'start', path, options)
+        tags[path] = (output or {}).get('scrub_tag')
+    state = {'paths': list(paths), 'tags': tags, 'started': time.time(),
+             'finished': None, 'windows': 1,
+             'last-status': {'state': 'running', 'inodes-queued': None,
+                             'checked': time.time()}}
+    save_state(state)
+    return state
+
+
+def pause(fs_name):
+    """Pause the scrubs, the queued inodes are kept.
+
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    _tell(fs_name, 'scrub', 'pause')
+
+
+def resume(fs_name):
+    """Resume paused scrubs.
+
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    _tell(fs_name, 'scrub', 'resume')
+    state = load_state()
+    if state.get('started') and not state.get('finished'):
+        state['windows'] = state.get('windows', 1) + 1
+        save_state(state)
+
+
+def run_window(fs_name, paths, window, max_ops=None, interval=60):
+    """Scrub for at most ``window`` seconds.
+
+    Scrubs not started by the charm are left alone: no scrub is resumed,
+    started or paused while they are active.
+
+    :param fs_name: Name of the filesystem.
+    :type fs_name: str
+    :param paths: Directories to scrub when a new scrub is started.
+    :type paths: List[str]
+    :param window: Seconds the scrub may run.
+    :type window: int
+    :param max_ops: Value of ``mds_max_scrub_ops_in_progress`` to apply.
+    :type max_ops: Optional[int]
+    :param interval: Seconds between two checks for the end of the scrub.
+    :type interval: int
+    :returns: 'finished', 'paused', or 'busy' when other scrubs are
+              active.
+    :rtype: str
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    current = scrub_status(fs_name)
+    if _other_scrubs(current, load_state()):
+        return 'busy'
+    if current['state'] == 'paused':
+        if max_ops:
+            set_max_ops(max_ops)
+        resume(fs_name)
+    elif current['state'] == 'idle':
+        _start(fs_name, paths, 'recursive', max_ops)
+    deadline = time.monotonic() + window
+    while time.monotonic() < deadline:
+        time.sleep(max(0, min(interval, deadline - time.monotonic())))
+        current = status(fs_name)
+        if load_state().get('finished'):
+            return 'finished'
+    if _other_scrubs(current, load_state()):
+        # Pausing would pause them too, the scrub of the charm runs on.
+        return 'busy'
+    pause(fs_name)
+    state = load_state()
+    _record_status(state, dict(current, state='paused'))
+    return 'paused'
+
+
+def status_note():
+    """Progress of the scrub started by the charm, for the workload status.
+
+    The MDS is not asked, the status is the last one recorded by the scrub
+    service or the scrub-status action.
+
+    :returns: The note, None if the charm never started a scrub.
+    :rtype: Optional[str]
+    """
+    state = load_state()
+    if not state.get('started'):
+        return None
+    if not state.get('finished'):
+        last = state.get('last-status') or {}
+        note = 'scrub {} for {}'.format(
+            last.get('state') or 'running',
+            format_duration(int(time.time() - state['started'])))
+        if last.get('inodes-queued') is not None:
+            note += ', {} inodes queued'.format(last['inodes-queued'])
+        return note
+    return 'last scrub took {} in {} window(s)'.format(
+        format_duration(state['finished'] - state['started']),
+        state.get('windows', 1))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run a forward scrub of the filesystem within a window.')
+    parser.add_argument('--filesystem', required=True)
+    parser.add_argument('--window', required=True, type=parse_duration)
+    parser.add_argument('--max-ops', type=int)
+    parser.add_argument('--maintenance-window')
+    parser.add_argument('paths', nargs='+')
+    args = parser.parse_args(argv)
+    if maintenance.postpone(args.maintenance_window, 'scrub'):
+        print('Deferred to the maintenance window')
+        return
+    print(run_window(args.filesystem, args.paths, args.window,
+                     max_ops=args.max_ops))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Analysis of the operations tracked by the MDS.
+
+The MDS keeps the slowest recent operations (``dump_historic_ops`` and
+``dump_historic_ops_by_duration``) and the ones currently in flight for too
+long (``dump_blocked_ops``). The functions below turn these dumps into
+latency histograms grouped by operation, client and path prefix, and work
+out where the operations spent their time from their event timelines.
+"""
+
+import collections
+import datetime
+import re
+
+from charm.openstack import ceph_cli
+
+DUMP_COMMANDS = ('dump_historic_ops', 'dump_historic_ops_by_duration',
+                 'dump_blocked_ops')
+
+# Upper bounds of the latency buckets, in seconds.
+BUCKETS = (0.001, 0.01, 0.1, 1, 10, 60)
+
+# Events after which an operation waits on a resource, the time until the
+# next event is accounted to the first category matching the event.
+WAIT_CATEGORIES = (
+    ('locks', ('lock',)),
+    ('journal', ('journal', 'submit entry')),
+    ('osd', ('osd', 'fetch', 'reading')),
+    ('authpin', ('authpin', 'freez', 'export')),
+    ('throttle', ('throttl',)),
+)
+
+_DESCRIPTION_RE = re.compile(
+    r'^(?P<type>[\w-]+)\((?P<reqid>\S+)(?: (?P<op>[\w-]+))?'
+    r'(?: [^#\s]\S*)?(?: (?P<path>#[^\s)]+))?')
+
+
+def _timestamp(value):
+    value = value.replace('T', ' ')
+    value = re.sub(r'[+-]\d{4}$', '', value)
+    for fmt in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    return None
+
+
+def _path(token, depth):
+    # Paths are given relative to an inode, '#0x1' being the root.
+    if not token:
+        return None
+    inode, _, path = token.lstrip('#').partition('/')
+    prefix = '/' + '/'.join([c for c in path.split('/') if c][:depth])
+    if inode == '0x1':
+        return prefix
+    return '{}:{}'.format(inode, prefix)
+
+
+def wait_category(event):
+    """Map the name of an op event to the resource the op waited on.
+
+    :param event: Event name, e.g. 'failed to rdlock, waiting'.
+    :type event: str
+    :returns: One of the WAIT_CATEGORIES names or 'other'.
+    :rtype: str
+    """
+    event = event.lower()
+    for name, keywords in WAIT_CATEGORIES:
+        if any(keyword in event for keyword in keywords):
+            return name
+    return 'other'
+
+
+def parse_op(op, depth=2):
+    """Extract the fields used for grouping from an op dump entry.
+
+    :param op: One entry of the 'ops' list of an op dump.
+    :type op: Dict[str, Any]
+    :param depth: Number of path components kept in the path prefix.
+    :type depth: int
+    :returns: The 'type', 'op', 'client', 'path' (None if the op has no
+              path), 'duration' in seconds, 'flag_point' and the seconds
+              spent in each wait category as 'waits'.
+    :rtype: Dict[str, Any]
+    """
+    type_data = op.get('type_data') or {}
+    match = _DESCRIPTION_RE.match(op.get('description', '')) or None
+    client = (type_data.get('client_info') or {}).get('client')
+    if not client and match:
+        client = match.group('reqid').split(':')[0]
+    waits = collections.Counter()
+    events = [(_timestamp(e.get('time', '')), e.get('event', ''))
+              for e in type_data.get('events') or []]
+    for (start, event), (end, _) in zip(events, events[1:]):
+        if start and end and end > start:
+            waits[wait_category(event)] += (end - start).total_seconds()
+    return {
+        'type': type_data.get('op_type') or (
+            match.group('type') if match else 'unknown'),
+        'op': (match.group('op') if match else None) or 'unknown',
+        'client': client or 'unknown',
+        'path': _path(match.group('path') if match else None, depth),
+        'duration': float(op.get('duration', op.get('age', 0)) or 0),
+        'flag_point': type_data.get('flag_point') or 'unknown',
+        'waits': dict(waits),
+    }
+
+
+def histogram(durations):
+    """Count durations per latency bucket.
+
+    :param durations: Durations in seconds.
+    :type durations: Iterable[float]
+    :returns: Bucket label to count, for every bucket.
+    :rtype: collections.OrderedDict
+    """
+    labels = ['<{}'.format(_format_seconds(b)) for b in BUCKETS]
+    labels.append('>={}'.format(_format_seconds(BUCKETS[-1])))
+    counts = collections.OrderedDict((label, 0) for label in labels)
+    for duration in durations:
+        for bound, label in zip(BUCKETS, labels):
+            if duration < bound:
+                counts[label] += 1
+                break
+        else:
+            counts[labels[-1]] += 1
+    return counts
+
+
+def _format_seconds(value):
+    if value < 1:
+        return '{:g}ms'.format(value * 1000)
+    return '{:g}s'.format(value)
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def group(ops, key, top=10):
+    """Latency statistics of ops grouped by one of their fields.
+
+    :param ops: Ops as returned by ``parse_op``.
+    :type ops: List[Dict[str, Any]]
+    :param key: Field to group by, e.g. 'client'.
+    :type key: str
+    :param top: Number of groups to keep, the slowest in total first.
+    :type top: int
+    :rtype: List[Dict[str, Any]]
+    """
+    groups = collections.defaultdict(list)
+    for op in ops:
+        if op[key] is not None:
+            groups[op[key]].append(op['duration'])
+    stats = []
+    for name, durations in groups.items():
+        ordered = sorted(durations)
+        stats.append({
+            key: name,
+            'count': len(ordered),
+            'total': round(sum(ordered), 6),
+            'p50': round(_percentile(ordered, 0.5), 6),
+            'p99': round(_percentile(ordered, 0.99), 6),
+            'max': round(ordered[-1], 6),
+            'histogram': histogram(ordered),
+        })
+    stats.sort(key=lambda s: (-s['total'], str(s[key])))
+    return stats[:top]
+
+
+def analyse(dumps, depth=2, top=10, min_duration=0):
+    """Aggregate op dumps of the MDS.
+
+    Ops present in several dumps are only counted once.
+
+    :param dumps: Output of the dump commands, keyed by command name.
+    :type dumps: Dict[str, Dict[str, Any]]
+    :param depth: Number of path components kept in the path prefix.
+    :type depth: int
+    :param top: Number of entries kept in every grouping.
+    :type top: int
+    :param min_duration: Ignore ops faster than this, in seconds.
+    :type min_duration: float
+    :returns: Report with the number of 'ops' and 'blocked' ops, the
+              statistics 'by-op', 'by-client' and 'by-path', the 'waits'
+              per resource and the current 'flag-points'.
+    :rtype: Dict[str, Any]
+    """
+    seen = set()
+    ops = []
+    blocked = 0
+    for command, dump in dumps.items():
+        for op in (dump or {}).get('ops') or []:
+            identity = (op.get('description'), op.get('initiated_at'))
+            if identity in seen:
+                continue
+            seen.add(identity)
+            parsed = parse_op(op, depth=depth)
+            if parsed['duration'] < min_duration:
+                continue
+            parsed['blocked'] = command == 'dump_blocked_ops'
+            blocked += parsed['blocked']
+            parsed['op'] = '{}:{}'.format(parsed['type'], parsed['op'])
+            ops.append(parsed)
+    waits = collections.defaultdict(lambda: {'ops': 0, 'seconds': 0.0})
+    for op in ops:
+        for category, seconds in op['waits'].items():
+            waits[category]['ops'] += 1
+            waits[category]['seconds'] += seconds
+    flag_points = collections.Counter(op['flag_point'] for op in ops
+                                      if op['blocked'] or
+                                      op['flag_point'] != 'done')
+    return {
+        'ops': len(ops),
+        'blocked': blocked,
+        'histogram': histogram(op['duration'] for op in ops),
+        'by-op': group(ops, 'op', top),
+        'by-client': group(ops, 'client', top),
+        'by-path': group(ops, 'path', top),
+        'waits': {category: {'ops': w['ops'],
+                             'seconds': round(w['seconds'], 6)}
+                  for category, w in sorted(waits.items())},
+        'flag-points': dict(flag_points.most_common(top)),
+    }
+
+
+def collect():
+    """Read the op dumps from the local MDS admin socket.
+
+    :returns: Output of every command in DUMP_COMMANDS, keyed by command.
+    :rtype: Dict[str, Dict[str, Any]]
+    :raises: subprocess.CalledProcessError, subprocess.TimeoutExpired
+    """
+    return {command: ceph_cli.daemon_command(command, timeout=60)
+            for command in DUMP_COMMANDS}
@@ -0,0 +1,172 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Bulk management of CephFS subvolumes and subvolume groups.
+
+Every entry of a bulk request is turned into one ``ceph fs subvolume`` or
+``ceph fs subvolumegroup`` call. The calls are issued concurrently by a
+bounded pool of workers, and a result is returned for every entry in the
+order they were given.
+"""
+
+import concurrent.futures
+import json
+import subprocess
+
+from charm.openstack import ceph_cli
+from charm.openstack.utils import parse_size
+
+
+def parse_specs(specs):
+    """Parse and validate a JSON list of subvolume or group specifications.
+
+    :param specs: JSON encoded list of objects, each with at least a 'name'.
+    :type specs: str
+    :returns: The decoded specifications.
+    :rtype: List[Dict[str, Any]]
+    :raises: ValueError if the list is malformed.
+    """
+    try:
+        specs = json.loads(specs)
+    except ValueError as e:
+        raise ValueError('Invalid JSON: {}'.format(e))
+    if not isinstance(specs, list):
+        raise ValueError('Expected a JSON list')
+    for spec in specs:
+        if not isinstance(spec, dict) or not spec.get('name'):
+            raise ValueError('Every entry needs a "name": {}'.format(spec))
+    return specs
+
+
+def _options(spec, *names):
+    args = []
+    for name in names:
+        value = spec.get(name)
+        if value is None:
+            continue
+        if name == 'size':
+            value = parse_size(value)
+        args.extend(['--{}'.format(name.replace('-', '_')), value])
+    return args
+
+
+def create_subvolume(volume, spec):
+    args = ['fs', 'subvolume', 'create', volume, spec['name']]
+    args.extend(_options(spec, 'size', 'group-name', 'pool-layout', 'mode'))
+    if spec.get('namespace-isolated'):
+        args.append('--namespace-isolated')
+    return ceph_cli.ceph_command(*args)
+
+
+def resize_subvolume(volume, spec):
+    if spec.get('size') is None:
+        raise ValueError('"size" is required to resize a subvolume')
+    args = ['fs', 'subvolume', 'resize', volume, spec['name'],
+            parse_size(spec['size'])]
+    args.extend(_options(spec, 'group-name'))
+    if spec.get('no-shrink'):
+        args.append('--no_shrink')
+    return ceph_cli.ceph_command(*args)
+
+
+def remove_subvolume(volume, spec):
+    args = ['fs', 'subvolume', 'rm', volume, spec['name']]
+    args.extend(_options(spec, 'group-name'))
+    if spec.get('force'):
+        args.append('--force')
+    return ceph_cli.ceph_command(*args)
+
+
+def subvolume_info(volume, spec):
+    args = ['fs', 'subvolume', 'info', volume, spec['name']]
+    args.extend(_options(spec, 'group-name'))
+    return ceph_cli.ceph_command(*args)
+
+
+def create_group(volume, spec):
+    args = ['fs', 'subvolumegroup', 'create', volume, spec['name']]
+    args.extend(_options(spec, 'size', 'pool-layout', 'mode'))
+    return ceph_cli.ceph_command(*args)
+
+
+def remove_group(volume, spec):
+    args = ['fs', 'subvolumegroup', 'rm', volume, spec['name']]
+    if spec.get('force'):
+        args.append('--force')
+    return ceph_cli.ceph_command(*args)
+
+
+def list_subvolumes(volume, group=None):
+    """List the names of the subvolumes in a group.
+
+    :param volume: Name of the volume (filesystem).
+    :type volume: str
+    :param group: Subvolume group, None for the default group.
+    :type group: Optional[str]
+    :rtype: List[str]
+    """
+    args = ['fs', 'subvolume', 'ls', volume]
+    if group:
+        args.extend(['--group_name', group])
+    return [entry['name'] for entry in ceph_cli.ceph_command(*args) or []]
+
+
+def list_groups(volume):
+    """List the names of the subvolume groups of a volume.
+
+    :param volume: Name of the volume (filesystem).
+    :type volume: str
+    :rtype: List[str]
+    """
+    return [entry['name'] for entry in
+            ceph_cli.ceph_command('fs', 'subvolumegroup', 'ls', volume) or []]
+
+
+def _run_one(func, volume, spec):
+    result = {'name': spec['name']}
+    if spec.get('group-name'):
+        result['group-name'] = spec['group-name']
+    try:
+        output = func(volume, spec)
+    except subprocess.CalledProcessError as e:
+        result.update(status='error', error=ceph_cli.command_error(e))
+    except (ValueError, subprocess.TimeoutExpired) as e:
+        result.update(status='error', error=str(e))
+    else:
+        result['status'] = 'ok'
+        if output:
+            result['output'] = output
+    return result
+
+
+def run_bulk(func, volume, specs, workers=4):
+    """Apply an operation to many entries concurrently.
+
+    :param func: One of the per-entry operations of this module.
+    :type func: Callable[[str, Dict[str, Any]], Any]
+    :param volume: Name of the volume (filesystem).
+    :type volume: str
+    :param specs: Entries as returned by ``parse_specs``.
+    :type specs: List[Dict[str, Any]]
+    :param workers: Maximum number of commands in flight.
+    :type workers: int
+    :returns: One result per entry, in the order of ``specs``. Each result
+              has the entry 'name', a 'status' of 'ok' or 'error' and
+              either the command 'output' or an 'error' message.
+    :rtype: List[Dict[str, Any]]
+    """
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, workers)) as executor:
+        return list(executor.map(lambda spec: _run_one(func, volume, spec),
+                                 specs))
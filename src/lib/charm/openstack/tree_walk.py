@@ -0,0 +1,200 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Parallel, resumable walks of the directory tree through libcephfs.
+
+Listing a directory is a round trip to the MDS, so a serial walk of a large
+tree spends most of its time waiting. ``TreeWalk`` keeps a bounded number of
+directories being listed at once from a shared libcephfs handle. Directories
+still to be listed are kept in a stack, which bounds their number to the
+depth of the tree times its fan-out, and can be saved as a cursor to resume
+the walk later: every directory is either already visited or in ``pending``.
+"""
+
+import collections
+import concurrent.futures
+import fnmatch
+import json
+import os
+import posixpath
+
+STATE_DIR = '/var/lib/ceph-fs-charm'
+
+
+def list_subdirectories(fs, path):
+    """Names of the directories within a directory, symlinks excluded.
+
+    :param fs: Mounted libcephfs handle.
+    :type fs: cephfs.LibCephFS
+    :param path: Path within the filesystem.
+    :type path: str
+    :rtype: List[str]
+    :raises: cephfs.Error
+    """
+    names = []
+    handle = fs.opendir(path)
+    try:
+        entry = fs.readdir(handle)
+        while entry:
+            name = entry.d_name.decode('utf-8', 'surrogateescape')
+            if entry.is_dir() and name not in ('.', '..'):
+                names.append(name)
+            entry = fs.readdir(handle)
+    finally:
+        fs.closedir(handle)
+    return sorted(names)
+
+
+class TreeWalk(object):
+    """Visit the directories below some roots with a pool of workers.
+
+    :param fs: Mounted libcephfs handle, shared by the workers.
+    :type fs: cephfs.LibCephFS
+    :param visit: Called with ``fs`` and the path of every directory, returns
+                  the result reported for it, or a ``(result, descend)``
+                  tuple when ``descend`` tells whether to walk below the
+                  directory.
+    :type visit: Callable[[cephfs.LibCephFS, str], Any]
+    :param pending: Directories to visit, as ``[path, depth]`` pairs: the
+                    roots with a depth of 0, or the cursor of an earlier walk.
+    :type pending: List[Tuple[str, int]]
+    :param workers: Maximum number of directories visited at once.
+    :type workers: int
+    :param max_depth: Depth below which directories are not visited, the
+                      roots being at depth 0. None for no limit.
+    :type max_depth: Optional[int]
+    :param exclude: Glob patterns of subtrees to skip, matched against the
+                    path and the name of the directories.
+    :type exclude: List[str]
+    :param errors: Exceptions recorded in ``failed`` rather than raised.
+    :type errors: Union[Type[Exception], Tuple[Type[Exception]]]
+    :param split: Whether ``visit`` returns a ``(result, descend)`` tuple.
+    :type split: bool
+    """
+
+    def __init__(self, fs, visit, pending, workers=8, max_depth=None,
+                 exclude=(), errors=(), split=False):
+        self.fs = fs
+        self.visit = visit
+        self.stack = collections.deque(
+            (path, depth) for path, depth in reversed(pending))
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.exclude = list(exclude)
+        self.errors = errors
+        self.split = split
+        self.in_flight = {}
+        self.scanned = 0
+        self.failed = []
+
+    def excluded(self, path):
+        name = posixpath.basename(path)
+        return any(fnmatch.fnmatchcase(path, pattern) or
+                   fnmatch.fnmatchcase(name, pattern)
+                   for pattern in self.exclude)
+
+    def _scan(self, path, depth):
+        result = self.visit(self.fs, path)
+        descend = True
+        if self.split:
+            result, descend = result
+        children = []
+        if descend and (self.max_depth is None or depth < self.max_depth):
+            children = [
+                (child, depth + 1) for child in
+                (posixpath.join(path, name)
+                 for name in list_subdirectories(self.fs, path))
+                if not self.excluded(child)]
+        return result, children
+
+    def pending(self):
+        """Directories not visited yet, the cursor to resume the walk from.
+
+        Only consistent between two results of ``run``.
+
+        :rtype: List[List[Union[str, int]]]
+        """
+        return ([list(entry) for entry in self.in_flight.values()] +
+                [list(entry) for entry in reversed(self.stack)])
+
+    def run(self):
+        """Walk the tree.
+
+        Stopping the iteration leaves the directories being visited in
+        ``pending``, they are visited again by a resumed walk. Closing the
+        iterator, e.g. with ``contextlib.closing``, waits for the workers,
+        which must be done before the filesystem is unmounted.
+
+        :returns: The path and result of every directory visited, in the
+                  order the workers finish them.
+        :rtype: Iterator[Tuple[str, Any]]
+        """
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.workers) as executor:
+            try:
+                while self.stack or self.in_flight:
+                    while self.stack and len(self.in_flight) < self.workers:
+                        path, depth = self.stack.pop()
+                        future = executor.submit(self._scan, path, depth)
+                        self.in_flight[future] = (path, depth)
+                    done, _ = concurrent.futures.wait(
+                        self.in_flight,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        path, _ = self.in_flight.pop(future)
+                        self.scanned += 1
+                        try:
+                            result, children = future.result()
+                        except self.errors as e:
+                            self.failed.append({'path': path,
+                                                'error': str(e)})
+                            continue
+                        self.stack.extend(reversed(children))
+                        yield path, result
+            finally:
+                for future in self.in_flight:
+                    future.cancel()
+
+
+def load_cursor(name):
+    """Cursor saved by ``save_cursor``, None if there is none.
+
+    :param name: Name of the walk, e.g. 'list-quotas'.
+    :type name: str
+    :rtype: Optional[Dict[str, Any]]
+    """
+    try:
+        with open(os.path.join(STATE_DIR, name + '.cursor')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_cursor(name, cursor):
+    """Persist the state of a walk, atomically.
+
+    :param name: Name of the walk, e.g. 'list-quotas'.
+    :type name: str
+    :param cursor: The state, None to remove it.
+    :type cursor: Optional[Dict[str, Any]]
+    """
+    path = os.path.join(STATE_DIR, name + '.cursor')
+    if cursor is None:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    os.makedirs(STATE_DIR, exist_ok=True)
+    with open(path + '.new', 'w') as f:
+        json.dump(cursor, f)
+    os.replace(path + '.new', path)
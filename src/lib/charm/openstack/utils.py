@@ -0,0 +1,173 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Small helpers shared by the charm class and its actions."""
+
+import os
+import re
+import threading
+import time
+
+_SIZE_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGTPE]?)(?:i?B?)?\s*$',
+                      re.IGNORECASE)
+_SIZE_UNITS = 'KMGTPE'
+
+
+def parse_size(value):
+    """Convert a size as accepted by Ceph to a number of bytes.
+
+    Suffixes follow the Ceph convention where 'K', 'Ki' and 'KiB' all mean
+    1024 bytes, 'M' 1024 KiB and so on.
+
+    :param value: Size such as 4096, '4096', '4Gi' or '1.5G'.
+    :type value: Union[int, str]
+    :returns: Size in bytes.
+    :rtype: int
+    :raises: ValueError if the value can not be parsed.
+    """
+    if isinstance(value, int):
+        return value
+    match = _SIZE_RE.match(str(value))
+    if not match:
+        raise ValueError('Invalid size: {!r}'.format(value))
+    number, unit = match.groups()
+    power = _SIZE_UNITS.index(unit.upper()) + 1 if unit else 0
+    return int(float(number) * (1024 ** power))
+
+
+def format_size(value):
+    """Format a number of bytes using the largest fitting binary unit.
+
+    :param value: Size in bytes.
+    :type value: int
+    :rtype: str
+    """
+    value = float(value)
+    for unit in ['B'] + ['{}iB'.format(u) for u in _SIZE_UNITS]:
+        if abs(value) < 1024 or unit == 'EiB':
+            break
+        value /= 1024
+    return '{:.1f}{}'.format(value, unit)
+
+
+def format_config_size(value):
+    """Format a number of bytes for a Ceph option, such as '4Gi' or '768Mi'.
+
+    Ceph only parses whole numbers, so the largest binary unit dividing the
+    size exactly is used, bytes if there is none.
+
+    :param value: Size in bytes.
+    :type value: int
+    :rtype: str
+    """
+    value = int(value)
+    for power, unit in reversed(list(enumerate(_SIZE_UNITS, 1))):
+        if value and value % (1024 ** power) == 0:
+            return '{}{}i'.format(value // 1024 ** power, unit)
+    return str(value)
+
+
+_DURATION_RE = re.compile(r'^\s*(\d+)\s*([smhd]?)\s*$', re.IGNORECASE)
+_DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(value):
+    """Convert a duration such as '90m' or '4h' to a number of seconds.
+
+    :param value: Duration in seconds, or suffixed with 's', 'm', 'h' or
+                  'd'.
+    :type value: Union[int, str]
+    :rtype: int
+    :raises: ValueError if the value can not be parsed.
+    """
+    if isinstance(value, int):
+        return value
+    match = _DURATION_RE.match(str(value))
+    if not match:
+        raise ValueError('Invalid duration: {!r}'.format(value))
+    number, unit = match.groups()
+    return int(number) * _DURATION_UNITS[unit.lower()]
+
+
+def format_duration(seconds):
+    """Format a number of seconds as hours and minutes, e.g. '2h05m'.
+
+    :type seconds: float
+    :rtype: str
+    """
+    minutes = int(seconds) // 60
+    if minutes < 60:
+        return '{}m'.format(minutes)
+    return '{}h{:02d}m'.format(minutes // 60, minutes % 60)
+
+
+class RateLimiter(object):
+    """Keep work shared by several threads under a rate.
+
+    Every call to ``consume`` reserves the next slot of the budget and
+    waits until it starts, so the rate holds over any period longer than
+    the largest amount consumed at once.
+
+    :param rate: Units per second, None or 0 for no limit.
+    :type rate: Optional[float]
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.next = time.monotonic()
+
+    def consume(self, amount=1):
+        """Wait until ``amount`` units fit within the rate.
+
+        :type amount: float
+        """
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next)
+            self.next = start + amount / self.rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def fs_path(path):
+    """Normalise a path so that it is relative to the filesystem root.
+
+    :param path: Path as provided by the operator, with or without a
+                 leading slash.
+    :type path: str
+    :returns: Absolute path within the filesystem.
+    :rtype: str
+    """
+    return os.path.normpath('/' + path.strip().lstrip('/'))
+
+
+def fs_paths(paths):
+    """Normalise the paths given to an action.
+
+    Paths may contain spaces, several of them are given as a list, e.g. the
+    value of an array parameter.
+
+    :param paths: A list of paths, a single path or None.
+    :type paths: Union[List[str], str, None]
+    :returns: Normalised paths, in the order given.
+    :rtype: List[str]
+    """
+    if not paths:
+        return []
+    if isinstance(paths, str):
+        paths = [paths]
+    return [fs_path(path) for path in paths]
@@ -12,9 +12,10 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from charms import reactive
+from charms import leadership, reactive
 
 import charmhelpers.core as ch_core
+from charmhelpers.contrib.storage.linux import ceph as ch_ceph
 
 from charmhelpers.core.hookenv import (
     service_name,
@@ -40,15 +41,21 @@ charm.use_defaults(
 
 
 @reactive.when_none('charm.paused', 'run-default-update-status')
-@reactive.when('ceph-mds.pools.available')
+@reactive.when('ceph-mds.available', 'leadership.set.pools-ready')
 def config_changed():
-    ceph_mds = reactive.endpoint_from_flag('ceph-mds.pools.available')
+    ceph_mds = reactive.endpoint_from_flag('ceph-mds.available')
     with charm.provide_charm_instance() as cephfs_charm:
         host = cephfs_charm.hostname
         exists = os.path.exists('/var/lib/ceph/mds/ceph-%s/keyring' % host)
 
         cephfs_charm.configure_ceph_keyring(ceph_mds.mds_key())
+        if reactive.is_flag_set('config.changed.cephfs-mirror'):
+            # Install the mirror daemon before its configuration is rendered.
+            cephfs_charm.install()
+            reactive.clear_flag('config.changed.cephfs-mirror')
         cephfs_charm.render_with_interfaces([ceph_mds])
+        cephfs_charm.apply_sysctl()
+        cephfs_charm.configure_mirror()
         if reactive.is_flag_set('config.changed.source'):
             # update system source configuration and check for upgrade
             cephfs_charm.install()
@@ -75,10 +82,27 @@ def config_changed():
                                     str(exc))
 
 
+@reactive.when('leadership.is_leader', 'ceph-mds.pools.available')
+@reactive.when_not('leadership.set.pools-ready')
+def publish_pools_ready():
+    # Lets the other units render their configuration, they never request
+    # the pools themselves.
+    leadership.leader_set({'pools-ready': True})
+
+
 @reactive.when('ceph-mds.connected')
 def storage_ceph_connected(ceph):
     ceph_mds = reactive.endpoint_from_flag('ceph-mds.connected')
     ceph_mds.announce_mds_name()
+
+
+@reactive.when('leadership.is_leader', 'ceph-mds.connected')
+def request_pools(ceph):
+    # Only the leader sends the broker requests for the pools and the
+    # filesystem, so the monitors process one request per change instead of
+    # one per unit. A new leader takes over the request of the old one.
+    ceph_mds = reactive.endpoint_from_flag('ceph-mds.connected')
+    sent = sent_pool_requests()
     service = service_name()
     weight = config('ceph-pool-weight')
     replicas = config('ceph-osd-replication-count')
@@ -205,3 +229,46 @@ def storage_ceph_connected(ceph):
             weight=metadata_weight,
             app_name=ceph_mds.ceph_pool_app_name)
     ceph_mds.request_cephfs(service, extra_pools=extra_pools)
+    if sent_pool_requests() != sent:
+        reset_pools_ready()
+
+
+def sent_pool_requests():
+    """Return the broker requests this unit has sent on the ceph-mds relation.
+
+    The interface only sends a request that differs from the previous one,
+    so comparing them before and after building the request tells whether a
+    new one went out.
+    """
+    return [ch_ceph.get_previous_request(rid)
+            for rid in ch_core.hookenv.relation_ids('ceph-mds')]
+
+
+def reset_pools_ready():
+    """Hold the other units back while a new pool request is processed.
+
+    The broker completed the previous request, not the new one, so the pools
+    are not ready again until the monitors answer it.
+    """
+    reactive.clear_flag('ceph-mds.pools.available')
+    if leadership.leader_get('pools-ready'):
+        leadership.leader_set({'pools-ready': None})
+
+
+@reactive.when('leadership.is_leader', 'ceph-mds.available',
+               'leadership.set.pools-ready')
+def update_cephfs_clients():
+    ceph_mds = reactive.endpoint_from_flag('ceph-mds.available')
+    with charm.provide_charm_instance() as cephfs_charm:
+        cephfs_charm.update_cephfs_clients(ceph_mds)
+
+
+@reactive.when_none('charm.paused')
+@reactive.when('cephfs.configured', 'ceph-mds.available')
+def run_deferred_operations():
+    # Runs in every hook, update-status included, so that the operations
+    # queued for the maintenance window start soon after it opens.
+    ceph_mds = reactive.endpoint_from_flag('ceph-mds.available')
+    with charm.provide_charm_instance() as cephfs_charm:
+        if cephfs_charm.run_deferred([ceph_mds]):
+            cephfs_charm.assess_status()
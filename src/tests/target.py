@@ -179,6 +179,52 @@ class CephFSTests(unittest.TestCase):
                       'mds-health-cache-threshold': '1.5'}
         _change_conf_check(mds_config)
 
+    def test_msgr_conf(self):
+        """Test messenger config options are properly set on the MDS."""
+        self.TESTED_UNIT = 'ceph-fs/0'
+
+        def _get_conf():
+            """get/parse ceph daemon response into dict.
+
+            :returns dict: Current configuration of the Ceph MDS daemon
+            :rtype: dict
+            """
+            cmd = "sudo ceph daemon mds.$HOSTNAME config show"
+            conf = model.run_on_unit(self.TESTED_UNIT, cmd)
+            return json.loads(conf['Stdout'])
+
+        @retry(wait=wait_exponential(multiplier=1, min=4, max=10),
+               stop=stop_after_attempt(10))
+        def _change_conf_check(msgr_config, expected):
+            """Change configs, then assert to ensure config was set.
+
+            Doesn't return a value.
+            """
+            model.set_application_config('ceph-fs', msgr_config)
+            results = _get_conf()
+            for option, value in expected.items():
+                self.assertEqual(results[option], value)
+
+        msgr_config = {'ms-client-mode': 'secure crc',
+                       'ms-service-mode': 'secure crc',
+                       'ms-compress-mode': 'force',
+                       'ms-compression-algorithm': 'zstd',
+                       'ms-async-op-threads': '5'}
+        _change_conf_check(msgr_config, {
+            'ms_client_mode': 'secure crc',
+            'ms_service_mode': 'secure crc',
+            'ms_osd_compress_mode': 'force',
+            'ms_osd_compression_algorithm': 'zstd',
+            'ms_async_op_threads': '5'})
+
+        # Restore config to keep tests idempotent
+        model.reset_application_config('ceph-fs', list(msgr_config.keys()))
+        _change_conf_check({}, {
+            'ms_client_mode': 'crc secure',
+            'ms_service_mode': 'crc secure',
+            'ms_osd_compress_mode': 'none',
+            'ms_async_op_threads': '3'})
+
 
 class CharmOperationTest(test_utils.BaseCharmTest):
     """CephFS Charm operation tests."""
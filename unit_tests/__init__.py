@@ -24,3 +24,5 @@ charms_openstack.test_mocks.mock_charmhelpers()
 
 sys.modules['dns'] = mock.MagicMock()
 sys.modules['dns.resolver'] = mock.MagicMock()
+# charms.leadership is provided by layer:leadership when the charm is built.
+sys.modules['charms.leadership'] = mock.MagicMock()
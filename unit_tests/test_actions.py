@@ -1,18 +1,31 @@
+import json
+import subprocess
 import sys
 
 sys.path.append('src/actions')
 import unittest
-from unittest.mock import patch, call, Mock
+from unittest.mock import ANY, patch, call, Mock
 
 __author__ = 'Chris Holcombe <chris.holcombe@canonical.com>'
 
 sys.modules['action_set'] = Mock()
 sys.modules['action_get'] = Mock()
 sys.modules['action_fail'] = Mock()
-sys.modules['xattr'] = Mock()
+sys.modules['cephfs'] = Mock()
+sys.modules['rados'] = Mock()
 from get_quota import get_quota
 from remove_quota import remove_quota
 from set_quota import set_quota
+import background
+import delete_tree
+import diagnostics
+import find_changes
+import list_quotas
+import migrate_layout
+import mirror
+import run_deferred
+import scrub
+import subvolumes
 
 
 def action_get_side_effect(*args):
@@ -22,58 +35,763 @@ def action_get_side_effect(*args):
         return 1024
     elif args[0] == 'directory':
         return 'foo'
+    elif args[0] == 'directories':
+        return ['foo', '/bar baz']
+
+
+class FakeError(Exception):
+    pass
 
 
 class CephActionsTestCase(unittest.TestCase):
+    @patch('get_quota.service_name')
     @patch('get_quota.action_fail')
     @patch('get_quota.action_set')
     @patch('get_quota.action_get')
-    @patch('get_quota.os')
-    @patch('get_quota.xattr')
-    def test_get_quota(self, xattr, os, action_get, action_set, action_fail):
+    @patch('get_quota.cephfs_client')
+    def test_get_quota(self, cephfs_client, action_get, action_set,
+                       action_fail, service_name):
         action_get.side_effect = action_get_side_effect
-        os.path.exists.return_value = True
-        xattr.getxattr.return_value = "1024"
+        service_name.return_value = 'ceph-fs'
+        cephfs_client.get_xattr.return_value = "1024"
+        fs = cephfs_client.connect.return_value.__enter__.return_value
         get_quota()
         action_get.assert_has_calls(
             [call('max-files'),
              call('max-bytes'),
-             call('directory')])
+             call('directories')])
         action_fail.assert_not_called()
-        xattr.getxattr.assert_called_with('foo',
-                                          'ceph.quota.max_files')
-        action_set.assert_called_with({'foo quota': "1024"})
+        cephfs_client.connect.assert_called_once_with('ceph-fs')
+        cephfs_client.get_xattr.assert_has_calls([
+            call(fs, '/foo', 'ceph.quota.max_files'),
+            call(fs, '/bar baz', 'ceph.quota.max_files')])
+        action_set.assert_called_with({'/foo quota': "1024",
+                                       '/bar baz quota': "1024"})
 
+    @patch('get_quota.service_name')
+    @patch('get_quota.action_fail')
+    @patch('get_quota.action_set')
+    @patch('get_quota.action_get')
+    @patch('get_quota.cephfs_client')
+    def test_get_quota_error(self, cephfs_client, action_get, action_set,
+                             action_fail, service_name):
+        action_get.side_effect = action_get_side_effect
+        cephfs_client.Error = FakeError
+        cephfs_client.get_xattr.side_effect = FakeError('no data')
+        get_quota()
+        action_fail.assert_called_once_with(
+            'Unable to get xattr on /foo.  Error: no data')
+        action_set.assert_not_called()
+        action_fail.reset_mock()
+        action_get.side_effect = lambda key: (
+            None if key in ('directory', 'directories')
+            else action_get_side_effect(key))
+        get_quota()
+        action_fail.assert_called_once_with(
+            'A directory or directories are required')
+
+    @patch('set_quota.service_name')
     @patch('set_quota.action_fail')
     @patch('set_quota.action_get')
-    @patch('set_quota.os')
-    @patch('set_quota.xattr')
-    def test_set_quota(self, xattr, os, action_get, action_fail):
+    @patch('set_quota.cephfs_client')
+    def test_set_quota(self, cephfs_client, action_get, action_fail,
+                       service_name):
         action_get.side_effect = action_get_side_effect
-        os.path.exists.return_value = True
+        fs = cephfs_client.connect.return_value.__enter__.return_value
         set_quota()
-        xattr.setxattr.assert_called_with('foo',
-                                          'ceph.quota.max_files',
-                                          '1024')
+        cephfs_client.connect.assert_called_once_with(
+            service_name.return_value)
+        cephfs_client.set_xattr.assert_has_calls([
+            call(fs, '/foo', 'ceph.quota.max_files', '1024'),
+            call(fs, '/bar baz', 'ceph.quota.max_files', '1024')])
         action_get.assert_has_calls(
             [call('max-files'),
              call('max-bytes'),
-             call('directory')])
+             call('directories')])
         action_fail.assert_not_called()
 
+    @patch('remove_quota.service_name')
     @patch('remove_quota.action_fail')
     @patch('remove_quota.action_get')
-    @patch('remove_quota.os')
-    @patch('remove_quota.xattr')
-    def test_remove_quota(self, xattr, os, action_get, action_fail):
-        action_get.side_effect = action_get_side_effect
-        os.path.exists.return_value = True
+    @patch('remove_quota.cephfs_client')
+    def test_remove_quota(self, cephfs_client, action_get, action_fail,
+                          service_name):
+        # A single directory, without directories.
+        action_get.side_effect = lambda key: (
+            None if key == 'directories' else action_get_side_effect(key))
+        fs = cephfs_client.connect.return_value.__enter__.return_value
         remove_quota()
-        xattr.setxattr.assert_called_with('foo',
-                                          'ceph.quota.max_files',
-                                          '0')
+        cephfs_client.set_xattr.assert_called_with(fs, '/foo',
+                                                   'ceph.quota.max_files',
+                                                   0)
         action_get.assert_has_calls(
             [call('max-files'),
              call('max-bytes'),
+             call('directories'),
              call('directory')])
         action_fail.assert_not_called()
+
+
+class SubvolumeActionsTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail',
+                     'service_name', 'subvolumes'):
+            patcher = patch.object(subvolumes, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.params = {'workers': 4}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+        self.service_name.return_value = 'ceph-fs'
+
+    def test_create_subvolumes(self):
+        self.params['subvolumes'] = '[{"name": "a"}]'
+        specs = self.subvolumes.parse_specs.return_value
+        self.subvolumes.run_bulk.return_value = [
+            {'name': 'a', 'status': 'ok'}]
+        subvolumes.main(['create-subvolumes'])
+        self.subvolumes.parse_specs.assert_called_once_with(
+            '[{"name": "a"}]')
+        self.subvolumes.run_bulk.assert_called_once_with(
+            self.subvolumes.create_subvolume, 'ceph-fs', specs, workers=4)
+        self.action_set.assert_called_once_with({
+            'results': '[{"name": "a", "status": "ok"}]', 'failed': 0})
+        self.action_fail.assert_not_called()
+
+    def test_remove_subvolumes_failure(self):
+        self.params.update(subvolumes='[]', volume='other')
+        self.subvolumes.run_bulk.return_value = [
+            {'name': 'a', 'status': 'ok'},
+            {'name': 'b', 'status': 'error', 'error': 'EBUSY'}]
+        subvolumes.main(['remove-subvolumes'])
+        self.assertEqual(self.subvolumes.run_bulk.call_args[0][1], 'other')
+        self.action_fail.assert_called_once_with('1 of 2 operations failed')
+
+    def test_invalid_specs(self):
+        self.subvolumes.parse_specs.side_effect = ValueError('Invalid JSON')
+        subvolumes.main(['create-subvolume-groups'])
+        self.action_fail.assert_called_once_with('Invalid JSON')
+
+    def test_list_subvolumes(self):
+        self.params['groups'] = ['g1', 'g2']
+        self.subvolumes.list_subvolumes.side_effect = [['a'], ['b']]
+        subvolumes.main(['list-subvolumes'])
+        self.subvolumes.list_subvolumes.assert_has_calls([
+            call('ceph-fs', 'g1'), call('ceph-fs', 'g2')])
+        self.action_set.assert_called_once_with({'results': (
+            '[{"name": "a", "group-name": "g1"}, '
+            '{"name": "b", "group-name": "g2"}]')})
+
+    def test_list_subvolumes_no_group(self):
+        self.subvolumes.list_subvolumes.return_value = ['a']
+        subvolumes.main(['list-subvolumes'])
+        self.subvolumes.list_subvolumes.assert_called_once_with(
+            'ceph-fs', None)
+        self.action_set.assert_called_once_with(
+            {'results': '[{"name": "a"}]'})
+
+    def test_undefined_action(self):
+        self.assertEqual(subvolumes.main(['foo']), 'Action foo undefined')
+
+
+class DiagnosticsActionsTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail', 'action_log',
+                     'cephfs_client', 'client_stats', 'config', 'dirfrags',
+                     'maintenance', 'mds_cache', 'metadata_bench',
+                     'service_name', 'slow_ops', '_mds_cache'):
+            patcher = patch.object(diagnostics, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.maintenance.postpone.return_value = False
+        self.params = {'depth': 2, 'top': 10, 'min-duration': 0,
+                       'timeout': 60, 'interval': 5, 'warn-ratio': 0.9,
+                       'fragments': 8, 'sort': 'metadata-ops', 'limit': 20}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+
+    def test_slow_ops(self):
+        self.slow_ops.analyse.return_value = {'ops': 3, 'blocked': 1}
+        diagnostics.main(['slow-ops'])
+        self.slow_ops.analyse.assert_called_once_with(
+            self.slow_ops.collect.return_value, depth=2, top=10,
+            min_duration=0)
+        self.action_set.assert_called_once_with({
+            'ops': 3, 'blocked': 1,
+            'report': '{\n  "ops": 3,\n  "blocked": 1\n}'})
+
+    def test_slow_ops_failure(self):
+        self.slow_ops.collect.side_effect = subprocess.CalledProcessError(
+            22, 'ceph', stderr=b'admin socket not found')
+        diagnostics.main(['slow-ops'])
+        self.action_fail.assert_called_once_with('admin socket not found')
+
+    def test_client_top(self):
+        self.service_name.return_value = 'ceph-fs'
+        self.params['root'] = '/volumes'
+        self.client_stats.top.return_value = [{'client': 'client.4305'}]
+        self.client_stats.format_table.return_value = 'CLIENT\nclient.4305'
+        diagnostics.main(['client-top'])
+        self.client_stats.top.assert_called_once_with(
+            'ceph-fs', interval=5, client=None, root='/volumes',
+            sort='metadata-ops', limit=20)
+        self.action_set.assert_called_once_with({
+            'clients': 1, 'table': 'CLIENT\nclient.4305',
+            'report': '[\n  {\n    "client": "client.4305"\n  }\n]'})
+
+    def test_cache_status(self):
+        self.mds_cache.cache_status.return_value = {'usage': '75.0%'}
+        diagnostics.main(['cache-status'])
+        self.mds_cache.cache_status.assert_called_once_with(
+            self._mds_cache.return_value)
+        self.action_set.assert_called_once_with({'usage': '75.0%'})
+
+    def test_cache_plan(self):
+        self.service_name.return_value = 'ceph-fs'
+        self.params.update({'hot-fraction': 0.1, 'headroom': 0.2,
+                            'max-cache-per-mds': '32Gi'})
+        self.cephfs_client.get_xattr.side_effect = ['1000000', '20000']
+        self.mds_cache.session_totals.return_value = {
+            'sessions': 4, 'caps': 5000, 'active': 1}
+        self.mds_cache.measure_inode_size.return_value = {
+            'bytes-per-inode': 3000.0, 'rss-ratio': 1.2}
+        self.mds_cache.plan.return_value = {
+            'recommended': {'mds-cache-memory-limit': '1Gi',
+                            'mds-cache-reservation': 0.05,
+                            'max-mds': 1},
+            'memory-per-unit': '2.0GiB', 'units': 2}
+        diagnostics.main(['cache-plan'])
+        fs = self.cephfs_client.connect.return_value.__enter__.return_value
+        self.cephfs_client.get_xattr.assert_has_calls([
+            call(fs, '/', 'ceph.dir.rfiles'),
+            call(fs, '/', 'ceph.dir.rsubdirs')])
+        self.mds_cache.plan.assert_called_once_with(
+            self._mds_cache.return_value, 1000000, 20000, 4, 5000,
+            bytes_per_inode=3000.0, rss_ratio=1.2, hot_fraction=0.1,
+            headroom=0.2, max_cache_per_mds=32 << 30)
+        self.action_set.assert_called_once_with({
+            'mds-cache-memory-limit': '1Gi',
+            'mds-cache-reservation': 0.05, 'max-mds': 1,
+            'memory-per-unit': '2.0GiB', 'units': 2,
+            'report': json.dumps(self.mds_cache.plan.return_value,
+                                 indent=2)})
+
+    def test_drop_cache(self):
+        self.mds_cache.cache_limits.return_value = {'target': 1024}
+        self.mds_cache.drop_cache.return_value = {
+            'after': {'bytes': '2.0KiB'}, 'target-reached': False,
+            'output': None}
+        diagnostics.main(['drop-cache'])
+        self.mds_cache.drop_cache.assert_called_once_with(
+            60, 1024, progress=self.action_log, interval=5)
+        self.action_set.assert_called_once_with({
+            'after': '{"bytes": "2.0KiB"}', 'target-reached': False})
+        self.action_fail.assert_called_once_with(
+            'Cache at 2.0KiB after the drop, above the target of 1.0KiB')
+        self.params['target-size'] = '1Mi'
+        self.mds_cache.drop_cache.reset_mock()
+        diagnostics.main(['drop-cache'])
+        self.assertEqual(self.mds_cache.drop_cache.call_args[0][1], 1048576)
+
+    def test_drop_cache_deferred(self):
+        self.config.return_value = '* 1-4 * * *'
+        self.maintenance.postpone.return_value = True
+        self.params['target-size'] = '1Mi'
+        diagnostics.main(['drop-cache'])
+        self.config.assert_called_once_with('maintenance-window')
+        self.maintenance.postpone.assert_called_once_with(
+            '* 1-4 * * *', 'drop-cache', {'timeout': 60, 'target': 1048576})
+        self.mds_cache.drop_cache.assert_not_called()
+        self.action_set.assert_called_once_with(
+            {'deferred': 'Queued for the maintenance window'})
+
+    def test_directory_hotspots(self):
+        self.dirfrags.report.return_value = {'scanned': 2, 'directories': [
+            {'path': '/a', 'warnings': ['fragment at 95%']},
+            {'path': '/b', 'warnings': []}]}
+        diagnostics.main(['directory-hotspots'])
+        self.dirfrags.report.assert_called_once_with(
+            self.cephfs_client.connect.return_value.__enter__.return_value,
+            ['/'], depth=2, top=10, warn_ratio=0.9)
+        self.assertEqual(self.action_set.call_args[0][0]['flagged'], '["/a"]')
+
+    def test_fragment_directories(self):
+        self.params['directories'] = ['a', 'b']
+        self.dirfrags.fragment_directory.return_value = ['0/1', '1/1']
+        diagnostics.main(['fragment-directories'])
+        self.dirfrags.fragment_directory.assert_has_calls([
+            call('/a', 8), call('/b', 8)])
+        self.action_set.assert_called_once_with({'results': (
+            '{"/a": ["0/1", "1/1"], "/b": ["0/1", "1/1"]}')})
+
+    def test_metadata_bench(self):
+        self.service_name.return_value = 'ceph-fs'
+        self.params.update({'directory': 'bench', 'local': False,
+                            'phases': ['create', 'stat'], 'workers': 4,
+                            'files': 1000, 'files-per-directory': 100,
+                            'file-size': 0})
+        report = {'phases': {
+            'create': {'ops-per-second': 1234.5,
+                       'latency-ms': {'p99': 4.5}},
+            'stat': {'ops-per-second': 9999.9,
+                     'latency-ms': {'p99': 0.25}}}}
+        self.metadata_bench.run.return_value = report
+        diagnostics.main(['metadata-bench'])
+        self.metadata_bench.run.assert_called_once_with(
+            '/bench', phases=['create', 'stat'], workers=4, files=1000,
+            files_per_directory=100, file_size=0, filesystem='ceph-fs')
+        self.action_set.assert_called_once_with({
+            'report': json.dumps(report, indent=2),
+            'create': '1234 ops/s, p99 4.500ms',
+            'stat': '10000 ops/s, p99 0.250ms'})
+        self.params.update({'directory': '/dev/shm', 'local': True})
+        self.metadata_bench.run.reset_mock()
+        diagnostics.main(['metadata-bench'])
+        self.assertEqual(self.metadata_bench.run.call_args,
+                         call('/dev/shm', phases=['create', 'stat'],
+                              workers=4, files=1000, files_per_directory=100,
+                              file_size=0, filesystem=None))
+
+    def test_metadata_bench_failure(self):
+        self.params.update({'directory': '/', 'local': True,
+                            'phases': ['create']})
+        self.cephfs_client.Error = ()
+        self.metadata_bench.Error = FakeError
+        self.metadata_bench.run.side_effect = FakeError('worker 0: EIO')
+        diagnostics.main(['metadata-bench'])
+        self.action_fail.assert_called_once_with('worker 0: EIO')
+
+
+class ScrubActionsTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail', 'config',
+                     'maintenance', 'scrub', 'service_name'):
+            patcher = patch.object(scrub, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.maintenance.postpone.return_value = False
+        self.service_name.return_value = 'ceph-fs'
+        self.params = {'paths': ['/a'], 'repair': False, 'force': True}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+
+    def test_scrub_start(self):
+        self.scrub.start.return_value = {'tags': {'/a': 'tag'}}
+        scrub.main(['scrub-start'])
+        self.scrub.start.assert_called_once_with(
+            'ceph-fs', ['/a'], repair=False, force=True, max_ops=None)
+        self.action_set.assert_called_once_with({'tags': '{"/a": "tag"}'})
+
+    def test_scrub_start_deferred(self):
+        self.config.return_value = '* 1-4 * * *'
+        self.maintenance.postpone.return_value = True
+        scrub.main(['scrub-start'])
+        self.maintenance.postpone.assert_called_once_with(
+            '* 1-4 * * *', 'scrub-start',
+            {'paths': ['/a'], 'repair': False, 'force': True,
+             'max-ops': None})
+        self.scrub.start.assert_not_called()
+        self.action_set.assert_called_once_with(
+            {'deferred': 'Queued for the maintenance window'})
+
+    def test_scrub_start_running(self):
+        self.scrub.start.side_effect = ValueError('A scrub is already paused')
+        scrub.main(['scrub-start'])
+        self.action_fail.assert_called_once_with('A scrub is already paused')
+
+    def test_scrub_pause(self):
+        self.scrub.status.return_value = {'state': 'paused'}
+        scrub.main(['scrub-pause'])
+        self.scrub.pause.assert_called_once_with('ceph-fs')
+        self.action_set.assert_called_once_with({
+            'state': 'paused', 'status': '{\n  "state": "paused"\n}'})
+
+
+class MirrorActionsTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail', 'mirror',
+                     'service_name'):
+            patcher = patch.object(mirror, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.service_name.return_value = 'ceph-fs'
+        self.params = {'client': 'client.mirror_remote', 'site-name': 'dr',
+                       'directories': ['/a', '/b']}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+
+    def test_mirror_bootstrap_create(self):
+        self.mirror.create_bootstrap_token.return_value = 'token'
+        mirror.main(['mirror-bootstrap-create'])
+        self.mirror.create_bootstrap_token.assert_called_once_with(
+            'ceph-fs', 'client.mirror_remote', 'dr')
+        self.action_set.assert_called_once_with({'token': 'token'})
+
+    def test_mirror_add_directories(self):
+        mirror.main(['mirror-add-directories'])
+        self.mirror.enable_mirroring.assert_called_once_with('ceph-fs')
+        self.mirror.add_directory.assert_has_calls([
+            call('ceph-fs', '/a'), call('ceph-fs', '/b')])
+
+    def test_mirror_status(self):
+        self.mirror.sync_status.return_value = [
+            {'path': '/a', 'lag': 12.5}, {'path': '/b', 'lag': None}]
+        mirror.main(['mirror-status'])
+        self.action_set.assert_called_once_with({
+            'directories': 2, 'max-lag': 12.5,
+            'status': mock_json([{'path': '/a', 'lag': 12.5},
+                                 {'path': '/b', 'lag': None}])})
+
+    def test_mirror_status_not_synced(self):
+        self.mirror.sync_status.return_value = [{'path': '/a', 'lag': None}]
+        mirror.main(['mirror-status'])
+        self.action_set.assert_called_once_with({
+            'directories': 1,
+            'status': mock_json([{'path': '/a', 'lag': None}])})
+
+    def test_mirror_status_not_running(self):
+        self.mirror.sync_status.side_effect = ValueError(
+            'The cephfs-mirror daemon is not running')
+        mirror.main(['mirror-status'])
+        self.action_fail.assert_called_once_with(
+            'The cephfs-mirror daemon is not running')
+
+
+def mock_json(value):
+    return json.dumps(value, indent=2)
+
+
+class ListQuotasActionTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail',
+                     'action_log', 'cephfs_client', 'quotas',
+                     'service_name'):
+            patcher = patch.object(list_quotas, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.cephfs_client.Error = FakeError
+        self.params = {'directory': '/', 'workers': 8, 'max-depth': -1,
+                       'exclude': ['.snap', 'tmp*'], 'batch-size': 100,
+                       'time-limit': 600, 'resume': False}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+
+    def test_list_quotas(self):
+        quota = {'path': '/a', 'max-bytes': 1024, 'max-files': 0}
+
+        def _list_quotas(fs, **kwargs):
+            kwargs['on_batch']([quota])
+            return {'complete': True, 'scanned': 10, 'found': 1,
+                    'pending': 0, 'failed': [], 'quotas': [quota],
+                    'output': '/var/lib/ceph-fs-charm/list-quotas.jsonl'}
+        self.quotas.list_quotas.side_effect = _list_quotas
+        list_quotas.list_quotas()
+        fs = self.cephfs_client.connect.return_value.__enter__.return_value
+        self.quotas.list_quotas.assert_called_once_with(
+            fs, roots=['/'], workers=8, max_depth=None,
+            exclude=['.snap', 'tmp*'], batch_size=100, time_limit=600,
+            resume=False, on_batch=ANY)
+        self.action_log.assert_called_once_with(json.dumps([quota]))
+        self.action_set.assert_called_once_with({
+            'complete': True, 'scanned': 10, 'found': 1, 'pending': 0,
+            'failed': '[]', 'quotas': json.dumps([quota], indent=2),
+            'output': '/var/lib/ceph-fs-charm/list-quotas.jsonl'})
+
+    def test_list_quotas_directories(self):
+        self.params.update({'directories': ['/a b', 'c'],
+                            'background': True})
+        with patch.object(list_quotas, 'start_job') as start_job:
+            list_quotas.list_quotas()
+        start_job.assert_called_once()
+        self.assertEqual(start_job.call_args[0][1]['roots'], ['/a b', '/c'])
+
+    def test_list_quotas_error(self):
+        self.quotas.list_quotas.side_effect = FakeError('no access')
+        list_quotas.list_quotas()
+        self.action_fail.assert_called_once_with(
+            'Unable to list quotas: no access')
+        self.action_set.assert_not_called()
+
+
+class FindChangesActionTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail',
+                     'action_log', 'cephfs_client', 'changes',
+                     'service_name'):
+            patcher = patch.object(find_changes, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.cephfs_client.Error = FakeError
+        self.changes.parse_since.return_value = 1700000000
+        self.params = {'since': '24h', 'directory': 'volumes', 'workers': 8,
+                       'exclude': ['.snap'], 'batch-size': 100,
+                       'time-limit': 600, 'resume': False}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+
+    def test_find_changes(self):
+        change = {'path': '/volumes/f', 'type': 'file', 'ctime': 1700000001,
+                  'size': 10}
+
+        def _find_changes(fs, **kwargs):
+            kwargs['on_batch']([change])
+            return {'complete': True, 'since': 1700000000, 'scanned': 10,
+                    'skipped': 8, 'found': 1, 'pending': 0, 'failed': [],
+                    'output': '/var/lib/ceph-fs-charm/find-changes.jsonl'}
+        self.changes.find_changes.side_effect = _find_changes
+        find_changes.find_changes()
+        self.changes.parse_since.assert_called_once_with('24h')
+        fs = self.cephfs_client.connect.return_value.__enter__.return_value
+        self.changes.find_changes.assert_called_once_with(
+            fs, roots=['/volumes'], since=1700000000, workers=8,
+            exclude=['.snap'], batch_size=100, time_limit=600,
+            resume=False, on_batch=ANY)
+        self.action_log.assert_called_once_with(json.dumps([change]))
+        self.action_set.assert_called_once_with({
+            'complete': True, 'since': 1700000000, 'scanned': 10,
+            'skipped': 8, 'found': 1, 'pending': 0, 'failed': '[]',
+            'output': '/var/lib/ceph-fs-charm/find-changes.jsonl'})
+
+    def test_find_changes_since(self):
+        self.params['since'] = None
+        find_changes.find_changes()
+        self.action_fail.assert_called_once_with(
+            'A time to find the changes since is required unless resuming')
+        self.changes.find_changes.assert_not_called()
+        self.params['resume'] = True
+        self.changes.find_changes.return_value = {
+            'complete': True, 'since': 1, 'scanned': 1, 'skipped': 1,
+            'found': 0, 'pending': 0, 'failed': [], 'output': 'out'}
+        find_changes.find_changes()
+        self.assertIsNone(self.changes.find_changes.call_args[1]['since'])
+        self.changes.parse_since.assert_not_called()
+
+    def test_find_changes_error(self):
+        self.changes.find_changes.side_effect = FakeError('no access')
+        find_changes.find_changes()
+        self.action_fail.assert_called_once_with(
+            'Unable to find the changes: no access')
+        self.action_set.assert_not_called()
+
+
+class BackgroundActionTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail', 'charm_dir',
+                     'config', 'jobs', 'service_name'):
+            patcher = patch.object(background, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.jobs.FINISHED = ('completed', 'failed', 'cancelled')
+        self.service_name.return_value = 'ceph-fs'
+        self.charm_dir.return_value = '/var/lib/juju/charm'
+        self.config.return_value = 2
+        self.job = {'id': '3f2a9c1e', 'kind': 'list-quotas',
+                    'state': 'running', 'unit': 'ceph-fs-job-3f2a9c1e',
+                    'created': 1, 'started': 2, 'finished': None,
+                    'progress': 'two', 'params': {'roots': ['/']},
+                    'log': ['one', 'two'], 'result': None, 'error': None}
+        self.jobs.load.return_value = self.job
+        self.jobs.refresh.side_effect = lambda job: job
+        self.action_get.return_value = '3f2a9c1e'
+
+    def test_start_job(self):
+        self.jobs.start.return_value = self.job
+        background.start_job('list-quotas', {'roots': ['/']})
+        self.jobs.start.assert_called_once_with(
+            'list-quotas', 'ceph-fs', {'roots': ['/']},
+            lib_dir='/var/lib/juju/charm/lib', max_jobs=2)
+        self.config.assert_called_once_with('max-jobs')
+        self.action_set.assert_called_once_with(
+            {'job': '3f2a9c1e', 'unit': 'ceph-fs-job-3f2a9c1e'})
+        self.jobs.start.side_effect = ValueError('2 jobs already running')
+        background.start_job('list-quotas', {})
+        self.action_fail.assert_called_once_with('2 jobs already running')
+
+    @patch.object(background.subprocess, 'call')
+    def test_action_log(self, call):
+        background.action_log('10 files unlinked')
+        call.assert_called_once_with(['action-log', '10 files unlinked'])
+
+    def test_job_status(self):
+        background.main(['job-status'])
+        status = json.loads(self.action_set.call_args[0][0]['status'])
+        self.assertEqual(status['state'], 'running')
+        self.assertEqual(status['log'], ['one', 'two'])
+        self.action_get.return_value = None
+        self.jobs.list_jobs.return_value = [self.job]
+        background.main(['job-status'])
+        jobs = json.loads(self.action_set.call_args[0][0]['jobs'])
+        self.assertEqual([job['id'] for job in jobs], ['3f2a9c1e'])
+        self.assertNotIn('log', jobs[0])
+
+    def test_job_result(self):
+        background.main(['job-result'])
+        self.action_fail.assert_called_once_with(
+            'Job 3f2a9c1e is still running: two')
+        self.job.update({'state': 'completed', 'result': {'found': 2}})
+        background.main(['job-result'])
+        self.action_set.assert_called_once_with(
+            {'state': 'completed', 'result': mock_json({'found': 2})})
+        self.action_fail.reset_mock()
+        self.job.update({'state': 'failed', 'error': 'OSError: no access'})
+        background.main(['job-result'])
+        self.action_fail.assert_called_once_with(
+            'Job 3f2a9c1e failed: OSError: no access')
+        self.action_fail.reset_mock()
+        self.jobs.load.return_value = None
+        background.main(['job-result'])
+        self.action_fail.assert_called_once_with('There is no job 3f2a9c1e')
+
+    def test_job_cancel(self):
+        self.jobs.cancel.return_value = dict(self.job, state='cancelled')
+        background.main(['job-cancel'])
+        self.jobs.cancel.assert_called_once_with('3f2a9c1e')
+        self.action_set.assert_called_once_with({'state': 'cancelled'})
+
+
+class RunDeferredActionTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_set', 'action_fail', 'charm', 'maintenance'):
+            patcher = patch.object(run_deferred, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.target = (
+            self.charm.provide_charm_instance.return_value.__enter__
+            .return_value)
+
+    def test_run_deferred(self):
+        self.target.run_deferred.return_value = ['restart', 'scrub']
+        self.maintenance.load_state.return_value = {
+            'pending': {'upgrade': {}}, 'forced': ['upgrade']}
+        run_deferred.run_deferred()
+        self.target.run_deferred.assert_called_once_with(force=True)
+        self.target.assess_status.assert_called_once_with()
+        self.action_set.assert_called_once_with({'ran': 'restart scrub',
+                                                 'pending': 'upgrade'})
+
+    def test_run_deferred_failure(self):
+        self.target.run_deferred.side_effect = subprocess.CalledProcessError(
+            1, 'systemctl', stderr=b'Unit not found')
+        run_deferred.run_deferred()
+        self.action_fail.assert_called_once_with('Unit not found')
+        self.action_set.assert_not_called()
+
+
+class MigrateLayoutActionTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail',
+                     'action_log', 'cephfs_client', 'layout_migration',
+                     'service_name'):
+            patcher = patch.object(migrate_layout, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.cephfs_client.Error = FakeError
+        self.params = {'directory': 'archive', 'pool': 'ec_data',
+                       'workers': 4, 'bandwidth': '200Mi',
+                       'exclude': ['.snap'],
+                       'time-limit': 3600, 'resume': False}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+
+    def test_migrate_layout(self):
+        self.layout_migration.migrate.return_value = {
+            'complete': False, 'scanned': 10, 'migrated': 7, 'linked': 1,
+            'skipped': 2, 'bytes': 4096, 'pending': 3,
+            'throughput': '1.0KiB/s',
+            'failed': [{'path': '/archive/f', 'error': 'modified'}]}
+        migrate_layout.migrate_layout()
+        fs = self.cephfs_client.connect.return_value.__enter__.return_value
+        self.layout_migration.migrate.assert_called_once_with(
+            fs, root='/archive', pool='ec_data', workers=4,
+            bandwidth=200 << 20, exclude=['.snap'], time_limit=3600,
+            resume=False, on_progress=self.action_log)
+        self.action_set.assert_called_once_with({
+            'complete': False, 'scanned': 10, 'migrated': 7, 'linked': 1,
+            'skipped': 2, 'bytes': 4096, 'pending': 3,
+            'throughput': '1.0KiB/s',
+            'failed': mock_json([{'path': '/archive/f',
+                                  'error': 'modified'}])})
+        self.params['bandwidth'] = None
+        migrate_layout.migrate_layout()
+        self.assertIsNone(
+            self.layout_migration.migrate.call_args[1]['bandwidth'])
+
+    def test_migrate_layout_background(self):
+        self.params['background'] = True
+        with patch.object(migrate_layout, 'start_job') as start_job:
+            migrate_layout.migrate_layout()
+        start_job.assert_called_once_with('migrate-layout', {
+            'root': '/archive', 'pool': 'ec_data', 'workers': 4,
+            'bandwidth': 200 << 20, 'exclude': ['.snap'],
+            'time_limit': None, 'resume': False})
+        self.layout_migration.migrate.assert_not_called()
+
+    def test_migrate_layout_error(self):
+        self.layout_migration.migrate.side_effect = FakeError('EINVAL')
+        migrate_layout.migrate_layout()
+        self.action_fail.assert_called_once_with(
+            'Unable to migrate the layout: EINVAL')
+        self.params['bandwidth'] = 'fast'
+        self.action_fail.reset_mock()
+        migrate_layout.migrate_layout()
+        self.action_fail.assert_called_once_with("Invalid size: 'fast'")
+
+
+class DeleteTreeActionTestCase(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        for name in ('action_get', 'action_set', 'action_fail',
+                     'action_log', 'bulk_delete',
+                     'cephfs_client', 'service_name'):
+            patcher = patch.object(delete_tree, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.cephfs_client.Error = FakeError
+        self.service_name.return_value = 'ceph-fs'
+        self.params = {'directory': 'scratch', 'workers': 8, 'rate': 1000,
+                       'max-purge-queue': 0, 'time-limit': 3600,
+                       'resume': False}
+        self.action_get.side_effect = lambda key: self.params.get(key)
+
+    def test_delete_tree(self):
+        self.bulk_delete.delete.return_value = {
+            'complete': True, 'scanned': 10, 'unlinked': 90, 'removed': 10,
+            'pending': 0, 'paused': 20, 'rate': 950.0,
+            'failed': [{'path': '/scratch/f', 'error': 'EPERM'}]}
+        delete_tree.delete_tree()
+        fs = self.cephfs_client.connect.return_value.__enter__.return_value
+        self.bulk_delete.delete.assert_called_once_with(
+            fs, root='/scratch', workers=8, rate=1000, max_queue=None,
+            queue_length=ANY, time_limit=3600, resume=False,
+            on_progress=self.action_log)
+        queue_length = self.bulk_delete.delete.call_args[1]['queue_length']
+        queue_length()
+        self.bulk_delete.purge_queue_length.assert_called_once_with(
+            'ceph-fs')
+        self.action_set.assert_called_once_with({
+            'complete': True, 'scanned': 10, 'unlinked': 90, 'removed': 10,
+            'pending': 0, 'paused': 20, 'rate': 950.0,
+            'failed': mock_json([{'path': '/scratch/f',
+                                  'error': 'EPERM'}])})
+
+    def test_delete_tree_resume(self):
+        self.params.update({'directory': None, 'resume': True})
+        self.bulk_delete.delete.return_value = {
+            'complete': False, 'scanned': 1, 'unlinked': 0, 'removed': 0,
+            'pending': 1, 'paused': 0, 'rate': 0, 'failed': []}
+        delete_tree.delete_tree()
+        self.assertIsNone(self.bulk_delete.delete.call_args[1]['root'])
+        self.params['resume'] = False
+        self.bulk_delete.delete.reset_mock()
+        delete_tree.delete_tree()
+        self.bulk_delete.delete.assert_not_called()
+        self.action_fail.assert_called_once_with(
+            'A directory is required unless resuming')
+
+    def test_delete_tree_error(self):
+        self.bulk_delete.delete.side_effect = FakeError('EACCES')
+        delete_tree.delete_tree()
+        self.action_fail.assert_called_once_with(
+            'Unable to delete the tree: EACCES')
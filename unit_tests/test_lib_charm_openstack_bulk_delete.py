@@ -0,0 +1,213 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import tempfile
+import unittest
+import unittest.mock as mock
+
+sys.modules['cephfs'] = mock.MagicMock()
+sys.modules['rados'] = mock.MagicMock()
+
+import charm.openstack.bulk_delete as bulk_delete
+
+
+class FakeEntry(object):
+
+    def __init__(self, entry):
+        self.d_name = entry.name.encode('utf-8')
+        self._entry = entry
+
+    def is_dir(self):
+        return self._entry.is_dir(follow_symlinks=False)
+
+
+class LocalFS(object):
+    """libcephfs calls on a local directory."""
+
+    def __init__(self, root):
+        self.root = root
+        self.calls = []
+
+    def _path(self, path):
+        return self.root + path
+
+    def opendir(self, path):
+        return iter(list(os.scandir(self._path(path))))
+
+    def readdir(self, handle):
+        entry = next(handle, None)
+        return FakeEntry(entry) if entry else None
+
+    def closedir(self, handle):
+        pass
+
+    def stat(self, path):
+        return os.stat(self._path(path))
+
+    def unlink(self, path):
+        self.calls.append(('unlink', path))
+        os.unlink(self._path(path))
+
+    def rmdir(self, path):
+        self.calls.append(('rmdir', path))
+        os.rmdir(self._path(path))
+
+
+class TestBulkDelete(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, 'fs')
+        for target, name, value in (
+                (bulk_delete.tree_walk, 'STATE_DIR',
+                 os.path.join(tmp.name, 'state')),
+                (bulk_delete.cephfs_client, 'Error', OSError),
+                (bulk_delete.cephfs, 'ObjectNotFound', FileNotFoundError)):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.makedirs(os.path.join(self.root, 'old', 'a', 'b'))
+        os.makedirs(os.path.join(self.root, 'old', 'c'))
+        os.makedirs(os.path.join(self.root, 'keep'))
+        for path in ('/old/one', '/old/a/two', '/old/a/b/three',
+                     '/old/c/four', '/keep/five'):
+            with open(self.root + path, 'w') as f:
+                f.write(path)
+        os.symlink('/keep', self.root + '/old/c/link')
+        self.fs = LocalFS(self.root)
+
+    def test_delete(self):
+        progress = []
+        with mock.patch.object(bulk_delete, 'CHECKPOINT_INTERVAL', 0):
+            result = bulk_delete.delete(self.fs, '/old/', workers=2,
+                                        rate=1000, on_progress=progress.append)
+        self.assertEqual(result, {
+            'complete': True, 'scanned': 4, 'unlinked': 5, 'removed': 4,
+            'pending': 0, 'failed': [], 'paused': 0, 'rate': mock.ANY})
+        self.assertTrue(progress)
+        self.assertEqual(os.listdir(self.root), ['keep'])
+        self.assertEqual(sorted(os.listdir(self.root + '/keep')), ['five'])
+        removed = [path for call, path in self.fs.calls if call == 'rmdir']
+        self.assertEqual(removed[-1], '/old')
+        self.assertLess(removed.index('/old/a/b'), removed.index('/old/a'))
+        self.assertIsNone(bulk_delete.tree_walk.load_cursor(
+            bulk_delete.CURSOR))
+
+    def test_delete_resume(self):
+        result = bulk_delete.delete(self.fs, '/old', workers=1, time_limit=0)
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['scanned'], 1)
+        self.assertEqual(result['unlinked'], 1)
+        self.assertEqual(result['pending'], 2)
+        self.assertTrue(os.path.isdir(self.root + '/old'))
+        result = bulk_delete.delete(self.fs, resume=True)
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['unlinked'], 5)
+        self.assertEqual(result['removed'], 4)
+        self.assertFalse(os.path.exists(self.root + '/old'))
+        self.assertRaises(ValueError, bulk_delete.delete, self.fs,
+                          resume=True)
+
+    def test_delete_root(self):
+        self.assertRaises(ValueError, bulk_delete.delete, self.fs, '/')
+        self.assertRaises(ValueError, bulk_delete.delete, self.fs, '//')
+        self.assertRaises(ValueError, bulk_delete.delete, self.fs)
+        self.assertEqual(self.fs.calls, [])
+
+    def test_delete_failed(self):
+        rmdir = self.fs.rmdir
+
+        def _rmdir(path):
+            if path == '/old/c':
+                # A file created in the directory meanwhile.
+                raise OSError('directory not empty')
+            rmdir(path)
+
+        self.fs.rmdir = _rmdir
+        result = bulk_delete.delete(self.fs, '/old')
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['failed'], [
+            {'path': '/old/c', 'error': 'directory not empty'},
+            {'path': '/old', 'error': mock.ANY}])
+        self.assertTrue(os.path.isdir(self.root + '/old/c'))
+        # The next run makes a new pass over what is left.
+        self.fs.rmdir = rmdir
+        result = bulk_delete.delete(self.fs, resume=True)
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['failed'], [])
+        self.assertEqual(result['removed'], 4)
+        self.assertFalse(os.path.exists(self.root + '/old'))
+
+    def test_delete_queue_failed(self):
+        queue_length = mock.Mock(
+            side_effect=bulk_delete.subprocess.TimeoutExpired('ceph', 60))
+        result = bulk_delete.delete(self.fs, '/old', workers=2, max_queue=10,
+                                    queue_length=queue_length)
+        # Nothing deleted unchecked, and the deletion can be resumed.
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['unlinked'], 0)
+        self.assertEqual(result['removed'], 0)
+        self.assertIn({'path': '/old', 'error': mock.ANY}, result['failed'])
+        # Sampled once, the operations fail until the next sample.
+        self.assertEqual(queue_length.call_count, 1)
+        self.assertTrue(os.path.isfile(self.root + '/old/one'))
+        queue_length.side_effect = None
+        queue_length.return_value = 0
+        with mock.patch.object(bulk_delete, 'QUEUE_INTERVAL', 0):
+            result = bulk_delete.delete(self.fs, resume=True, max_queue=10,
+                                        queue_length=queue_length)
+        self.assertTrue(result['complete'])
+        self.assertFalse(os.path.exists(self.root + '/old'))
+
+    @mock.patch.object(bulk_delete.time, 'sleep')
+    def test_throttle(self, sleep):
+        queue_length = mock.Mock(side_effect=[100, 60, 40, 100])
+        throttle = bulk_delete.Throttle(max_queue=80,
+                                        queue_length=queue_length)
+        throttle.wait()
+        self.assertEqual(queue_length.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertEqual(throttle.paused, 2 * bulk_delete.QUEUE_INTERVAL)
+        # Sampled again once the interval is over.
+        throttle.wait()
+        self.assertEqual(queue_length.call_count, 3)
+        throttle.sampled -= bulk_delete.QUEUE_INTERVAL
+        sleep.reset_mock()
+        queue_length.side_effect = [100, 10]
+        throttle.wait()
+        self.assertEqual(sleep.call_count, 1)
+        # Never sampled without a maximum.
+        queue_length.reset_mock()
+        bulk_delete.Throttle(queue_length=queue_length).wait()
+        queue_length.assert_not_called()
+
+    @mock.patch.object(bulk_delete.ceph_cli, 'ceph_command')
+    def test_purge_queue_length(self, ceph_command):
+        def _command(*args, **kwargs):
+            if args[0] == 'fs':
+                return {'mdsmap': [
+                    {'name': 'a', 'state': 'active'},
+                    {'name': 'b', 'state': 'standby'},
+                    {'name': 'c', 'state': 'active'}]}
+            return {'purge_queue': {
+                'pq_item_in_journal': 5 if args[1] == 'mds.a' else 7}}
+
+        ceph_command.side_effect = _command
+        self.assertEqual(bulk_delete.purge_queue_length('cephfs'), 12)
+        ceph_command.assert_any_call('tell', 'mds.c', 'perf', 'dump',
+                                     'purge_queue', timeout=60)
@@ -0,0 +1,70 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import subprocess
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.ceph_cli as ceph_cli
+
+
+class TestCephCli(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(ceph_cli.socket, 'gethostname')
+        self.gethostname = patcher.start()
+        self.gethostname.return_value = 'somehost'
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(ceph_cli.subprocess, 'check_output')
+        self.check_output = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_ceph_command(self):
+        self.check_output.return_value = b'{"epoch": 3}\n'
+        self.assertEqual(ceph_cli.ceph_command('fs', 'dump', timeout=5),
+                         {'epoch': 3})
+        self.check_output.assert_called_once_with(
+            ['ceph', '--conf', '/etc/ceph/ceph.conf',
+             '--name', 'mds.somehost',
+             '--keyring', '/var/lib/ceph/mds/ceph-somehost/keyring',
+             '--format', 'json', 'fs', 'dump'],
+            stderr=subprocess.PIPE, timeout=5)
+
+    def test_daemon_command(self):
+        self.check_output.return_value = b''
+        self.assertIsNone(ceph_cli.daemon_command('cache', 'drop', 10))
+        self.check_output.assert_called_once_with(
+            ['ceph', '--conf', '/etc/ceph/ceph.conf', 'daemon',
+             'mds.somehost', 'cache', 'drop', '10'],
+            stderr=subprocess.PIPE, timeout=None)
+        self.check_output.return_value = b'not json'
+        self.assertEqual(ceph_cli.daemon_command('help'), 'not json')
+
+    def test_socket_command(self):
+        self.check_output.return_value = b'{"peers": {}}'
+        self.assertEqual(
+            ceph_cli.socket_command('/run/ceph/mirror.asok', 'help'),
+            {'peers': {}})
+        self.check_output.assert_called_once_with(
+            ['ceph', '--admin-daemon', '/run/ceph/mirror.asok', 'help'],
+            stderr=subprocess.PIPE, timeout=None)
+
+    def test_command_error(self):
+        exc = subprocess.CalledProcessError(
+            1, ['ceph'], stderr=b'Error ENOENT: no such volume\n')
+        self.assertEqual(ceph_cli.command_error(exc),
+                         'Error ENOENT: no such volume')
+        self.assertEqual(ceph_cli.command_error(ValueError('boom')), 'boom')
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import re
 import unittest.mock as mock
 
 import charms_openstack.test_utils as test_utils
@@ -33,7 +34,8 @@ class TestMitakaCephFsCharm(test_utils.PatchHelper):
         # future versions of this charm, see ``TestCephFsCharm`` for the rest
         # of the tests
         self.assertEquals(self.target.packages, [
-            'ceph-mds', 'gdisk', 'btrfs-tools', 'xfsprogs'])
+            'ceph-mds', 'gdisk', 'btrfs-tools', 'xfsprogs', 'python3-cephfs',
+            'python3-rados'])
 
 
 class TestCephFsCharm(test_utils.PatchHelper):
@@ -54,12 +56,39 @@ class TestCephFsCharm(test_utils.PatchHelper):
         setattr(self, attr, started)
 
     def test___init__(self):
+        self.patch_object(ceph_fs, 'config', return_value=None)
+        self.target = ceph_fs.UssuriCephFSCharm()
         self.assertEquals(self.target.services, [
             'ceph-mds@somehost'])
         self.assertDictEqual(self.target.restart_map, {
-            '/etc/ceph/ceph.conf': ['ceph-mds@somehost']})
+            '/etc/ceph/ceph.conf': ['ceph-mds@somehost'],
+            '/etc/systemd/system/ceph-mds@somehost.service.d/'
+            'charm-resources.conf': ['ceph-mds@somehost'],
+            '/etc/default/ceph-fs-charm': ['ceph-mds@somehost'],
+            '/etc/systemd/system/ceph-fs-scrub.service': [],
+            '/etc/systemd/system/ceph-fs-scrub.timer': [],
+            '/etc/systemd/system/ceph-fs-autoscale.service': [],
+            '/etc/systemd/system/ceph-fs-autoscale.timer': [],
+            '/etc/systemd/system/ceph-fs-cache-tune.service': [],
+            '/etc/systemd/system/ceph-fs-cache-tune.timer': []})
         self.assertEquals(self.target.packages, [
-            'ceph-mds', 'gdisk', 'btrfs-progs', 'xfsprogs'])
+            'ceph-mds', 'gdisk', 'btrfs-progs', 'xfsprogs',
+            'python3-cephfs', 'python3-rados'])
+
+    def test___init___mirror(self):
+        self.patch_object(ceph_fs, 'config')
+        self.config.side_effect = lambda x: x == 'cephfs-mirror'
+        self.target = ceph_fs.UssuriCephFSCharm()
+        self.assertEqual(self.target.services, [
+            'ceph-mds@somehost', 'cephfs-mirror@cephfs-mirror'])
+        for path in ('/etc/ceph/cephfs-mirror.conf',
+                     '/etc/ceph/cephfs-mirror.keyring',
+                     '/etc/systemd/system/cephfs-mirror@cephfs-mirror.'
+                     'service.d/charm-mirror.conf'):
+            self.assertEqual(self.target.restart_map[path],
+                             ['cephfs-mirror@cephfs-mirror'])
+        self.assertEqual(self.target.restart_map['/etc/ceph/ceph.conf'],
+                         ['ceph-mds@somehost'])
 
     def test_configuration_class(self):
         self.assertEquals(self.target.options.hostname, 'somehost')
@@ -89,3 +118,670 @@ class TestCephFsCharm(test_utils.PatchHelper):
             'mds-cache-memory-limit': '4Gi',
             'mds-cache-reservation': 0.05,
             'mds-health-cache-threshold': 1.5})
+
+    def test_get_mds_service_resources(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {
+            'cpu-affinity': '0-3, 8',
+            'numa-policy': 'bind',
+            'numa-mask': '0',
+            'cpu-weight': 500,
+            'memory-max': '16Gi',
+            'nice': -5,
+            'io-scheduling-class': 'best-effort',
+        }
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertEqual(self.target.get_mds_service_resources(), [
+            ('CPUAffinity', '0-3, 8'),
+            ('NUMAPolicy', 'bind'),
+            ('NUMAMask', '0'),
+            ('CPUWeight', 500),
+            ('MemoryMax', 17179869184),
+            ('Nice', -5),
+            ('IOSchedulingClass', 'best-effort'),
+        ])
+        self.assertEqual(self.target.options.mds_service_resources[0],
+                         ('CPUAffinity', '0-3, 8'))
+        cfg['nice'] = 42
+        with self.assertRaises(ValueError):
+            self.target.get_mds_service_resources()
+        self.assertEqual(self.target.options.mds_service_resources, [])
+        cfg['nice'] = None
+        cfg['cpu-affinity'] = 'all of them'
+        with self.assertRaises(ValueError):
+            self.target.get_mds_service_resources()
+
+    def test_check_mds_memory_limits(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {
+            'mds-cache-memory-limit': '4Gi',
+            'mds-health-cache-threshold': 1.5,
+            'memory-max': '6Gi',
+            'memory-high': '4Gi',
+        }
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertEqual(self.target.check_mds_memory_limits(),
+                         (None, None))
+        cfg['memory-max'] = '5Gi'
+        self.assertEqual(self.target.check_mds_memory_limits(), (
+            'blocked', 'memory-max (5.0GiB) is too low for '
+            'mds-cache-memory-limit, need at least 6.0GiB'))
+        cfg['memory-max'] = 'infinity'
+        cfg['memory-high'] = '3Gi'
+        self.assertEqual(self.target.check_mds_memory_limits()[0],
+                         'blocked')
+        cfg['memory-high'] = '4Gi'
+        self.patch_target('get_mds_cache_autotune')
+        self.get_mds_cache_autotune.return_value = {
+            'interval': 300, 'settings': {'ceiling': 8 << 30}}
+        self.assertEqual(self.target.check_mds_memory_limits(), (
+            'blocked', 'memory-high (4.0GiB) is too low for '
+            'mds-cache-memory-limit, need at least 8.0GiB'))
+
+    def test_custom_assess_status_check(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {'mds-cache-memory-limit': '4Gi', 'numa-policy': 'spread'}
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.patch_object(ceph_fs.charms_openstack.plugins.CephCharm,
+                          'custom_assess_status_check')
+        self.custom_assess_status_check.return_value = (None, None)
+        self.patch_object(ceph_fs.reactive, 'is_flag_set')
+        flags = {'ceph-mds.available'}
+        self.is_flag_set.side_effect = lambda flag: flag in flags
+        self.assertEqual(self.target.custom_assess_status_check(), (
+            'waiting', 'Waiting for the leader to create the pools'))
+        flags.add('leadership.set.pools-ready')
+        state, message = self.target.custom_assess_status_check()
+        self.assertEqual(state, 'blocked')
+        self.assertTrue(message.startswith(
+            'Invalid configuration: numa-policy'))
+        cfg['numa-policy'] = None
+        self.assertEqual(self.target.custom_assess_status_check(),
+                         (None, None))
+
+    def test_restart_on_change(self):
+        self.patch_object(ceph_fs.charms_openstack.plugins.CephCharm,
+                          'restart_on_change', new=mock.MagicMock())
+        self.patch_object(ceph_fs.ch_host, 'path_hash')
+        self.patch_object(ceph_fs.subprocess, 'check_call')
+        self.patch_target('maintenance_window_open', return_value=True)
+        hashes = {}
+        self.path_hash.side_effect = hashes.get
+        with self.target.restart_on_change():
+            pass
+        self.check_call.assert_not_called()
+        with self.target.restart_on_change():
+            hashes[self.target.mds_service_dropin] = 'new'
+        self.check_call.assert_called_once_with(
+            ['systemctl', 'daemon-reload'])
+        self.check_call.reset_mock()
+        self.patch_object(ceph_fs.CephFSCharmConfigurationAdapter,
+                          'scrub_schedule', new=mock.PropertyMock())
+        self.scrub_schedule.return_value = {'schedule': 'daily'}
+        with self.target.restart_on_change():
+            hashes[ceph_fs.SCRUB_TIMER] = 'new'
+        self.check_call.assert_has_calls([
+            mock.call(['systemctl', 'daemon-reload']),
+            mock.call(['systemctl', 'enable', '--now',
+                       'ceph-fs-scrub.timer'])])
+        self.scrub_schedule.return_value = None
+        with self.target.restart_on_change():
+            hashes[ceph_fs.SCRUB_TIMER] = 'newer'
+        self.check_call.assert_called_with(
+            ['systemctl', 'disable', '--now', 'ceph-fs-scrub.timer'])
+        self.patch_object(ceph_fs.CephFSCharmConfigurationAdapter,
+                          'mds_autoscale', new=mock.PropertyMock())
+        self.mds_autoscale.return_value = {'interval': 60}
+        with self.target.restart_on_change():
+            hashes[ceph_fs.AUTOSCALE_TIMER] = 'new'
+        self.check_call.assert_called_with(
+            ['systemctl', 'enable', '--now', 'ceph-fs-autoscale.timer'])
+
+    def test_restart_on_change_deferred(self):
+        restart_on_change = mock.MagicMock()
+        self.patch_object(ceph_fs.charms_openstack.plugins.CephCharm,
+                          'restart_on_change', new=restart_on_change)
+        self.patch_object(ceph_fs.ch_host, 'path_hash')
+        self.patch_object(ceph_fs.subprocess, 'check_call')
+        self.patch_object(ceph_fs.maintenance, 'defer')
+        self.patch_target('maintenance_window_open', return_value=False)
+        self.target.full_restart_map = {
+            '/etc/ceph/ceph.conf': ['ceph-mds@somehost'],
+            ceph_fs.SCRUB_SERVICE: []}
+        hashes = {}
+        self.path_hash.side_effect = hashes.get
+        with self.target.restart_on_change():
+            hashes[ceph_fs.SCRUB_SERVICE] = 'new'
+        restart_on_change.assert_not_called()
+        self.check_call.assert_called_once_with(
+            ['systemctl', 'daemon-reload'])
+        self.defer.assert_not_called()
+        with self.target.restart_on_change():
+            hashes['/etc/ceph/ceph.conf'] = 'new'
+        self.defer.assert_called_once_with(
+            'restart', {'services': ['ceph-mds@somehost']})
+
+    def test_upgrade_if_available(self):
+        upgrade = mock.MagicMock()
+        self.patch_object(ceph_fs.charms_openstack.plugins.CephCharm,
+                          'upgrade_if_available', new=upgrade, create=True)
+        self.patch_object(ceph_fs.maintenance, 'defer')
+        self.patch_target('maintenance_window_open', return_value=False)
+        self.target.upgrade_if_available(['ceph-mds'])
+        self.defer.assert_called_once_with('upgrade')
+        upgrade.assert_not_called()
+        self.maintenance_window_open.return_value = True
+        self.target.upgrade_if_available(['ceph-mds'])
+        upgrade.assert_called_once_with(['ceph-mds'])
+
+    def test_get_maintenance_window(self):
+        self.patch_object(ceph_fs, 'config')
+        self.config.return_value = None
+        self.assertIsNone(self.target.get_maintenance_window())
+        self.assertTrue(self.target.maintenance_window_open())
+        self.config.return_value = ' * 1-4 * * 6,0 '
+        self.assertEqual(self.target.get_maintenance_window(),
+                         '* 1-4 * * 6,0')
+        self.assertEqual(self.target.options.maintenance_window,
+                         '* 1-4 * * 6,0')
+        self.config.return_value = '* 25 * * *'
+        with self.assertRaisesRegex(ValueError, '^maintenance-window: '):
+            self.target.get_maintenance_window()
+        self.assertIsNone(self.target.options.maintenance_window)
+        # An invalid window blocks the unit but defers nothing.
+        self.assertTrue(self.target.maintenance_window_open())
+
+    def test_run_deferred(self):
+        upgrade = mock.MagicMock()
+        self.patch_object(ceph_fs.charms_openstack.plugins.CephCharm,
+                          'upgrade_if_available', new=upgrade, create=True)
+        self.patch_object(ceph_fs, 'maintenance')
+        self.patch_object(ceph_fs.ch_host, 'service_restart',
+                          return_value=True)
+        self.patch_object(ceph_fs.mds_cache, 'drop_cache')
+        self.patch_object(ceph_fs.subprocess, 'check_call')
+        self.patch_object(ceph_fs.ch_core.hookenv, 'service_name',
+                          return_value='ceph-fs')
+        self.patch_target('get_maintenance_window',
+                          return_value='* 1-4 * * *')
+        self.maintenance.window_open.return_value = False
+        self.maintenance.load_state.return_value = {'pending': {}}
+        self.assertEqual(self.target.run_deferred(['ceph-mds']), [])
+        self.maintenance.take.assert_not_called()
+        self.maintenance.load_state.return_value = {'pending': {'scrub': {}}}
+        self.maintenance.take.return_value = {
+            'restart': {'services': ['ceph-mds@somehost']},
+            'upgrade': {},
+            'drop-cache': {'timeout': 60, 'target': 1024},
+            'scrub': {}}
+        self.drop_cache.side_effect = ceph_fs.subprocess.TimeoutExpired(
+            'ceph', 120)
+        self.assertEqual(self.target.run_deferred(['ceph-mds']),
+                         ['upgrade', 'restart', 'scrub'])
+        self.maintenance.force.assert_called_once_with(['scrub'])
+        self.maintenance.take.assert_called_once_with('* 1-4 * * *')
+        upgrade.assert_called_once_with(['ceph-mds'])
+        self.service_restart.assert_called_once_with('ceph-mds@somehost')
+        self.maintenance.defer.assert_called_once_with(
+            'drop-cache', {'timeout': 60, 'target': 1024})
+        self.check_call.assert_called_once_with(
+            ['systemctl', 'start', '--no-block', 'ceph-fs-scrub.service'])
+        # Upgrades need the relations and wait for the next hook.
+        self.maintenance.reset_mock()
+        self.maintenance.take.return_value = {'upgrade': {'since': 1}}
+        self.assertEqual(self.target.run_deferred(force=True), [])
+        self.maintenance.force.assert_has_calls([
+            mock.call(), mock.call(['upgrade'])])
+        self.maintenance.defer.assert_called_once_with(
+            'upgrade', {'since': 1})
+
+    def test_run_deferred_restart_failed(self):
+        self.patch_object(ceph_fs, 'maintenance')
+        self.patch_object(ceph_fs.ch_host, 'service_restart')
+        self.patch_target('get_maintenance_window',
+                          return_value='* 1-4 * * *')
+        self.maintenance.load_state.return_value = {
+            'pending': {'restart': {}}}
+        self.maintenance.take.return_value = {
+            'restart': {'services': ['ceph-mds@somehost', 'cephfs-mirror'],
+                        'since': 1}}
+        # service_restart reports a failure by returning False.
+        self.service_restart.side_effect = lambda service: (
+            service == 'cephfs-mirror')
+        self.assertEqual(self.target.run_deferred(), [])
+        self.service_restart.assert_has_calls([
+            mock.call('ceph-mds@somehost'), mock.call('cephfs-mirror')])
+        self.maintenance.defer.assert_called_once_with(
+            'restart', {'services': ['ceph-mds@somehost'], 'since': 1})
+
+    def test_get_mds_environment(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {
+            'mds-cache-memory-limit': '4Gi',
+            'tcmalloc-max-total-thread-cache-bytes': '128Mi',
+            'tcmalloc-release-rate': 5,
+        }
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertEqual(self.target.get_mds_environment(), [
+            ('TCMALLOC_MAX_TOTAL_THREAD_CACHE_BYTES', 134217728),
+            ('TCMALLOC_RELEASE_RATE', 5.0)])
+        self.assertEqual(self.target.options.mds_environment, [
+            ('TCMALLOC_MAX_TOTAL_THREAD_CACHE_BYTES', 134217728),
+            ('TCMALLOC_RELEASE_RATE', 5.0)])
+        cfg['tcmalloc-release-rate'] = 11
+        self.assertRaises(ValueError, self.target.get_mds_environment)
+        self.assertEqual(self.target.options.mds_environment, [])
+        cfg['tcmalloc-release-rate'] = None
+        cfg['tcmalloc-max-total-thread-cache-bytes'] = '4Gi'
+        self.assertRaises(ValueError, self.target.get_mds_environment)
+
+    def test_get_transparent_hugepage(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {}
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertIsNone(self.target.get_transparent_hugepage())
+        cfg['transparent-hugepage'] = 'madvise'
+        self.assertEqual(self.target.get_transparent_hugepage(), 'madvise')
+        cfg['transparent-hugepage'] = 'sometimes'
+        self.assertRaises(ValueError, self.target.get_transparent_hugepage)
+
+    def test_get_mds_process(self):
+        self.patch_object(ceph_fs.subprocess, 'check_output',
+                          return_value='1234\n')
+        self.patch_object(ceph_fs.psutil, 'Process')
+        self.patch_object(ceph_fs.psutil, 'Error', new=OSError)
+        self.assertEqual(self.target.get_mds_process(),
+                         self.Process.return_value)
+        self.check_output.assert_called_once_with(
+            ['systemctl', 'show', '--property', 'MainPID', '--value',
+             'ceph-mds@somehost'], universal_newlines=True)
+        self.Process.assert_called_once_with(1234)
+        # The unit is stopped.
+        self.check_output.return_value = '0\n'
+        self.assertIsNone(self.target.get_mds_process())
+        # The process exited since.
+        self.check_output.return_value = '1234\n'
+        self.Process.side_effect = OSError('no such process')
+        self.assertIsNone(self.target.get_mds_process())
+        self.check_output.side_effect = (
+            ceph_fs.subprocess.CalledProcessError(1, 'systemctl'))
+        self.assertIsNone(self.target.get_mds_process())
+
+    def test_check_mds_allocator(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {
+            'mds-cache-memory-limit': '4Gi',
+            'tcmalloc-max-total-thread-cache-bytes': '128Mi',
+            'transparent-hugepage': 'never',
+        }
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.patch_target('get_mds_process')
+        self.assertEqual(self.target.check_mds_allocator(), [])
+        proc = mock.MagicMock()
+        proc.memory_info.return_value.rss = 5 * 1024 ** 3
+        proc.environ.return_value = {
+            'TCMALLOC_MAX_TOTAL_THREAD_CACHE_BYTES': '134217728'}
+        self.get_mds_process.return_value = proc
+        with mock.patch('builtins.open', mock.mock_open(
+                read_data='always madvise [never]\n')):
+            self.assertEqual(self.target.check_mds_allocator(), [
+                'MDS RSS 5.0GiB of 4.0GiB cache limit'])
+        proc.environ.return_value = {}
+        with mock.patch('builtins.open', mock.mock_open(
+                read_data='[always] madvise never\n')):
+            self.assertEqual(self.target.check_mds_allocator(), [
+                'MDS RSS 5.0GiB of 4.0GiB cache limit',
+                'restart needed to apply '
+                'TCMALLOC_MAX_TOTAL_THREAD_CACHE_BYTES',
+                'transparent hugepages always instead of never'])
+
+    def test_get_sysctl(self):
+        self.patch_object(ceph_fs, 'config')
+        self.config.return_value = (
+            '{ net.core.somaxconn: 4096, '
+            'net.ipv4.tcp_rmem: "4096 87380 16777216" }')
+        self.assertEqual(self.target.get_sysctl(), {
+            'net.core.somaxconn': '4096',
+            'net.ipv4.tcp_rmem': '4096 87380 16777216'})
+        self.config.return_value = None
+        self.assertEqual(self.target.get_sysctl(), {})
+        for value in ('[1, 2]', '{ a: [1] }', '{ a: '):
+            self.config.return_value = value
+            self.assertRaises(ValueError, self.target.get_sysctl)
+
+    def test_apply_sysctl(self):
+        self.patch_object(ceph_fs.ch_host, 'is_container',
+                          return_value=False)
+        self.patch_object(ceph_fs.reactive, 'data_changed',
+                          return_value=True)
+        self.patch_object(ceph_fs.os.path, 'exists', return_value=True)
+        self.patch_object(ceph_fs.ch_sysctl, 'create')
+        self.patch_target('get_sysctl',
+                          return_value={'net.core.somaxconn': '4096'})
+        self.target.apply_sysctl()
+        self.create.assert_called_once_with(
+            'net.core.somaxconn: \'4096\'\n',
+            '/etc/sysctl.d/50-ceph-fs-charm.conf')
+        self.create.reset_mock()
+        self.data_changed.return_value = False
+        self.target.apply_sysctl()
+        self.create.assert_not_called()
+        self.exists.return_value = False
+        self.target.apply_sysctl()
+        self.create.assert_called_once_with(
+            mock.ANY, '/etc/sysctl.d/50-ceph-fs-charm.conf')
+        self.create.reset_mock()
+        self.is_container.return_value = True
+        self.target.apply_sysctl()
+        self.create.assert_not_called()
+
+    def test_check_sysctl(self):
+        self.patch_object(ceph_fs.ch_host, 'is_container',
+                          return_value=False)
+        self.patch_target('get_sysctl', return_value={
+            'net.core.somaxconn': '4096',
+            'net.ipv4.tcp_rmem': '4096 87380 16777216',
+            'net.missing': '1'})
+        self.patch_target('get_mds_service_resources',
+                          return_value=[('LimitNOFILE', 1048576)])
+        proc = mock.MagicMock()
+        proc.rlimit.return_value = (65536, 65536)
+        self.patch_target('get_mds_process', return_value=proc)
+        proc_sys = {'/proc/sys/net/core/somaxconn': '4096\n',
+                    '/proc/sys/net/ipv4/tcp_rmem': '4096\t131072\t6291456\n'}
+
+        def _open(path, *args, **kwargs):
+            if path not in proc_sys:
+                raise FileNotFoundError(path)
+            return mock.mock_open(read_data=proc_sys[path])()
+        with mock.patch('builtins.open', side_effect=_open):
+            self.assertEqual(self.target.check_sysctl(), [
+                'settings differ from the charm: '
+                'net.ipv4.tcp_rmem=4096 131072 6291456, nofile=65536'])
+            proc_sys['/proc/sys/net/ipv4/tcp_rmem'] = '4096 87380 16777216'
+            proc.rlimit.return_value = (1048576, 1048576)
+            self.assertEqual(self.target.check_sysctl(), [])
+        self.is_container.return_value = True
+        self.assertEqual(self.target.check_sysctl(), [])
+
+    def test_custom_assess_status_last_check(self):
+        self.patch_target('get_status_notes')
+        self.get_status_notes.return_value = []
+        self.assertEqual(self.target.custom_assess_status_last_check(),
+                         (None, None))
+        self.get_status_notes.return_value = ['one', 'two']
+        self.assertEqual(self.target.custom_assess_status_last_check(),
+                         ('active', 'Unit is ready (one; two)'))
+
+    def test_get_msgr_config(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {
+            'ms-client-mode': 'secure crc',
+            'ms-service-mode': 'crc',
+            'ms-compress-mode': 'force',
+            'ms-async-op-threads': 6,
+        }
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertEqual(self.target.get_msgr_config(), [
+            ('global', 'ms client mode', 'secure crc'),
+            ('mds', 'ms service mode', 'crc'),
+            ('global', 'ms osd compress mode', 'force'),
+            ('mds', 'ms async op threads', 6)])
+        self.assertEqual(self.target.options.msgr_global, [
+            ('ms client mode', 'secure crc'),
+            ('ms osd compress mode', 'force')])
+        self.assertEqual(self.target.options.msgr_mds, [
+            ('ms service mode', 'crc'),
+            ('ms async op threads', 6)])
+        cfg['ms-async-op-threads'] = 64
+        self.assertRaises(ValueError, self.target.get_msgr_config)
+        self.assertEqual(self.target.options.msgr_mds, [])
+        cfg['ms-async-op-threads'] = None
+        cfg['ms-client-mode'] = 'plain'
+        self.assertRaises(ValueError, self.target.get_msgr_config)
+
+    def test_get_purge_config(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {
+            'mds-max-purge-ops': 16384,
+            'mds-max-purge-ops-per-pg': 2,
+            'filer-max-purge-ops': 64,
+        }
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertEqual(self.target.get_purge_config(), [
+            ('mds max purge ops', 16384),
+            ('mds max purge ops per pg', 2.0),
+            ('filer max purge ops', 64)])
+        self.assertEqual(self.target.options.purge_config,
+                         self.target.get_purge_config())
+        cfg['filer-max-purge-ops'] = 0
+        self.assertRaises(ValueError, self.target.get_purge_config)
+        self.assertEqual(self.target.options.purge_config, [])
+        cfg['filer-max-purge-ops'] = None
+        cfg['mds-max-purge-ops-per-pg'] = 0
+        self.assertRaises(ValueError, self.target.get_purge_config)
+
+    def test_get_client_config(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {
+            'client-cache-size': 65536,
+            'client-oc-size': '512Mi',
+            'fuse-big-writes': False,
+            'kernel-rasize': '64Mi',
+            'kernel-wsize': '',
+        }
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertEqual(self.target.get_client_config(), [
+            ('ceph', 'client_cache_size', 65536),
+            ('ceph', 'client_oc_size', 512 << 20),
+            ('ceph', 'fuse_big_writes', False),
+            ('kernel', 'rasize', 64 << 20)])
+        cfg['kernel-wsize'] = '1000'
+        self.assertRaises(ValueError, self.target.get_client_config)
+        cfg['kernel-wsize'] = None
+        cfg['client-cache-size'] = 0
+        self.assertRaises(ValueError, self.target.get_client_config)
+
+    def test_update_cephfs_clients(self):
+        self.patch_target('get_client_config')
+        self.get_client_config.return_value = [
+            ('ceph', 'client_oc_size', 512 << 20),
+            ('ceph', 'client_cache_size', 65536),
+            ('kernel', 'rasize', 64 << 20),
+            ('kernel', 'wsize', 16 << 20)]
+        self.patch_object(ceph_fs.client_relation, 'update')
+        self.patch_object(ceph_fs.ch_core.hookenv, 'service_name')
+        self.service_name.return_value = 'ceph-fs'
+        ceph_mds = mock.MagicMock()
+        ceph_mds.fsid.return_value = 'fsid'
+        ceph_mds.mon_hosts.return_value = ['10.0.0.1']
+        self.target.update_cephfs_clients(ceph_mds)
+        self.update.assert_called_once_with('ceph-fs', 'fsid', ['10.0.0.1'], {
+            'client-options': '{"client_cache_size": 65536, '
+                              '"client_oc_size": 536870912}',
+            'kernel-mount-options': 'rasize=67108864,wsize=16777216'})
+        self.update.reset_mock()
+        self.get_client_config.side_effect = ValueError
+        self.target.update_cephfs_clients(ceph_mds)
+        self.update.assert_not_called()
+
+    def test_get_scrub_schedule(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {'scrub-window': '4h', 'scrub-paths': '/'}
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertIsNone(self.target.get_scrub_schedule())
+        cfg.update({'scrub-schedule': 'Sat *-*-* 01:00',
+                    'scrub-paths': '/a /b',
+                    'scrub-max-ops-in-progress': 2})
+        self.assertEqual(self.target.get_scrub_schedule(), {
+            'schedule': 'Sat *-*-* 01:00', 'window': 14400,
+            'paths': ['/a', '/b'], 'max-ops': 2})
+        cfg['scrub-paths'] = 'relative'
+        self.assertRaises(ValueError, self.target.get_scrub_schedule)
+        cfg['scrub-paths'] = '/'
+        cfg['scrub-window'] = 'forever'
+        self.assertRaises(ValueError, self.target.get_scrub_schedule)
+
+    def test_get_mds_autoscale(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {'mds-cache-memory-limit': '4Gi',
+               'mds-autoscale-min-mds': 1,
+               'mds-autoscale-max-mds': 3,
+               'mds-autoscale-up-rate': 2000,
+               'mds-autoscale-down-rate': 500,
+               'mds-autoscale-cache-pressure': 1.2,
+               'mds-autoscale-sustain': '10m',
+               'mds-autoscale-cooldown': '30m',
+               'mds-autoscale-interval': '1m',
+               'mds-autoscale-standbys': 1}
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertIsNone(self.target.get_mds_autoscale())
+        cfg['mds-autoscale'] = True
+        self.assertEqual(self.target.get_mds_autoscale(), {
+            'interval': 60, 'cache-limit': 4 << 30,
+            'settings': {'min-mds': 1, 'max-mds': 3, 'up-rate': 2000.0,
+                         'down-rate': 500.0, 'cache-pressure': 1.2,
+                         'sustain': 600, 'cooldown': 1800,
+                         'standbys': 1}})
+        for option, value in (('mds-autoscale-max-mds', 0),
+                              ('mds-autoscale-min-mds', 4),
+                              ('mds-autoscale-down-rate', 3000),
+                              ('mds-autoscale-sustain', 'a while'),
+                              ('mds-autoscale-interval', '1h')):
+            with self.subTest(option=option):
+                saved = cfg[option]
+                cfg[option] = value
+                self.assertRaisesRegex(ValueError, option,
+                                       self.target.get_mds_autoscale)
+                cfg[option] = saved
+
+    def test_get_mds_cache_autotune(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {'mds-cache-autotune-floor': '1Gi',
+               'mds-cache-autotune-ceiling': '16Gi',
+               'mds-cache-autotune-headroom': '2Gi',
+               'mds-cache-autotune-target-hit-ratio': 0.9,
+               'mds-cache-autotune-step': 0.25,
+               'mds-cache-autotune-interval': '5m'}
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertIsNone(self.target.get_mds_cache_autotune())
+        cfg['mds-cache-autotune'] = True
+        self.assertEqual(self.target.get_mds_cache_autotune(), {
+            'interval': 300,
+            'settings': {'floor': 1 << 30, 'ceiling': 16 << 30,
+                         'headroom': 2 << 30, 'target-hit-ratio': 0.9,
+                         'step': 0.25}})
+        for option, value in (('mds-cache-autotune-floor', '32Gi'),
+                              ('mds-cache-autotune-ceiling', 'lots'),
+                              ('mds-cache-autotune-step', 2),
+                              ('mds-cache-autotune-interval', '0')):
+            with self.subTest(option=option):
+                saved = cfg[option]
+                cfg[option] = value
+                self.assertRaisesRegex(ValueError, option,
+                                       self.target.get_mds_cache_autotune)
+                cfg[option] = saved
+
+    def test_get_mds_cache_recommended(self):
+        # The limit recommended by the cache-plan action is set as is and
+        # rendered in ceph.conf, where Ceph parses it.
+        self.patch_object(ceph_fs, 'config')
+        cfg = {'mds-cache-memory-limit': '4Gi',
+               'mds-cache-reservation': 0.05,
+               'mds-health-cache-threshold': 1.5}
+        self.config.side_effect = lambda x: cfg.get(x)
+        for files, max_cache in ((10000000, 32 << 30), (2000000, 32 << 30),
+                                 (10000000, 1 << 30)):
+            with self.subTest(files=files, max_cache=max_cache):
+                plan = ceph_fs.mds_cache.plan(
+                    self.target.get_mds_cache(), files, files // 10, 10,
+                    1000, max_cache_per_mds=max_cache)
+                limit = plan['recommended']['mds-cache-memory-limit']
+                cfg['mds-cache-memory-limit'] = limit
+                cache = self.target.get_mds_cache()
+                self.assertRegex(cache['mds-cache-memory-limit'],
+                                 re.compile(r'^\d+([KMGTPE]i)?$'))
+                self.assertEqual(
+                    ceph_fs.mds_cache.cache_limits(cache)['limit'],
+                    ceph_fs.parse_size(limit))
+
+    def test_get_status_notes_autoscale(self):
+        self.patch_target('check_mds_allocator')
+        self.check_mds_allocator.side_effect = list
+        self.patch_object(ceph_fs, 'scrub')
+        self.scrub.status_note.return_value = None
+        self.patch_object(ceph_fs.ch_core.hookenv, 'is_leader',
+                          return_value=True)
+        self.patch_object(ceph_fs.client_relation, 'pending_clients',
+                          return_value=[])
+        self.patch_object(ceph_fs, 'config', return_value=True)
+        self.patch_target('get_maintenance_window', return_value=None)
+        self.patch_object(ceph_fs, 'mds_cache_tune')
+        self.mds_cache_tune.status_note.return_value = 'cache limit 6.0GiB'
+        self.patch_object(ceph_fs.mds_autoscale, 'status_note')
+        self.status_note.return_value = 'max_mds 2'
+        self.assertEqual(self.target.get_status_notes(),
+                         ['cache limit 6.0GiB', 'max_mds 2'])
+
+    def test_get_status_notes_scrub(self):
+        self.patch_target('check_mds_allocator')
+        self.check_mds_allocator.side_effect = list
+        self.patch_object(ceph_fs.ch_core.hookenv, 'is_leader',
+                          return_value=False)
+        self.patch_object(ceph_fs.scrub, 'status_note')
+        self.status_note.return_value = 'scrub running for 2h05m'
+        self.patch_target('get_maintenance_window',
+                          return_value='* 1-4 * * *')
+        self.patch_object(ceph_fs, 'maintenance')
+        self.maintenance.status_note.return_value = None
+        self.assertEqual(self.target.get_status_notes(),
+                         ['scrub running for 2h05m'])
+        self.maintenance.status_note.return_value = (
+            'deferred: scrub, maintenance window in 3h00m')
+        self.assertEqual(self.target.get_status_notes(), [
+            'scrub running for 2h05m',
+            'deferred: scrub, maintenance window in 3h00m'])
+        self.maintenance.status_note.assert_called_with('* 1-4 * * *')
+
+    def test_get_mirror_config(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {'cephfs-mirror-max-concurrent-directory-syncs': 8,
+               'cephfs-mirror-action-update-interval': 5}
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.assertEqual(self.target.get_mirror_config(), [
+            ('cephfs_mirror_max_concurrent_directory_syncs', 8),
+            ('cephfs_mirror_action_update_interval', 5)])
+        self.assertEqual(self.target.options.mirror_config, [
+            ('cephfs_mirror_max_concurrent_directory_syncs', 8),
+            ('cephfs_mirror_action_update_interval', 5)])
+        cfg['cephfs-mirror-max-concurrent-directory-syncs'] = 0
+        self.assertRaises(ValueError, self.target.get_mirror_config)
+        self.assertEqual(self.target.options.mirror_config, [])
+
+    def test_configure_mirror(self):
+        self.patch_object(ceph_fs, 'config')
+        cfg = {'cephfs-mirror': True, 'cephfs-mirror-key': 'AQkey=='}
+        self.config.side_effect = lambda x: cfg.get(x)
+        self.patch_object(ceph_fs.ch_host, 'service')
+        self.patch_object(ceph_fs.ch_host, 'service_running',
+                          return_value=False)
+        self.patch_object(ceph_fs.ch_host, 'service_start')
+        self.patch_object(ceph_fs.ch_host, 'service_stop')
+        self.patch_object(ceph_fs.os.path, 'exists', return_value=True)
+        self.patch_object(ceph_fs.os, 'remove')
+        self.patch_object(ceph_fs.subprocess, 'check_call')
+        self.target.configure_mirror()
+        self.service.assert_called_once_with(
+            'enable', 'cephfs-mirror@cephfs-mirror')
+        self.service_start.assert_called_once_with(
+            'cephfs-mirror@cephfs-mirror')
+        self.service.reset_mock()
+        cfg['cephfs-mirror'] = False
+        self.target.configure_mirror()
+        self.service_stop.assert_called_once_with(
+            'cephfs-mirror@cephfs-mirror')
+        self.service.assert_called_once_with(
+            'disable', 'cephfs-mirror@cephfs-mirror')
+        self.assertEqual(self.remove.call_count, 3)
+        self.check_call.assert_called_once_with(
+            ['systemctl', 'daemon-reload'])
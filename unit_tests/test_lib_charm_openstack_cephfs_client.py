@@ -0,0 +1,76 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+import unittest
+import unittest.mock as mock
+
+sys.modules['cephfs'] = mock.MagicMock()
+sys.modules['rados'] = mock.MagicMock()
+
+import charm.openstack.cephfs_client as cephfs_client
+
+
+class TestCephFSClient(unittest.TestCase):
+
+    @mock.patch.object(cephfs_client.socket, 'gethostname')
+    @mock.patch.object(cephfs_client, 'cephfs')
+    @mock.patch.object(cephfs_client, 'rados')
+    def test_connect(self, rados, cephfs, gethostname):
+        gethostname.return_value = 'somehost'
+        with cephfs_client.connect('ceph-fs') as fs:
+            self.assertEqual(fs, cephfs.LibCephFS.return_value)
+            fs.shutdown.assert_not_called()
+        rados.Rados.assert_called_once_with(
+            name='mds.somehost',
+            conffile='/etc/ceph/ceph.conf',
+            conf={'keyring': '/var/lib/ceph/mds/ceph-somehost/keyring'})
+        cluster = rados.Rados.return_value
+        cluster.connect.assert_called_once_with()
+        cephfs.LibCephFS.assert_called_once_with(rados_inst=cluster)
+        fs.mount.assert_called_once_with(filesystem_name='ceph-fs')
+        fs.shutdown.assert_called_once_with()
+        cluster.shutdown.assert_called_once_with()
+
+    def test_xattr(self):
+        fs = mock.MagicMock()
+        fs.getxattr.return_value = b'1024'
+        self.assertEqual(
+            cephfs_client.get_xattr(fs, '/foo', 'ceph.quota.max_bytes'),
+            '1024')
+        fs.getxattr.assert_called_once_with('/foo', 'ceph.quota.max_bytes')
+        cephfs_client.set_xattr(fs, '/foo', 'ceph.quota.max_files', 10)
+        fs.setxattr.assert_called_once_with(
+            '/foo', 'ceph.quota.max_files', b'10', 0)
+
+    @mock.patch.object(cephfs_client, 'cephfs')
+    def test_get_quota(self, cephfs):
+        class NoData(Exception):
+            pass
+        cephfs.NoData = NoData
+        fs = mock.MagicMock()
+        fs.getxattr.side_effect = [b'1024', NoData()]
+        self.assertEqual(cephfs_client.get_quota(fs, '/foo'),
+                         {'max-bytes': 1024, 'max-files': 0})
+        fs.getxattr.assert_has_calls([
+            mock.call('/foo', 'ceph.quota.max_bytes'),
+            mock.call('/foo', 'ceph.quota.max_files')])
+
+    def test_get_rctime(self):
+        fs = mock.MagicMock()
+        fs.getxattr.return_value = b'1700000000.500000000'
+        self.assertEqual(cephfs_client.get_rctime(fs, '/foo'), 1700000000.5)
+        fs.getxattr.assert_called_once_with('/foo', 'ceph.dir.rctime')
+        fs.getxattr.return_value = b'1700000000'
+        self.assertEqual(cephfs_client.get_rctime(fs, '/foo'), 1700000000)
@@ -0,0 +1,155 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+import unittest.mock as mock
+
+sys.modules['cephfs'] = mock.MagicMock()
+sys.modules['rados'] = mock.MagicMock()
+
+import charm.openstack.changes as changes
+
+from unit_tests.test_lib_charm_openstack_tree_walk import FakeFS, TREE
+
+FILES = ['/a/f1', '/a/b/c/f2', '/d/f3']
+# Recursive change times of the directories, change times of everything.
+RCTIMES = {'/': 200, '/a': 200, '/a/b': 200, '/a/b/c': 200, '/a/tmp1': 50,
+           '/d': 90, '/d/.snap': 90, '/d/e': 50}
+CTIMES = {'/': 50, '/a': 150, '/a/b': 50, '/a/b/c': 60, '/a/tmp1': 50,
+          '/a/f1': 50, '/a/b/c/f2': 200, '/d': 90, '/d/.snap': 90,
+          '/d/e': 50, '/d/f3': 90}
+
+
+class ChangesFS(FakeFS):
+
+    def __init__(self):
+        super().__init__(TREE, FILES)
+
+    def getxattr(self, path, name):
+        assert name == 'ceph.dir.rctime'
+        return '{}.000000001'.format(RCTIMES[path]).encode('utf-8')
+
+    def stat(self, path):
+        return mock.Mock(st_ctime=datetime.datetime.fromtimestamp(
+            CTIMES[path]), st_size=len(path))
+
+    lstat = stat
+
+
+class TestFindChanges(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for target, name, value in (
+                (changes.tree_walk, 'STATE_DIR', tmp.name),
+                (changes, 'OUTPUT', os.path.join(tmp.name, 'changes.jsonl')),
+                (changes.cephfs_client, 'Error', OSError)):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.fs = ChangesFS()
+
+    def test_find_changes(self):
+        batches = []
+        result = changes.find_changes(self.fs, since=100, workers=2,
+                                      batch_size=1, on_batch=batches.append)
+        expected = [
+            {'path': '/a', 'type': 'directory', 'ctime': 150.0},
+            {'path': '/a/b/c/f2', 'type': 'file', 'ctime': 200.0,
+             'size': 9}]
+        self.assertEqual(result, {
+            'complete': True, 'since': 100, 'scanned': 6, 'skipped': 2,
+            'found': 2, 'pending': 0, 'failed': [],
+            'output': changes.OUTPUT})
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(sorted((change for batch in batches
+                                 for change in batch),
+                                key=lambda c: c['path']), expected)
+        with open(changes.OUTPUT) as f:
+            self.assertEqual(sorted((json.loads(line) for line in f),
+                                    key=lambda c: c['path']), expected)
+        self.assertIsNone(changes.tree_walk.load_cursor(changes.CURSOR))
+
+    def test_find_changes_all(self):
+        result = changes.find_changes(self.fs, roots=['/d'], since=0)
+        self.assertEqual(result['found'], 4)
+        self.assertEqual(result['skipped'], 0)
+
+    @mock.patch.object(changes.time, 'monotonic')
+    def test_find_changes_resume(self, monotonic):
+        self.assertRaises(ValueError, changes.find_changes, self.fs,
+                          resume=True)
+        self.assertRaises(ValueError, changes.find_changes, self.fs)
+        # Every directory read takes a second.
+        monotonic.side_effect = range(1000)
+        result = changes.find_changes(self.fs, since=100, workers=1,
+                                      time_limit=2)
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['scanned'], 2)
+        self.assertEqual(changes.tree_walk.load_cursor(
+            changes.CURSOR)['since'], 100)
+        result = changes.find_changes(self.fs, since=0, resume=True)
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['scanned'], 6)
+        self.assertEqual(result['found'], 2)
+
+    def test_find_changes_failed(self):
+        getxattr = self.fs.getxattr
+
+        def _getxattr(path, name):
+            if path == '/a/b':
+                raise OSError('permission denied')
+            return getxattr(path, name)
+
+        self.fs.getxattr = _getxattr
+        result = changes.find_changes(self.fs, since=100)
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['failed'], [
+            {'path': '/a/b', 'error': 'permission denied'}])
+        self.assertEqual(result['found'], 1)
+
+    def test_find_changes_interrupted(self):
+        # Errors of the caller, e.g. the cancellation of a job, leave once
+        # the workers are done with the filesystem, before it is unmounted.
+        getxattr = self.fs.getxattr
+        visiting = []
+
+        def _getxattr(path, name):
+            visiting.append(path)
+            time.sleep(0.05)
+            visiting.remove(path)
+            return getxattr(path, name)
+
+        def _cancel(batch):
+            raise RuntimeError('cancelled')
+
+        self.fs.getxattr = _getxattr
+        self.assertRaises(RuntimeError, changes.find_changes, self.fs,
+                          since=0, workers=4, batch_size=1, on_batch=_cancel)
+        self.assertEqual(visiting, [])
+
+    def test_parse_since(self):
+        self.assertEqual(changes.parse_since('1700000000'), 1700000000)
+        self.assertEqual(changes.parse_since('24h', now=100000), 13600)
+        self.assertEqual(changes.parse_since('2024-05-01T02:00:00+00:00'),
+                         1714528800)
+        self.assertRaises(ValueError, changes.parse_since, 'yesterday')
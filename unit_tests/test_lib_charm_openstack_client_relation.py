@@ -0,0 +1,157 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.client_relation as client_relation
+
+
+class FakeRequest(object):
+
+    def __init__(self, ops=None, request_id='req-1'):
+        self.ops = list(ops or [])
+        self.request_id = request_id
+
+    def set_ops(self, ops):
+        self.ops = ops
+
+
+class TestClientRelation(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.relations = {
+            'ceph-mds': {'ceph-mds:1': {'ceph-mon/0': {}}},
+            'cephfs-client': {
+                'cephfs-client:2': {'app-a/0': {'path': '/shares/a'},
+                                    'app-a/1': {}},
+                'cephfs-client:3': {'app-b/0': {}},
+            },
+        }
+        self.leader_settings = {}
+        self.previous = None
+        for name, side_effect in (
+                ('relation_ids', lambda name: list(self.relations[name])),
+                ('related_units', self._related_units),
+                ('relation_get', self._relation_get),
+                ('remote_service_name', lambda rid: {
+                    'cephfs-client:2': 'app-a',
+                    'cephfs-client:3': 'app-b'}[rid]),
+                ('leader_get', self.leader_settings.get),
+                ('leader_set', self.leader_settings.update),
+                ('relation_set', None),
+                ('log', None)):
+            patcher = mock.patch.object(client_relation, name)
+            setattr(self, name, patcher.start())
+            getattr(self, name).side_effect = side_effect
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(client_relation, 'ch_ceph')
+        self.ch_ceph = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.ch_ceph.get_broker_rsp_key.return_value = 'broker-rsp-ceph-fs-0'
+        self.ch_ceph.get_previous_request.side_effect = (
+            lambda rid: self.previous)
+        self.ch_ceph.CephBrokerRq.side_effect = FakeRequest
+        patcher = mock.patch.object(client_relation.reactive, 'data_changed')
+        self.data_changed = patcher.start()
+        self.data_changed.return_value = True
+        self.addCleanup(patcher.stop)
+
+    def _related_units(self, rid):
+        for units in self.relations.values():
+            if rid in units:
+                return list(units[rid])
+        return []
+
+    def _relation_get(self, attribute, unit, rid):
+        for units in self.relations.values():
+            if rid in units:
+                return units[rid][unit].get(attribute)
+
+    def test_requested_clients(self):
+        self.assertEqual(client_relation.requested_clients(), {
+            'cephfs-client:2': {'client': 'client.app-a',
+                                'path': '/shares/a'},
+            'cephfs-client:3': {'client': 'client.app-b', 'path': '/'},
+        })
+        self.relations['cephfs-client']['cephfs-client:2']['app-a/1'] = {
+            'path': '/shares/other'}
+        self.relations['cephfs-client']['cephfs-client:3']['app-b/0'] = {
+            'path': 'relative'}
+        self.assertEqual(client_relation.requested_clients(), {})
+
+    def test_update_requests_first_pending_key(self):
+        self.previous = FakeRequest([{'op': 'create-cephfs'}])
+        client_relation.update('ceph-fs', 'fsid', ['10.0.0.1'], {})
+        request = self.ch_ceph.send_request_if_needed.call_args[0][0]
+        self.assertEqual(request.ops, [
+            {'op': 'create-cephfs'},
+            {'op': 'create-cephfs-client', 'fs_name': 'ceph-fs',
+             'client_id': 'client.app-a', 'path': '/shares/a',
+             'perms': 'rw'}])
+        self.relation_set.assert_not_called()
+        self.assertEqual(self.leader_settings, {})
+
+    def test_update_publishes_received_key(self):
+        self.previous = FakeRequest([
+            {'op': 'create-cephfs'},
+            {'op': 'create-cephfs-client', 'fs_name': 'ceph-fs',
+             'client_id': 'client.app-a', 'path': '/shares/a',
+             'perms': 'rw'}])
+        self.relations['ceph-mds']['ceph-mds:1']['ceph-mon/0'] = {
+            'broker-rsp-ceph-fs-0': json.dumps({
+                'exit-code': 0, 'request-id': 'req-1', 'key': 'AQkey=='})}
+        self.leader_settings['cephfs-client-keys'] = json.dumps({
+            'client.gone': {'key': 'old', 'path': '/'}})
+        client_relation.update('ceph-fs', 'fsid', ['10.0.0.1', '10.0.0.2'],
+                               {'kernel-mount-options': 'rasize=4096'})
+        self.assertEqual(
+            json.loads(self.leader_settings['cephfs-client-keys']),
+            {'client.app-a': {'key': 'AQkey==', 'path': '/shares/a'}})
+        # The next client is requested while the first one is published.
+        request = self.ch_ceph.send_request_if_needed.call_args[0][0]
+        self.assertEqual(request.ops[-1]['client_id'], 'client.app-b')
+        self.assertEqual(len(request.ops), 2)
+        self.relation_set.assert_called_once_with(
+            relation_id='cephfs-client:2', app=True, relation_settings={
+                'fs-name': 'ceph-fs',
+                'fsid': 'fsid',
+                'mon-hosts': '10.0.0.1 10.0.0.2',
+                'client-id': 'app-a',
+                'key': 'AQkey==',
+                'path': '/shares/a',
+                'kernel-mount-options': 'rasize=4096'})
+
+    def test_update_ignores_failed_and_stale_responses(self):
+        self.previous = FakeRequest([
+            {'op': 'create-cephfs-client', 'fs_name': 'ceph-fs',
+             'client_id': 'client.app-a', 'path': '/shares/a',
+             'perms': 'rw'}])
+        rsp = self.relations['ceph-mds']['ceph-mds:1']['ceph-mon/0']
+        rsp['broker-rsp-ceph-fs-0'] = json.dumps({
+            'exit-code': 0, 'request-id': 'req-0', 'key': 'AQold=='})
+        client_relation.update('ceph-fs', 'fsid', [], {})
+        rsp['broker-rsp-ceph-fs-0'] = json.dumps({
+            'exit-code': 1, 'request-id': 'req-1', 'stderr': 'denied'})
+        client_relation.update('ceph-fs', 'fsid', [], {})
+        self.assertEqual(self.leader_settings, {})
+        self.relation_set.assert_not_called()
+
+    def test_pending_clients(self):
+        keys = {'client.app-a': {'key': 'k', 'path': '/shares/a'},
+                'client.app-b': {'key': 'k', 'path': '/old'}}
+        self.assertEqual(client_relation.pending_clients(keys=keys), [
+            {'client': 'client.app-b', 'path': '/'}])
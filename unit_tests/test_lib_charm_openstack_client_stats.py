@@ -0,0 +1,117 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.client_stats as client_stats
+
+COUNTERS = ['cap_hit', 'read_latency', 'write_latency', 'metadata_latency',
+            'read_io_sizes', 'write_io_sizes', 'avg_read_latency',
+            'avg_write_latency', 'avg_metadata_latency']
+
+
+def perf_stats(md_latency, read_bytes, write_bytes, per_fs=True):
+    metrics = {
+        'client.4305': [[90, 10], [0, 0], [0, 0], [md_latency, 0],
+                        [10, read_bytes], [20, write_bytes],
+                        [0, 2000000], [0, 4000000], [0, 500000000]],
+        'client.4400': [[1, 0], [0, 0], [0, 0], [0, 0], [0, 0], [0, 0],
+                        [0, 0], [0, 0], [0, 0]],
+    }
+    metadata = {
+        'client.4305': {'hostname': 'web1', 'root': '/volumes/a'},
+        'client.4400': {'hostname': 'batch', 'root': '/'},
+    }
+    if per_fs:
+        metrics = {'ceph-fs': metrics}
+        metadata = {'ceph-fs': metadata}
+    return {'version': 2, 'global_counters': COUNTERS,
+            'global_metrics': metrics, 'client_metadata': metadata}
+
+
+class TestClientStats(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(client_stats.ceph_cli, 'ceph_command')
+        self.ceph_command = patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(client_stats.time, 'sleep')
+        self.sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_counters(self):
+        for per_fs in (True, False):
+            clients = client_stats.parse_counters(
+                perf_stats(3, 1024, 2048, per_fs=per_fs), 'ceph-fs')
+            self.assertEqual(clients['client.4305'], {
+                'hostname': 'web1', 'root': '/volumes/a',
+                'cap-hits': 90, 'cap-misses': 10,
+                'read-ops': 10, 'read-bytes': 1024,
+                'write-ops': 20, 'write-bytes': 2048,
+                'metadata-latency-total': 3.0,
+                'metadata-latency': 0.5, 'read-latency': 0.002,
+                'write-latency': 0.004})
+            self.assertEqual(len(clients), 2)
+
+    def test_enable_stats_module(self):
+        self.ceph_command.return_value = {'enabled_modules': ['stats']}
+        self.assertFalse(client_stats.enable_stats_module())
+        self.ceph_command.return_value = {'enabled_modules': []}
+        self.assertTrue(client_stats.enable_stats_module())
+        self.ceph_command.assert_called_with(
+            'mgr', 'module', 'enable', 'stats', timeout=60)
+
+    def test_top(self):
+        self.ceph_command.side_effect = [
+            {'enabled_modules': ['stats']},
+            perf_stats(3, 1024, 2048),
+            perf_stats(8, 1024 + 10 * 4096, 2048)]
+        rows = client_stats.top('ceph-fs', interval=10)
+        self.sleep.assert_called_once_with(10)
+        self.assertEqual([row['client'] for row in rows],
+                         ['client.4305', 'client.4400'])
+        self.assertEqual(rows[0]['metadata-ops'], 1.0)
+        self.assertEqual(rows[0]['read-throughput'], 4096)
+        self.assertEqual(rows[0]['write-throughput'], 0)
+        self.assertEqual(rows[0]['cap-hit-ratio'], 0.9)
+        self.assertEqual(rows[0]['metadata-latency'], 500)
+        self.assertIsNone(rows[1]['metadata-ops'])
+        table = client_stats.format_table(rows).splitlines()
+        self.assertTrue(table[0].startswith('CLIENT'))
+        self.assertIn('4.0KiB', table[1])
+        self.assertIn('90.0%', table[1])
+
+    def test_client_rates_cap_misses(self):
+        now = {'hostname': 'web1', 'root': '/', 'cap-misses': 10}
+        rows = client_stats.client_rates({}, {'client.4305': now}, 10)
+        self.assertEqual(rows[0]['cap-hit-ratio'], 0.0)
+        self.assertIsNone(rows[0]['read-iops'])
+
+    def test_top_filters(self):
+        def _stats(*args, **kwargs):
+            if args[0] == 'mgr':
+                return {'always_on_modules': ['stats']}
+            return perf_stats(3, 0, 0)
+        self.ceph_command.side_effect = _stats
+        for client in ('client.4400', '4400', 'batch'):
+            rows = client_stats.top('ceph-fs', client=client)
+            self.assertEqual([row['client'] for row in rows],
+                             ['client.4400'])
+        rows = client_stats.top('ceph-fs', root='/volumes/')
+        self.assertEqual([row['client'] for row in rows], ['client.4305'])
+        self.assertEqual(client_stats.top('ceph-fs', root='/vol'), [])
+        self.assertRaises(ValueError, client_stats.top, 'ceph-fs',
+                          sort='bogus')
@@ -0,0 +1,130 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.dirfrags as dirfrags
+
+
+class FakeEntry(object):
+
+    def __init__(self, name, is_dir):
+        self.d_name = name.encode('utf-8')
+        self._is_dir = is_dir
+
+    def is_dir(self):
+        return self._is_dir
+
+
+class FakeFS(object):
+    """Directory tree of {path: (entries, [subdirectories])}."""
+
+    def __init__(self, tree):
+        self.tree = tree
+        self.listed = []
+
+    def getxattr(self, path, name):
+        entries, subdirs = self.tree[path]
+        value = {'ceph.dir.entries': entries,
+                 'ceph.dir.files': entries - len(subdirs),
+                 'ceph.dir.subdirs': len(subdirs),
+                 'ceph.dir.rentries': entries}[name]
+        return str(value).encode('utf-8')
+
+    def opendir(self, path):
+        self.listed.append(path)
+        entries = [FakeEntry('.', True), FakeEntry('file', False)]
+        entries.extend(FakeEntry(d, True) for d in self.tree[path][1])
+        return iter(entries)
+
+    def readdir(self, handle):
+        return next(handle, None)
+
+    def closedir(self, handle):
+        pass
+
+
+class TestDirfrags(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(dirfrags.ceph_cli, 'daemon_command')
+        self.daemon_command = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.config = {'mds_bal_split_size': '10000',
+                       'mds_bal_fragment_size_max': '100000'}
+        self.frags = {'/': ['0/0'], '/big': ['0/1', '1/1']}
+
+        def _daemon_command(*args, **kwargs):
+            if args[:2] == ('config', 'get'):
+                if args[2] not in self.config:
+                    raise subprocess.CalledProcessError(22, 'ceph')
+                return {args[2]: self.config[args[2]]}
+            if args == ('get', 'subtrees'):
+                return [{'dir': {'path': ''}}, {'dir': {'path': '~mds0'}},
+                        {'dir': {'path': '/pinned'}}]
+            if args[:2] == ('dirfrag', 'ls'):
+                if args[2] not in self.frags:
+                    raise subprocess.CalledProcessError(2, 'ceph')
+                return [{'str': frag} for frag in self.frags[args[2]]]
+        self.daemon_command.side_effect = _daemon_command
+        self.fs = FakeFS({
+            '/': (3, ['big', 'pinned']),
+            '/big': (19000, []),
+            '/pinned': (120001, ['huge']),
+            '/pinned/huge': (5, []),
+        })
+
+    def test_get_thresholds(self):
+        self.assertEqual(dirfrags.get_thresholds(), {
+            'mds_bal_split_size': 10000,
+            'mds_bal_fragment_size_max': 100000,
+            'mds_dir_max_entries': 0})
+
+    def test_subtree_roots(self):
+        self.assertEqual(dirfrags.subtree_roots(), ['/', '/pinned'])
+
+    def test_scan(self):
+        stats = dirfrags.scan(self.fs, ['/'], depth=2, max_listing=100000)
+        self.assertEqual([s['path'] for s in stats],
+                         ['/', '/big', '/pinned'])
+        self.assertEqual(stats[0]['subdirs'], 2)
+        # Too large to be listed.
+        self.assertNotIn('/pinned', self.fs.listed)
+        self.assertEqual(len(dirfrags.scan(self.fs, ['/'], depth=0)), 1)
+
+    def test_report(self):
+        report = dirfrags.report(self.fs, ['/'], top=2)
+        self.assertEqual(report['scanned'], 3)
+        pinned, big = report['directories']
+        self.assertEqual(pinned['path'], '/pinned')
+        self.assertIsNone(pinned['fragments'])
+        self.assertEqual(pinned['warnings'], [
+            'fragment at 1200% of mds_bal_split_size (10000)',
+            'fragment at 120% of mds_bal_fragment_size_max (100000)'])
+        self.assertEqual(big['fragments'], ['0/1', '1/1'])
+        self.assertEqual(big['warnings'], [
+            'fragment at 95% of mds_bal_split_size (10000)'])
+
+    def test_fragment_directory(self):
+        self.assertEqual(dirfrags.fragment_directory('/big', 4),
+                         ['0/1', '1/1'])
+        self.daemon_command.assert_has_calls([
+            mock.call('dirfrag', 'split', '/big', '0/1', 1),
+            mock.call('dirfrag', 'split', '/big', '1/1', 1)])
+        self.assertRaises(ValueError, dirfrags.fragment_directory, '/big', 6)
+        self.assertRaises(ValueError, dirfrags.fragment_directory,
+                          '/missing', 4)
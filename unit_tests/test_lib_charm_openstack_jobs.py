@@ -0,0 +1,181 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import subprocess
+import tempfile
+import threading
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.jobs as jobs
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(jobs, 'JOBS_DIR',
+                                    os.path.join(tmp.name, 'jobs'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for target, name in ((jobs, 'unit_active'),
+                             (jobs.subprocess, 'check_call')):
+            patcher = mock.patch.object(target, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.unit_active.return_value = True
+        self.kind = mock.Mock(return_value={'complete': True})
+        patcher = mock.patch.dict(jobs.KINDS, {'list-quotas': self.kind})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _start(self, kind='list-quotas', max_jobs=None):
+        return jobs.start(kind, 'ceph-fs', {'roots': ['/']}, '/charm/lib',
+                          max_jobs=max_jobs)
+
+    def test_start(self):
+        job = self._start()
+        self.assertEqual(job['state'], 'starting')
+        self.assertEqual(job['unit'], 'ceph-fs-job-' + job['id'])
+        self.assertEqual(jobs.load(job['id']), job)
+        self.check_call.assert_called_once_with([
+            'systemd-run', '--unit', job['unit'], '--collect', '--quiet',
+            '--description', 'ceph-fs list-quotas job ' + job['id'],
+            '--setenv', 'PYTHONPATH=/charm/lib',
+            '--property', 'TimeoutStopSec=300',
+            '/usr/bin/python3', '-m', 'charm.openstack.jobs', job['id']])
+        self.assertRaises(ValueError, self._start, 'unknown')
+        self.assertIsNone(jobs.load('../jobs'))
+
+    def test_start_limits(self):
+        first = self._start()
+        with self.assertRaises(ValueError) as e:
+            self._start()
+        self.assertIn(first['id'], str(e.exception))
+        self.assertRaises(ValueError, self._start, 'delete-tree',
+                          max_jobs=1)
+        second = self._start('delete-tree', max_jobs=2)
+        # Jobs whose unit is gone no longer count, the starting ones only
+        # once their unit had time to start.
+        self.unit_active.return_value = False
+        self.assertRaises(ValueError, self._start, 'migrate-layout',
+                          max_jobs=2)
+        jobs.save(dict(second, state='running'))
+        self._start('migrate-layout', max_jobs=2)
+        self.assertEqual(jobs.load(second['id'])['state'], 'failed')
+        self.assertEqual(jobs.load(first['id'])['state'], 'starting')
+        with mock.patch.object(jobs, 'START_TIMEOUT', 0):
+            self._start(max_jobs=2)
+        self.assertEqual(jobs.load(first['id'])['state'], 'failed')
+
+    def test_start_error(self):
+        self.check_call.side_effect = subprocess.CalledProcessError(
+            1, 'systemd-run')
+        self.assertRaises(subprocess.CalledProcessError, self._start)
+        job, = jobs.list_jobs()
+        self.assertEqual(job['state'], 'failed')
+
+    def test_prune(self):
+        with mock.patch.object(jobs, 'MAX_FINISHED', 1):
+            first = self._start()
+            jobs.cancel(first['id'])
+            second = self._start()
+            jobs.cancel(second['id'])
+            self._start()
+        self.assertEqual([job['id'] for job in jobs.list_jobs()][:1],
+                         [second['id']])
+        self.assertEqual(len(jobs.list_jobs()), 2)
+
+    def test_run(self):
+        def _kind(filesystem, params, log):
+            log('one')
+            log('two')
+            return {'complete': True, 'roots': params['roots']}
+        self.kind.side_effect = _kind
+        job = self._start()
+
+        def _running(filesystem, params, log):
+            self.assertEqual(jobs.load(job['id'])['state'], 'running')
+            return _kind(filesystem, params, log)
+        self.kind.side_effect = _running
+        with mock.patch.object(jobs.signal, 'signal'), \
+                mock.patch.object(jobs, 'MAX_LOG', 1):
+            jobs.run(job['id'])
+        job = jobs.load(job['id'])
+        self.assertEqual(job['state'], 'completed')
+        self.assertEqual(job['result'], {'complete': True, 'roots': ['/']})
+        self.assertEqual(job['progress'], 'two')
+        self.assertEqual(job['log'], ['two'])
+        self.assertTrue(job['finished'])
+        self.assertRaises(ValueError, jobs.run, 'missing')
+
+    @mock.patch.object(jobs.signal, 'signal')
+    def test_run_progress(self, signal):
+        job = self._start()
+        saved = []
+
+        def _kind(filesystem, params, log):
+            for message in ('one', 'two'):
+                log(message)
+                saved.append(jobs.load(job['id'])['progress'])
+            return {'complete': True}
+        self.kind.side_effect = _kind
+        # Saved at most every PROGRESS_INTERVAL seconds, and at the end.
+        jobs.run(job['id'])
+        self.assertEqual(saved, [None, None])
+        self.assertEqual(jobs.load(job['id'])['log'], ['one', 'two'])
+        job = self._start('find-changes')
+        saved.clear()
+        with mock.patch.dict(jobs.KINDS, {'find-changes': self.kind}), \
+                mock.patch.object(jobs, 'PROGRESS_INTERVAL', 0):
+            jobs.run(job['id'])
+        self.assertEqual(saved, ['one', 'two'])
+        self.assertEqual(
+            [name for name in os.listdir(jobs.JOBS_DIR)
+             if name.endswith('.new')], [])
+
+    @mock.patch.object(jobs.signal, 'signal')
+    def test_run_failed(self, signal):
+        job = self._start()
+        self.kind.side_effect = OSError('no access')
+        self.assertEqual(jobs.run(job['id'])['error'], 'OSError: no access')
+        signal.assert_called_once_with(jobs.signal.SIGTERM, mock.ANY)
+        job = self._start('delete-tree')
+        with mock.patch.dict(jobs.KINDS, {'delete-tree': mock.Mock(
+                side_effect=jobs.Cancelled())}):
+            self.assertEqual(jobs.run(job['id'])['state'], 'cancelled')
+
+    def test_cancel(self):
+        job = self._start()
+        self.check_call.reset_mock()
+        self.assertEqual(jobs.cancel(job['id'])['state'], 'cancelled')
+        self.check_call.assert_called_once_with(
+            ['systemctl', 'stop', job['unit']])
+        self.assertRaises(ValueError, jobs.cancel, job['id'])
+        self.assertRaises(ValueError, jobs.cancel, 'missing')
+
+    def test_cancel_locked(self):
+        job = self._start()
+        cancelled = threading.Thread(target=jobs.cancel, args=(job['id'],))
+        with jobs._job_locked(job['id']):
+            cancelled.start()
+            cancelled.join(0.2)
+            # The state is not changed while another process updates it.
+            self.assertTrue(cancelled.is_alive())
+            self.assertEqual(jobs.load(job['id'])['state'], 'starting')
+        cancelled.join()
+        self.assertEqual(jobs.load(job['id'])['state'], 'cancelled')
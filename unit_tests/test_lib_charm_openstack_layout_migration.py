@@ -0,0 +1,233 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import tempfile
+import unittest
+import unittest.mock as mock
+
+sys.modules['cephfs'] = mock.MagicMock()
+sys.modules['rados'] = mock.MagicMock()
+
+import charm.openstack.layout_migration as layout_migration
+
+
+class FakeEntry(object):
+
+    def __init__(self, entry):
+        self.d_name = entry.name.encode('utf-8')
+        self._entry = entry
+
+    def is_dir(self):
+        return self._entry.is_dir(follow_symlinks=False)
+
+    def is_file(self):
+        return self._entry.is_file(follow_symlinks=False)
+
+
+class LocalFS(object):
+    """libcephfs calls on a local directory, layouts kept per inode."""
+
+    def __init__(self, root):
+        self.root = root
+        self.xattrs = {}
+
+    def _path(self, path):
+        return self.root + path
+
+    def opendir(self, path):
+        return iter(list(os.scandir(self._path(path))))
+
+    def readdir(self, handle):
+        entry = next(handle, None)
+        return FakeEntry(entry) if entry else None
+
+    def closedir(self, handle):
+        pass
+
+    def stat(self, path):
+        return os.stat(self._path(path))
+
+    def open(self, path, flags, mode):
+        return os.open(self._path(path), flags, mode)
+
+    def read(self, fd, offset, length):
+        return os.pread(fd, length, offset)
+
+    def write(self, fd, data, offset):
+        return os.pwrite(fd, data, offset)
+
+    def fsync(self, fd, dataonly):
+        os.fsync(fd)
+
+    def close(self, fd):
+        os.close(fd)
+
+    def _xattrs(self, path):
+        return self.xattrs.setdefault(os.stat(self._path(path)).st_ino, {
+            'ceph.file.layout.pool': b'cephfs_data'})
+
+    def getxattr(self, path, name):
+        return self._xattrs(path)[name]
+
+    def setxattr(self, path, name, value, flags):
+        self._xattrs(path)[name] = value
+
+    def listxattr(self, path):
+        names = b''.join(name.encode('utf-8') + b'\0'
+                         for name in self._xattrs(path))
+        return len(names), names
+
+    def chown(self, path, uid, gid):
+        os.chown(self._path(path), uid, gid)
+
+    def chmod(self, path, mode):
+        os.chmod(self._path(path), mode)
+
+    def utime(self, path, times):
+        os.utime(self._path(path), times)
+
+    def link(self, existing, new):
+        os.link(self._path(existing), self._path(new))
+
+    def rename(self, src, dst):
+        os.rename(self._path(src), self._path(dst))
+
+    def unlink(self, path):
+        os.unlink(self._path(path))
+
+
+class TestLayoutMigration(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        root = os.path.join(tmp.name, 'fs')
+        for target, name, value in (
+                (layout_migration.tree_walk, 'STATE_DIR',
+                 os.path.join(tmp.name, 'state')),
+                (layout_migration.cephfs_client, 'Error', OSError),
+                (layout_migration.cephfs, 'ObjectNotFound',
+                 FileNotFoundError),
+                (layout_migration, 'CHUNK_SIZE', 1000)):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        os.makedirs(os.path.join(root, 'a', 'b'))
+        os.makedirs(os.path.join(root, 'c'))
+        self.files = {'/a/one': os.urandom(2500), '/a/b/two': b'',
+                      '/c/three': os.urandom(10)}
+        for path, data in self.files.items():
+            with open(root + path, 'wb') as f:
+                f.write(data)
+        os.chmod(root + '/a/one', 0o640)
+        os.utime(root + '/a/one', (1000000000, 1200000000))
+        os.link(root + '/a/one', root + '/c/one-link')
+        self.fs = LocalFS(root)
+        self.fs.setxattr('/a/one', 'user.tag', b'blue', 0)
+        self.fs.setxattr('/c/three', 'ceph.file.layout.pool', b'fast', 0)
+
+    def _pool(self, path):
+        return self.fs.getxattr(path, 'ceph.file.layout.pool')
+
+    def test_migrate(self):
+        progress = []
+        with mock.patch.object(layout_migration, 'CHECKPOINT_INTERVAL', 0):
+            result = layout_migration.migrate(
+                self.fs, '/', 'fast', workers=2, bandwidth=1 << 30,
+                on_progress=progress.append)
+        self.assertEqual(result, {
+            'complete': True, 'scanned': 4, 'migrated': 2, 'linked': 1,
+            'skipped': 1, 'bytes': 2500, 'pending': 0, 'failed': [],
+            'throughput': mock.ANY})
+        self.assertTrue(progress)
+        self.assertEqual(self.fs.getxattr('/', 'ceph.dir.layout.pool'),
+                         b'fast')
+        for path, data in self.files.items():
+            self.assertEqual(self._pool(path), b'fast')
+            with open(self.fs._path(path), 'rb') as f:
+                self.assertEqual(f.read(), data)
+        one = self.fs.stat('/a/one')
+        self.assertEqual(one.st_ino, self.fs.stat('/c/one-link').st_ino)
+        self.assertEqual(one.st_nlink, 2)
+        self.assertEqual(one.st_mode & 0o7777, 0o640)
+        self.assertEqual(one.st_mtime, 1200000000)
+        self.assertEqual(self.fs.getxattr('/a/one', 'user.tag'), b'blue')
+        self.assertNotIn('one' + layout_migration.SUFFIX,
+                         os.listdir(self.fs._path('/a')))
+        self.assertIsNone(layout_migration.tree_walk.load_cursor(
+            layout_migration.CURSOR))
+
+    def test_migrate_two_links(self):
+        root = self.fs.root
+        os.makedirs(root + '/e')
+        with open(root + '/e/first', 'wb') as f:
+            f.write(b'shared')
+        os.link(root + '/e/first', root + '/e/second')
+        migration = layout_migration.LayoutMigration(self.fs, 'fast')
+        migration.visit(self.fs, '/e')
+        self.assertEqual(migration.counters['migrated'], 1)
+        self.assertEqual(migration.counters['linked'], 1)
+        first, second = self.fs.stat('/e/first'), self.fs.stat('/e/second')
+        self.assertEqual(first.st_ino, second.st_ino)
+        self.assertEqual(first.st_nlink, 2)
+        self.assertEqual(self._pool('/e/second'), b'fast')
+        # The original is gone, its inode number may be reused.
+        self.assertEqual(migration.links, {})
+
+    def test_migrate_resume(self):
+        result = layout_migration.migrate(self.fs, '/', 'fast', workers=1,
+                                          time_limit=0)
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['scanned'], 1)
+        self.assertEqual(result['pending'], 2)
+        result = layout_migration.migrate(self.fs, resume=True)
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['scanned'], 4)
+        self.assertEqual(result['migrated'] + result['linked'], 3)
+        self.assertRaises(ValueError, layout_migration.migrate, self.fs,
+                          resume=True)
+        self.assertRaises(ValueError, layout_migration.migrate, self.fs)
+
+    def test_migrate_modified(self):
+        stat = self.fs.stat
+        calls = []
+
+        def _stat(path):
+            result = stat(path)
+            if path == '/a/b/two':
+                calls.append(path)
+                if len(calls) == 2:
+                    # Written to between the start and the end of the copy.
+                    return os.stat_result(
+                        result[:8] + (result.st_mtime + 1,) + result[9:])
+            return result
+        self.fs.stat = _stat
+        write = self.fs.write
+
+        def _write(fd, data, offset):
+            # Corrupt the copy of /c/three.
+            return write(fd, bytes(len(data)) if len(data) == 10 else data,
+                         offset)
+        self.fs.write = _write
+        self.fs.setxattr('/c/three', 'ceph.file.layout.pool', b'slow', 0)
+        result = layout_migration.migrate(self.fs, '/', 'fast')
+        self.assertEqual(sorted(result['failed'], key=lambda f: f['path']), [
+            {'path': '/a/b/two', 'error': 'modified during the copy'},
+            {'path': '/c/three', 'error': 'checksum of the copy differs'}])
+        self.assertEqual(self._pool('/a/b/two'), b'cephfs_data')
+        self.assertEqual(sorted(os.listdir(self.fs._path('/c'))),
+                         ['one-link', 'three'])
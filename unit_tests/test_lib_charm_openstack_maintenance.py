@@ -0,0 +1,127 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import datetime
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.maintenance as maintenance
+
+WEEKENDS = '* 1-4 * * 6,0'
+# A Wednesday.
+NOON = datetime.datetime(2024, 5, 15, 12, 0)
+
+
+class TestWindow(unittest.TestCase):
+
+    def test_parse_window(self):
+        self.assertIsNone(maintenance.parse_window(''))
+        self.assertIsNone(maintenance.parse_window(None))
+        window = maintenance.parse_window('*/15 22-23,0-2 1 */3 7')
+        self.assertEqual(window['minute'], {0, 15, 30, 45})
+        self.assertEqual(window['hour'], {22, 23, 0, 1, 2})
+        self.assertEqual(window['month'], {1, 4, 7, 10})
+        self.assertEqual(window['day of week'], {0})
+        self.assertTrue(window['restricted'])
+        self.assertEqual(maintenance.parse_window('5/20 * * * *')['minute'],
+                         {5, 25, 45})
+        for expression in ('* * * *', '60 * * * *', '* 5-2 * * *',
+                           '* * 0 * *', '*/0 * * * *', 'a * * * *'):
+            self.assertRaises(ValueError, maintenance.parse_window,
+                              expression)
+
+    def test_window_open(self):
+        self.assertTrue(maintenance.window_open('', NOON))
+        self.assertFalse(maintenance.window_open(WEEKENDS, NOON))
+        self.assertTrue(maintenance.window_open(
+            WEEKENDS, datetime.datetime(2024, 5, 18, 4, 59)))
+        self.assertFalse(maintenance.window_open(
+            WEEKENDS, datetime.datetime(2024, 5, 18, 5, 0)))
+        # Either of the days matches when both are restricted.
+        self.assertTrue(maintenance.window_open('* * 15 * 1', NOON))
+        self.assertTrue(maintenance.window_open('* * 1 * 3', NOON))
+        self.assertFalse(maintenance.window_open('* * 1 * *', NOON))
+
+    def test_next_opening(self):
+        self.assertEqual(maintenance.next_opening(WEEKENDS, NOON),
+                         datetime.datetime(2024, 5, 18, 1, 0))
+        self.assertEqual(maintenance.next_opening('30 12 * * *', NOON),
+                         datetime.datetime(2024, 5, 15, 12, 30))
+        self.assertEqual(maintenance.next_opening('* * * * *', NOON), NOON)
+        self.assertEqual(maintenance.next_opening('0 0 29 2 *', NOON),
+                         datetime.datetime(2028, 2, 29, 0, 0))
+        self.assertIsNone(maintenance.next_opening('0 0 31 2 *', NOON))
+
+
+class TestQueue(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        patcher = mock.patch.object(
+            maintenance, 'MAINTENANCE_STATE',
+            os.path.join(tmpdir.name, 'maintenance.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(maintenance, 'window_open')
+        self.window_open = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.window_open.return_value = False
+
+    def test_defer_and_take(self):
+        maintenance.defer('restart', {'services': ['ceph-mds@a']})
+        maintenance.defer('restart', {'services': ['cephfs-mirror',
+                                                   'ceph-mds@a']})
+        maintenance.defer('drop-cache', {'timeout': 60})
+        maintenance.defer('drop-cache', {'timeout': 300})
+        pending = maintenance.load_state()['pending']
+        self.assertEqual(pending['restart']['services'],
+                         ['ceph-mds@a', 'cephfs-mirror'])
+        self.assertEqual(pending['drop-cache']['timeout'], 300)
+        self.assertEqual(maintenance.take(WEEKENDS), {})
+        self.assertEqual(maintenance.force(['restart']), ['restart'])
+        self.assertEqual(list(maintenance.take(WEEKENDS)), ['restart'])
+        self.assertEqual(maintenance.load_state()['forced'], [])
+        self.window_open.return_value = True
+        self.assertEqual(list(maintenance.take(WEEKENDS)), ['drop-cache'])
+        self.assertEqual(maintenance.load_state()['pending'], {})
+
+    def test_postpone(self):
+        self.assertTrue(maintenance.postpone(WEEKENDS, 'scrub'))
+        self.assertIn('scrub', maintenance.load_state()['pending'])
+        maintenance.force()
+        self.assertFalse(maintenance.postpone(WEEKENDS, 'scrub'))
+        self.assertEqual(maintenance.load_state(),
+                         {'pending': {}, 'forced': []})
+        self.window_open.return_value = True
+        self.assertFalse(maintenance.postpone(WEEKENDS, 'scrub'))
+        self.assertEqual(maintenance.load_state()['pending'], {})
+
+    @mock.patch.object(maintenance, 'next_opening')
+    def test_status_note(self, next_opening):
+        self.assertIsNone(maintenance.status_note(WEEKENDS))
+        maintenance.defer('upgrade')
+        maintenance.defer('restart', {'services': ['ceph-mds@a']})
+        next_opening.return_value = (datetime.datetime.now() +
+                                     datetime.timedelta(hours=3, seconds=5))
+        self.assertEqual(maintenance.status_note(WEEKENDS),
+                         'deferred: restart ceph-mds@a, upgrade, '
+                         'maintenance window in 3h00m')
+        next_opening.return_value = None
+        self.assertEqual(maintenance.status_note(WEEKENDS),
+                         'deferred: restart ceph-mds@a, upgrade, the '
+                         'maintenance window never opens')
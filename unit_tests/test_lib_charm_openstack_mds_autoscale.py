@@ -0,0 +1,164 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.mds_autoscale as mds_autoscale
+
+SETTINGS = {'min-mds': 1, 'max-mds': 3, 'up-rate': 2000, 'down-rate': 500,
+            'cache-pressure': 1.2, 'sustain': 600, 'cooldown': 1800,
+            'standbys': 1}
+
+
+def _samples(rates, max_mds=1, daemons=3, cache=0.9, start=0, step=60):
+    return [{'time': start + i * step, 'active': max_mds,
+             'standby': daemons - max_mds, 'daemons': daemons,
+             'max-mds': max_mds, 'standby-count-wanted': 1,
+             'rate': rate, 'cache': cache}
+            for i, rate in enumerate(rates)]
+
+
+class TestDecide(unittest.TestCase):
+
+    def test_scale_up(self):
+        samples = _samples([2500] * 12)
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, None, 660),
+            (2, '2500 req/s per rank for 10m'))
+
+    def test_scale_up_not_sustained(self):
+        samples = _samples([2500] * 11 + [1500] + [2500])
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, None, 720), (None, None))
+        # Not measured over the whole period yet.
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, _samples([2500] * 5), None, 240),
+            (None, None))
+
+    def test_scale_up_cache(self):
+        samples = _samples([100] * 12, cache=1.4)
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, None, 660),
+            (2, 'cache at 140% of the limit for 10m'))
+
+    def test_cooldown(self):
+        samples = _samples([2500] * 12)
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, 0, 660), (None, None))
+
+    def test_standbys(self):
+        samples = _samples([2500] * 12, max_mds=2, daemons=3)
+        # No more rank can be added without losing the last standby.
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, None, 660), (None, None))
+        samples[-1]['daemons'] = 2
+        samples[-1]['standby'] = 0
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, 600, 660),
+            (1, 'keep 1 standby(s) with 0 available'))
+
+    def test_scale_down(self):
+        # 1800 req/s over 3 ranks is 900 per rank with 2, above the rate to
+        # scale down even though every rank is below it.
+        samples = _samples([1400] * 12, max_mds=3, daemons=4)
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, None, 660), (None, None))
+        samples = _samples([900] * 12, max_mds=3, daemons=4)
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, None, 660),
+            (2, '450 req/s per rank with 2 rank(s)'))
+        samples = _samples([100] * 12, max_mds=1)
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, None, 660), (None, None))
+
+    def test_bounds(self):
+        samples = _samples([100], max_mds=5, daemons=8)
+        self.assertEqual(
+            mds_autoscale.decide(SETTINGS, samples, 0, 0),
+            (3, 'above mds-autoscale-max-mds'))
+
+
+class TestRun(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        patcher = mock.patch.object(mds_autoscale, 'AUTOSCALE_STATE',
+                                    os.path.join(tmp.name, 'autoscale.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(mds_autoscale.ceph_cli, 'ceph_command')
+        self.ceph_command = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.status = {'mdsmap': [
+            {'name': 'a', 'rank': 0, 'state': 'active', 'rate': 2500},
+            {'name': 'b', 'state': 'standby'},
+            {'name': 'c', 'state': 'standby'}]}
+
+        def _ceph_command(*args, **kwargs):
+            if args[:2] == ('fs', 'status'):
+                return self.status
+            if args[:2] == ('fs', 'get'):
+                return {'mdsmap': {'max_mds': 1, 'standby_count_wanted': 1}}
+            if args[0] == 'tell':
+                return {'pool': {'bytes': 3 << 30}}
+        self.ceph_command.side_effect = _ceph_command
+
+    @mock.patch.object(mds_autoscale.time, 'time')
+    def test_sample(self, time):
+        time.return_value = 100
+        self.assertEqual(mds_autoscale.sample('ceph-fs', 4 << 30), {
+            'time': 100, 'active': 1, 'standby': 2, 'daemons': 3,
+            'max-mds': 1, 'standby-count-wanted': 1, 'rate': 2500,
+            'cache': 0.75})
+        self.ceph_command.assert_any_call('tell', 'mds.a', 'cache',
+                                          'status', timeout=60)
+
+    @mock.patch.object(mds_autoscale.time, 'time')
+    def test_run_once(self, time):
+        for now in range(0, 660, 60):
+            time.return_value = now
+            self.assertIsNone(
+                mds_autoscale.run_once('ceph-fs', SETTINGS, 4 << 30))
+        time.return_value = 660
+        self.assertEqual(
+            mds_autoscale.run_once('ceph-fs', SETTINGS, 4 << 30),
+            {'time': 660, 'from': 1, 'to': 2,
+             'reason': '2500 req/s per rank for 10m'})
+        self.ceph_command.assert_called_with('fs', 'set', 'ceph-fs',
+                                             'max_mds', 2, timeout=60)
+        state = mds_autoscale.load_state()
+        self.assertEqual(state['max-mds'], 2)
+        self.assertEqual(state['last-change'], 660)
+        self.assertEqual(len(state['samples']), 1)
+        time.return_value = 960
+        self.assertEqual(mds_autoscale.status_note(),
+                         'max_mds 2, scaled 1 to 2 5m ago '
+                         '(2500 req/s per rank for 10m)')
+
+    @mock.patch.object(mds_autoscale.time, 'time')
+    def test_run_once_standby_count(self, time):
+        time.return_value = 0
+        mds_autoscale.run_once('ceph-fs', dict(SETTINGS, standbys=2),
+                               4 << 30)
+        self.ceph_command.assert_any_call('fs', 'set', 'ceph-fs',
+                                          'standby_count_wanted', 2,
+                                          timeout=60)
+
+    def test_status_note_never_ran(self):
+        self.assertIsNone(mds_autoscale.status_note())
@@ -0,0 +1,144 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.mds_cache as mds_cache
+
+CACHE = {'mds-cache-memory-limit': '4Gi',
+         'mds-cache-reservation': 0.05,
+         'mds-health-cache-threshold': 1.5}
+
+
+class TestMdsCache(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(mds_cache.ceph_cli, 'daemon_command')
+        self.daemon_command = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.cache_bytes = [3 << 30]
+
+        def _daemon_command(*args, **kwargs):
+            if args[:2] == ('cache', 'status'):
+                return {'pool': {'items': 1000,
+                                 'bytes': self.cache_bytes.pop(0)}}
+            if args[:2] == ('perf', 'dump'):
+                return {'mds_mem': {'ino': 400, 'dn': 500, 'cap': 600,
+                                    'rss': 4 << 20},
+                        'mds': {'inodes_pinned': 10,
+                                'inodes_with_caps': 20}}
+            return {'trim_cache': {'trimmed': 800}}
+        self.daemon_command.side_effect = _daemon_command
+
+    def test_cache_limits(self):
+        self.assertEqual(mds_cache.cache_limits(CACHE), {
+            'limit': 4 << 30,
+            'target': int((4 << 30) * 0.95),
+            'warning': 6 << 30})
+        self.assertRaises(ValueError, mds_cache.cache_limits,
+                          {'mds-cache-memory-limit': 'lots'})
+
+    def test_cache_status(self):
+        status = mds_cache.cache_status(CACHE)
+        self.assertEqual(status['memory-used'], '3.0GiB')
+        self.assertEqual(status['memory-limit'], '4.0GiB')
+        self.assertEqual(status['usage'], '75.0%')
+        self.assertFalse(status['oversized'])
+        self.assertEqual(status['rss'], '4.0GiB')
+        self.assertEqual(status['dentries'], 500)
+        self.assertEqual(status['inodes-pinned'], 10)
+
+    def test_cache_status_no_limit(self):
+        status = mds_cache.cache_status(
+            dict(CACHE, **{'mds-cache-memory-limit': '0'}))
+        self.assertEqual(status['memory-limit'], '0.0B')
+        self.assertEqual(status['usage'], 'unavailable')
+        self.assertFalse(status['oversized'])
+
+    def test_drop_cache(self):
+        self.cache_bytes = [3 << 30] + [1 << 30] * 100
+        progress = mock.MagicMock()
+        result = mds_cache.drop_cache(30, 2 << 30, progress=progress,
+                                      interval=0.01)
+        self.daemon_command.assert_any_call('cache', 'drop', 30, timeout=90)
+        self.assertEqual(result['before']['bytes'], '3.0GiB')
+        self.assertEqual(result['after']['bytes'], '1.0GiB')
+        self.assertTrue(result['target-reached'])
+        self.assertEqual(result['output'], {'trim_cache': {'trimmed': 800}})
+        progress.assert_called()
+
+    def test_drop_cache_error(self):
+        def _daemon_command(*args, **kwargs):
+            if args[:2] == ('cache', 'drop'):
+                raise subprocess.CalledProcessError(1, 'ceph')
+            return {}
+        self.daemon_command.side_effect = _daemon_command
+        self.assertRaises(subprocess.CalledProcessError,
+                          mds_cache.drop_cache, 30, 1, interval=0.01)
+
+    @mock.patch.object(mds_cache.ceph_cli, 'ceph_command')
+    def test_session_totals(self, ceph_command):
+        ceph_command.return_value = {
+            'clients': [{'clients': 3, 'fs': 'ceph-fs'},
+                        {'clients': 7, 'fs': 'other'}],
+            'mdsmap': [{'rank': 0, 'state': 'active', 'caps': 1000},
+                       {'rank': 1, 'state': 'active', 'caps': 500},
+                       {'name': 'mds-c', 'state': 'standby'}]}
+        self.assertEqual(mds_cache.session_totals('ceph-fs'),
+                         {'sessions': 3, 'caps': 1500, 'active': 2})
+        ceph_command.assert_called_once_with('fs', 'status', 'ceph-fs',
+                                             timeout=60)
+
+    def test_measure_inode_size(self):
+        self.assertEqual(mds_cache.measure_inode_size(),
+                         {'bytes-per-inode': None, 'rss-ratio': 4 / 3})
+        self.cache_bytes = [1 << 30]
+        self.daemon_command.side_effect = lambda *args, **kwargs: (
+            {'pool': {'bytes': self.cache_bytes.pop(0)}}
+            if args[0] == 'cache' else
+            {'mds_mem': {'ino': 1 << 18, 'rss': 2 << 20}})
+        self.assertEqual(mds_cache.measure_inode_size(),
+                         {'bytes-per-inode': 4096, 'rss-ratio': 2})
+
+    def test_plan(self):
+        plan = mds_cache.plan(CACHE, 10000000, 1000000, 100, 200000,
+                              bytes_per_inode=3000, rss_ratio=1.2)
+        self.assertEqual(plan['working-set'], 1100000)
+        self.assertEqual(plan['cache-needed'], '3.7GiB')
+        self.assertEqual(plan['current'], {
+            'mds-cache-memory-limit': '4.0GiB',
+            'mds-cache-reservation': 0.05})
+        self.assertEqual(plan['recommended'], {
+            'mds-cache-memory-limit': '4Gi',
+            'mds-cache-reservation': 0.35,
+            'max-mds': 1})
+        self.assertEqual(plan['memory-per-unit'], '6.0GiB')
+        self.assertEqual(plan['units'], 2)
+        self.assertTrue(plan['bytes-per-inode-measured'])
+
+    def test_plan_spread(self):
+        plan = mds_cache.plan(CACHE, 10000000, 1000000, 1, 5000000,
+                              max_cache_per_mds=8 << 30)
+        self.assertEqual(plan['working-set'], 5000000)
+        self.assertEqual(plan['bytes-per-inode'], 4096)
+        self.assertFalse(plan['bytes-per-inode-measured'])
+        self.assertEqual(plan['recommended'], {
+            'mds-cache-memory-limit': '8Gi',
+            'mds-cache-reservation': 0.05,
+            'max-mds': 3})
+        self.assertEqual(plan['memory-per-unit'], '12.0GiB')
+        self.assertEqual(plan['units'], 4)
@@ -0,0 +1,148 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.mds_cache_tune as mds_cache_tune
+
+SETTINGS = {'floor': 1 << 30, 'ceiling': 16 << 30, 'headroom': 2 << 30,
+            'target-hit-ratio': 0.9, 'step': 0.25}
+
+
+def _counters(traverse, hits, recalls=0, limit=4 << 30):
+    return {'traverse': traverse, 'hits': hits, 'recalls': recalls,
+            'limit': limit, 'usage': limit}
+
+
+class TestDecide(unittest.TestCase):
+
+    def test_grow_on_misses_and_recalls(self):
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(1000, 1000), _counters(2000, 1800, 500),
+            False, 32 << 30, 0),
+            (5 << 30, 'hit ratio 80%, 500 caps recalled', False))
+        # Misses without recalls do not call for a larger cache.
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(1000, 1000), _counters(2000, 1800),
+            False, 32 << 30, 0), (None, 'hit ratio 80%', False))
+
+    def test_grow_oversized(self):
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(1000, 1000), _counters(2000, 2000),
+            True, 32 << 30, 0), (5 << 30, 'cache oversized', False))
+
+    def test_grow_bounded(self):
+        # The headroom is kept available.
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(1000, 1000), _counters(2000, 2000),
+            True, 2560 << 20, 0)[0], 4608 << 20)
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(0, 0, limit=16 << 30),
+            _counters(10, 10, limit=16 << 30), True, 32 << 30, 0)[0], None)
+
+    def test_shrink_when_quiet(self):
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(1000, 1000), _counters(2000, 2000),
+            False, 32 << 30, 0), (None, 'hit ratio 100%', True))
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(1000, 1000), _counters(2000, 2000),
+            False, 32 << 30, 2),
+            (3584 << 20, 'no cache miss or recall in 3 runs', True))
+
+    def test_shrink_on_host_memory(self):
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, None, _counters(2000, 2000), False, 1 << 30, 0),
+            (3584 << 20, '1.0GiB of memory available on the host', False))
+
+    def test_bounds_and_restart(self):
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, None, _counters(10, 10, limit=512 << 20), False,
+            32 << 30, 0), (1 << 30, 'outside of the floor and ceiling',
+                           False))
+        self.assertEqual(mds_cache_tune.decide(
+            SETTINGS, _counters(1000, 1000), _counters(10, 10), True,
+            32 << 30, 0), (None, 'no previous sample', False))
+
+
+class TestRun(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.meminfo = os.path.join(tmp.name, 'meminfo')
+        with open(self.meminfo, 'w') as f:
+            f.write('MemTotal:       65536000 kB\n'
+                    'MemAvailable:   33554432 kB\n')
+        for name, value in (
+                ('CACHE_TUNE_STATE', os.path.join(tmp.name, 'tune.json')),
+                ('MEMINFO', self.meminfo)):
+            patcher = mock.patch.object(mds_cache_tune, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for name in ('ceph_command', 'daemon_command', 'mds_name'):
+            patcher = mock.patch.object(mds_cache_tune.ceph_cli, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        self.mds_name.return_value = 'mds.somehost'
+        self.perf = [{'mds': {'traverse': 1000, 'traverse_hit': 1000}},
+                     {'mds': {'traverse': 2000, 'traverse_hit': 1500}}]
+
+        def _daemon_command(*args, **kwargs):
+            if args[:2] == ('perf', 'dump'):
+                return self.perf.pop(0)
+            if args[:2] == ('session', 'ls'):
+                return [{'recall_caps': {'value': 1200.5}},
+                        {'recall_caps': {'value': 0}}]
+            if args[:2] == ('cache', 'status'):
+                return {'pool': {'bytes': 4 << 30}}
+            if args[:2] == ('config', 'get'):
+                return {'mds_cache_memory_limit': str(4 << 30)}
+        self.daemon_command.side_effect = _daemon_command
+        self.ceph_command.return_value = {'checks': {}}
+
+    def test_memory_available(self):
+        self.assertEqual(mds_cache_tune.memory_available(), 32 << 30)
+
+    def test_cache_oversized(self):
+        self.assertFalse(mds_cache_tune.cache_oversized())
+        self.ceph_command.return_value = {'checks': {'MDS_CACHE_OVERSIZED': {
+            'detail': [{'message': 'mds.somehost(mds.0): MDS cache is too '
+                                   'large (9GB/4GB); 0 inodes in use'}]}}}
+        self.assertTrue(mds_cache_tune.cache_oversized())
+        self.mds_name.return_value = 'mds.other'
+        self.assertFalse(mds_cache_tune.cache_oversized())
+
+    @mock.patch.object(mds_cache_tune.time, 'time')
+    def test_run_once(self, time):
+        time.return_value = 100
+        self.assertIsNone(mds_cache_tune.run_once(SETTINGS))
+        self.assertEqual(mds_cache_tune.run_once(SETTINGS), {
+            'time': 100, 'from': 4 << 30, 'to': 5 << 30,
+            'reason': 'hit ratio 50%, 1200 caps recalled'})
+        self.daemon_command.assert_any_call(
+            'config', 'set', 'mds_cache_memory_limit', 5 << 30)
+        state = mds_cache_tune.load_state()
+        self.assertEqual(state['limit'], 5 << 30)
+        self.assertEqual(len(state['decisions']), 1)
+        time.return_value = 760
+        self.assertEqual(mds_cache_tune.status_note(),
+                         'cache limit 5.0GiB, grown 11m ago '
+                         '(hit ratio 50%, 1200 caps recalled)')
+
+    def test_status_note_never_ran(self):
+        self.assertIsNone(mds_cache_tune.status_note())
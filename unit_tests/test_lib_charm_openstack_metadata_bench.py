@@ -0,0 +1,86 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from charm.openstack import metadata_bench
+
+
+class TestMetadataBench(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.directory = tmp.name
+
+    def test_run(self):
+        report = metadata_bench.run(self.directory, workers=3, files=25,
+                                    files_per_directory=10, file_size=16)
+        self.assertEqual(list(report['phases']), list(metadata_bench.PHASES))
+        for phase, summary in report['phases'].items():
+            # Three directories per worker for the readdir phase.
+            self.assertEqual(summary['ops'], 9 if phase == 'readdir' else 75)
+            latency = summary['latency-ms']
+            self.assertLessEqual(latency['p50'], latency['p90'])
+            self.assertLessEqual(latency['p99'], latency['max'])
+            self.assertGreater(summary['ops-per-second'], 0)
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_run_without_unlink(self):
+        report = metadata_bench.run(self.directory, phases=['stat', 'create'],
+                                    workers=2, files=5)
+        self.assertEqual(list(report['phases']), ['create', 'stat'])
+        # Files are removed even when not unlinked by a phase.
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_run_invalid(self):
+        self.assertRaises(ValueError, metadata_bench.run, self.directory,
+                          phases=['stat'])
+        self.assertRaises(ValueError, metadata_bench.run, self.directory,
+                          phases=['create', 'chmod'])
+        self.assertRaises(ValueError, metadata_bench.run, self.directory,
+                          workers=0)
+
+    def test_run_failure(self):
+        with self.assertRaisesRegex(metadata_bench.Error,
+                                    'FileNotFoundError'):
+            metadata_bench.run(os.path.join(self.directory, 'missing'),
+                               workers=2, files=5)
+
+    def test_cephfs_backend(self):
+        fs = mock.MagicMock()
+        fs.readdir.side_effect = [mock.Mock(), mock.Mock(), None]
+        backend = metadata_bench.CephFSBackend(fs)
+        backend.create('/a', b'data')
+        fs.open.assert_called_once_with(
+            '/a', os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        fs.write.assert_called_once_with(fs.open.return_value, b'data', 0)
+        fs.close.assert_called_once_with(fs.open.return_value)
+        backend.listdir('/d')
+        self.assertEqual(fs.readdir.call_count, 3)
+        fs.closedir.assert_called_once_with(fs.opendir.return_value)
+
+    def test_summarise(self):
+        summary = metadata_bench.summarise([
+            {'start': 10.0, 'end': 11.0,
+             'latencies': [0.001 * n for n in range(1, 101)]},
+            {'start': 10.5, 'end': 12.0, 'latencies': []}])
+        self.assertEqual(summary, {
+            'ops': 100, 'seconds': 2.0, 'ops-per-second': 50.0,
+            'latency-ms': {'mean': 50.5, 'p50': 50.0, 'p90': 90.0,
+                           'p99': 99.0, 'max': 100.0}})
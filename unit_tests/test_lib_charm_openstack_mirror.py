@@ -0,0 +1,97 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.mirror as mirror
+
+ASOK = '/var/run/ceph/ceph-client.cephfs-mirror.1234.5678.asok'
+PEER = 'a2dc7784-e7a1-4723-b103-03ee8d8768f8'
+
+
+class TestMirror(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        for name in ('ceph_command', 'socket_command'):
+            patcher = mock.patch.object(mirror.ceph_cli, name)
+            setattr(self, name, patcher.start())
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(mirror.glob, 'glob')
+        self.glob = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_import_bootstrap_token(self):
+        self.ceph_command.return_value = {'enabled_modules': []}
+        mirror.import_bootstrap_token('ceph-fs', 'token')
+        self.ceph_command.assert_has_calls([
+            mock.call('mgr', 'module', 'ls', timeout=60),
+            mock.call('mgr', 'module', 'enable', 'mirroring', timeout=60),
+            mock.call('fs', 'snapshot', 'mirror', 'enable', 'ceph-fs',
+                      timeout=60),
+            mock.call('fs', 'snapshot', 'mirror', 'peer_bootstrap',
+                      'import', 'ceph-fs', 'token', timeout=60)])
+
+    def test_create_bootstrap_token(self):
+        self.ceph_command.side_effect = [None, {'token': 'abc'}]
+        self.assertEqual(mirror.create_bootstrap_token(
+            'ceph-fs', 'client.mirror_remote', 'dr'), 'abc')
+        self.ceph_command.assert_has_calls([
+            mock.call('fs', 'authorize', 'ceph-fs', 'client.mirror_remote',
+                      '/', 'rwps', timeout=60),
+            mock.call('fs', 'snapshot', 'mirror', 'peer_bootstrap',
+                      'create', 'ceph-fs', 'client.mirror_remote', 'dr',
+                      timeout=60)])
+
+    @mock.patch.object(mirror.time, 'monotonic')
+    def test_sync_status(self, monotonic):
+        monotonic.return_value = 1000.0
+        self.glob.return_value = [ASOK]
+        command = 'fs mirror peer status ceph-fs@1 {}'.format(PEER)
+
+        def _socket_command(path, *args, **kwargs):
+            self.assertEqual(path, ASOK)
+            if args == ('help',):
+                return {command: 'get peer mirror status',
+                        'fs mirror status ceph-fs@1': 'get status',
+                        'fs mirror peer status other@2 x': 'other fs'}
+            self.assertEqual(' '.join(args), command)
+            return {
+                '/a': {'state': 'idle', 'snaps_synced': 2,
+                       'last_synced_snap': {
+                           'id': 120, 'name': 'snap1',
+                           'sync_duration': 0.08,
+                           'sync_time_stamp': '900.5s'}},
+                '/b': {'state': 'syncing', 'snaps_synced': 0},
+                '/c': {'state': 'idle', 'snaps_synced': 5,
+                       'last_synced_snap': {
+                           'name': 'snap9', 'sync_duration': 1.5,
+                           'sync_time_stamp': '990.0s'}},
+            }
+        self.socket_command.side_effect = _socket_command
+        self.assertEqual(mirror.sync_status('ceph-fs'), [
+            {'path': '/b', 'peer': PEER, 'state': 'syncing',
+             'last-synced-snap': None, 'sync-duration': None, 'lag': None,
+             'snaps-synced': 0},
+            {'path': '/a', 'peer': PEER, 'state': 'idle',
+             'last-synced-snap': 'snap1', 'sync-duration': 0.08,
+             'lag': 99.5, 'snaps-synced': 2},
+            {'path': '/c', 'peer': PEER, 'state': 'idle',
+             'last-synced-snap': 'snap9', 'sync-duration': 1.5,
+             'lag': 10.0, 'snaps-synced': 5}])
+
+    def test_sync_status_not_running(self):
+        self.glob.return_value = []
+        self.assertRaises(ValueError, mirror.sync_status, 'ceph-fs')
@@ -0,0 +1,89 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+import os
+import sys
+import tempfile
+import unittest
+import unittest.mock as mock
+
+sys.modules['cephfs'] = mock.MagicMock()
+sys.modules['rados'] = mock.MagicMock()
+
+import charm.openstack.quotas as quotas
+
+from unit_tests.test_lib_charm_openstack_tree_walk import FakeFS, TREE
+
+QUOTAS = {'/a/b': {'max-bytes': 1024, 'max-files': 0},
+          '/d/e': {'max-bytes': 0, 'max-files': 10}}
+
+
+class TestListQuotas(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        for target, name, value in (
+                (quotas.tree_walk, 'STATE_DIR', tmp.name),
+                (quotas, 'OUTPUT', os.path.join(tmp.name, 'quotas.jsonl')),
+                (quotas.cephfs_client, 'Error', OSError)):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(quotas.cephfs_client, 'get_quota')
+        self.get_quota = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get_quota.side_effect = lambda fs, path: QUOTAS.get(
+            path, {'max-bytes': 0, 'max-files': 0})
+        self.fs = FakeFS(TREE)
+
+    def test_list_quotas(self):
+        batches = []
+        result = quotas.list_quotas(self.fs, batch_size=1,
+                                    on_batch=batches.append)
+        expected = [{'path': '/a/b', 'max-bytes': 1024, 'max-files': 0},
+                    {'path': '/d/e', 'max-bytes': 0, 'max-files': 10}]
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['scanned'], 8)
+        self.assertEqual(result['found'], 2)
+        self.assertEqual(result['pending'], 0)
+        self.assertEqual(sorted(result['quotas'], key=lambda q: q['path']),
+                         expected)
+        self.assertEqual(len(batches), 2)
+        with open(quotas.OUTPUT) as f:
+            self.assertEqual(sorted((json.loads(line) for line in f),
+                                    key=lambda q: q['path']), expected)
+        self.assertIsNone(quotas.tree_walk.load_cursor(quotas.CURSOR))
+
+    @mock.patch.object(quotas.time, 'monotonic')
+    def test_list_quotas_resume(self, monotonic):
+        self.assertRaises(ValueError, quotas.list_quotas, self.fs,
+                          resume=True)
+        # Every directory read takes a second.
+        monotonic.side_effect = range(1000)
+        result = quotas.list_quotas(self.fs, workers=1, time_limit=3,
+                                    exclude=['.snap'])
+        self.assertFalse(result['complete'])
+        self.assertEqual(result['scanned'], 3)
+        cursor = quotas.tree_walk.load_cursor(quotas.CURSOR)
+        self.assertEqual(cursor['exclude'], ['.snap'])
+        self.assertTrue(cursor['pending'])
+        result = quotas.list_quotas(self.fs, resume=True)
+        self.assertTrue(result['complete'])
+        self.assertEqual(result['scanned'], 7)
+        self.assertEqual(result['found'], 2)
+        with open(quotas.OUTPUT) as f:
+            self.assertEqual(len(f.readlines()), 2)
@@ -0,0 +1,174 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.scrub as scrub
+
+
+class TestScrub(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        patcher = mock.patch.object(
+            scrub, 'SCRUB_STATE', os.path.join(tmpdir.name, 'scrub.json'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(scrub.ceph_cli, 'ceph_command')
+        self.ceph_command = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mds_status = ['no active scrubs running']
+        # Active scrubs by tag, until the MDS is found idle.
+        self.scrubs = {}
+
+        def _ceph_command(*args, **kwargs):
+            if args[2:] == ('scrub', 'status'):
+                text = self.mds_status.pop(0)
+                if text.startswith('no active'):
+                    self.scrubs.clear()
+                return {'status': text, 'scrubs': dict(self.scrubs)}
+            if args[2:4] == ('scrub', 'start'):
+                self.scrubs['tag-' + args[4]] = {'path': args[4]}
+                return {'return_code': 0, 'scrub_tag': 'tag-' + args[4]}
+        self.ceph_command.side_effect = _ceph_command
+        patcher = mock.patch.object(scrub.time, 'time')
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.time.return_value = 1000
+
+    def test_scrub_status(self):
+        self.mds_status = ['scrub active (1234 inodes in the stack)',
+                           'PAUSED (12 inodes in the stack)',
+                           'no active scrubs running']
+        self.assertEqual(scrub.scrub_status('ceph-fs'), {
+            'state': 'running',
+            'status': 'scrub active (1234 inodes in the stack)',
+            'inodes-queued': 1234, 'scrubs': {}})
+        self.ceph_command.assert_called_with(
+            'tell', 'mds.ceph-fs:0', 'scrub', 'status', timeout=60)
+        self.assertEqual(scrub.scrub_status('ceph-fs')['state'], 'paused')
+        self.assertEqual(scrub.scrub_status('ceph-fs')['state'], 'idle')
+
+    def test_start(self):
+        state = scrub.start('ceph-fs', ['/a', '/b'], repair=True, max_ops=2)
+        self.assertEqual(state['tags'], {'/a': 'tag-/a', '/b': 'tag-/b'})
+        self.ceph_command.assert_has_calls([
+            mock.call('tell', 'mds.*', 'config', 'set',
+                      'mds_max_scrub_ops_in_progress', 2, timeout=60),
+            mock.call('tell', 'mds.ceph-fs:0', 'scrub', 'start', '/a',
+                      'recursive,repair', timeout=60)])
+        self.assertEqual(scrub.load_state()['started'], 1000)
+        self.mds_status = ['scrub active (3 inodes in the stack)']
+        self.assertRaises(ValueError, scrub.start, 'ceph-fs', ['/'])
+
+    def test_status_and_note(self):
+        self.assertIsNone(scrub.status_note())
+        scrub.start('ceph-fs', ['/'])
+        self.time.return_value = 1000 + 7500
+        self.assertEqual(scrub.status_note(), 'scrub running for 2h05m')
+        self.mds_status = ['scrub active (42 inodes in the stack)']
+        self.assertEqual(scrub.status('ceph-fs')['elapsed'], 7500)
+        calls = self.ceph_command.call_count
+        # The note is the last status recorded, the MDS is not asked.
+        self.assertEqual(scrub.status_note(),
+                         'scrub running for 2h05m, 42 inodes queued')
+        self.assertEqual(self.ceph_command.call_count, calls)
+        scrub.resume('ceph-fs')
+        self.time.return_value = 1000 + 9000
+        self.mds_status = ['no active scrubs running']
+        self.assertEqual(scrub.status('ceph-fs')['elapsed'], 9000)
+        self.assertEqual(scrub.status_note(),
+                         'last scrub took 2h30m in 2 window(s)')
+
+    def test_status_other_scrub(self):
+        scrub.start('ceph-fs', ['/'])
+        # The scrub of the charm is over, another one is active.
+        self.scrubs = {'other': {'path': '/a'}}
+        self.mds_status = ['scrub active (3 inodes in the stack)']
+        scrub.status('ceph-fs')
+        self.assertEqual(scrub.load_state()['finished'], 1000)
+
+    @mock.patch.object(scrub.time, 'sleep')
+    @mock.patch.object(scrub.time, 'monotonic')
+    def test_run_window(self, monotonic, sleep):
+        clock = [0]
+        monotonic.side_effect = lambda: clock[0]
+        sleep.side_effect = lambda seconds: clock.__setitem__(
+            0, clock[0] + seconds)
+        self.mds_status = ['no active scrubs running'] + [
+            'scrub active (5 inodes in the stack)'] * 3
+        self.assertEqual(scrub.run_window('ceph-fs', ['/'], 150), 'paused')
+        self.ceph_command.assert_called_with(
+            'tell', 'mds.ceph-fs:0', 'scrub', 'pause', timeout=60)
+        self.assertEqual(scrub.status_note(),
+                         'scrub paused for 0m, 5 inodes queued')
+        self.assertEqual(sleep.call_args_list,
+                         [mock.call(60), mock.call(60), mock.call(30)])
+        clock[0] = 0
+        self.mds_status = ['PAUSED (5 inodes in the stack)',
+                           'no active scrubs running']
+        self.assertEqual(scrub.run_window('ceph-fs', ['/'], 150), 'finished')
+        self.assertEqual(scrub.load_state()['windows'], 2)
+
+    @mock.patch.object(scrub.time, 'sleep')
+    @mock.patch.object(scrub.time, 'monotonic')
+    def test_run_window_other_scrub(self, monotonic, sleep):
+        clock = [0]
+        monotonic.side_effect = lambda: clock[0]
+        sleep.side_effect = lambda seconds: clock.__setitem__(
+            0, clock[0] + seconds)
+        # A scrub started by an operator is neither resumed nor paused.
+        self.scrubs = {'other': {'path': '/a'}}
+        self.mds_status = ['PAUSED (5 inodes in the stack)']
+        self.assertEqual(scrub.run_window('ceph-fs', ['/'], 150), 'busy')
+        self.mds_status = ['scrub active (5 inodes in the stack)']
+        self.assertEqual(scrub.run_window('ceph-fs', ['/'], 150), 'busy')
+        for call in self.ceph_command.call_args_list:
+            self.assertEqual(call[0][2:], ('scrub', 'status'))
+        # One started during the window keeps the scrub of the charm
+        # running, as pausing would pause both.
+        _ceph_command = self.ceph_command.side_effect
+
+        def _other_started(*args, **kwargs):
+            output = _ceph_command(*args, **kwargs)
+            if args[2:4] == ('scrub', 'start'):
+                self.scrubs['other'] = {'path': '/a'}
+            return output
+        self.ceph_command.side_effect = _other_started
+        self.mds_status = ['no active scrubs running'] + [
+            'scrub active (5 inodes in the stack)'] * 3
+        self.assertEqual(scrub.run_window('ceph-fs', ['/'], 150), 'busy')
+        self.assertNotIn(mock.call('tell', 'mds.ceph-fs:0', 'scrub', 'pause',
+                                   timeout=60),
+                         self.ceph_command.call_args_list)
+        self.assertIsNone(scrub.load_state()['finished'])
+
+    @mock.patch.object(scrub, 'run_window')
+    @mock.patch.object(scrub.maintenance, 'postpone')
+    def test_main(self, postpone, run_window):
+        postpone.return_value = True
+        scrub.main(['--filesystem', 'ceph-fs', '--window', '4h',
+                    '--maintenance-window', '* 1-4 * * *', '/'])
+        postpone.assert_called_once_with('* 1-4 * * *', 'scrub')
+        run_window.assert_not_called()
+        postpone.return_value = False
+        scrub.main(['--filesystem', 'ceph-fs', '--window', '4h', '/a', '/b'])
+        postpone.assert_called_with(None, 'scrub')
+        run_window.assert_called_once_with('ceph-fs', ['/a', '/b'], 14400,
+                                           max_ops=None)
@@ -0,0 +1,114 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.slow_ops as slow_ops
+
+
+def _event(second, name):
+    return {'time': '2024-01-01T00:00:{:09.6f}+0000'.format(second),
+            'event': name}
+
+
+GETATTR = {
+    'description': ('client_request(client.4155:3 getattr pAsLsXsFs '
+                    '#0x1/home/alice/file 2024-01-01T00:00:00.000000+0000 '
+                    'caller_uid=0, caller_gid=0{})'),
+    'initiated_at': '2024-01-01T00:00:00.000000+0000',
+    'duration': 0.5,
+    'type_data': {
+        'flag_point': 'done',
+        'op_type': 'client_request',
+        'client_info': {'client': 'client.4155', 'tid': 3},
+        'events': [
+            _event(0, 'initiated'),
+            _event(0.1, 'failed to rdlock, waiting'),
+            _event(0.3, 'acquired locks'),
+            _event(0.3, 'submit entry: journal_and_reply'),
+            _event(0.5, 'journal_committed: '),
+        ],
+    },
+}
+
+MKDIR = {
+    'description': 'client_request(client.9:1 mkdir #0x10000000001/tmp)',
+    'initiated_at': '2024-01-01T00:00:01.000000+0000',
+    'age': 42,
+    'type_data': {'flag_point': 'failed to xlock, waiting', 'events': []},
+}
+
+
+class TestSlowOps(unittest.TestCase):
+
+    def test_wait_category(self):
+        self.assertEqual(slow_ops.wait_category('failed to wrlock, waiting'),
+                         'locks')
+        self.assertEqual(slow_ops.wait_category('journal_committed: '),
+                         'journal')
+        self.assertEqual(slow_ops.wait_category('waiting for osd read'),
+                         'osd')
+        self.assertEqual(slow_ops.wait_category('dispatched'), 'other')
+
+    def test_parse_op(self):
+        op = slow_ops.parse_op(GETATTR)
+        self.assertEqual(op['type'], 'client_request')
+        self.assertEqual(op['op'], 'getattr')
+        self.assertEqual(op['client'], 'client.4155')
+        self.assertEqual(op['path'], '/home/alice')
+        self.assertEqual(op['duration'], 0.5)
+        self.assertAlmostEqual(op['waits']['locks'], 0.2)
+        self.assertAlmostEqual(op['waits']['journal'], 0.2)
+        self.assertAlmostEqual(op['waits']['other'], 0.1)
+        op = slow_ops.parse_op(MKDIR, depth=1)
+        self.assertEqual(op['client'], 'client.9')
+        self.assertEqual(op['path'], '0x10000000001:/tmp')
+        self.assertEqual(op['duration'], 42)
+        self.assertEqual(op['waits'], {})
+
+    def test_histogram(self):
+        self.assertEqual(list(slow_ops.histogram([0.0005, 0.5, 0.7, 120])
+                              .items()),
+                         [('<1ms', 1), ('<10ms', 0), ('<100ms', 0),
+                          ('<1s', 2), ('<10s', 0), ('<60s', 0),
+                          ('>=60s', 1)])
+
+    def test_analyse(self):
+        report = slow_ops.analyse({
+            'dump_historic_ops': {'ops': [GETATTR]},
+            'dump_historic_ops_by_duration': {'ops': [GETATTR]},
+            'dump_blocked_ops': {'ops': [MKDIR], 'num_blocked_ops': 1},
+        })
+        self.assertEqual(report['ops'], 2)
+        self.assertEqual(report['blocked'], 1)
+        self.assertEqual([g['op'] for g in report['by-op']],
+                         ['client_request:mkdir', 'client_request:getattr'])
+        self.assertEqual(report['by-client'][1]['client'], 'client.4155')
+        self.assertEqual(report['by-client'][1]['count'], 1)
+        self.assertEqual(report['waits']['locks'],
+                         {'ops': 1, 'seconds': 0.2})
+        self.assertEqual(report['flag-points'],
+                         {'failed to xlock, waiting': 1})
+        report = slow_ops.analyse({'dump_historic_ops': {'ops': [GETATTR]},
+                                   'dump_blocked_ops': {'ops': [MKDIR]}},
+                                  min_duration=1)
+        self.assertEqual(report['ops'], 1)
+
+    @mock.patch.object(slow_ops.ceph_cli, 'daemon_command')
+    def test_collect(self, daemon_command):
+        daemon_command.return_value = {'ops': []}
+        self.assertEqual(sorted(slow_ops.collect()),
+                         sorted(slow_ops.DUMP_COMMANDS))
+        daemon_command.assert_any_call('dump_blocked_ops', timeout=60)
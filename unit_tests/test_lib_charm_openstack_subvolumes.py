@@ -0,0 +1,90 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import subprocess
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.subvolumes as subvolumes
+
+
+class TestSubvolumes(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(subvolumes.ceph_cli, 'ceph_command')
+        self.ceph_command = patcher.start()
+        self.ceph_command.return_value = None
+        self.addCleanup(patcher.stop)
+
+    def test_parse_specs(self):
+        self.assertEqual(subvolumes.parse_specs('[{"name": "a"}]'),
+                         [{'name': 'a'}])
+        self.assertRaises(ValueError, subvolumes.parse_specs, '[{')
+        self.assertRaises(ValueError, subvolumes.parse_specs, '{"a": 1}')
+        self.assertRaises(ValueError, subvolumes.parse_specs, '[{"size": 1}]')
+
+    def test_create_subvolume(self):
+        subvolumes.create_subvolume('ceph-fs', {
+            'name': 'tenant1', 'group-name': 'tenants', 'size': '1Gi',
+            'pool-layout': 'ec_data', 'namespace-isolated': True})
+        self.ceph_command.assert_called_once_with(
+            'fs', 'subvolume', 'create', 'ceph-fs', 'tenant1',
+            '--size', 1073741824, '--group_name', 'tenants',
+            '--pool_layout', 'ec_data', '--namespace-isolated')
+
+    def test_resize_subvolume(self):
+        subvolumes.resize_subvolume('ceph-fs', {
+            'name': 'tenant1', 'size': 1024, 'no-shrink': True})
+        self.ceph_command.assert_called_once_with(
+            'fs', 'subvolume', 'resize', 'ceph-fs', 'tenant1', 1024,
+            '--no_shrink')
+        self.assertRaises(ValueError, subvolumes.resize_subvolume,
+                          'ceph-fs', {'name': 'tenant1'})
+
+    def test_groups(self):
+        subvolumes.create_group('ceph-fs', {'name': 'g', 'mode': '755'})
+        self.ceph_command.assert_called_once_with(
+            'fs', 'subvolumegroup', 'create', 'ceph-fs', 'g', '--mode', '755')
+        self.ceph_command.reset_mock()
+        subvolumes.remove_group('ceph-fs', {'name': 'g', 'force': True})
+        self.ceph_command.assert_called_once_with(
+            'fs', 'subvolumegroup', 'rm', 'ceph-fs', 'g', '--force')
+        self.ceph_command.return_value = [{'name': 'g'}, {'name': 'h'}]
+        self.assertEqual(subvolumes.list_groups('ceph-fs'), ['g', 'h'])
+
+    def test_list_subvolumes(self):
+        self.ceph_command.return_value = [{'name': 'a'}]
+        self.assertEqual(subvolumes.list_subvolumes('ceph-fs', 'g'), ['a'])
+        self.ceph_command.assert_called_once_with(
+            'fs', 'subvolume', 'ls', 'ceph-fs', '--group_name', 'g')
+
+    def test_run_bulk(self):
+        def _command(*args):
+            if args[4] == 'bad':
+                raise subprocess.CalledProcessError(
+                    2, ['ceph'], stderr=b'Error EEXIST')
+
+        self.ceph_command.side_effect = _command
+        results = subvolumes.run_bulk(
+            subvolumes.remove_subvolume, 'ceph-fs',
+            [{'name': 'good', 'group-name': 'g'}, {'name': 'bad'},
+             {'name': 'good2'}],
+            workers=2)
+        self.assertEqual(results, [
+            {'name': 'good', 'group-name': 'g', 'status': 'ok'},
+            {'name': 'bad', 'status': 'error', 'error': 'Error EEXIST'},
+            {'name': 'good2', 'status': 'ok'},
+        ])
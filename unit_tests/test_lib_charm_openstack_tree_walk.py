@@ -0,0 +1,122 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import posixpath
+import tempfile
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.tree_walk as tree_walk
+
+
+class FakeEntry(object):
+
+    def __init__(self, name, is_dir):
+        self.d_name = name.encode('utf-8')
+        self._is_dir = is_dir
+
+    def is_dir(self):
+        return self._is_dir
+
+
+class FakeFS(object):
+    """In-memory tree of directories, given as a list of paths."""
+
+    def __init__(self, directories, files=()):
+        self.children = {'/': []}
+        for path in sorted(directories):
+            self.children[path] = []
+            self.children[posixpath.dirname(path)].append((
+                posixpath.basename(path), True))
+        for path in files:
+            self.children[posixpath.dirname(path)].append((
+                posixpath.basename(path), False))
+
+    def opendir(self, path):
+        if path not in self.children:
+            raise OSError('No such directory: {}'.format(path))
+        return iter([FakeEntry('.', True), FakeEntry('..', True)] +
+                    [FakeEntry(*child) for child in self.children[path]])
+
+    def readdir(self, handle):
+        return next(handle, None)
+
+    def closedir(self, handle):
+        pass
+
+
+TREE = ['/a', '/a/b', '/a/b/c', '/a/tmp1', '/d', '/d/.snap', '/d/e']
+
+
+class TestTreeWalk(unittest.TestCase):
+
+    def test_list_subdirectories(self):
+        fs = FakeFS(['/a', '/b'], files=['/f'])
+        self.assertEqual(tree_walk.list_subdirectories(fs, '/'), ['a', 'b'])
+
+    def test_run(self):
+        walk = tree_walk.TreeWalk(FakeFS(TREE), lambda fs, path: len(path),
+                                  [['/', 0]], workers=3)
+        self.assertEqual(dict(walk.run()), {
+            '/': 1, '/a': 2, '/a/b': 4, '/a/b/c': 6, '/a/tmp1': 7, '/d': 2,
+            '/d/.snap': 8, '/d/e': 4})
+        self.assertEqual(walk.scanned, 8)
+        self.assertEqual(walk.pending(), [])
+
+    def test_run_depth_and_exclude(self):
+        walk = tree_walk.TreeWalk(FakeFS(TREE), lambda fs, path: None,
+                                  [['/', 0]], max_depth=2,
+                                  exclude=['.snap', '/a/tmp*'])
+        self.assertEqual(sorted(path for path, _ in walk.run()),
+                         ['/', '/a', '/a/b', '/d', '/d/e'])
+
+    def test_run_split(self):
+        walk = tree_walk.TreeWalk(
+            FakeFS(TREE), lambda fs, path: (path, path != '/a'), [['/', 0]],
+            split=True)
+        self.assertEqual(sorted(path for path, _ in walk.run()),
+                         ['/', '/a', '/d', '/d/.snap', '/d/e'])
+
+    def test_run_errors(self):
+        walk = tree_walk.TreeWalk(FakeFS(TREE), lambda fs, path: None,
+                                  [['/a', 1], ['/missing', 1]],
+                                  errors=OSError)
+        self.assertEqual(sorted(path for path, _ in walk.run()),
+                         ['/a', '/a/b', '/a/b/c', '/a/tmp1'])
+        self.assertEqual(walk.failed, [
+            {'path': '/missing', 'error': 'No such directory: /missing'}])
+
+    def test_run_resume(self):
+        fs = FakeFS(TREE)
+        walk = tree_walk.TreeWalk(fs, lambda fs, path: None, [['/', 0]],
+                                  workers=1)
+        seen = []
+        for path, _ in walk.run():
+            seen.append(path)
+            if len(seen) == 3:
+                break
+        cursor = walk.pending()
+        walk = tree_walk.TreeWalk(fs, lambda fs, path: None, cursor)
+        seen.extend(path for path, _ in walk.run())
+        self.assertEqual(sorted(seen), ['/'] + TREE)
+
+    def test_cursor(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            with mock.patch.object(tree_walk, 'STATE_DIR', tmp + '/state'):
+                self.assertIsNone(tree_walk.load_cursor('walk'))
+                tree_walk.save_cursor('walk', {'pending': [['/a', 1]]})
+                self.assertEqual(tree_walk.load_cursor('walk'),
+                                 {'pending': [['/a', 1]]})
+                tree_walk.save_cursor('walk', None)
+                self.assertIsNone(tree_walk.load_cursor('walk'))
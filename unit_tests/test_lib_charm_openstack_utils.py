@@ -0,0 +1,88 @@
+# Copyright 2024 Canonical Ltd
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import unittest
+import unittest.mock as mock
+
+import charm.openstack.utils as utils
+
+
+class TestUtils(unittest.TestCase):
+
+    def test_parse_size(self):
+        self.assertEqual(utils.parse_size(4096), 4096)
+        self.assertEqual(utils.parse_size('4096'), 4096)
+        self.assertEqual(utils.parse_size('4Gi'), 4 * 1024 ** 3)
+        self.assertEqual(utils.parse_size('4G'), 4 * 1024 ** 3)
+        self.assertEqual(utils.parse_size('1.5KiB'), 1536)
+        self.assertEqual(utils.parse_size('2 m'), 2 * 1024 ** 2)
+        self.assertRaises(ValueError, utils.parse_size, 'lots')
+        self.assertRaises(ValueError, utils.parse_size, '')
+
+    def test_format_size(self):
+        self.assertEqual(utils.format_size(512), '512.0B')
+        self.assertEqual(utils.format_size(1536), '1.5KiB')
+        self.assertEqual(utils.format_size(4 * 1024 ** 3), '4.0GiB')
+
+    def test_format_config_size(self):
+        self.assertEqual(utils.format_config_size(4 << 30), '4Gi')
+        self.assertEqual(utils.format_config_size(768 << 20), '768Mi')
+        self.assertEqual(utils.format_config_size(3072), '3Ki')
+        self.assertEqual(utils.format_config_size(1536), '1536')
+        self.assertEqual(utils.format_config_size(1000), '1000')
+        self.assertEqual(utils.format_config_size(0), '0')
+
+    def test_parse_duration(self):
+        self.assertEqual(utils.parse_duration(30), 30)
+        self.assertEqual(utils.parse_duration('30'), 30)
+        self.assertEqual(utils.parse_duration('90m'), 5400)
+        self.assertEqual(utils.parse_duration('4H'), 14400)
+        self.assertEqual(utils.parse_duration('1d'), 86400)
+        self.assertRaises(ValueError, utils.parse_duration, '1.5h')
+        self.assertRaises(ValueError, utils.parse_duration, 'soon')
+
+    def test_format_duration(self):
+        self.assertEqual(utils.format_duration(59), '0m')
+        self.assertEqual(utils.format_duration(125 * 60), '2h05m')
+
+    @mock.patch.object(utils.time, 'sleep')
+    @mock.patch.object(utils.time, 'monotonic')
+    def test_rate_limiter(self, monotonic, sleep):
+        monotonic.return_value = 100.0
+        limiter = utils.RateLimiter(10)
+        limiter.consume(5)
+        sleep.assert_not_called()
+        limiter.consume(10)
+        sleep.assert_called_once_with(0.5)
+        monotonic.return_value = 101.0
+        limiter.consume()
+        sleep.assert_called_with(0.5)
+        sleep.reset_mock()
+        unlimited = utils.RateLimiter(None)
+        unlimited.consume(1 << 30)
+        sleep.assert_not_called()
+
+    def test_fs_path(self):
+        self.assertEqual(utils.fs_path('foo/bar'), '/foo/bar')
+        self.assertEqual(utils.fs_path('/foo/bar/'), '/foo/bar')
+        self.assertEqual(utils.fs_path(' //foo '), '/foo')
+        self.assertEqual(utils.fs_path(''), '/')
+
+    def test_fs_paths(self):
+        self.assertEqual(utils.fs_paths(['a', '/b c/', 'c/d']),
+                         ['/a', '/b c', '/c/d'])
+        self.assertEqual(utils.fs_paths('my dir'), ['/my dir'])
+        self.assertEqual(utils.fs_paths(None), [])
+        self.assertEqual(utils.fs_paths([]), [])
@@ -32,12 +32,26 @@ class TestRegisteredHooks(test_utils.TestRegisteredHooks):
         ]
         hook_set = {
             'when': {
-                'config_changed': ('ceph-mds.pools.available',),
+                'config_changed': ('ceph-mds.available',
+                                   'leadership.set.pools-ready',),
+                'publish_pools_ready': ('leadership.is_leader',
+                                        'ceph-mds.pools.available',),
                 'storage_ceph_connected': ('ceph-mds.connected',),
+                'request_pools': ('leadership.is_leader',
+                                  'ceph-mds.connected',),
+                'update_cephfs_clients': ('leadership.is_leader',
+                                          'ceph-mds.available',
+                                          'leadership.set.pools-ready',),
+                'run_deferred_operations': ('cephfs.configured',
+                                            'ceph-mds.available',),
+            },
+            'when_not': {
+                'publish_pools_ready': ('leadership.set.pools-ready',),
             },
             'when_none': {
                 'config_changed': ('charm.paused',
                                    'run-default-update-status',),
+                'run_deferred_operations': ('charm.paused',),
             },
         }
         # test that the hooks were registered via the reactive.ceph_fs module
@@ -69,17 +83,164 @@ class TestCephFSHandlers(test_utils.PatchHelper):
         self.is_flag_set.return_value = False
         handlers.config_changed()
         self.endpoint_from_flag.assert_called_once_with(
-            'ceph-mds.pools.available')
+            'ceph-mds.available')
         self.target.configure_ceph_keyring.assert_called_once_with('fakekey')
         self.target.render_with_interfaces.assert_called_once_with([ceph_mds])
-        self.is_flag_set.assert_called_once_with('config.changed.source')
+        self.is_flag_set.assert_has_calls([
+            mock.call('config.changed.cephfs-mirror'),
+            mock.call('config.changed.source')])
+        self.target.apply_sysctl.assert_called_once_with()
+        self.target.configure_mirror.assert_called_once_with()
         self.set_flag.assert_has_calls([
             mock.call('cephfs.configured'),
             mock.call('config.rendered'),
         ])
         self.target.install.assert_not_called()
         self.target.upgrade_if_available.assert_not_called()
-        self.is_flag_set.return_value = True
+        self.is_flag_set.side_effect = (
+            lambda flag: flag == 'config.changed.source')
         handlers.config_changed()
         self.target.install.assert_called_once_with()
         self.target.upgrade_if_available.assert_called_once_with([ceph_mds])
+
+    def test_publish_pools_ready(self):
+        self.patch_object(handlers.leadership, 'leader_set')
+        handlers.publish_pools_ready()
+        self.leader_set.assert_called_once_with({'pools-ready': True})
+
+    def _patch_request(self, cfg, settings):
+        self.patch_object(handlers, 'config')
+        self.config.side_effect = (
+            lambda key=None: cfg if key is None else cfg.get(key))
+        self.patch_object(handlers, 'service_name', return_value='ceph-fs')
+        self.patch_object(handlers.reactive, 'endpoint_from_flag')
+        self.patch_object(handlers.reactive, 'clear_flag')
+        self.patch_object(handlers.leadership, 'leader_get')
+        self.patch_object(handlers.leadership, 'leader_set')
+        self.leader_get.side_effect = settings.get
+        self.leader_set.side_effect = settings.update
+        self.target._get_bluestore_compression.return_value = None
+        self.patch_object(handlers.ch_core.hookenv, 'relation_ids',
+                          return_value=['ceph-mds:1'])
+        self.patch_object(handlers.ch_ceph, 'get_previous_request')
+        self.requests = []
+        self.get_previous_request.side_effect = (
+            lambda rid: self.requests[-1] if self.requests else None)
+
+    def _send(self, ceph_mds, request):
+        # The interface sends the request when it builds the filesystem one.
+        ceph_mds.request_cephfs.side_effect = (
+            lambda *args, **kwargs: self.requests.append(request))
+
+    def _request_pools(self):
+        ceph_mds = mock.MagicMock()
+        self.endpoint_from_flag.return_value = ceph_mds
+        handlers.request_pools(ceph_mds)
+        self.endpoint_from_flag.assert_called_with('ceph-mds.connected')
+        return ceph_mds
+
+    def test_request_pools(self):
+        cfg = {'ceph-pool-weight': 40, 'ceph-osd-replication-count': 3,
+               'pool-type': 'replicated', 'source': 'distro'}
+        self._patch_request(cfg, {})
+        ceph_mds = self._request_pools()
+        app_name = ceph_mds.ceph_pool_app_name
+        # The metadata pool gets a fifth of the weight.
+        ceph_mds.create_replicated_pool.assert_has_calls([
+            mock.call(name='ceph-fs_data', replicas=3, weight=32.0,
+                      app_name=app_name),
+            mock.call(name='ceph-fs_metadata', replicas=3, weight=8.0,
+                      app_name=app_name)])
+        ceph_mds.create_erasure_pool.assert_not_called()
+        ceph_mds.request_cephfs.assert_called_once_with('ceph-fs',
+                                                        extra_pools=[])
+
+    def test_request_pools_erasure_coded(self):
+        cfg = {'ceph-pool-weight': 40, 'ceph-osd-replication-count': 3,
+               'pool-type': 'erasure-coded', 'rbd-pool-name': 'files',
+               'metadata-pool': 'files_meta', 'ec-pool-weight': 30,
+               'ec-profile-k': 4, 'ec-profile-m': 2,
+               'ec-profile-plugin': 'jerasure'}
+        self._patch_request(cfg, {})
+        ceph_mds = self._request_pools()
+        app_name = ceph_mds.ceph_pool_app_name
+        ceph_mds.create_erasure_profile.assert_called_once_with(
+            name='ceph-fs-profile', k=4, m=2, lrc_locality=None,
+            lrc_crush_locality=None, shec_durability_estimator=None,
+            clay_helper_chunks=None, clay_scalar_mds=None,
+            device_class=None, erasure_type='jerasure',
+            erasure_technique=None)
+        ceph_mds.create_erasure_pool.assert_called_once_with(
+            name='ec_files', erasure_profile='ceph-fs-profile', weight=30,
+            app_name=app_name, allow_ec_overwrites=True)
+        ceph_mds.create_replicated_pool.assert_has_calls([
+            mock.call(name='files', weight=32.0, app_name=app_name),
+            mock.call(name='files_meta', weight=8.0, app_name=app_name)])
+        ceph_mds.request_cephfs.assert_called_once_with(
+            'ceph-fs', extra_pools=['ec_files'])
+
+    def test_request_pools_reset_ready(self):
+        cfg = {'ceph-pool-weight': 40, 'ceph-osd-replication-count': 3,
+               'pool-type': 'replicated'}
+        settings = {'pools-ready': True}
+        self._patch_request(cfg, settings)
+        ceph_mds = mock.MagicMock()
+        self.endpoint_from_flag.return_value = ceph_mds
+        self.requests.append('weight-40')
+        # The options changed but the request did not, the interface sent
+        # nothing and the pools stay ready.
+        cfg['ec-profile-k'] = 4
+        cfg['bluestore-compression-mode'] = 'none'
+        self._send(ceph_mds, 'weight-40')
+        handlers.request_pools(ceph_mds)
+        self.leader_set.assert_not_called()
+        self.clear_flag.assert_not_called()
+        self.assertTrue(settings['pools-ready'])
+        # A new request holds the other units back until it completes.
+        cfg['ceph-pool-weight'] = 60
+        self._send(ceph_mds, 'weight-60')
+        handlers.request_pools(ceph_mds)
+        self.leader_set.assert_called_once_with({'pools-ready': None})
+        self.clear_flag.assert_called_once_with('ceph-mds.pools.available')
+
+    def test_request_pools_first_request(self):
+        cfg = {'ceph-pool-weight': 40, 'ceph-osd-replication-count': 3,
+               'pool-type': 'replicated'}
+        self._patch_request(cfg, {})
+        ceph_mds = mock.MagicMock()
+        self.endpoint_from_flag.return_value = ceph_mds
+        self._send(ceph_mds, 'weight-40')
+        handlers.request_pools(ceph_mds)
+        self.leader_set.assert_not_called()
+        self.clear_flag.assert_called_once_with('ceph-mds.pools.available')
+
+    def test_update_cephfs_clients(self):
+        self.patch_object(handlers.reactive, 'endpoint_from_flag')
+        ceph_mds = mock.MagicMock()
+        self.endpoint_from_flag.return_value = ceph_mds
+        handlers.update_cephfs_clients()
+        self.endpoint_from_flag.assert_called_once_with('ceph-mds.available')
+        self.target.update_cephfs_clients.assert_called_once_with(ceph_mds)
+
+    def test_run_deferred_operations(self):
+        self.patch_object(handlers.reactive, 'endpoint_from_flag')
+        ceph_mds = mock.MagicMock()
+        self.endpoint_from_flag.return_value = ceph_mds
+        self.target.run_deferred.return_value = []
+        handlers.run_deferred_operations()
+        self.target.run_deferred.assert_called_once_with([ceph_mds])
+        self.target.assess_status.assert_not_called()
+        self.target.run_deferred.return_value = ['restart']
+        handlers.run_deferred_operations()
+        self.target.assess_status.assert_called_once_with()
+
+    def test_storage_ceph_connected(self):
+        self.patch_object(handlers.reactive, 'endpoint_from_flag')
+        ceph_mds = mock.MagicMock()
+        self.endpoint_from_flag.return_value = ceph_mds
+        handlers.storage_ceph_connected(ceph_mds)
+        ceph_mds.announce_mds_name.assert_called_once_with()
+        # Every unit announces its MDS, only the leader requests the pools
+        # (request_pools is registered for leadership.is_leader).
+        ceph_mds.create_replicated_pool.assert_not_called()
+        ceph_mds.request_cephfs.assert_not_called()